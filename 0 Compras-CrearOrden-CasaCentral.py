@@ -1,56 +1,482 @@
-import os, json, uuid, datetime
-import boto3
+import os, json, uuid, datetime, time, random
 from botocore.exceptions import ClientError
+from comun.items import encode_for_dynamo
+from comun import aws, estados, eventos, idempotencia, trazas
 
-dynamodb = boto3.client('dynamodb')
-events = boto3.client('events')
+dynamodb = aws.client('dynamodb')
+events = aws.client('events')
+sqs = aws.client('sqs')
 
-def put_event_orden_creada(order):
+ORDERS_TABLE = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
+EVENT_BUS    = os.environ.get('EVENT_BUS', 'ventas-bus')
+
+# Alta asíncrona (INTAKE_MODE=async): el POST valida, encola en INTAKE_QUEUE_URL y responde
+# 202 con el orderId; esta misma Lambda consume la cola (event source mapping de SQS con
+# ReportBatchItemFailures) y hace el alta como el bulk. Si DynamoDB throttlea, el resto del
+# lote vuelve a la cola sin intentarse (backpressure): SQS lo reentrega al vencer la visibilidad.
+INTAKE_MODE      = os.environ.get('INTAKE_MODE', 'sync').lower()
+INTAKE_QUEUE_URL = os.environ.get('INTAKE_QUEUE_URL', '').strip()
+SQS_BATCH        = 10
+SQS_MAX_BYTES    = 256 * 1024   # por mensaje y por SendMessageBatch
+
+# Bulk: límites de DynamoDB (TransactWriteItems) y EventBridge (PutEvents). Cada orden
+# ocupa su Put + la entrada CREATED del historial (comun/estados.py). Los chunks se cortan
+# por cantidad y por bytes: con órdenes grandes 25 entran justo en el límite de cantidad
+# pero no en el de tamaño, y DynamoDB rechazaría la transacción entera.
+TX_CHUNK      = min(int(os.environ.get('BULK_TX_CHUNK', '25')), 100 // estados.acciones_por_transicion())
+TX_MAX_BYTES  = 4 * 1024 * 1024   # suma de los items de una transacción
+ITEM_MAX_BYTES = 400 * 1024       # por item de DynamoDB
+EVENTS_CHUNK  = 10
+EVENTS_MAX_BYTES = 256 * 1024     # por entrada y por PutEvents (suma de las entradas)
+FUSED_RESERVA = 1024              # lo que suma `fusedTargets` (eventos.put_events) a cada Detail
+MAX_RETRIES   = int(os.environ.get('BULK_MAX_RETRIES', '5'))
+BASE_BACKOFF  = float(os.environ.get('BULK_BASE_BACKOFF', '0.05'))
+
+RETRYABLE = ('ProvisionedThroughputExceededException', 'ThrottlingException',
+             'RequestLimitExceeded', 'TransactionConflictException',
+             'InternalServerError', 'ServiceUnavailable')
+
+def _backoff(intento):
+    # backoff exponencial con jitter completo
+    time.sleep(random.uniform(0, BASE_BACKOFF * (2 ** intento)))
+
+def _tam_evento(entry):
+    # cómo mide EventBridge una entrada: Time + Source + DetailType + Detail (+ bus, por las dudas)
+    return 14 + sum(len(entry[k].encode()) for k in ("Source", "DetailType", "Detail", "EventBusName"))
+
+def _event_entry(order):
     detail = {
         "orderId": order["orderId"],
         "items": order["items"],
         "origen": order.get("origen", "CasaCentral")
     }
-    events.put_events(Entries=[{
+    if order.get("traceId"):
+        detail["traceId"] = order["traceId"]
+    if order.get("prioridad"):
+        detail["prioridad"] = order["prioridad"]
+    entry = {
         "Source": "com.casacentral.compras", #OrdenCreada
         "DetailType": "OrdenCreada",
         "Detail": json.dumps(detail),
-        "EventBusName": "ventas-bus"
-    }])
+        "EventBusName": EVENT_BUS
+    }
+    if _tam_evento(entry) + FUSED_RESERVA > EVENTS_MAX_BYTES:
+        # orden muy grande: el evento viaja sin items (los consumidores leen la orden de DynamoDB)
+        del detail["items"]
+        entry["Detail"] = json.dumps(detail)
+    return entry
+
+def put_event_orden_creada(order):
+    eventos.put_events(events, [_event_entry(order)])
+
+def _order_id(body):
+    # orderId del body, o uno nuevo si no viene; None si viene pero no es un texto no vacío
+    order_id = body.get("orderId")
+    if order_id is None:
+        return f"OC-{uuid.uuid4().hex[:10].upper()}"
+    return order_id if isinstance(order_id, str) and order_id.strip() else None
+
+def _prioridad(body):
+    # URGENTE / ALTA se notifican al instante aunque el rol esté en modo digest (comun/digest.py)
+    p = str(body.get("prioridad") or "").strip().upper()
+    return p or None
+
+def _order_item(order_id, items, origen, now_iso, trace_id=None, prioridad=None):
+    item = {
+        "orderId": {"S": order_id},
+        "status": {"S": "CREATED"},
+        "items": encode_for_dynamo(items),
+        "origen": {"S": origen},
+        "createdAt": {"S": now_iso},
+        "updatedAt": {"S": now_iso}
+    }
+    if trace_id:
+        item["traceId"] = {"S": trace_id}   # los endpoints de aprobación/recepción/despacho la retoman
+    if prioridad:
+        item["prioridad"] = {"S": prioridad}
+    return item
+
+def _tam_atributo(v):
+    # bytes de un AttributeValue low-level como los cuenta DynamoDB (N y BOOL, por exceso)
+    (t, x), = v.items()
+    if t == "M":
+        return 3 + sum(len(k.encode()) + _tam_atributo(a) + 1 for k, a in x.items())
+    if t == "L":
+        return 3 + sum(_tam_atributo(a) + 1 for a in x)
+    if t in ("SS", "NS", "BS"):
+        return sum(len(s) if isinstance(s, (bytes, bytearray)) else len(str(s).encode()) for s in x)
+    if isinstance(x, (bytes, bytearray)):
+        return len(x)
+    return len(str(x).encode())
+
+def _tam_item(item):
+    return sum(len(k.encode()) + _tam_atributo(v) for k, v in item.items())
+
+def _tam_orden(o, now_iso):
+    """Bytes que la orden suma a la transacción: su item + las acciones de historial."""
+    item = _order_item(o["orderId"], o["items"], o["origen"], now_iso, o["traceId"], o["prioridad"])
+    acciones = [p for a in estados.alta(o["orderId"], now_iso, o["origen"]) for p in a.values()]
+    return _tam_item(item), sum(_tam_item(p.get("Item") or p.get("Key") or {}) for p in acciones)
+
+def _chunks_tx(validas):
+    """Chunks de TransactWriteItems: hasta TX_CHUNK órdenes y TX_MAX_BYTES en total."""
+    chunk, tam = [], 0
+    for o in validas:
+        if chunk and (len(chunk) == TX_CHUNK or tam + o["_bytes"] > TX_MAX_BYTES):
+            yield chunk
+            chunk, tam = [], 0
+        chunk.append(o)
+        tam += o["_bytes"]
+    if chunk:
+        yield chunk
+
+def _write_chunk(chunk, now_iso, results):
+    """Escribe un chunk de órdenes en una transacción condicional.
+    Las que ya existen se marcan 'duplicate' (con el status guardado en `stored`) y se
+    reintenta el resto."""
+    pendientes = list(chunk)
+    intento = 0
+    while pendientes:
+        try:
+            # primero los Put de las órdenes: CancellationReasons[i] es la orden i
+            dynamodb.transact_write_items(TransactItems=[{
+                "Put": {
+                    "TableName": ORDERS_TABLE,
+                    "Item": _order_item(o["orderId"], o["items"], o["origen"], now_iso, o["traceId"], o["prioridad"]),
+                    "ConditionExpression": "attribute_not_exists(orderId)",
+                    "ReturnValuesOnConditionCheckFailure": "ALL_OLD"
+                }
+            } for o in pendientes] + [a for o in pendientes for a in estados.alta(o["orderId"], now_iso, o["origen"])])
+            for o in pendientes:
+                results[o["_idx"]] = {"orderId": o["orderId"], "status": "created"}
+            return
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code == "TransactionCanceledException":
+                reasons = e.response.get("CancellationReasons") or []
+                duplicadas = [(o, r) for o, r in zip(pendientes, reasons)
+                              if (r or {}).get("Code") == "ConditionalCheckFailed"]
+                if duplicadas:
+                    for o, r in duplicadas:
+                        results[o["_idx"]] = {"orderId": o["orderId"], "status": "duplicate",
+                                              "message": f"La orden {o['orderId']} ya existe",
+                                              "stored": (r.get("Item") or {}).get("status", {}).get("S")}
+                    duplicadas = [o for o, _ in duplicadas]
+                    ids = {o["orderId"] for o in duplicadas}
+                    pendientes = [o for o in pendientes if o["orderId"] not in ids]
+                    continue
+                # cancelada por conflicto/throttling: reintento con backoff
+                code = "TransactionConflictException"
+            if code in RETRYABLE and intento < MAX_RETRIES:
+                _backoff(intento)
+                intento += 1
+                continue
+            for o in pendientes:
+                results[o["_idx"]] = {"orderId": o["orderId"], "status": "failed",
+                                      "message": f"DynamoDB: {str(e)}", "retryable": code in RETRYABLE}
+            return
+
+def _sin_evento(validas, results):
+    """Órdenes a las que les falta OrdenCreada: las recién creadas y las 'duplicate' que
+    siguen en CREATED (una entrega anterior guardó la orden pero no llegó a publicar).
+    Publicar de nuevo es seguro: CREATED → PENDING_APPROVAL es condicional."""
+    out = []
+    for o in validas:
+        r = results[o["_idx"]]
+        if r["status"] == "created":
+            out.append(o)
+        elif r["status"] == "duplicate" and r.get("stored") == estados.CREATED:
+            r["republished"] = True
+            out.append(o)
+    return out
+
+def _lotes_eventos(creadas):
+    """Lotes de PutEvents: hasta EVENTS_CHUNK entradas y EVENTS_MAX_BYTES en total."""
+    lote, tam = [], 0
+    for o in creadas:
+        entry = _event_entry(o)
+        n = _tam_evento(entry) + FUSED_RESERVA
+        if lote and (len(lote) == EVENTS_CHUNK or tam + n > EVENTS_MAX_BYTES):
+            yield lote
+            lote, tam = [], 0
+        lote.append((o, entry))
+        tam += n
+    if lote:
+        yield lote
+
+def _publish_created(creadas, results):
+    """OrdenCreada en lotes de 10 (y 256KB); reintenta sólo las entradas fallidas.
+    Pasa por eventos.put_events (targets fusionados + `fusedTargets`): un reintento le da al
+    handler fusionado el mismo id de evento, así su idempotencia descarta la repetición."""
+    for lote in _lotes_eventos(creadas):
+        intento = 0
+        while lote:
+            try:
+                resp = eventos.put_events(events, [entry for _, entry in lote])
+            except ClientError as e:
+                resp = {"FailedEntryCount": len(lote),
+                        "Entries": [{"ErrorCode": "ClientError", "ErrorMessage": str(e)}] * len(lote)}
+            if not resp.get("FailedEntryCount"):
+                break
+            fallidas = [(o, r) for o, r in zip(lote, resp.get("Entries", [])) if r.get("ErrorCode")]
+            if intento >= MAX_RETRIES:
+                for (o, _), r in fallidas:
+                    # la orden quedó guardada pero sin evento: se informa para reintento manual
+                    results[o["_idx"]]["eventError"] = r.get("ErrorMessage") or r.get("ErrorCode")
+                break
+            _backoff(intento)
+            intento += 1
+            lote = [(o, entry) for (o, entry), _ in fallidas]
+
+def _validar(orders_in, results):
+    """Órdenes válidas (con orderId / traceId asignados); las demás quedan en `results`."""
+    validas, vistos = [], set()
+    now_iso = datetime.datetime.utcnow().isoformat()
+    for idx, body in enumerate(orders_in):
+        if not isinstance(body, dict):
+            results[idx] = {"orderId": None, "status": "failed", "message": "orden inválida"}
+            continue
+        order_id = _order_id(body)
+        if order_id is None:
+            results[idx] = {"orderId": body.get("orderId"), "status": "failed",
+                            "message": "orderId debe ser un texto no vacío"}
+            continue
+        items = body.get("items", [])
+        if not items:
+            results[idx] = {"orderId": order_id, "status": "failed",
+                            "message": "items es requerido y no puede ser vacío"}
+            continue
+        if order_id in vistos:
+            results[idx] = {"orderId": order_id, "status": "duplicate",
+                            "message": f"La orden {order_id} está repetida en el request"}
+            continue
+        o = {"_idx": idx, "orderId": order_id, "items": items,
+             "origen": body.get("origen", "CasaCentral"),
+             "traceId": body.get("traceId") or trazas.nuevo_trace_id(),
+             "prioridad": _prioridad(body)}
+        tam, historial = _tam_orden(o, now_iso)
+        if tam > ITEM_MAX_BYTES:
+            results[idx] = {"orderId": order_id, "status": "failed",
+                            "message": "orden demasiado grande para DynamoDB (400KB por item)"}
+            continue
+        vistos.add(order_id)
+        o["_bytes"] = tam + historial
+        validas.append(o)
+    return validas
+
+def _bulk_create(orders_in):
+    now_iso = datetime.datetime.utcnow().isoformat()
+    results = [None] * len(orders_in)
+
+    # 1) Validar y descartar repetidas dentro del mismo request
+    validas = _validar(orders_in, results)
+
+    # 2) Guardar en transacciones condicionales de hasta TX_CHUNK órdenes / TX_MAX_BYTES
+    for chunk in _chunks_tx(validas):
+        _write_chunk(chunk, now_iso, results)
+
+    # 3) Publicar OrdenCreada para las creadas (y las repetidas que nunca lo publicaron)
+    _publish_created(_sin_evento(validas, results), results)
+
+    resumen = {s: sum(1 for r in results if r["status"] == s) for s in ("created", "duplicate", "failed")}
+    return {"ok": resumen["failed"] == 0, **resumen, "results": results}
+
+# ----------------------------------------------------------------------------
+# Alta asíncrona: encolar (API) y consumir (SQS)
+# ----------------------------------------------------------------------------
+
+def _mensaje_cola(o):
+    return json.dumps({k: o[k] for k in ("orderId", "items", "origen", "traceId", "prioridad")},
+                      separators=(",", ":"))
+
+def _lotes_cola(validas, results):
+    """Lotes de SendMessageBatch: hasta 10 mensajes y SQS_MAX_BYTES en total."""
+    lote, tam = [], 0
+    for o in validas:
+        body = _mensaje_cola(o)
+        n = len(body.encode())
+        if n > SQS_MAX_BYTES:
+            results[o["_idx"]] = {"orderId": o["orderId"], "status": "failed",
+                                  "message": "orden demasiado grande para la cola (256KB): usar el alta sincrónica"}
+            continue
+        if len(lote) == SQS_BATCH or tam + n > SQS_MAX_BYTES:
+            yield lote
+            lote, tam = [], 0
+        lote.append((o, body))
+        tam += n
+    if lote:
+        yield lote
+
+def _encolar(validas, results):
+    """SendMessageBatch; reintenta sólo las entradas fallidas por SQS (throttling, 5xx). Las de
+    error del cliente (SenderFault: mensaje inválido, cola inexistente, permisos) fallan al toque
+    y no son reintentables; si la llamada entera falla (ClientError) sí lo son."""
+    for lote in _lotes_cola(validas, results):
+        intento = 0
+        while lote:
+            try:
+                resp = sqs.send_message_batch(QueueUrl=INTAKE_QUEUE_URL, Entries=[
+                    {"Id": str(o["_idx"]), "MessageBody": body} for o, body in lote])
+                fallidas = {f["Id"]: f for f in resp.get("Failed", [])}
+            except ClientError as e:
+                fallidas = {str(o["_idx"]): {"Code": "ClientError", "Message": str(e)} for o, _ in lote}
+            for o, _ in lote:
+                if str(o["_idx"]) not in fallidas:
+                    results[o["_idx"]] = {"orderId": o["orderId"], "status": "accepted"}
+            reintentar = []
+            for o, b in lote:
+                f = fallidas.get(str(o["_idx"]))
+                if f is None:
+                    continue
+                if not f.get("SenderFault") and intento < MAX_RETRIES:
+                    reintentar.append((o, b))
+                    continue
+                results[o["_idx"]] = {"orderId": o["orderId"], "status": "failed",
+                                      "retryable": not f.get("SenderFault"),
+                                      "message": f"SQS: {f.get('Code')}: {f.get('Message', '')}"}
+            lote = reintentar
+            if lote:
+                _backoff(intento)
+                intento += 1
+
+def _respuesta(code, body):
+    return {"statusCode": code, "headers": {"Content-Type": "application/json"}, "body": json.dumps(body)}
+
+def _codigo_rechazo(results):
+    """Nada aceptado: 503 si SQS no respondió (throttling, 5xx, reintentos agotados), 422 si
+    SQS rechazó el mensaje (SenderFault), 400 si la orden es inválida."""
+    if any(r.get("retryable") for r in results):
+        return 503
+    if any(r.get("retryable") is False for r in results):
+        return 422
+    return 400
+
+def _aceptar(orders_in, bulk):
+    """API en modo async: validar + encolar; 202 con los orderId aceptados."""
+    if not INTAKE_QUEUE_URL:
+        return _respuesta(500, {"ok": False, "message": "Falta INTAKE_QUEUE_URL para INTAKE_MODE=async"})
+    results = [None] * len(orders_in)
+    _encolar(_validar(orders_in, results), results)
+    if not bulk:
+        r = results[0]
+        if r["status"] != "accepted":
+            return _respuesta(_codigo_rechazo([r]), {"ok": False, "orderId": r["orderId"], "message": r["message"]})
+        return _respuesta(202, {"ok": True, "orderId": r["orderId"], "status": "accepted"})
+    resumen = {s: sum(1 for r in results if r["status"] == s) for s in ("accepted", "duplicate", "failed")}
+    code = 202 if resumen["accepted"] else _codigo_rechazo(results)
+    return _respuesta(code, {"ok": resumen["failed"] == 0, **resumen, "results": results})
+
+def _es_sqs(event):
+    records = event.get("Records") if isinstance(event, dict) else None
+    return bool(records) and records[0].get("eventSource") == "aws:sqs"
 
+def _consumir(records):
+    """Alta de un lote de la cola por el mismo camino que el bulk. Devuelve
+    {"batchItemFailures": [...]} con los mensajes a reintentar (ReportBatchItemFailures)."""
+    now_iso = datetime.datetime.utcnow().isoformat()
+    orders, ids = [], []
+    for r in records:
+        try:
+            orders.append(json.loads(r["body"]))
+            ids.append(r["messageId"])
+        except Exception:
+            print("[ALTA-ASYNC] mensaje ilegible, se descarta:", r.get("messageId"))
+    results = [None] * len(orders)
+    validas = _validar(orders, results)
+    for r in results:
+        if r is not None and r["status"] == "failed":
+            print("[ALTA-ASYNC] orden inválida, se descarta:", json.dumps(r))   # no mejora reintentando
+
+    # 1) Guardar por chunks (_chunks_tx); si DynamoDB throttlea, el resto vuelve a la cola sin intentarse
+    saturado = False
+    for chunk in _chunks_tx(validas):
+        if saturado:
+            for o in chunk:
+                results[o["_idx"]] = {"orderId": o["orderId"], "status": "failed", "retryable": True,
+                                      "message": "backpressure: DynamoDB saturado"}
+            continue
+        _write_chunk(chunk, now_iso, results)
+        saturado = any(results[o["_idx"]].get("retryable") for o in chunk)
+
+    # 2) OrdenCreada para las creadas y para las reentregas que siguen en CREATED
+    creadas = _sin_evento(validas, results)
+    _publish_created(creadas, results)
+    for o in creadas:
+        if results[o["_idx"]].get("eventError"):
+            print("[ALTA-ASYNC] orden guardada sin OrdenCreada, vuelve a la cola:", o["orderId"],
+                  results[o["_idx"]]["eventError"])
+
+    # 3) Reintentar lo que falló en DynamoDB o en EventBridge: la reentrega da 'duplicate' con la
+    #    orden todavía en CREATED y publica OrdenCreada de nuevo
+    fallidos = [{"itemIdentifier": ids[o["_idx"]]} for o in validas
+                if results[o["_idx"]]["status"] == "failed" or results[o["_idx"]].get("eventError")]
+    resumen = {s: sum(1 for r in results if r["status"] == s) for s in ("created", "duplicate", "failed")}
+    republicadas = sum(1 for o in creadas if results[o["_idx"]].get("republished"))
+    print("[ALTA-ASYNC]", json.dumps(dict(resumen, records=len(records), retry=len(fallidos), backpressure=saturado,
+                                          republished=republicadas)))
+    return {"batchItemFailures": fallidos}
+
+def _clave_alta(event):
+    # Header Idempotency-Key del ERP o, si viene, el orderId de una alta individual
+    if not isinstance(event, dict):
+        return None
+    headers = {k.lower(): v for k, v in (event.get("headers") or {}).items()}
+    if headers.get("idempotency-key"):
+        return f"CREATE#{headers['idempotency-key']}"
+    body = event.get("body")
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except Exception:
+            return None
+    if isinstance(body, dict) and isinstance(body.get("orderId"), str) and body["orderId"] \
+            and not isinstance(body.get("orders"), list):
+        return f"{body['orderId']}#CREATE"
+    return None
+
+@trazas.instrumentar(__file__, origen=True)
+@idempotencia.idempotente(_clave_alta)
 def lambda_handler(event, context):
-    body = event.get("detail") or event.get("body") or event
+    if _es_sqs(event):
+        return _consumir(event["Records"])
+    body = event if isinstance(event, list) else (event.get("detail") or event.get("body") or event)
     if isinstance(body, str):
         try:
             body = json.loads(body)
         except Exception:
             body = {}
 
+    # Bulk: array de órdenes (o {"orders": [...]})
+    if isinstance(body, list):
+        return _aceptar(body, True) if INTAKE_MODE == "async" else _bulk_create(body)
+    if isinstance(body.get("orders"), list):
+        return _aceptar(body["orders"], True) if INTAKE_MODE == "async" else _bulk_create(body["orders"])
+    if INTAKE_MODE == "async":
+        return _aceptar([dict(body, traceId=body.get("traceId") or trazas.trace_id())], False)
+
     now_iso = datetime.datetime.utcnow().isoformat()
-    order_id = body.get("orderId") or f"OC-{uuid.uuid4().hex[:10].upper()}"
+    order_id = _order_id(body)
+    if order_id is None:
+        return {"ok": False, "message": "orderId debe ser un texto no vacío"}
     items = body.get("items", [])
     origen = body.get("origen", "CasaCentral")
+    prioridad = _prioridad(body)
+    trazas.adoptar(order_id=order_id)
 
     if not items:
         return {"ok": False, "message": "items es requerido y no puede ser vacío"}
 
-    # 1) Guardar orden con condición para no pisar si ya existe
+    # 1) Guardar orden (con condición para no pisar si ya existe) + historial CREATED
     try:
-        dynamodb.put_item(
-            TableName="OrdenesCompra",
-            Item={
-                "orderId": {"S": order_id},
-                "status": {"S": "CREATED"},
-                "items": {"S": json.dumps(items)},
-                "origen": {"S": origen},
-                "createdAt": {"S": now_iso},
-                "updatedAt": {"S": now_iso}
-            },
-            ConditionExpression="attribute_not_exists(orderId)"
-        )
+        dynamodb.transact_write_items(TransactItems=[{"Put": {
+            "TableName": ORDERS_TABLE,
+            "Item": _order_item(order_id, items, origen, now_iso, trazas.trace_id(), prioridad),
+            "ConditionExpression": "attribute_not_exists(orderId)"
+        }}] + estados.alta(order_id, now_iso, origen))
     except ClientError as e:
         # Si ya existía, devolvemos error claro
-        if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+        reasons = e.response.get("CancellationReasons") or []
+        if reasons and (reasons[0] or {}).get("Code") == "ConditionalCheckFailed":
             return {"ok": False, "message": f"La orden {order_id} ya existe"}
         raise
 
@@ -58,7 +484,8 @@ def lambda_handler(event, context):
     put_event_orden_creada({
         "orderId": order_id,
         "items": items,
-        "origen": origen
+        "origen": origen,
+        "prioridad": prioridad
     })
 
     return {"ok": True, "orderId": order_id}
@@ -1,26 +1,27 @@
-import os, json, boto3
+import os, json
 from datetime import datetime
 from botocore.exceptions import ClientError
+from comun import aws, estados, eventos, idempotencia, trazas
+from comun.util import detail as _get_detail
 
-dynamo = boto3.resource('dynamodb')
-events = boto3.client('events')
+events = aws.client('events')
+ddb = aws.client('dynamodb')
 
-ORDERS_TABLE = "OrdenesCompra"
 EVENT_BUS    = "ventas-bus"
 EVENT_SRC    = "com.casacentral.procesos" #Notificaciones-OC
 
 ROL = "CasaCentral"
 
-table_ordenes = dynamo.Table(ORDERS_TABLE)
-
-def _get_detail(evt):
-    d = evt.get('detail', evt)
-    if isinstance(d, str):
-        try: d = json.loads(d)
-        except Exception: d = {}
-    return d
+def _aviso_pendiente(order_id):
+    item = ddb.get_item(TableName=estados.ORDERS_TABLE, Key={'orderId': {'S': order_id}},
+                        ProjectionExpression='avisoPendiente', ConsistentRead=True).get('Item') or {}
+    return item.get('avisoPendiente', {}).get('BOOL', False)
 
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_evento(__file__))
 def lambda_handler(event, context):
+    if eventos.fusionado(event, __file__):
+        return {'statusCode': 200, 'body': json.dumps({'info': 'ya procesado en proceso (fused)'})}
     try:
         detail = _get_detail(event)
         order_id = detail.get('orderId') or detail.get('id_orden')
@@ -29,35 +30,48 @@ def lambda_handler(event, context):
 
         now_iso = datetime.utcnow().isoformat()
 
-        # 1) status -> PENDING_APPROVAL
-        table_ordenes.update_item(
-            Key={'orderId': order_id},
-            UpdateExpression='SET #st=:st, updatedAt=:ts',
-            ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={':st': 'PENDING_APPROVAL', ':ts': now_iso},
-            ConditionExpression='attribute_exists(orderId)'
-        )
-
-        # 2) Evento con ROL hardcodeado + destinatarios
-        events.put_events(Entries=[{
-            'Source': EVENT_SRC,
-            'DetailType': 'OrdenPendienteAprobacion',
-            'Detail': json.dumps({
-                'orderId': order_id,
-                'ROL': ROL,                                   # <- aquí viaja el rol
-                'audienceRoles': ['COMPRAS_APROBADORES']      # destinatarios
-            }),
-            'EventBusName': EVENT_BUS
-        }])
-
-        return {'statusCode': 200, 'body': json.dumps({
-            'orderId': order_id, 'status': 'PENDING_APPROVAL', 'ROL': ROL
-        })}
+        # 1) status CREATED -> PENDING_APPROVAL (comun/estados.py). `avisoPendiente` queda en la
+        #    orden hasta que OrdenPendienteAprobacion sale: una reentrega de OrdenCreada con la
+        #    orden ya pendiente reemite el aviso sólo si quedó marcado (una vez por orden)
+        actual = estados.aplicar(order_id, estados.PENDING_APPROVAL, now_iso,
+                                 sets={'avisoPendiente': {'BOOL': True}}, por=ROL)
+        if actual == '':
+            return {'statusCode': 404, 'body': json.dumps({'error': f'Orden {order_id} no existe'})}
+        if actual == estados.PENDING_APPROVAL and not _aviso_pendiente(order_id):
+            return {'statusCode': 200, 'body': json.dumps({'info': 'ya estaba pendiente de aprobación'})}
+        if actual not in (None, estados.PENDING_APPROVAL):
+            return {'statusCode': 409, 'body': json.dumps({'error': f'Orden {order_id} en estado {actual}'})}
 
     except ClientError as e:
-        code = e.response.get('Error', {}).get('Code')
-        if code == 'ConditionalCheckFailedException':
-            return {'statusCode': 404, 'body': json.dumps({'error': f'Orden {order_id} no existe'})}
         return {'statusCode': 500, 'body': json.dumps({'error': f'AWS: {str(e)}'})}
     except Exception as e:
         return {'statusCode': 500, 'body': json.dumps({'error': f'Interno: {str(e)}'})}
+
+    # 2) Evento con ROL hardcodeado + destinatarios. Fuera del try: si no sale, la invocación
+    #    falla (reintento asíncrono / DLQ) y la reentrega lo reemite por `avisoPendiente`
+    pendiente = {
+        'orderId': order_id,
+        'ROL': ROL,                                   # <- aquí viaja el rol
+        'audienceRoles': ['COMPRAS_APROBADORES']      # destinatarios
+    }
+    if detail.get('prioridad'):
+        pendiente['prioridad'] = detail['prioridad']  # urgentes: aviso inmediato (sin digest)
+    resp = eventos.put_events(events, [{
+        'Source': EVENT_SRC,
+        'DetailType': 'OrdenPendienteAprobacion',
+        'Detail': json.dumps(pendiente),
+        'EventBusName': EVENT_BUS
+    }])
+    if resp.get('FailedEntryCount'):
+        raise RuntimeError(f"OrdenPendienteAprobacion de {order_id} rechazado: {json.dumps(resp.get('Entries'))}")
+    try:
+        ddb.update_item(TableName=estados.ORDERS_TABLE, Key={'orderId': {'S': order_id}},
+                        UpdateExpression='REMOVE avisoPendiente', ConditionExpression='attribute_exists(orderId)')
+    except ClientError as e:
+        # a lo sumo una reentrega vuelve a avisar
+        print("[AVISO] no se pudo bajar avisoPendiente", order_id, str(e))
+
+    return {'statusCode': 200, 'body': json.dumps({
+        'orderId': order_id, 'status': 'PENDING_APPROVAL', 'ROL': ROL,
+        **({'reemitido': True} if actual == estados.PENDING_APPROVAL else {})
+    })}
@@ -1,19 +1,75 @@
-import os, json, boto3
+import os, json, time, random
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from comun import aws, digest, eventos, idempotencia, plantillas, sucursales, trazas
+from comun.util import detail as _detail
 
-sns = boto3.client('sns')
+sns = aws.client('sns')
 
 SUCURSALES_TOPIC_ARN = os.environ.get('SUCURSALES_TOPIC_ARN', '').strip()
-APP_NAME = os.environ.get('APP_NAME', 'NBA')
 
-def _detail(evt):
-    d = evt.get('detail', evt)
-    if isinstance(d, str):
-        try: d = json.loads(d)
-        except Exception: d = {}
-    return d
+# publish_batch acepta hasta 10 entradas; los lotes se envían en paralelo (acotado)
+SNS_BATCH     = 10
+SNS_WORKERS   = int(os.environ.get('SNS_WORKERS', '4'))
+SNS_RETRIES   = int(os.environ.get('SNS_RETRIES', '3'))
+SNS_BACKOFF   = float(os.environ.get('SNS_BACKOFF', '0.1'))
+# sólo throttling y errores del servicio (5xx) mejoran reintentando; el resto (permisos,
+# topic inexistente, mensaje inválido) falla igual y sólo suma latencia
+RETRYABLE     = ('Throttling', 'ThrottlingException', 'ThrottledException', 'TooManyRequestsException',
+                 'RequestLimitExceeded', 'InternalError', 'InternalFailure', 'ServiceUnavailable')
+# publish_batch tiene un límite de 256KB por lote: el detalle por SKU se recorta
+# (a MAX_LINEAS_SKU líneas y a 1/10 del límite por mensaje)
+MAX_LINEAS_SKU = int(os.environ.get('MAX_LINEAS_SKU', '50'))
 
+def _ctx(suc, order_id, dispatched, unidades=None):
+    return {'sucursal': suc, 'orderId': order_id, 'despachada': dispatched, 'unidades': unidades}
+
+def _mensaje(suc, order_id, dispatched, unidades=None, skus=None):
+    return plantillas.mensaje('sucursal', _ctx(suc, order_id, dispatched, unidades), skus or None,
+                              rol='SUCURSALES', max_bytes=plantillas.SNS_MAX_BYTES // SNS_BATCH,
+                              max_lineas=MAX_LINEAS_SKU)
+
+def _reintentable(code, http_status=None):
+    return code in RETRYABLE or (http_status or 0) >= 500
+
+def _publicar_lote(lote):
+    """publish_batch de hasta 10 sucursales; reintenta sólo las fallidas por throttling / 5xx,
+    con backoff + jitter."""
+    resultado = [None] * len(lote)
+    pendientes = list(range(len(lote)))
+    for intento in range(SNS_RETRIES + 1):
+        if intento:
+            time.sleep(random.uniform(0, SNS_BACKOFF * (2 ** (intento - 1))))
+        try:
+            res = sns.publish_batch(TopicArn=SUCURSALES_TOPIC_ARN, PublishBatchRequestEntries=[
+                {'Id': str(i), 'Subject': lote[i][1][0], 'Message': lote[i][1][1]} for i in pendientes
+            ])
+        except ClientError as e:
+            for i in pendientes:
+                resultado[i] = {'sucursal': lote[i][0], 'error': str(e)}
+            if not _reintentable(e.response.get('Error', {}).get('Code'),
+                                 e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')):
+                break
+            continue
+        for ok in res.get('Successful', []):
+            i = int(ok['Id'])
+            resultado[i] = {'sucursal': lote[i][0], 'messageId': ok.get('MessageId')}
+        fallidas = []
+        for err in res.get('Failed', []):
+            i = int(err['Id'])
+            resultado[i] = {'sucursal': lote[i][0], 'error': f"{err.get('Code')}: {err.get('Message', '')}"}
+            if not err.get('SenderFault') or _reintentable(err.get('Code')):
+                fallidas.append(i)   # errores del cliente no se reintentan (salvo throttling)
+        pendientes = fallidas
+        if not pendientes:
+            break
+    return resultado
+
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_evento(__file__))
 def lambda_handler(event, context):
+    if eventos.fusionado(event, __file__):
+        return {'statusCode': 200, 'body': json.dumps({'info': 'ya procesado en proceso (fused)'})}
     if not SUCURSALES_TOPIC_ARN:
         return {'statusCode': 500, 'body': json.dumps({'error':'Falta SUCURSALES_TOPIC_ARN'})}
 
@@ -24,20 +80,37 @@ def lambda_handler(event, context):
     order_id    = det.get('orderId')
     sucursales  = det.get('sucursales') or []
     dispatched  = det.get('dispatchedAt', '')
+    unidades    = det.get('unidadesPorSucursal') or {}
+    reparto     = det.get('asignacion') or {}
 
-    enviados = []
-    for suc in sucursales:
-        subject = f"[{APP_NAME}] {suc}: Despacho confirmado – OC {order_id}"
-        msg = (
-            f"Hola {suc},\n\n"
-            f"Se confirmó el despacho de la Orden de Compra {order_id}.\n"
-            f"Fecha/Hora: {dispatched}\n\n"
-            f"Este es un aviso automático."
-        )
+    # modo digest: un consolidado por sucursal (destino SUCURSAL#<suc>), sin el detalle por SKU
+    if digest.activo('SUCURSALES', digest.urgente(det)):
+        pendientes = [digest.entrada(f"SUCURSAL#{suc}", SUCURSALES_TOPIC_ARN, order_id,
+                                     plantillas.resumen('sucursal', _ctx(suc, order_id, dispatched, unidades.get(suc)),
+                                                        rol='SUCURSALES'),
+                                     f"{suc}: despachos confirmados", rol='SUCURSALES')
+                      for suc in sucursales]
         try:
-            res = sns.publish(TopicArn=SUCURSALES_TOPIC_ARN, Subject=subject, Message=msg)
-            enviados.append({'sucursal': suc, 'messageId': res.get('MessageId')})
+            digest.encolar(pendientes)
         except ClientError as e:
-            enviados.append({'sucursal': suc, 'error': str(e)})
+            return {'statusCode': 500, 'body': json.dumps({'error': f'Digest: {str(e)}'})}
+        return {'statusCode': 200, 'body': json.dumps({'queuedForDigest': sucursales})}
+
+    if not reparto and det.get('asignacionRef'):
+        # despacho grande: el detalle por SKU está en AsignacionesEnvio; sin él, sólo totales
+        try:
+            reparto = sucursales.leer_asignacion(det.get('envioId') or order_id, det['asignacionRef'])
+        except Exception as e:
+            print("[SUCURSALES] sin detalle de la asignación de", order_id, repr(e))
+    entradas = [(suc, _mensaje(suc, order_id, dispatched, unidades.get(suc), reparto.get(suc)))
+                for suc in sucursales]
+    lotes = [entradas[i:i + SNS_BATCH] for i in range(0, len(entradas), SNS_BATCH)]
+    if len(lotes) <= 1:
+        resultados = [_publicar_lote(l) for l in lotes]   # caso común: sin costo de crear el pool
+    else:
+        with ThreadPoolExecutor(max_workers=min(SNS_WORKERS, len(lotes))) as pool:
+            resultados = list(pool.map(trazas.propagar(_publicar_lote), lotes))
 
+    # mismo orden y forma que antes: un resultado por sucursal
+    enviados = [r for lote in resultados for r in lote]
     return {'statusCode': 200, 'body': json.dumps({'sent': enviados})}
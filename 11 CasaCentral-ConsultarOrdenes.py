@@ -0,0 +1,156 @@
+import os, json, base64, time, random
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from comun.items import parse_items
+from comun import aws, estados, trazas
+
+ddb = aws.client('dynamodb')
+
+ORDERS_TABLE = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
+STATUS_INDEX = os.environ.get('STATUS_INDEX', 'status-updatedAt-index')   # PK status, SK updatedAt
+
+STATUSES      = estados.ESTADOS
+DEFAULT_LIMIT = int(os.environ.get('QUERY_DEFAULT_LIMIT', '50'))
+MAX_LIMIT     = int(os.environ.get('QUERY_MAX_LIMIT', '200'))
+BATCH_GET_MAX = 100
+
+# Atributos proyectados en el GSI (INCLUDE); `items` sólo si se pide con fields=items
+BASE_FIELDS = ('orderId', 'status', 'origen', 'createdAt', 'updatedAt')
+
+def _json(body, code=200):
+    return {'statusCode': code, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body, default=str)}
+
+def _plain(av):
+    (t, v), = av.items()
+    if t == 'N':
+        return float(v) if '.' in v else int(v)
+    if t == 'L':
+        return [_plain(x) for x in v]
+    if t == 'M':
+        return {k: _plain(x) for k, x in v.items()}
+    return v
+
+def _encode_cursor(lek):
+    return base64.urlsafe_b64encode(json.dumps(lek, separators=(',', ':')).encode()).decode() if lek else None
+
+def _decode_cursor(cursor):
+    lek = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(lek, dict) or 'orderId' not in lek:
+        raise ValueError('cursor inválido')
+    return lek
+
+def _items_for(order_ids):
+    """`items` de la tabla base vía BatchGetItem (100 claves por llamada, reintenta UnprocessedKeys)."""
+    out = {}
+    for i in range(0, len(order_ids), BATCH_GET_MAX):
+        request = {ORDERS_TABLE: {
+            'Keys': [{'orderId': {'S': oid}} for oid in order_ids[i:i + BATCH_GET_MAX]],
+            'ProjectionExpression': 'orderId, #it',
+            'ExpressionAttributeNames': {'#it': 'items'}
+        }}
+        intento = 0
+        while request:
+            resp = ddb.batch_get_item(RequestItems=request)
+            for row in resp.get('Responses', {}).get(ORDERS_TABLE, []):
+                raw = row.get('items') or {}
+                campo = raw.get('S') if 'S' in raw else raw.get('B')
+                out[row['orderId']['S']] = list(parse_items(campo))
+            request = resp.get('UnprocessedKeys') or None
+            if request:
+                time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+                intento += 1
+    return out
+
+def _params(event):
+    qp = event.get('queryStringParameters') or {}
+    status = (qp.get('status') or '').strip().upper()
+    if status not in STATUSES:
+        raise ValueError(f"status requerido, uno de: {', '.join(STATUSES)}")
+    limit = int(qp.get('limit') or DEFAULT_LIMIT)
+    if limit < 1:
+        raise ValueError('limit debe ser >= 1')
+    until = qp.get('until')
+    if qp.get('olderThanMinutes'):
+        until = (datetime.utcnow() - timedelta(minutes=float(qp['olderThanMinutes']))).isoformat()
+    fields = {f.strip() for f in (qp.get('fields') or '').split(',') if f.strip()}
+    return {
+        'status': status,
+        'since': qp.get('since'),
+        'until': until,
+        'limit': min(limit, MAX_LIMIT),
+        'cursor': _decode_cursor(qp['cursor']) if qp.get('cursor') else None,
+        'desc': (qp.get('order') or '').lower() == 'desc',
+        'withItems': 'items' in fields,
+    }
+
+def _orden(order_id, historial=False):
+    """Orden completa (con todos los items): destino del link de los avisos recortados.
+    Con historial=1 suma el replay de sus transiciones (comun/estados.py)."""
+    try:
+        row = ddb.get_item(TableName=ORDERS_TABLE, Key={'orderId': {'S': order_id}}).get('Item')
+        vida = estados.replay(order_id) if row and historial else None
+    except ClientError as e:
+        return _json({'error': f'DynamoDB: {str(e)}'}, 500)
+    if not row:
+        return _json({'error': f'Orden {order_id} no encontrada'}, 404)
+    raw = row.pop('items', None) or {}
+    orden = {k: _plain(v) for k, v in row.items() if 'B' not in v}
+    orden['items'] = list(parse_items(raw.get('S') if 'S' in raw else raw.get('B')))
+    if historial:
+        orden['historial'] = vida
+    return _json(orden)
+
+@trazas.instrumentar(__file__)
+def lambda_handler(event, context):
+    qp = (event or {}).get('queryStringParameters') or {}
+    if qp.get('orderId'):
+        return _orden(qp['orderId'].strip(), (qp.get('historial') or '').lower() in ('1', 'true', 'si', 'sí'))
+    try:
+        p = _params(event)
+    except (ValueError, TypeError) as e:
+        return _json({'error': str(e)}, 400)
+
+    # Rango sobre la sort key del GSI: updatedAt (ISO-8601 ordena como string)
+    names = {'#st': 'status'}
+    values = {':st': {'S': p['status']}}
+    cond = '#st = :st'
+    if p['since'] and p['until']:
+        cond += ' AND updatedAt BETWEEN :since AND :until'
+        values.update({':since': {'S': p['since']}, ':until': {'S': p['until']}})
+    elif p['since']:
+        cond += ' AND updatedAt >= :since'
+        values[':since'] = {'S': p['since']}
+    elif p['until']:
+        cond += ' AND updatedAt <= :until'
+        values[':until'] = {'S': p['until']}
+
+    names.update({f"#f{i}": f for i, f in enumerate(BASE_FIELDS)})
+    kwargs = {
+        'TableName': ORDERS_TABLE,
+        'IndexName': STATUS_INDEX,
+        'KeyConditionExpression': cond,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values,
+        'ProjectionExpression': ', '.join(f"#f{i}" for i in range(len(BASE_FIELDS))),
+        'ScanIndexForward': not p['desc'],
+        'Limit': p['limit'],
+    }
+    if p['cursor']:
+        kwargs['ExclusiveStartKey'] = p['cursor']
+
+    try:
+        resp = ddb.query(**kwargs)
+        rows = [{k: _plain(v) for k, v in it.items()} for it in resp.get('Items', [])]
+        if p['withItems'] and rows:
+            items = _items_for([r['orderId'] for r in rows])
+            for r in rows:
+                r['items'] = items.get(r['orderId'], [])
+    except ClientError as e:
+        return _json({'error': f'DynamoDB: {str(e)}'}, 500)
+
+    return _json({
+        'status': p['status'],
+        'count': len(rows),
+        'items': rows,
+        'nextCursor': _encode_cursor(resp.get('LastEvaluatedKey')),
+    })
@@ -0,0 +1,141 @@
+import os, json, time, random
+from datetime import datetime
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from comun.ordenes import snapshot_for_event
+from comun import aws, estados, eventos, idempotencia, ordenes, trazas
+
+ev = aws.client('events')
+
+EVENT_BUS    = os.environ.get('EVENT_BUS', 'ventas-bus')
+EVENT_SOURCE = os.environ.get('EVENT_SOURCE', 'com.casacentral.aprobaciones')
+
+# Decisiones en paralelo acotado; OrdenAprobada en lotes de 10 por put_events
+BULK_MAX_ENTRIES = int(os.environ.get('BULK_MAX_ENTRIES', '500'))
+DECISION_WORKERS = int(os.environ.get('DECISION_WORKERS', '16'))
+EVENTS_CHUNK     = 10
+MAX_RETRIES      = int(os.environ.get('BULK_MAX_RETRIES', '5'))
+RETRYABLE        = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'TransactionCanceledException')
+
+DECISIONES = {'approve': 'APPROVED', 'aprobar': 'APPROVED', 'reject': 'REJECTED', 'rechazar': 'REJECTED'}
+
+def _json(body, code=200):
+    return {'statusCode': code, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body, default=str)}
+
+def _entries(evt):
+    body = evt.get('body')
+    if isinstance(body, str):
+        try: body = json.loads(body)
+        except Exception: body = None
+    if isinstance(body, dict):
+        body = body.get('decisions') or body.get('orders')
+    return body if isinstance(body, list) else None
+
+def _clave_bulk(evt):
+    headers = {k.lower(): v for k, v in (evt.get('headers') or {}).items()}
+    key = headers.get('idempotency-key')
+    return f"BULK_DECISION#{key}" if key else None
+
+def _decidir(entry, now):
+    """Misma transición que AprobarOrden / RechazarOrden (PENDING_APPROVAL → ..., comun/estados.py)."""
+    order_id, status, reason = entry['orderId'], entry['target'], entry.get('reason')
+    sets = {'rejectionReason': {'S': str(reason)}} if status == estados.REJECTED and reason else None
+    intento = 0
+    while True:
+        try:
+            actual = estados.aplicar(order_id, status, now, sets=sets, por='CasaCentral')
+            break
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in RETRYABLE and intento < MAX_RETRIES:
+                time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+                intento += 1
+                continue
+            return {'orderId': order_id, 'status': 'failed', 'message': f'DynamoDB: {str(e)}'}, None
+    if actual is not None and not (intento and actual == status):   # un reintento puede encontrar la propia transición
+        return {'orderId': order_id, 'status': 'conflict',
+                'message': f"Estado inválido o no existe (estado actual: {actual or '-'}; se esperaba PENDING_APPROVAL)"}, None
+    if status != estados.APPROVED:
+        return {'orderId': order_id, 'status': status}, None
+    # snapshot para OrdenAprobada: la transacción no devuelve la orden (items/origen no cambian)
+    try:
+        ordenes.invalidate(order_id)
+        orden = ordenes.get_order(order_id)
+    except ClientError:
+        orden = None   # el evento va sin snapshot y los consumidores leen la orden
+    return {'orderId': order_id, 'status': status}, orden and dict(orden, status=status, approvedAt=now, updatedAt=now)
+
+def _evento_aprobada(order_id, now, attrs):
+    detail = {'orderId': order_id, 'approvedAt': now, 'updatedAt': now}
+    if (attrs or {}).get('traceId'):
+        detail['traceId'] = attrs['traceId']   # bulk: cada orden sigue su propia traza
+    snapshot = snapshot_for_event(attrs)
+    if snapshot:
+        detail['order'] = snapshot
+    return {'Source': EVENT_SOURCE, 'DetailType': 'OrdenAprobada',
+            'Detail': json.dumps(detail, default=str), 'EventBusName': EVENT_BUS}
+
+def _publicar(aprobadas, now, results):
+    for i in range(0, len(aprobadas), EVENTS_CHUNK):
+        lote = aprobadas[i:i + EVENTS_CHUNK]
+        intento = 0
+        while lote:
+            try:
+                resp = eventos.put_events(ev, [_evento_aprobada(r['orderId'], now, attrs) for r, attrs in lote])
+            except ClientError as e:
+                resp = {'FailedEntryCount': len(lote), 'Entries': [{'ErrorCode': 'ClientError', 'ErrorMessage': str(e)}] * len(lote)}
+            if not resp.get('FailedEntryCount'):
+                break
+            fallidas = [(x, r) for x, r in zip(lote, resp.get('Entries', [])) if r.get('ErrorCode')]
+            if intento >= MAX_RETRIES:
+                for (r, _), err in fallidas:
+                    r['eventError'] = err.get('ErrorMessage') or err.get('ErrorCode')
+                break
+            time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+            intento += 1
+            lote = [x for x, _ in fallidas]
+
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(_clave_bulk)
+def lambda_handler(event, context):
+    entries = _entries(event)
+    if entries is None:
+        return _json({'error': 'body debe ser una lista de {orderId, decision, reason}'}, 400)
+    if len(entries) > BULK_MAX_ENTRIES:
+        return _json({'error': f'máximo {BULK_MAX_ENTRIES} decisiones por request'}, 400)
+
+    now = datetime.utcnow().isoformat()
+    results = [None] * len(entries)
+    validas, vistos = [], set()
+
+    # 1) Validar (decisión conocida, orderId texto no vacío y no repetido)
+    for idx, e in enumerate(entries):
+        e = e if isinstance(e, dict) else {}
+        order_id = e.get('orderId')
+        target = DECISIONES.get(str(e.get('decision') or '').strip().lower())
+        if not isinstance(order_id, str) or not order_id.strip() or not target:
+            results[idx] = {'orderId': order_id, 'status': 'invalid',
+                            'message': 'orderId (texto no vacío) y decision (approve|reject) requeridos'}
+        elif order_id in vistos:
+            results[idx] = {'orderId': order_id, 'status': 'duplicate', 'message': 'orderId repetido en el request'}
+        else:
+            vistos.add(order_id)
+            validas.append((idx, {'orderId': order_id, 'target': target, 'reason': e.get('reason')}))
+
+    # 2) Transiciones condicionales en paralelo acotado
+    aprobadas = []
+    if validas:
+        with ThreadPoolExecutor(max_workers=min(DECISION_WORKERS, len(validas))) as pool:
+            hechos = list(pool.map(trazas.propagar(lambda v: _decidir(v[1], now)), validas))
+        for (idx, _), (res, attrs) in zip(validas, hechos):
+            results[idx] = res
+            if res['status'] == 'APPROVED':
+                aprobadas.append((res, attrs))
+
+    # 3) OrdenAprobada en lotes de 10
+    _publicar(aprobadas, now, results)
+
+    resumen = {}
+    for r in results:
+        resumen[r['status']] = resumen.get(r['status'], 0) + 1
+    return _json({'summary': resumen, 'results': results})
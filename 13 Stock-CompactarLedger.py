@@ -0,0 +1,68 @@
+import os, json
+from datetime import datetime
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from comun import aws, ledger, stock, trazas
+
+ddb = aws.client('dynamodb')
+
+STOCK_TABLE = os.environ.get('STOCK_TABLE', 'StockGlobal')
+
+# Regla programada (rate(1 hour)): un snapshot por item de StockGlobal con los
+# movimientos del ledger anteriores a ahora − COMPACT_LAG_S. Las claves salen de un
+# Scan paralelo de StockGlobal (incluye los shards `sku#i`); un item sin movimientos
+# nuevos cuesta un Query y no escribe nada. Se puede forzar con {"skus": [...], "hasta": "..."}.
+# Al activar el ledger sobre stock existente, correr una vez con {"apertura": true}:
+# guarda el saldo previo de cada item como snapshot inicial.
+COMPACT_SEGMENTS = int(os.environ.get('COMPACT_SEGMENTS', '4'))
+COMPACT_WORKERS  = int(os.environ.get('COMPACT_WORKERS', '16'))
+
+def _claves_segmento(segmento):
+    claves, kw = [], {'TableName': STOCK_TABLE, 'ProjectionExpression': 'sku',
+                      'Segment': segmento, 'TotalSegments': COMPACT_SEGMENTS}
+    while True:
+        resp = ddb.scan(**kw)
+        claves += [it['sku']['S'] for it in resp.get('Items', [])]
+        if 'LastEvaluatedKey' not in resp:
+            return claves
+        kw['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+def _claves(event):
+    skus = (event or {}).get('skus') if isinstance(event, dict) else None
+    if skus:
+        return [key for sku in skus for key in stock.shard_keys(str(sku))]
+    with ThreadPoolExecutor(max_workers=COMPACT_SEGMENTS) as pool:
+        return [k for seg in pool.map(trazas.propagar(_claves_segmento), range(COMPACT_SEGMENTS)) for k in seg]
+
+@trazas.instrumentar(__file__)
+def lambda_handler(event, context):
+    hasta = (event or {}).get('hasta') if isinstance(event, dict) else None
+    hasta = hasta or ledger.corte(datetime.utcnow())
+
+    # 1) Items a compactar
+    try:
+        claves = _claves(event)
+    except ClientError as e:
+        print("[COMPACT] error listando StockGlobal:", str(e))
+        return {'ok': False, 'error': str(e)}
+
+    # 2) Snapshot por item (idempotente: re-correr con el mismo `hasta` no duplica)
+    abrir = isinstance(event, dict) and bool(event.get('apertura'))
+    def compactar(key):
+        try:
+            return key, (int(ledger.apertura(key)) if abrir else ledger.compactar(key, hasta)), None
+        except (ClientError, RuntimeError) as e:
+            return key, 0, str(e)
+    with ThreadPoolExecutor(max_workers=COMPACT_WORKERS) as pool:
+        resultados = list(pool.map(trazas.propagar(compactar), claves))
+
+    errores = {k: err for k, _, err in resultados if err}
+    resumen = {
+        'ok': not errores, 'hasta': hasta, 'items': len(claves),
+        'snapshots': sum(1 for _, n, _ in resultados if n),
+        'movimientos': sum(n for _, n, _ in resultados),
+    }
+    if errores:
+        resumen['errores'] = dict(list(errores.items())[:20])
+    print("[COMPACT]", json.dumps(resumen))
+    return resumen
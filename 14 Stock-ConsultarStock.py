@@ -0,0 +1,213 @@
+import os, json, zlib, base64
+from datetime import datetime
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from comun import aws, ordenes, stock, trazas
+from comun.items import parse_items
+from comun.util import detail as _detail
+
+ddb = aws.client('dynamodb')
+
+STOCK_TABLE = os.environ.get('STOCK_TABLE', 'StockGlobal')
+VISTA_TABLE = os.environ.get('STOCK_VIEW_TABLE', 'StockDisponible')   # PK sku
+VISTA_INDEX = os.environ.get('STOCK_VIEW_INDEX', 'vista-sku-index')   # PK vista (= 'STOCK#<n>'), SK sku: prefijos
+BAJO_INDEX  = os.environ.get('STOCK_LOW_INDEX',  'bajo-sku-index')    # PK bajo (= 'LOW#<n>', sparse), SK sku
+# Las PK de los GSI van repartidas en VISTA_SHARDS particiones (n = crc32(sku) % VISTA_SHARDS):
+# con un valor fijo todas las escrituras de la vista caían en una sola partición del índice.
+# Las consultas leen todas las particiones en paralelo y mezclan por sku.
+VISTA_SHARDS = int(os.environ.get('STOCK_VIEW_SHARDS', '8'))
+
+# GET /stock?sku=A,B | ?prefix=SKU-00 | ?lowStock=1
+#   - sku / prefix: qty de StockGlobal (suma de shards, BatchGetItem de a 100 claves) con
+#     cache por contenedor de STOCK_CACHE_TTL segundos
+#   - prefix / lowStock: la lista de SKUs sale de la vista StockDisponible (sin Scan)
+# La misma Lambda consume RecepcionRecibida / DespachoConfirmado y refresca en la vista las
+# filas de los SKUs tocados (qty y marca de stock bajo). El cache es por contenedor: el que
+# procesa el evento descarta esos SKUs, los demás los ven al vencer STOCK_CACHE_TTL.
+STOCK_CACHE_TTL     = float(os.environ.get('STOCK_CACHE_TTL', '30'))
+LOW_STOCK_THRESHOLD = Decimal(os.environ.get('LOW_STOCK_THRESHOLD', '10'))
+MAX_SKUS            = int(os.environ.get('STOCK_QUERY_MAX_SKUS', '500'))
+DEFAULT_LIMIT       = int(os.environ.get('QUERY_DEFAULT_LIMIT', '50'))
+MAX_LIMIT           = int(os.environ.get('QUERY_MAX_LIMIT', '200'))
+VISTA_WORKERS       = int(os.environ.get('STOCK_VIEW_WORKERS', '8'))
+
+def _json(body, code=200):
+    return {'statusCode': code, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps(body, default=str)}
+
+def _encode_cursor(lek):
+    return base64.urlsafe_b64encode(json.dumps(lek, separators=(',', ':')).encode()).decode() if lek else None
+
+def _decode_cursor(cursor):
+    """{partición: LastEvaluatedKey | {} (desde el principio) | None (terminada)}."""
+    try:
+        pos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('cursor inválido')
+    if not isinstance(pos, dict) or not all(v is None or isinstance(v, dict) for v in pos.values()):
+        raise ValueError('cursor inválido')
+    return pos
+
+def _limit(qp):
+    limit = int(qp.get('limit') or DEFAULT_LIMIT)
+    if limit < 1:
+        raise ValueError('limit debe ser >= 1')
+    return min(limit, MAX_LIMIT)
+
+def _num(d):
+    return int(d) if d == d.to_integral_value() else float(d)
+
+def _filas(qtys):
+    return [{'sku': sku, 'qty': _num(qty), 'lowStock': qty <= LOW_STOCK_THRESHOLD} for sku, qty in qtys.items()]
+
+def _claves_stock():
+    """SKUs de StockGlobal (los shards `sku#i` cuentan como su SKU)."""
+    claves, kw = set(), {'TableName': STOCK_TABLE, 'ProjectionExpression': 'sku'}
+    while True:
+        resp = ddb.scan(**kw)
+        claves.update(it['sku']['S'].split('#', 1)[0] for it in resp.get('Items', []))
+        if 'LastEvaluatedKey' not in resp:
+            return sorted(claves)
+        kw['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+# ----------------------------------------------------------------------------
+# Vista materializada (StockDisponible)
+# ----------------------------------------------------------------------------
+
+def _particion(sku):
+    return zlib.crc32(sku.encode()) % VISTA_SHARDS
+
+def _vista_set(sku, qty, leido):
+    # leidoEn evita que un refresco más viejo pise a uno más nuevo (eventos fuera de orden)
+    n = _particion(sku)
+    expr = 'SET qty = :q, leidoEn = :l, vista = :v'
+    values = {':q': {'N': str(qty)}, ':l': {'S': leido}, ':v': {'S': f"STOCK#{n}"}}
+    if qty <= LOW_STOCK_THRESHOLD:
+        expr += ', bajo = :b'
+        values[':b'] = {'S': f"LOW#{n}"}
+    else:
+        expr += ' REMOVE bajo'
+    try:
+        ddb.update_item(TableName=VISTA_TABLE, Key={'sku': {'S': sku}}, UpdateExpression=expr,
+                        ConditionExpression='attribute_not_exists(leidoEn) OR leidoEn <= :l',
+                        ExpressionAttributeValues=values)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+
+_pool_vista = None
+
+def _pool():
+    # un pool por contenedor (escrituras de la vista y lecturas por partición): los eventos traen
+    # pocos SKUs y crear hilos costaba más que los UpdateItem
+    global _pool_vista
+    if _pool_vista is None:
+        _pool_vista = ThreadPoolExecutor(max_workers=VISTA_WORKERS)
+    return _pool_vista
+
+def refrescar(skus):
+    """Relee los SKUs de StockGlobal (consistente) y actualiza sus filas en la vista."""
+    leido = datetime.utcnow().isoformat()
+    totales = {sku: sum(por_shard.values(), Decimal(0)) for sku, por_shard in stock.leer_shards(skus).items()}
+    list(_pool().map(trazas.propagar(lambda kv: _vista_set(kv[0], kv[1], leido)), totales.items()))
+    return totales
+
+def _skus_del_evento(det):
+    if det.get('skus') is not None:
+        return det['skus']
+    orden = ordenes.get_order(det.get('orderId')) if det.get('orderId') else None
+    items = parse_items((orden or {}).get('items'))
+    return sorted({str(it.get('sku') or '').strip() for it in items if isinstance(it, dict)} - {''})
+
+def _consultar_vista(index, atributo, valor, qp, prefijo=None):
+    """Query al GSI en sus VISTA_SHARDS particiones (`<valor>#<n>`) en paralelo; devuelve las
+    primeras `limit` filas por sku y un cursor con dónde quedó cada partición."""
+    limit = _limit(qp)
+    desde = _decode_cursor(qp['cursor']) if qp.get('cursor') else {str(n): {} for n in range(VISTA_SHARDS)}
+    cond = '#a = :v' + (' AND begins_with(sku, :p)' if prefijo else '')
+
+    def leer(n):
+        inicio = desde.get(str(n))
+        if inicio is None:   # partición terminada en una página anterior
+            return n, [], None
+        values = {':v': {'S': f"{valor}#{n}"}}
+        if prefijo:
+            values[':p'] = {'S': prefijo}
+        kwargs = {'TableName': VISTA_TABLE, 'IndexName': index, 'KeyConditionExpression': cond,
+                  'ExpressionAttributeNames': {'#a': atributo}, 'ExpressionAttributeValues': values,
+                  'Limit': limit}
+        if inicio:
+            kwargs['ExclusiveStartKey'] = inicio
+        resp = ddb.query(**kwargs)
+        return n, resp.get('Items', []), resp.get('LastEvaluatedKey')
+
+    leidas = list(_pool().map(trazas.propagar(leer), range(VISTA_SHARDS)))
+    filas = sorted(((it['sku']['S'], n, it) for n, items, _ in leidas for it in items),
+                   key=lambda t: t[0])[:limit]
+    ultima = {n: it for _, n, it in filas}   # última fila devuelta de cada partición
+    cursor = {}
+    for n, items, lek in leidas:
+        if n in ultima:
+            # devolvió todo lo que leyó y no hay más: terminada; si no, sigue después de la última
+            fin = ultima[n] is items[-1] and not lek
+            cursor[str(n)] = None if fin else {'sku': ultima[n]['sku'], atributo: ultima[n][atributo]}
+        elif items or lek:
+            cursor[str(n)] = desde.get(str(n))   # no entró ninguna: se relee desde el mismo lugar
+        else:
+            cursor[str(n)] = None
+    pendiente = any(v is not None for v in cursor.values())
+    return [it for _, _, it in filas], (_encode_cursor(cursor) if pendiente else None)
+
+# ----------------------------------------------------------------------------
+# Handler
+# ----------------------------------------------------------------------------
+
+def _on_event(event):
+    det = _detail(event)
+    skus = [s for s in _skus_del_evento(det) if s]
+    stock.invalidar(skus)   # sólo en este contenedor; el resto, al vencer STOCK_CACHE_TTL
+    totales = refrescar(skus) if skus else {}
+    bajos = [sku for sku, qty in totales.items() if qty <= LOW_STOCK_THRESHOLD]
+    print("[VISTA]", json.dumps({'orderId': det.get('orderId'), 'skus': len(skus), 'lowStock': bajos[:20]}))
+    return {'ok': True, 'refreshed': len(totales), 'lowStock': len(bajos)}
+
+@trazas.instrumentar(__file__)
+def lambda_handler(event, context):
+    event = event or {}
+    if event.get('detail-type') in ('RecepcionRecibida', 'DespachoConfirmado'):
+        return _on_event(event)
+    if event.get('reconstruir'):
+        # backfill de la vista desde StockGlobal
+        return {'ok': True, 'refreshed': len(refrescar(_claves_stock()))}
+
+    qp = event.get('queryStringParameters') or {}
+    try:
+        # 1) Stock bajo: precomputado en la vista (índice sparse)
+        if (qp.get('lowStock') or '').lower() in ('1', 'true', 'si', 'sí'):
+            rows, cursor = _consultar_vista(BAJO_INDEX, 'bajo', 'LOW', qp)
+            items = [{'sku': r['sku']['S'], 'qty': _num(Decimal(r['qty']['N'])), 'lowStock': True,
+                      'asOf': r.get('leidoEn', {}).get('S')} for r in rows]
+            return _json({'threshold': _num(LOW_STOCK_THRESHOLD), 'count': len(items), 'items': items, 'nextCursor': cursor})
+
+        # 2) Prefijo: SKUs de la vista, qty actual de StockGlobal
+        if qp.get('prefix'):
+            rows, cursor = _consultar_vista(VISTA_INDEX, 'vista', 'STOCK', qp, prefijo=qp['prefix'])
+            qtys = stock.disponible([r['sku']['S'] for r in rows], STOCK_CACHE_TTL)
+            return _json({'prefix': qp['prefix'], 'count': len(qtys), 'items': _filas(qtys), 'nextCursor': cursor})
+
+        # 3) Uno o varios SKUs
+        skus = list(dict.fromkeys(s.strip() for s in (qp.get('sku') or qp.get('skus') or '').split(',') if s.strip()))
+        if not skus:
+            raise ValueError('sku, prefix o lowStock requerido')
+        if len(skus) > MAX_SKUS:
+            raise ValueError(f'máximo {MAX_SKUS} SKUs por consulta')
+    except (ValueError, TypeError) as e:
+        return _json({'error': str(e)}, 400)
+    except ClientError as e:
+        return _json({'error': f'DynamoDB: {str(e)}'}, 500)
+
+    try:
+        qtys = stock.disponible(skus, STOCK_CACHE_TTL)
+    except ClientError as e:
+        return _json({'error': f'DynamoDB: {str(e)}'}, 500)
+    return _json({'count': len(qtys), 'items': _filas(qtys)})
@@ -0,0 +1,45 @@
+import os, json
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from comun import digest, trazas
+
+# Regla programada (rate(15 minutes)): envía el consolidado de cada destino con avisos
+# pendientes en NotificacionesPendientes (ver comun/digest.py). Los destinos que llegan a
+# DIGEST_MAX_PENDING ya se envían solos al encolar; esto cubre el resto.
+# Se puede forzar un destino con {"destinos": ["COMPRAS_APROBADORES", "SUCURSAL#S1"]}.
+DIGEST_WORKERS = int(os.environ.get('DIGEST_WORKERS', '4'))
+
+def _enviar(destino):
+    try:
+        return destino, digest.flush(destino), None
+    except ClientError as e:
+        return destino, None, str(e)
+
+@trazas.instrumentar(__file__)
+def lambda_handler(event, context):
+    # 1) Destinos a enviar
+    destinos = (event or {}).get('destinos') if isinstance(event, dict) else None
+    try:
+        destinos = destinos or digest.destinos_pendientes()
+    except ClientError as e:
+        print("[DIGEST] error listando pendientes:", str(e))
+        return {'ok': False, 'error': str(e)}
+    if not destinos:
+        return {'ok': True, 'destinos': 0, 'avisos': 0, 'mensajes': 0}
+
+    # 2) Un consolidado por destino (el lock de cada destino evita envíos dobles)
+    with ThreadPoolExecutor(max_workers=min(DIGEST_WORKERS, len(destinos))) as pool:
+        resultados = list(pool.map(trazas.propagar(_enviar), destinos))
+
+    errores = {d: err for d, _, err in resultados if err}
+    enviados = [r for _, r, _ in resultados if r]
+    resumen = {
+        'ok': not errores, 'destinos': len(destinos),
+        'avisos': sum(r['avisos'] for r in enviados),
+        'mensajes': sum(len(r['mensajes']) for r in enviados),
+        'enCurso': [d for d, r, err in resultados if r is None and not err],
+    }
+    if errores:
+        resumen['errores'] = errores
+    print("[DIGEST]", json.dumps(resumen))
+    return resumen
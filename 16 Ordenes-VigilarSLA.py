@@ -0,0 +1,174 @@
+import os, json, time, random
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from comun import aws, digest, eventos, plantillas, sla, trazas
+
+ddb = aws.client('dynamodb')
+ev = aws.client('events')
+sns = aws.client('sns')
+
+ORDERS_TABLE = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
+STATUS_INDEX = os.environ.get('STATUS_INDEX', 'status-updatedAt-index')   # PK status, SK updatedAt
+EVENT_BUS    = os.environ.get('EVENT_BUS', 'ventas-bus')
+SLA_TABLE    = os.environ.get('SLA_TABLE', 'VigilanciaSLA')               # PK ventana = '<status>#<nivel>'
+
+# Regla programada (rate(5 minutes)): detecta órdenes trabadas en PENDING_APPROVAL, APPROVED
+# o RECEIVED (umbrales por nivel en comun/sla.py) y reenvía el link de la acción pendiente por
+# el camino de siempre: publica el DetailType que consume cada Notificaciones-* con
+# source SLA_SOURCE y `recordatorio` en el detail.
+#
+# Sin Scan de OrdenesCompra: por cada (estado, nivel) se consulta el GSI status-updatedAt-index
+# en la ventana de updatedAt que cruzó el umbral desde la corrida anterior
+#   (hasta anterior, ahora − umbral]
+# así cada orden se lee una vez por nivel, no en cada corrida. La ventana se recorre en páginas
+# de SLA_PAGE_SIZE y el cursor se guarda en VigilanciaSLA después de cada página: si la corrida
+# se queda sin tiempo (backlog grande, primera corrida) la siguiente sigue desde ahí.
+# Se puede forzar con {"status": ["RECEIVED"], "ahora": "<ISO>"}.
+SLA_PAGE_SIZE     = int(os.environ.get('SLA_PAGE_SIZE', '500'))
+SLA_MAX_PAGES     = int(os.environ.get('SLA_MAX_PAGES', '200'))     # por ventana y corrida
+SLA_LOOKBACK_DAYS = int(os.environ.get('SLA_LOOKBACK_DAYS', '30'))  # primera corrida de cada ventana
+SLA_WORKERS       = int(os.environ.get('SLA_WORKERS', '8'))
+SLA_MARGIN_MS     = int(os.environ.get('SLA_MARGIN_MS', '20000'))   # no empezar una página con menos de esto
+SLA_ESCALATION_TOPIC_ARN = os.environ.get('SLA_ESCALATION_TOPIC_ARN', '').strip()
+EVENTS_CHUNK = 10
+MAX_RETRIES  = int(os.environ.get('SLA_MAX_RETRIES', '5'))
+
+_FIN = '~'   # '<ts>~' ordena después de '<ts>': la ventana siguiente no repite el borde
+
+# ----------------------------------------------------------------------------
+# Estado de cada ventana (VigilanciaSLA)
+# ----------------------------------------------------------------------------
+
+def _estado(ventana):
+    item = ddb.get_item(TableName=SLA_TABLE, Key={'ventana': {'S': ventana}}, ConsistentRead=True).get('Item')
+    if not item:
+        return None
+    return {'desde': item['desde']['S'], 'hasta': item['hasta']['S'],
+            'cursor': json.loads(item['cursor']['S']) if 'cursor' in item else None}
+
+def _guardar(ventana, desde, hasta, cursor, ahora):
+    item = {'ventana': {'S': ventana}, 'desde': {'S': desde}, 'hasta': {'S': hasta}, 'corrida': {'S': ahora}}
+    if cursor:
+        item['cursor'] = {'S': json.dumps(cursor, separators=(',', ':'))}
+    ddb.put_item(TableName=SLA_TABLE, Item=item)
+
+# ----------------------------------------------------------------------------
+# Página de órdenes vencidas + reenvío
+# ----------------------------------------------------------------------------
+
+def _pagina(status, desde, hasta, cursor):
+    kw = {'TableName': ORDERS_TABLE, 'IndexName': STATUS_INDEX,
+          'KeyConditionExpression': '#st = :st AND updatedAt BETWEEN :d AND :h',
+          'ExpressionAttributeNames': {'#st': 'status'},
+          'ExpressionAttributeValues': {':st': {'S': status}, ':d': {'S': desde}, ':h': {'S': hasta}},
+          'ProjectionExpression': 'orderId, updatedAt', 'Limit': SLA_PAGE_SIZE}
+    if cursor:
+        kw['ExclusiveStartKey'] = cursor
+    resp = ddb.query(**kw)
+    filas = [(it['orderId']['S'], it['updatedAt']['S']) for it in resp.get('Items', [])]
+    return filas, resp.get('LastEvaluatedKey')
+
+def _publicar(entries):
+    """put_events de a 10, reintentando sólo las fallidas. Devuelve cuántas no salieron."""
+    perdidas = 0
+    for i in range(0, len(entries), EVENTS_CHUNK):
+        lote, intento = entries[i:i + EVENTS_CHUNK], 0
+        while lote:
+            try:
+                resp = eventos.put_events(ev, lote)
+            except ClientError:
+                resp = {'FailedEntryCount': len(lote), 'Entries': [{'ErrorCode': 'ClientError'}] * len(lote)}
+            if not resp.get('FailedEntryCount'):
+                break
+            lote = [x for x, r in zip(lote, resp.get('Entries', [])) if r.get('ErrorCode')]
+            if intento >= MAX_RETRIES:
+                perdidas += len(lote)
+                break
+            time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+            intento += 1
+    return perdidas
+
+def _escalar(status, detalles):
+    """Último nivel: un consolidado (plantilla 'digest') con todas las órdenes de la página."""
+    if not SLA_ESCALATION_TOPIC_ARN or not detalles:
+        return 0
+    titulo = plantillas.texto('sla', 'titulo', {'status': status}, rol='SLA')
+    textos = [plantillas.resumen('sla', dict(sla.contexto(d), orderId=d['orderId'], status=status,
+                                             desde=d['recordatorio']['desde'][:16]), rol='SLA')
+              for d in detalles]
+    enviados = 0
+    while textos:
+        info = {}
+        subject, message = digest.consolidado(titulo, textos, rol='SLA', info=info)
+        sns.publish(TopicArn=SLA_ESCALATION_TOPIC_ARN, Subject=subject, Message=message)
+        textos = textos[info.get('lineas') or 1:]
+        enviados += 1
+    return enviados
+
+def _vigilar(status, nivel, ahora, queda_tiempo):
+    ventana = f"{status}#{nivel}"
+    limite = sla.limite(status, nivel, ahora)
+    ahora_iso = ahora.isoformat()
+    estado = _estado(ventana)
+    if estado and estado['cursor']:
+        # ventana a medio recorrer: se termina antes de abrir la siguiente
+        desde, hasta, cursor = estado['desde'], estado['hasta'], estado['cursor']
+    else:
+        desde = estado['hasta'] + _FIN if estado else (datetime.fromisoformat(limite) - timedelta(days=SLA_LOOKBACK_DAYS)).isoformat()
+        hasta, cursor = limite, None
+    ultimo = nivel == len(sla.SLA_TIERS[status])
+    res = {'ventana': ventana, 'ordenes': 0, 'paginas': 0, 'perdidas': 0, 'escalamientos': 0}
+
+    while desde <= hasta and res['paginas'] < SLA_MAX_PAGES and queda_tiempo():
+        filas, cursor = _pagina(status, desde, hasta, cursor)
+        detalles = [sla.detalle(status, oid, upd, nivel, ahora) for oid, upd in filas]
+        res['perdidas'] += _publicar([{'Source': sla.SLA_SOURCE, 'DetailType': sla.DETAIL_TYPES[status],
+                                       'Detail': json.dumps(d), 'EventBusName': EVENT_BUS} for d in detalles])
+        if ultimo:
+            res['escalamientos'] += _escalar(status, detalles)
+        res['ordenes'] += len(filas)
+        res['paginas'] += 1
+        _guardar(ventana, desde, hasta, cursor, ahora_iso)
+        if not cursor:
+            if hasta >= limite:
+                break
+            desde, hasta = hasta + _FIN, limite   # cerró una ventana vieja: sigue con la actual
+    res['pendiente'] = bool(cursor) or hasta < limite
+    return res
+
+@trazas.instrumentar(__file__)
+def lambda_handler(event, context):
+    event = event if isinstance(event, dict) else {}
+    ahora = datetime.fromisoformat(event['ahora']) if event.get('ahora') else datetime.utcnow()
+    estados_pedidos = event.get('status') or list(sla.SLA_TIERS)
+    ventanas = [(st, n) for st in estados_pedidos if st in sla.SLA_TIERS
+                for n in range(1, len(sla.SLA_TIERS[st]) + 1)]
+
+    def queda_tiempo():
+        return context is None or not hasattr(context, 'get_remaining_time_in_millis') or \
+            context.get_remaining_time_in_millis() > SLA_MARGIN_MS
+
+    def vigilar(v):
+        try:
+            return _vigilar(v[0], v[1], ahora, queda_tiempo)
+        except ClientError as e:
+            return {'ventana': f"{v[0]}#{v[1]}", 'error': str(e)}
+
+    # 1) Una tarea por (estado, nivel); cada una recorre su ventana en páginas
+    with ThreadPoolExecutor(max_workers=max(1, min(SLA_WORKERS, len(ventanas)))) as pool:
+        resultados = list(pool.map(trazas.propagar(vigilar), ventanas))
+
+    errores = {r['ventana']: r['error'] for r in resultados if 'error' in r}
+    ok = [r for r in resultados if 'error' not in r]
+    resumen = {
+        'ok': not errores, 'ahora': ahora.isoformat(),
+        'ordenes': sum(r['ordenes'] for r in ok), 'paginas': sum(r['paginas'] for r in ok),
+        'perdidas': sum(r['perdidas'] for r in ok), 'escalamientos': sum(r['escalamientos'] for r in ok),
+        'porVentana': {r['ventana']: r['ordenes'] for r in ok if r['ordenes']},
+        'pendientes': [r['ventana'] for r in ok if r['pendiente']],
+    }
+    if errores:
+        resumen['errores'] = errores
+    print("[SLA]", json.dumps(resumen))
+    return resumen
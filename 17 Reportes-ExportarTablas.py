@@ -0,0 +1,253 @@
+import os, json, time
+from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from comun import aws, estados, exportacion, trazas
+
+ddb = aws.client('dynamodb')
+s3 = aws.client('s3')
+
+ORDERS_TABLE = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
+STOCK_TABLE  = os.environ.get('STOCK_TABLE', 'StockGlobal')
+ENVIOS_TABLE = os.environ.get('ENVIOS_TABLE', 'Envios')
+STATUS_INDEX = os.environ.get('STATUS_INDEX', 'status-updatedAt-index')   # PK status, SK updatedAt
+EXPORT_STATE_TABLE = os.environ.get('EXPORT_STATE_TABLE', 'Exportaciones')  # PK clave
+
+# Regla programada (cron diario): exporta OrdenesCompra, StockGlobal y Envios a archivos
+# columnares particionados por fecha y status (comun/exportacion.py) para Athena / reporting,
+# sin leer las tablas desde las consultas de negocio.
+#   full         Scan paralelo segmentado (EXPORT_SEGMENTS) de toda la tabla
+#   incremental  sólo lo que cambió desde la marca anterior: updatedAt en (marca, corte]
+#                OrdenesCompra por el GSI status-updatedAt-index (una tarea por estado) +
+#                BatchGetItem de las órdenes; StockGlobal y Envios no tienen índice por
+#                updatedAt: Scan con filtro (lee y cobra la tabla entera, escribe sólo el delta)
+# Todas las lecturas comparten un presupuesto de EXPORT_RCU_PER_S (ConsumedCapacity de cada
+# página), así la exportación no le come la capacidad a los handlers.
+# La primera corrida de cada tabla es full; después incremental. El corte queda EXPORT_SKEW_S
+# atrás de ahora (escrituras en vuelo) y pasa a ser la marca recién cuando terminan todas
+# las tareas. Cada tarea guarda su cursor en Exportaciones después de cada archivo escrito:
+# si la corrida se queda sin tiempo, la siguiente sigue desde ahí (al menos una vez: un corte
+# a mitad de archivo puede repetir filas; deduplicar por clave + updatedAt).
+# Se puede forzar con {"tablas": ["Envios"], "modo": "full"}.
+EXPORT_SEGMENTS      = int(os.environ.get('EXPORT_SEGMENTS', '8'))
+EXPORT_RCU_PER_S     = float(os.environ.get('EXPORT_RCU_PER_S', '200'))     # 0 = sin límite
+EXPORT_PAGE_SIZE     = int(os.environ.get('EXPORT_PAGE_SIZE', '500'))
+EXPORT_ROWS_PER_FILE = int(os.environ.get('EXPORT_ROWS_PER_FILE', '100000'))  # filas en memoria por tarea
+EXPORT_SKEW_S        = int(os.environ.get('EXPORT_SKEW_S', '60'))
+EXPORT_MARGIN_MS     = int(os.environ.get('EXPORT_MARGIN_MS', '30000'))     # no empezar una página con menos de esto
+EXPORT_BUCKET        = os.environ.get('EXPORT_BUCKET', '').strip()          # vacío = sólo EXPORT_DIR (local)
+EXPORT_PREFIX        = os.environ.get('EXPORT_PREFIX', 'exportaciones').strip('/')
+EXPORT_DIR           = os.environ.get('EXPORT_DIR', '/tmp/exportaciones')
+BATCH_GET_MAX = 100
+
+_FIN = '~'   # '<marca>~' ordena después de '<marca>': el delta no repite el borde
+
+# tabla -> atributo de fecha de la partición, columnas de partición, atributo a aplanar,
+#          índice por updatedAt (incremental sin Scan) y clave primaria
+TABLAS = {
+    ORDERS_TABLE: {'fecha': 'updatedAt', 'particion': ('status',), 'aplanar': 'items',
+                   'indice': STATUS_INDEX, 'clave': 'orderId'},
+    STOCK_TABLE:  {'fecha': 'updatedAt', 'particion': (), 'aplanar': None, 'indice': None, 'clave': 'sku'},
+    ENVIOS_TABLE: {'fecha': 'dispatchedAt', 'particion': ('status',), 'aplanar': None,
+                   'indice': None, 'clave': 'envioId'},
+}
+
+# ----------------------------------------------------------------------------
+# Estado de la corrida (Exportaciones)
+#   clave=<tabla>          marca (watermark), ultimaCorrida y la corrida en curso (JSON)
+#   clave=<tabla>#<tarea>  cursor de cada segmento / estado de la corrida en curso y el
+#                          número del próximo archivo (una invocación que sigue la corrida
+#                          no pisa los archivos de la anterior)
+# ----------------------------------------------------------------------------
+
+def _estado(tabla):
+    item = ddb.get_item(TableName=EXPORT_STATE_TABLE, Key={'clave': {'S': tabla}}, ConsistentRead=True).get('Item') or {}
+    return {'marca': item.get('marca', {}).get('S'),
+            'enCurso': json.loads(item['enCurso']['S']) if 'enCurso' in item else None}
+
+def _iniciar(tabla, marca, corrida):
+    item = {'clave': {'S': tabla}, 'enCurso': {'S': json.dumps(corrida, separators=(',', ':'))}}
+    if marca:
+        item['marca'] = {'S': marca}
+    ddb.put_item(TableName=EXPORT_STATE_TABLE, Item=item)
+
+def _cerrar(tabla, corrida):
+    ddb.put_item(TableName=EXPORT_STATE_TABLE, Item={
+        'clave': {'S': tabla}, 'marca': {'S': corrida['corte']},
+        'ultimaCorrida': {'S': corrida['id']}, 'modo': {'S': corrida['modo']}})
+
+def _cursor(tabla, tarea, corrida):
+    """(cursor, hecho, próximo archivo) de la tarea en esta corrida; de otra corrida cuenta
+    como no empezada."""
+    item = ddb.get_item(TableName=EXPORT_STATE_TABLE, Key={'clave': {'S': f"{tabla}#{tarea}"}},
+                        ConsistentRead=True).get('Item') or {}
+    if item.get('corrida', {}).get('S') != corrida['id']:
+        return None, False, 0
+    return ((json.loads(item['cursor']['S']) if 'cursor' in item else None),
+            item.get('hecho', {}).get('BOOL', False), int(item.get('secuencia', {}).get('N', '0')))
+
+def _guardar_cursor(tabla, tarea, corrida, cursor, secuencia):
+    item = {'clave': {'S': f"{tabla}#{tarea}"}, 'corrida': {'S': corrida['id']}, 'hecho': {'BOOL': not cursor},
+            'secuencia': {'N': str(secuencia)}}
+    if cursor:
+        item['cursor'] = {'S': json.dumps(cursor, separators=(',', ':'))}
+    ddb.put_item(TableName=EXPORT_STATE_TABLE, Item=item)
+
+# ----------------------------------------------------------------------------
+# Lectura por páginas
+# ----------------------------------------------------------------------------
+
+def _unidades(resp):
+    cap = resp.get('ConsumedCapacity')
+    caps = cap if isinstance(cap, list) else [cap] if cap else []
+    if caps:
+        return sum(float(c.get('CapacityUnits') or 0) for c in caps)
+    leidos = resp.get('ScannedCount', sum(len(v) for v in resp.get('Responses', {}).values()))
+    return 0.5 * max(1, leidos)   # sin el dato: items de hasta 4 KB, lectura eventual
+
+def _scan(tabla, cfg, corrida, tarea, cursor):
+    kw = {'TableName': tabla, 'Segment': int(tarea.split('-')[1]), 'TotalSegments': corrida['segmentos'],
+          'Limit': EXPORT_PAGE_SIZE, 'ReturnConsumedCapacity': 'TOTAL'}
+    if corrida['modo'] == 'incremental':
+        kw.update(FilterExpression='updatedAt BETWEEN :d AND :h',
+                  ExpressionAttributeValues={':d': {'S': corrida['desde'] + _FIN}, ':h': {'S': corrida['corte']}})
+    if cursor:
+        kw['ExclusiveStartKey'] = cursor
+    resp = ddb.scan(**kw)
+    return [aws.from_item(it) for it in resp.get('Items', [])], resp.get('LastEvaluatedKey'), _unidades(resp)
+
+def _batch_get(tabla, claves):
+    """Items completos de `claves` (low-level), de a 100, reintentando UnprocessedKeys."""
+    items, unidades = [], 0
+    for i in range(0, len(claves), BATCH_GET_MAX):
+        pedido = {tabla: {'Keys': claves[i:i + BATCH_GET_MAX]}}
+        while pedido:
+            resp = ddb.batch_get_item(RequestItems=pedido, ReturnConsumedCapacity='TOTAL')
+            items += resp.get('Responses', {}).get(tabla, [])
+            unidades += _unidades(resp)
+            pedido = resp.get('UnprocessedKeys') or None
+            if pedido:
+                time.sleep(0.05)   # throttling: lo que no entró se pide de nuevo
+    return items, unidades
+
+def _delta_indice(tabla, cfg, corrida, tarea, cursor):
+    status = tarea.split('-', 1)[1]
+    kw = {'TableName': tabla, 'IndexName': cfg['indice'],
+          'KeyConditionExpression': '#st = :st AND updatedAt BETWEEN :d AND :h',
+          'ExpressionAttributeNames': {'#st': 'status'},
+          'ExpressionAttributeValues': {':st': {'S': status}, ':d': {'S': corrida['desde'] + _FIN},
+                                        ':h': {'S': corrida['corte']}},
+          'ProjectionExpression': cfg['clave'], 'Limit': EXPORT_PAGE_SIZE, 'ReturnConsumedCapacity': 'TOTAL'}
+    if cursor:
+        kw['ExclusiveStartKey'] = cursor
+    resp = ddb.query(**kw)
+    claves = [{cfg['clave']: it[cfg['clave']]} for it in resp.get('Items', [])]
+    items, unidades = _batch_get(tabla, claves) if claves else ([], 0)
+    return [aws.from_item(it) for it in items], resp.get('LastEvaluatedKey'), _unidades(resp) + unidades
+
+def _tareas(cfg, corrida):
+    if corrida['modo'] == 'incremental' and cfg['indice']:
+        return [f"status-{st}" for st in estados.ESTADOS]
+    return [f"seg-{i}" for i in range(corrida['segmentos'])]
+
+# ----------------------------------------------------------------------------
+# Exportación
+# ----------------------------------------------------------------------------
+
+def _subir(path, relativo):
+    if not EXPORT_BUCKET:
+        return
+    s3.upload_file(path, EXPORT_BUCKET, f"{EXPORT_PREFIX}/{relativo}" if EXPORT_PREFIX else relativo)
+    os.remove(path)   # /tmp de Lambda es chico
+
+def _tarea(tabla, cfg, corrida, tarea, presupuesto, queda_tiempo):
+    cursor, hecho, secuencia = _cursor(tabla, tarea, corrida)
+    res = {'tarea': tarea, 'items': 0, 'filas': 0, 'archivos': 0, 'paginas': 0, 'hecho': hecho}
+    if hecho:
+        return res
+    leer = _delta_indice if tarea.startswith('status-') else _scan
+    escritor = exportacion.Escritor(EXPORT_DIR, tabla, cfg['particion'], f"{corrida['id']}-{tarea}",
+                                    EXPORT_ROWS_PER_FILE, al_cerrar=_subir)
+    escritor.secuencia = secuencia
+    guardado = cursor
+    while queda_tiempo():
+        presupuesto.esperar()
+        items, cursor, unidades = leer(tabla, cfg, corrida, tarea, cursor)
+        presupuesto.cobrar(unidades)
+        for item in items:
+            fecha = str(item.get(cfg['fecha']) or item.get('updatedAt') or '')
+            for fila in exportacion.filas(item, cfg['aplanar']):
+                escritor.agregar(fila, fecha)
+                res['filas'] += 1
+        res['items'] += len(items)
+        res['paginas'] += 1
+        if not cursor or escritor.n >= EXPORT_ROWS_PER_FILE:
+            res['archivos'] += len(escritor.flush())
+            _guardar_cursor(tabla, tarea, corrida, cursor, escritor.secuencia)
+            guardado = cursor
+        if not cursor:
+            res['hecho'] = True
+            break
+    if cursor != guardado:   # sin tiempo: lo leído se escribe antes de guardar el cursor
+        res['archivos'] += len(escritor.flush())
+        _guardar_cursor(tabla, tarea, corrida, cursor, escritor.secuencia)
+    return res
+
+def _exportar(tabla, modo, ahora, presupuesto, queda_tiempo):
+    cfg = TABLAS[tabla]
+    estado = _estado(tabla)
+    corrida = estado['enCurso']
+    if not corrida:
+        # 1) Corrida nueva: full la primera vez (o si se pide), si no el delta desde la marca
+        modo = 'full' if modo == 'full' or not estado['marca'] else 'incremental'
+        corrida = {'id': ahora.strftime('%Y%m%dT%H%M%S'), 'modo': modo, 'segmentos': max(1, EXPORT_SEGMENTS),
+                   'desde': estado['marca'] if modo == 'incremental' else None,
+                   'corte': (ahora - timedelta(seconds=EXPORT_SKEW_S)).isoformat(timespec='microseconds')}
+        _iniciar(tabla, estado['marca'], corrida)
+
+    # 2) Tareas en paralelo (segmentos del Scan o estados del GSI), cada una con su cursor
+    tareas = _tareas(cfg, corrida)
+    with ThreadPoolExecutor(max_workers=len(tareas)) as pool:
+        resultados = list(pool.map(trazas.propagar(
+            lambda t: _tarea(tabla, cfg, corrida, t, presupuesto, queda_tiempo)), tareas))
+
+    # 3) La marca avanza sólo con todas las tareas terminadas
+    terminada = all(r['hecho'] for r in resultados)
+    if terminada:
+        _cerrar(tabla, corrida)
+    return {'tabla': tabla, 'corrida': corrida['id'], 'modo': corrida['modo'], 'corte': corrida['corte'],
+            'items': sum(r['items'] for r in resultados), 'filas': sum(r['filas'] for r in resultados),
+            'archivos': sum(r['archivos'] for r in resultados), 'paginas': sum(r['paginas'] for r in resultados),
+            'pendiente': not terminada}
+
+@trazas.instrumentar(__file__)
+def lambda_handler(event, context):
+    event = event if isinstance(event, dict) else {}
+    ahora = datetime.fromisoformat(event['ahora']) if event.get('ahora') else datetime.utcnow()
+    tablas = [t for t in (event.get('tablas') or list(TABLAS)) if t in TABLAS]
+    modo = event.get('modo') if event.get('modo') in ('full', 'incremental') else None
+    presupuesto = exportacion.Presupuesto(EXPORT_RCU_PER_S)
+
+    def queda_tiempo():
+        return context is None or not hasattr(context, 'get_remaining_time_in_millis') or \
+            context.get_remaining_time_in_millis() > EXPORT_MARGIN_MS
+
+    # Una tabla por vez: el presupuesto de RCU se reparte entre sus tareas
+    resultados, errores = [], {}
+    for tabla in tablas:
+        try:
+            resultados.append(_exportar(tabla, modo, ahora, presupuesto, queda_tiempo))
+        except (ClientError, OSError) as e:
+            errores[tabla] = str(e)
+
+    resumen = {
+        'ok': not errores, 'ahora': ahora.isoformat(), 'formato': exportacion.EXPORT_FORMAT,
+        'destino': f"s3://{EXPORT_BUCKET}/{EXPORT_PREFIX}" if EXPORT_BUCKET else EXPORT_DIR,
+        'tablas': {r.pop('tabla'): r for r in resultados},
+        'rcu': round(presupuesto.consumido, 1), 'esperaS': round(presupuesto.esperado, 2),
+    }
+    resumen['pendientes'] = [t for t, r in resumen['tablas'].items() if r['pendiente']]
+    if errores:
+        resumen['errores'] = errores
+    print("[EXPORT]", json.dumps(resumen))
+    return resumen
@@ -0,0 +1,44 @@
+import json
+from datetime import datetime
+from botocore.exceptions import ClientError
+from comun import eventos, idempotencia, sucursales, trazas
+from comun.util import detail as _detail
+
+# Consumidor de DespachoConfirmado: suma en StockSucursal lo que el despacho asignó a cada
+# sucursal. Va fuera del request de Logistica-ConfirmarDespacho (un despacho de 1k SKUs × 500
+# sucursales son ~176k celdas). Cada SKU se aplica una sola vez por orden (marca en
+# Idempotencia, comun/sucursales.py); si quedan SKUs sin aplicar se lanza la excepción para
+# que la invocación asíncrona reintente (y termine en la DLQ si no alcanza).
+
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_evento(__file__))
+def lambda_handler(event, context):
+    if eventos.fusionado(event, __file__):
+        return {'statusCode': 200, 'body': json.dumps({'info': 'ya procesado en proceso (fused)'})}
+    if (event.get('detail-type') or event.get('detailType')) != 'DespachoConfirmado':
+        return {'statusCode': 200, 'body': json.dumps({'info': 'evento ignorado'})}
+
+    det = _detail(event)
+    order_id = det.get('orderId')
+    if not order_id:
+        return {'statusCode': 400, 'body': json.dumps({'error': 'Falta orderId'})}
+
+    # 1) Reparto {sucursal: {sku: qty}}: inline o en AsignacionesEnvio
+    reparto = det.get('asignacion')
+    if reparto is None and det.get('asignacionRef'):
+        reparto = sucursales.leer_asignacion(det.get('envioId') or order_id, det['asignacionRef'])
+    if not reparto:
+        return {'statusCode': 200, 'body': json.dumps({'info': 'sin asignación por sucursal'})}
+
+    # 2) Sumar en StockSucursal (BatchGet + transacciones por lote de SKUs)
+    now = datetime.utcnow().isoformat()
+    try:
+        pendientes = sucursales.sumar(order_id, reparto, now)
+    except ClientError as e:
+        raise RuntimeError(f"StockSucursal: {str(e)}") from e
+    if pendientes:
+        raise RuntimeError(f"{len(pendientes)} SKUs sin aplicar en StockSucursal para {order_id}: "
+                           + ", ".join(pendientes[:20]))
+
+    celdas = sum(len(q) for q in reparto.values())
+    return {'statusCode': 200, 'body': json.dumps({'orderId': order_id, 'celdas': celdas})}
@@ -1,5 +1,7 @@
-import os, json, boto3
-sns = boto3.client('sns')
+import os, json
+from comun import aws, digest, eventos, idempotencia, plantillas, sla, trazas
+from comun.util import detail as _detail
+sns = aws.client('sns')
 
 def _load_role_topic_map():
     raw = os.environ.get('ROLE_TOPIC_MAP', '').strip()
@@ -16,26 +18,33 @@ def _load_role_topic_map():
 ROLE_TOPIC_MAP = _load_role_topic_map()
 APPROVAL_BASE_URL = os.environ.get('APPROVAL_BASE_URL', 'https://1y4g8pdtm1.execute-api.us-east-2.amazonaws.com')
 
-def _detail(evt):
-    d = evt.get('detail', evt)
-    if isinstance(d, str):
-        try: d = json.loads(d)
-        except Exception: d = {}
-    return d
-
-def _publish_to_roles(roles, subject, message):
+def _publish_to_roles(roles, order_id, ctx, urgente=False):
+    """Publica en el topic de cada rol (plantilla 'aprobacion', con la variante del rol);
+    los roles en modo digest reciben el resumen dentro del consolidado (comun/digest.py)
+    salvo que la orden sea urgente."""
     if not ROLE_TOPIC_MAP:
         raise RuntimeError("ROLE_TOPIC_MAP vacío o inválido.")
-    published = []
+    published, pendientes = [], []
     for role in roles if isinstance(roles, list) else [roles]:
         arn = ROLE_TOPIC_MAP.get(role)
         if not arn:
             raise RuntimeError(f"No hay Topic ARN para '{role}' en ROLE_TOPIC_MAP: {ROLE_TOPIC_MAP}")
+        if digest.activo(role, urgente):
+            pendientes.append(digest.entrada(role, arn, order_id, plantillas.resumen('aprobacion', ctx, rol=role),
+                                             'OCs pendientes de aprobación'))
+            published.append({'role': role, 'topic': arn, 'digest': True})
+            continue
+        subject, message = plantillas.mensaje('aprobacion', ctx, rol=role)
         res = sns.publish(TopicArn=arn, Subject=subject, Message=message)
         published.append({'role': role, 'topic': arn, 'messageId': res.get('MessageId')})
+    digest.encolar(pendientes)
     return published
 
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_evento(__file__))
 def lambda_handler(event, context):
+    if eventos.fusionado(event, __file__):
+        return {'statusCode': 200, 'body': json.dumps({'info': 'ya procesado en proceso (fused)'})}
     det = _detail(event)
     detail_type = event.get('detail-type') or event.get('detailType')
     order_id = det.get('orderId')
@@ -47,17 +56,9 @@ def lambda_handler(event, context):
         creador = det.get('ROL', 'CasaCentral')  # ← DEFINIRLO
         roles = det.get('audienceRoles', ['COMPRAS_APROBADORES'])
 
-        approve_url = f"{APPROVAL_BASE_URL}/approvals/{order_id}/approve?ROL={creador}"
-        reject_url  = f"{APPROVAL_BASE_URL}/approvals/{order_id}/reject?ROL={creador}"
-
-        subject = f"OC {order_id} pendiente de aprobación (Rol: {creador})"
-        msg = (
-            f"Se creó la Orden de Compra {order_id} y requiere aprobación.\n\n"
-            f"Aprobar: {approve_url}\n"
-            f"Rechazar: {reject_url}\n"
-        )
-
-        pubs = _publish_to_roles(roles, subject, msg)
+        # recordatorio de Ordenes-VigilarSLA: mismo mensaje con la marca de recordatorio / escalado
+        ctx = dict(sla.contexto(det), orderId=order_id, rol=creador, api=APPROVAL_BASE_URL)
+        pubs = _publish_to_roles(roles, order_id, ctx, digest.urgente(det))
         return {'statusCode': 200, 'body': json.dumps({'sent': pubs, 'ROL': creador})}
 
     return {'statusCode': 200, 'body': json.dumps({'info': 'evento ignorado', 'detailType': detail_type, 'orderId': order_id})}
@@ -1,41 +1,18 @@
 import os
 import json
-import boto3
 from datetime import datetime
-from botocore.exceptions import ClientError
+from comun.ordenes import snapshot_for_event
+from comun import aws, estados, eventos, idempotencia, ordenes, trazas
+from comun.util import get_order_id as _get_order_id
 
-d = boto3.resource('dynamodb')
-ev = boto3.client('events')
+ev = aws.client('events')
 
-ORDERS_TABLE = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
 EVENT_BUS    = os.environ.get('EVENT_BUS', 'ventas-bus')
 EVENT_SOURCE = os.environ.get('EVENT_SOURCE', 'com.casacentral.aprobaciones') #Notificaciones Proveedor / Notificaciones Deposito
 
-orders = d.Table(ORDERS_TABLE)
-
-
-def _get_order_id(evt):
-    # HTTP API (v2): pathParameters, queryStringParameters
-    pp = (evt.get('pathParameters') or {})
-    qp = (evt.get('queryStringParameters') or {})
-    if pp.get('orderId'):
-        return pp['orderId']
-    if qp.get('orderId'):
-        return qp['orderId']
-
-    # Body opcional
-    body = evt.get('body')
-    if isinstance(body, str):
-        try:
-            body = json.loads(body)
-        except Exception:
-            body = {}
-    if isinstance(body, dict) and body.get('orderId'):
-        return body['orderId']
-
-    return evt.get('orderId')
-
 
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_transicion('APPROVE', _get_order_id))
 def lambda_handler(event, context):
     order_id = _get_order_id(event)
     if not order_id:
@@ -43,33 +20,34 @@ def lambda_handler(event, context):
 
     now = datetime.utcnow().isoformat()
 
-    try:
-        orders.update_item(
-            Key={'orderId': order_id},
-            UpdateExpression='SET #st = :st, approvedAt = :ts, updatedAt = :ts',
-            ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={
-                ':st': 'APPROVED',
-                ':ts': now,
-                ':expected': 'PENDING_APPROVAL'
-            },
-            ConditionExpression='#st = :expected'
+    # PENDING_APPROVAL -> APPROVED + historial (comun/estados.py)
+    actual = estados.aplicar(order_id, estados.APPROVED, now, por='CasaCentral')
+    if actual is not None:
+        html = (
+            f"<html><body><h3>❗ No se puede aprobar la orden {order_id}</h3>"
+            f"<p>Estado inválido o no existe (estado actual: {actual or '-'}; se esperaba PENDING_APPROVAL).</p></body></html>"
         )
-    except ClientError as e:
-        code = e.response.get('Error', {}).get('Code')
-        if code == 'ConditionalCheckFailedException':
-            html = (
-                f"<html><body><h3>❗ No se puede aprobar la orden {order_id}</h3>"
-                f"<p>Estado inválido o no existe (se esperaba PENDING_APPROVAL).</p></body></html>"
-            )
-            return {'statusCode': 409, 'headers': {'Content-Type': 'text/html'}, 'body': html}
-        raise
-
-    # Evento para continuar flujo
-    ev.put_events(Entries=[{
+        return {'statusCode': 409, 'headers': {'Content-Type': 'text/html'}, 'body': html}
+
+    # Evento para continuar flujo (con snapshot de la orden: los consumidores no releen DynamoDB).
+    # La transacción no devuelve la orden: se lee (items/origen no cambian) y se le aplica la transición.
+    # La aprobación ya quedó escrita: si la lectura falla el evento sale igual, sin snapshot
+    # (los consumidores releen la orden cuando falta `order`).
+    detail = {'orderId': order_id, 'approvedAt': now, 'updatedAt': now}
+    ordenes.invalidate(order_id)
+    try:
+        orden = ordenes.get_order(order_id)
+    except Exception as e:
+        print(f"[APROBAR] {order_id}: no se pudo leer la orden ({e!r}); OrdenAprobada sin snapshot")
+        orden = None
+    trazas.adoptar((orden or {}).get('traceId'))
+    snapshot = snapshot_for_event(orden and dict(orden, status=estados.APPROVED, approvedAt=now, updatedAt=now))
+    if snapshot:
+        detail['order'] = snapshot
+    eventos.put_events(ev, [{
         'Source': EVENT_SOURCE,
         'DetailType': 'OrdenAprobada',
-        'Detail': json.dumps({'orderId': order_id, 'approvedAt': now}),
+        'Detail': json.dumps(detail, default=str),
         'EventBusName': EVENT_BUS
     }])
 
@@ -1,15 +1,6 @@
-import os, json, boto3
+import json
 from datetime import datetime
-from botocore.exceptions import ClientError
-
-d = boto3.resource('dynamodb')
-ev = boto3.client('events')
-
-ORDERS_TABLE = os.environ.get('ORDERS_TABLE','OrdenesCompra')
-EVENT_BUS    = os.environ.get('EVENT_BUS','ventas-bus')
-EVENT_SOURCE = os.environ.get('EVENT_SOURCE','com.casacentral.aprobaciones')
-
-orders = d.Table(ORDERS_TABLE)
+from comun import estados, idempotencia, trazas
 
 def _get_order_id_and_reason(evt):
     pp = (evt.get('pathParameters') or {})
@@ -25,6 +16,8 @@ def _get_order_id_and_reason(evt):
         reason = body.get('reason')
     return order_id, reason
 
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_transicion('REJECT', lambda e: _get_order_id_and_reason(e)[0]))
 def lambda_handler(event, context):
     order_id, reason = _get_order_id_and_reason(event)
     if not order_id:
@@ -32,25 +25,12 @@ def lambda_handler(event, context):
 
     now = datetime.utcnow().isoformat()
 
-    try:
-        orders.update_item(
-            Key={'orderId': order_id},
-            UpdateExpression='SET #st=:st, rejectedAt=:ts, updatedAt=:ts' + (', rejectionReason=:rr' if reason else ''),
-            ExpressionAttributeNames={'#st':'status'},
-            ExpressionAttributeValues={
-                ':st':'REJECTED',
-                ':ts': now,
-                ':expected':'PENDING_APPROVAL',
-                **({':rr': reason} if reason else {})
-            },
-            ConditionExpression='#st = :expected'
-        )
-    except ClientError as e:
-        code = e.response.get('Error',{}).get('Code')
-        if code == 'ConditionalCheckFailedException':
-            html = f"<html><body><h3>❗ No se puede rechazar la orden {order_id}</h3><p>Estado inválido o no existe (se esperaba PENDING_APPROVAL).</p></body></html>"
-            return {'statusCode':409,'headers':{'Content-Type':'text/html'},'body':html}
-        raise
+    # PENDING_APPROVAL -> REJECTED + historial (comun/estados.py)
+    actual = estados.aplicar(order_id, estados.REJECTED, now,
+                             sets={'rejectionReason': {'S': str(reason)}} if reason else None, por='CasaCentral')
+    if actual is not None:
+        html = f"<html><body><h3>❗ No se puede rechazar la orden {order_id}</h3><p>Estado inválido o no existe (estado actual: {actual or '-'}; se esperaba PENDING_APPROVAL).</p></body></html>"
+        return {'statusCode':409,'headers':{'Content-Type':'text/html'},'body':html}
 
 
     html = f"<html><body><h3>Orden {order_id} RECHAZADA</h3>" + (f"<p>Motivo: {reason}</p>" if reason else "") + "</body></html>"
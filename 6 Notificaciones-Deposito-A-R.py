@@ -1,70 +1,22 @@
-import os, json, boto3
+import os, json
 from datetime import datetime
 from botocore.exceptions import ClientError
+from comun import ordenes
+from comun.items import parse_items as _parse_items
+from comun import aws, digest, eventos, idempotencia, plantillas, sla, trazas
+from comun.util import detail as _detail
 
-sns    = boto3.client('sns')
-dynamo = boto3.resource('dynamodb')
+sns = aws.client('sns')
 
-ORDERS_TABLE = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
 DEPOSITO_TOPIC_ARN = os.environ.get('DEPOSITO', '').strip()
 API_BASE_URL = os.environ.get('API_BASE_URL', 'https://1y4g8pdtm1.execute-api.us-east-2.amazonaws.com')
 
-table = dynamo.Table(ORDERS_TABLE)
-
-def _detail(evt):
-    d = evt.get('detail', evt)
-    if isinstance(d, str):
-        try: d = json.loads(d)
-        except Exception: d = {}
-    return d
-
-def _parse_items(items_field):
-    if items_field is None:
-        return []
-    if isinstance(items_field, str):
-        try:
-            return json.loads(items_field)
-        except Exception:
-            return []
-    return items_field
-
-def _format_message(order, approved_at=None, api_base=None):
-    order_id = order.get('orderId', 'N/A')
-    items    = _parse_items(order.get('items'))
-
-    accept_url = f"{api_base}/recepciones/{order_id}/accept"
-
-    lines = [
-        "Pedido aprobado y en camino a Depósito",
-        f"OC: {order_id}",
-        f"Fecha aprobación: {approved_at or datetime.utcnow().isoformat()}",
-        "Rol: Deposito",
-        "",
-        "Productos:"
-    ]
-    if isinstance(items, list) and items:
-        for it in items:
-            if isinstance(it, dict):
-                sku  = it.get('sku', 'N/A')
-                qty  = it.get('qty', 'N/A')
-                desc = it.get('desc') or it.get('descripcion') or ''
-                lines.append(f" - SKU: {sku}  Qty: {qty}  {desc}")
-            else:
-                lines.append(f" - {str(it)}")
-    else:
-        lines.append(" (sin items)")
-
-    lines += [
-        "",
-        "Cuando llegue el pedido a Depósito, confirmá la recepción:",
-        accept_url,
-        "",
-        "Este es un aviso automático."
-    ]
-    return "\n".join(lines)
-
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_evento(__file__))
 def lambda_handler(event, context):
-    print("[EVENT]", json.dumps(event))
+    if eventos.fusionado(event, __file__):
+        return {'statusCode': 200, 'body': json.dumps({'info': 'ya procesado en proceso (fused)'})}
+    trazas.log('evento', detailType=event.get('detail-type') or event.get('detailType'))
     print("[ENV] DEPOSITO_TOPIC_ARN:", DEPOSITO_TOPIC_ARN)
 
     if not DEPOSITO_TOPIC_ARN:
@@ -81,17 +33,28 @@ def lambda_handler(event, context):
         return {'statusCode': 400, 'body': json.dumps({'error': 'orderId faltante en event.detail'})}
 
     # 1) Obtener la orden
+    ordenes.reset_stats()
     try:
-        resp  = table.get_item(Key={'orderId': order_id})
-        order = resp.get('Item')
+        order = ordenes.get_order(order_id, min_updated_at=det.get('updatedAt') or approved_at,
+                                  snapshot=det.get('order'))
         if not order:
             return {'statusCode': 404, 'body': json.dumps({'error': f'Orden {order_id} no encontrada'})}
     except ClientError as e:
         return {'statusCode': 500, 'body': json.dumps({'error': f'DynamoDB: {str(e)}'})}
 
-    # 2) Publicar mensaje
-    subject = f"Depósito: OC {order_id} aprobada (confirmar recepción al arribo) (Rol: DESPOITO)"
-    message = _format_message(order, approved_at, API_BASE_URL)
+    # 2) Publicar mensaje (o encolarlo en el consolidado si Depósito está en modo digest)
+    ctx = dict(sla.contexto(det), orderId=order_id, aprobada=approved_at or datetime.utcnow().isoformat(), api=API_BASE_URL)
+    if digest.activo('DEPOSITO', digest.urgente(det, order)):
+        try:
+            digest.encolar([digest.entrada('DEPOSITO', DEPOSITO_TOPIC_ARN, order_id,
+                                           plantillas.resumen('deposito', ctx, rol='DEPOSITO'),
+                                           'Depósito: OCs aprobadas a recibir')])
+        except ClientError as e:
+            return {'statusCode': 500, 'body': json.dumps({'error': f'Digest: {str(e)}'})}
+        print("[CACHE]", json.dumps(ordenes.stats()))
+        return {'statusCode': 200, 'body': json.dumps({'queuedForDigest': DEPOSITO_TOPIC_ARN})}
+
+    subject, message = plantillas.mensaje('deposito', ctx, _parse_items(order.get('items')), rol='DEPOSITO')
     print("[SNS] Publishing to:", DEPOSITO_TOPIC_ARN)
     try:
         res = sns.publish(TopicArn=DEPOSITO_TOPIC_ARN, Subject=subject, Message=message)
@@ -99,4 +62,5 @@ def lambda_handler(event, context):
     except ClientError as e:
         return {'statusCode': 500, 'body': json.dumps({'error': f'SNS: {str(e)}'})}
 
+    print("[CACHE]", json.dumps(ordenes.stats()))
     return {'statusCode': 200, 'body': json.dumps({'sentToTopic': DEPOSITO_TOPIC_ARN})}
@@ -1,46 +1,110 @@
-import os, json, boto3
+import os, json, time, random
 from datetime import datetime
 from botocore.exceptions import ClientError
 from decimal import Decimal
+from comun import ordenes
+from comun.items import parse_items as _parse_items
+from comun import aws, estados, eventos, idempotencia, stock, trazas
+from comun.util import get_order_id as _get_order_id, to_decimal as _to_decimal, html as _html
 
-d = boto3.resource('dynamodb')
-ev = boto3.client('events')
+ddb = aws.client('dynamodb')
+ev = aws.client('events')
 
 ORDERS_TABLE = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
-STOCK_TABLE  = os.environ.get('STOCK_TABLE',  'StockGlobal')
 EVENT_BUS    = os.environ.get('EVENT_BUS',    'ventas-bus')
 EVENT_SOURCE = os.environ.get('EVENT_SOURCE', 'com.deposito.recepcion')
 
-orders = d.Table(ORDERS_TABLE)
-stock  = d.Table(STOCK_TABLE)
-
-def _get_order_id(evt):
-    pp = (evt.get('pathParameters') or {})
-    qp = (evt.get('queryStringParameters') or {})
-    if pp.get('orderId'): return pp['orderId']
-    if qp and qp.get('orderId'): return qp['orderId']
-    body = evt.get('body')
-    if isinstance(body, str):
-        try: body = json.loads(body)
-        except: body = {}
-    if isinstance(body, dict) and body.get('orderId'):
-        return body['orderId']
-    return evt.get('orderId')
-
-def _parse_items(items_field):
-    if items_field is None: return []
-    if isinstance(items_field, str):
-        try: return json.loads(items_field)
-        except Exception: return []
-    return items_field
-
-def _to_decimal(n):
-    try: return Decimal(str(n))
-    except Exception: return Decimal(0)
-
-def _html(body, code=200):
-    return {'statusCode': code, 'headers': {'Content-Type': 'text/html; charset=UTF-8'}, 'body': body}
+# TransactWriteItems admite hasta 100 acciones: la orden (+ su historial) + N SKUs (× 2 con el ledger)
+TX_MAX_ITEMS = int(os.environ.get('TX_MAX_ITEMS', '100'))
+MAX_RETRIES  = int(os.environ.get('TX_MAX_RETRIES', '5'))
 
+def _totales_por_sku(items):
+    totales = {}
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        sku = str(it.get('sku') or '').strip()
+        inc = _to_decimal(it.get('qty', 0))
+        if sku and inc > 0:
+            totales[sku] = totales.get(sku, Decimal(0)) + inc
+    return totales
+
+def _stock_add(skus, totales, now, order_id):
+    # SKUs calientes (STOCK_HOT_SKUS): el ADD va a uno de sus shards, ver comun/stock.py.
+    # Cada ADD lleva su movimiento en MovimientosStock (comun/ledger.py).
+    return [a for sku in skus for a in stock.acciones_ingreso(sku, totales[sku], now, order_id)]
+
+def _transact(acciones):
+    """Ejecuta la transacción. Devuelve None si se aplicó, o el item actual de la
+    orden (ALL_OLD) si falló su condición ({} si la orden no existe)."""
+    intento = 0
+    while True:
+        try:
+            ddb.transact_write_items(TransactItems=acciones)
+            return None
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                raise
+            reasons = e.response.get('CancellationReasons') or []
+            orden = reasons[0] if reasons else {}
+            if orden.get('Code') == 'ConditionalCheckFailed':
+                return orden.get('Item') or {}
+            if intento >= MAX_RETRIES:
+                raise
+            time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+            intento += 1
+
+def _rechazo(actual):
+    if not actual:
+        return 'NOT_FOUND', actual
+    return ('ALREADY_RECEIVED' if actual == estados.RECEIVED else 'INVALID_STATE'), actual
+
+def _aplicar_recepcion(order_id, totales, now):
+    """Aplica APPROVED -> RECEIVED (comun/estados.py) + ADDs de stock de forma atómica e
+    idempotente. Devuelve (resultado, estado actual de la orden si no se aplicó).
+
+    Si entra en una sola transacción, la transición (con su historial) y los ADDs van
+    juntos. Si no, se parte en chunks deterministas (SKUs ordenados) y cada chunk
+    registra su marca en `recepcionChunks` de la orden dentro de la misma transacción
+    (condición: la orden sigue APPROVED): un reintento de la recepción saltea los
+    chunks ya aplicados y nunca duplica stock. La transición va al final.
+    """
+    skus = sorted(totales)
+    size = (TX_MAX_ITEMS - estados.acciones_por_transicion()) // stock.acciones_por_update()
+    chunks = [skus[i:i + size] for i in range(0, len(skus), size)] or [[]]
+    recibida = {'receivedBy': {'S': 'Deposito'}}
+
+    if len(chunks) == 1:
+        res = _transact(estados.acciones(order_id, estados.RECEIVED, now, recibida, por='Deposito')
+                        + _stock_add(chunks[0], totales, now, order_id))
+        return ('APPLIED', None) if res is None else _rechazo(res.get('status', {}).get('S', ''))
+
+    # Camino reanudable: un chunk por transacción, marcado por orderId + índice
+    desde, = estados.TRANSICIONES[estados.RECEIVED]
+    for idx, chunk in enumerate(chunks):
+        marca = f"{idx + 1}/{len(chunks)}"
+        res = _transact([{'Update': {
+            'TableName': ORDERS_TABLE, 'Key': {'orderId': {'S': order_id}},
+            'UpdateExpression': 'ADD recepcionChunks :m SET updatedAt = :ts',
+            'ConditionExpression': '#st = :desde AND '
+                                   '(attribute_not_exists(recepcionChunks) OR NOT contains(recepcionChunks, :ms))',
+            'ExpressionAttributeNames': {'#st': 'status'},
+            'ExpressionAttributeValues': {':m': {'SS': [marca]}, ':ms': {'S': marca},
+                                          ':desde': {'S': desde}, ':ts': {'S': now}},
+            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+        }}] + _stock_add(chunk, totales, now, order_id))
+        if res is None:
+            continue
+        actual = res.get('status', {}).get('S', '')
+        if actual != desde:
+            return _rechazo(actual)
+        # chunk ya aplicado en un intento anterior → seguir con el próximo
+
+    actual = estados.aplicar(order_id, estados.RECEIVED, now, recibida, por='Deposito')
+    return ('APPLIED', None) if actual is None else _rechazo(actual)
+
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_transicion('RECEIVE', _get_order_id))
 def lambda_handler(event, context):
     order_id = _get_order_id(event)
     if not order_id:
@@ -48,12 +112,13 @@ def lambda_handler(event, context):
 
     now = datetime.utcnow().isoformat()
 
-    # 1) Leer la orden
+    # 1) Leer la orden (cache del contenedor; el estado lo garantiza la condición de la transacción)
+    ordenes.reset_stats()
     try:
-        resp = orders.get_item(Key={'orderId': order_id})
-        order_item = resp.get('Item')
+        order_item = ordenes.get_order(order_id)
         if not order_item:
             return _html(f"<html><body><h3>❗ Orden {order_id} no encontrada</h3></body></html>", 404)
+        trazas.adoptar(order_item.get('traceId'))
     except ClientError as e:
         return _html(f"<html><body><h3>❗ Error DynamoDB (OrdenesCompra)</h3><pre>{str(e)}</pre></body></html>", 500)
 
@@ -61,46 +126,38 @@ def lambda_handler(event, context):
     if not items:
         return _html(f"<html><body><h3>❗ La orden {order_id} no tiene items</h3></body></html>", 422)
 
-    # 2) Cambiar status -> RECEIVED
-    try:
-        orders.update_item(
-            Key={'orderId': order_id},
-            UpdateExpression='SET #st = :st, receivedAt = :ts, receivedBy = :by, updatedAt = :ts',
-            ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={ ':st': 'RECEIVED', ':ts': now, ':by': 'Deposito' },
-            ConditionExpression='attribute_exists(orderId)'
-        )
-    except ClientError as e:
-        return _html(f"<html><body><h3>❗ Error actualizando estado de la orden</h3><pre>{str(e)}</pre></body></html>", 500)
+    if order_item.get('status') == 'RECEIVED':
+        return _html(f"<html><body><h3>La recepción de la OC {order_id} ya estaba confirmada ✅</h3></body></html>")
+
+    # 2) Agregar cantidades por SKU (una sola escritura por SKU)
+    totales = _totales_por_sku(items)
 
-    # 3) Sumar stock global por SKU
+    # 3) status -> RECEIVED + ADD en StockGlobal, en transacciones
     try:
-        for it in items:
-            if not isinstance(it, dict): 
-                continue
-            sku = str(it.get('sku') or '').strip()
-            if not sku: 
-                continue
-            inc = _to_decimal(it.get('qty', 0))
-            if inc <= 0: 
-                continue
-            stock.update_item(
-                Key={'sku': sku},
-                UpdateExpression='ADD qty :inc SET updatedAt = :ts, lastOrderId = :oid',
-                ExpressionAttributeValues={':inc': inc, ':ts': now, ':oid': order_id}
-            )
+        estado, actual = _aplicar_recepcion(order_id, totales, now)
+        ordenes.invalidate(order_id)
     except ClientError as e:
         return _html(f"<html><body><h3>❗ Error actualizando StockGlobal</h3><pre>{str(e)}</pre></body></html>", 500)
+    if estado == 'NOT_FOUND':
+        return _html(f"<html><body><h3>❗ Orden {order_id} no encontrada</h3></body></html>", 404)
+    if estado == 'ALREADY_RECEIVED':
+        return _html(f"<html><body><h3>La recepción de la OC {order_id} ya estaba confirmada ✅</h3></body></html>")
+    if estado == 'INVALID_STATE':
+        return _html(f"<html><body><h3>❗ No se puede recibir la OC {order_id}</h3>"
+                     f"<p>Estado actual: {actual} (se esperaba APPROVED). No se aplicó ningún cambio.</p></body></html>", 409)
 
     # 4) Emitir evento para notificaciones y pasos siguientes
     try:
-        ev.put_events(Entries=[{
+        eventos.put_events(ev, [{
             'Source': EVENT_SOURCE,                             # com.deposito.recepcion
             'DetailType': 'RecepcionRecibida',
-            'Detail': json.dumps({'orderId': order_id, 'receivedAt': now, 'status': 'RECEIVED'}),
+            'Detail': json.dumps({'orderId': order_id, 'receivedAt': now, 'status': 'RECEIVED',
+                                  'skus': stock.skus_evento(totales),
+                                  'prioridad': order_item.get('prioridad')}),
             'EventBusName': EVENT_BUS                           # ventas-bus
         }])
     except Exception:
         pass
 
+    print("[CACHE]", json.dumps(ordenes.stats()))
     return _html(f"<html><body><h3>Recepción de la OC {order_id} CONFIRMADA ✅</h3></body></html>")
@@ -1,21 +1,19 @@
-import os, json, boto3
+import os, json
 from botocore.exceptions import ClientError
+from comun import aws, digest, eventos, idempotencia, plantillas, sla, trazas
+from comun.util import detail as _detail
 
-sns = boto3.client('sns')
+sns = aws.client('sns')
 
 LOGISTICA_TOPIC_ARN = os.environ.get('LOGISTICA', '').strip()
 API_BASE_URL        = os.environ.get('API_BASE_URL', 'https://1y4g8pdtm1.execute-api.us-east-2.amazonaws.com')
-APP_NAME            = os.environ.get('APP_NAME', 'NBA')
-
-def _detail(evt):
-    d = evt.get('detail', evt)
-    if isinstance(d, str):
-        try: d = json.loads(d)
-        except Exception: d = {}
-    return d
 
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_evento(__file__))
 def lambda_handler(event, context):
-    print("[EVENT]", json.dumps(event))
+    if eventos.fusionado(event, __file__):
+        return {'statusCode': 200, 'body': json.dumps({'info': 'ya procesado en proceso (fused)'})}
+    trazas.log('evento', detailType=event.get('detail-type') or event.get('detailType'))
 
     if (event.get('detail-type') or event.get('detailType')) != 'RecepcionRecibida':
         return {'statusCode': 200, 'body': json.dumps({'info': 'evento ignorado'})}
@@ -30,15 +28,17 @@ def lambda_handler(event, context):
     if not order_id:
         return {'statusCode': 400, 'body': json.dumps({'error': 'orderId ausente en event.detail'})}
 
-    confirm_url = f"{API_BASE_URL}/despachos/{order_id}/confirm"
-
-    subject = f"[{APP_NAME}] Logística: stock disponible para OC {order_id}"
-    msg = (
-        f"Se confirmó la recepción en Depósito.\n\n"
-        f"OC: {order_id}\n"
-        f"Fecha recepción: {received}\n\n"
-        f"Confirmá el despacho aquí:\n{confirm_url}\n"
-    )
+    ctx = dict(sla.contexto(det), orderId=order_id, recibida=received, api=API_BASE_URL)
+    if digest.activo('LOGISTICA', digest.urgente(det)):
+        try:
+            digest.encolar([digest.entrada('LOGISTICA', LOGISTICA_TOPIC_ARN, order_id,
+                                           plantillas.resumen('logistica', ctx, rol='LOGISTICA'),
+                                           'Logística: OCs con stock disponible')])
+            return {'statusCode': 200, 'body': json.dumps({'queuedForDigest': LOGISTICA_TOPIC_ARN})}
+        except ClientError as e:
+            return {'statusCode': 500, 'body': json.dumps({'error': f'Digest: {str(e)}'})}
+
+    subject, msg = plantillas.mensaje('logistica', ctx, rol='LOGISTICA')
 
     try:
         res = sns.publish(TopicArn=LOGISTICA_TOPIC_ARN, Subject=subject, Message=msg)
@@ -1,52 +1,290 @@
-import os, json, boto3
+import os, json, time, random
 from datetime import datetime
 from botocore.exceptions import ClientError
-import random
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
+from comun import asignacion, ordenes, sucursales
+from comun.items import parse_items as _parse_items
+from comun import aws, estados, eventos, idempotencia, ledger, stock, trazas
+from comun.util import get_order_id as _get_order_id, to_decimal as _to_decimal, html as _html
 
-d = boto3.resource('dynamodb')
-ev = boto3.client('events')
+ddb = aws.client('dynamodb')
+ev = aws.client('events')
 
 ENVIOS_TABLE = os.environ.get('ENVIOS_TABLE', 'Envios')
 ORDERS_TABLE = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
-STOCK_TABLE  = os.environ.get('STOCK_TABLE',  'StockGlobal')
 EVENT_BUS    = os.environ.get('EVENT_BUS',    'ventas-bus')
 EVENT_SOURCE = os.environ.get('EVENT_SOURCE', 'com.logistica.despacho')
 
-# DEMO: sucursales a elegir (también podés pasarlas por evento/body)
-SUCURSALES_DEFAULT = os.environ.get('SUCURSALES_DEFAULT', 'S1,S2,S3,S4,S5').split(',')
+# Sucursales candidatas: las de SUCURSALES_DEFAULT más las que aparecen en StockSucursal
+# (o las que vengan en ?sucursales=S1,S2 / body). El reparto lo decide comun.asignacion y lo
+# suma en StockSucursal Stock-SumarSucursales al recibir DespachoConfirmado (fuera del request).
+SUCURSALES_DEFAULT = [s.strip() for s in os.environ.get('SUCURSALES_DEFAULT', 'S1,S2,S3,S4,S5').split(',') if s.strip()]
+# Detalle SKU × sucursal inline en Envios / DespachoConfirmado sólo si entra cómodo (400KB item,
+# 256KB evento); si no, va a AsignacionesEnvio y los dos llevan la referencia (comun/sucursales.py)
+ASIGNACION_MAX_BYTES = int(os.environ.get('ASIGNACION_MAX_BYTES', '150000'))
 
-envios = d.Table(ENVIOS_TABLE)
-orders = d.Table(ORDERS_TABLE)
-stock  = d.Table(STOCK_TABLE)
+# TransactWriteItems admite hasta 100 acciones: Envios + la transición RECEIVED -> DISPATCHED
+# de la orden (con su historial, comun/estados.py) + N SKUs (un SKU con shards puede ocupar
+# hasta uno por shard, cada decremento con su movimiento en el ledger). Órdenes más grandes
+# se reservan en paralelo con un pool acotado.
+TX_MAX_ITEMS  = int(os.environ.get('TX_MAX_ITEMS', '100'))
+MAX_RETRIES   = int(os.environ.get('TX_MAX_RETRIES', '5'))
+STOCK_WORKERS = int(os.environ.get('STOCK_WORKERS', '8'))
 
-def _get_order_id(evt):
-    pp = (evt.get('pathParameters') or {})
-    qp = (evt.get('queryStringParameters') or {})
-    if pp.get('orderId'): return pp['orderId']
-    if qp and qp.get('orderId'): return qp['orderId']
+def _envio_upsert(envio_id, order_id, plan, now):
+    # Update crea la fila si no existe; la condición evita re-despachar (y re-restar stock).
+    # `eventoPendiente` queda hasta que DespachoConfirmado sale: de ese evento dependen las
+    # altas en StockSucursal, así que si se pierde el próximo intento del link lo reemite
+    expr = ('SET orderId=:oid, #st=:st, dispatchedAt=:ts, updatedAt=:ts, confirmedBy=:by, sucursales=:s, '
+            'unidadesPorSucursal=:u, eventoPendiente=:ep')
+    values = {
+        ':oid': {'S': order_id}, ':st': {'S': 'DISPATCH_CONFIRMED'}, ':ts': {'S': now},
+        ':by': {'S': 'Logistica'}, ':s': {'L': [{'S': x} for x in plan['sucursales']]},
+        ':u': {'M': {suc: {'N': str(n)} for suc, n in plan['unidades'].items()}}, ':ep': {'BOOL': True}
+    }
+    if plan['detalle'] is not None:
+        expr += ', asignacion=:a'
+        values[':a'] = {'S': plan['detalle']}
+    if plan.get('ref'):
+        expr += ', asignacionRef=:ar'
+        values[':ar'] = sucursales.ref_item(plan['ref'])
+    return {
+        'TableName': ENVIOS_TABLE,
+        'Key': {'envioId': {'S': envio_id}},
+        'UpdateExpression': expr,
+        'ConditionExpression': 'attribute_not_exists(envioId) OR #st <> :st',
+        'ExpressionAttributeNames': {'#st': 'status'},
+        'ExpressionAttributeValues': values
+    }
+
+def _sucursales_pedidas(evt):
+    qp = evt.get('queryStringParameters') or {}
     body = evt.get('body')
     if isinstance(body, str):
         try: body = json.loads(body)
-        except: body = {}
-    if isinstance(body, dict) and body.get('orderId'):
-        return body['orderId']
-    return evt.get('orderId')
+        except Exception: body = {}
+    raw = qp.get('sucursales') or (body.get('sucursales') if isinstance(body, dict) else None)
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    pedidas = sorted({str(s).strip() for s in raw or [] if str(s).strip()})
+    return pedidas or None
+
+def _planificar(totales, pedidas):
+    """Reparte `totales` entre sucursales según demanda y stock actual (determinístico)."""
+    skus = sorted(totales)
+    leidas = sucursales.stock_y_demanda(skus)   # BatchGetItem de a 100 SKUs
+    candidatas = pedidas or sorted(set(SUCURSALES_DEFAULT).union(*[f.keys() for f in leidas.values()]))
+    stock = [[leidas[s].get(b, (0.0, 0.0))[0] for b in candidatas] for s in skus]
+    demanda = [[leidas[s].get(b, (0.0, 0.0))[1] for b in candidatas] for s in skus]
+    matriz = asignacion.asignar([totales[s] for s in skus], stock, demanda)
+    reparto = asignacion.por_sucursal(skus, candidatas, matriz)
+    detalle = json.dumps(reparto, default=str, separators=(',', ':'))
+    return {
+        'sucursales': sorted(reparto),
+        'reparto': reparto,
+        'unidades': {suc: sum(q.values()) for suc, q in reparto.items()},
+        'detalle': detalle if len(detalle) <= ASIGNACION_MAX_BYTES else None,
+        'ref': None,
+    }
+
+def _acciones_tx(totales):
+    """Peor caso de acciones de stock en la transacción (un SKU con shards puede tocar todos;
+    cada decremento lleva su movimiento en el ledger)."""
+    return sum(stock.shards(sku) for sku in totales) * stock.acciones_por_update()
+
+def _faltante(sku, dec, disponible):
+    return {'sku': sku, 'requested': str(dec), 'available': str(disponible)}
+
+def _ya_despachado(envio_id):
+    resp = ddb.get_item(TableName=ENVIOS_TABLE, Key={'envioId': {'S': envio_id}},
+                        ProjectionExpression='#st', ExpressionAttributeNames={'#st': 'status'},
+                        ConsistentRead=True)
+    return resp.get('Item', {}).get('status', {}).get('S') == 'DISPATCH_CONFIRMED'
+
+def _cabecera(order_id, envio_id, plan, now):
+    """Primeras acciones de la transacción: Envios + RECEIVED -> DISPATCHED de la orden."""
+    return ([{'Update': _envio_upsert(envio_id, order_id, plan, now)}]
+            + estados.acciones(order_id, estados.DISPATCHED, now, {'envioId': {'S': envio_id}}, por='Logistica'))
+
+def _totales(items):
+    """Cantidades agregadas por SKU."""
+    totales = {}
+    for it in items:
+        if isinstance(it, dict):
+            sku = str(it.get('sku') or '').strip()
+            qty = _to_decimal(it.get('qty') or 0)
+            if sku and qty > 0:
+                totales[sku] = totales.get(sku, Decimal(0)) + qty
+    return totales
+
+def _detalle_evento(order_id, envio_id, dispatched_at, plan, skus, prioridad):
+    detail = {
+        'orderId': order_id,
+        'envioId': envio_id,
+        'dispatchedAt': dispatched_at,
+        'status': 'DISPATCH_CONFIRMED',
+        'sucursales': plan['sucursales'],
+        'unidadesPorSucursal': plan['unidades'],
+        'skus': skus,
+        'prioridad': prioridad,
+    }
+    if plan['detalle'] is not None:
+        detail['asignacion'] = plan['reparto']
+    else:
+        detail['asignacionRef'] = plan['ref']    # comun/sucursales.leer_asignacion(envioId, ref)
+    return detail
 
-def _parse_items(items_field):
-    if items_field is None: return []
-    if isinstance(items_field, str):
-        try: return json.loads(items_field)
-        except Exception: return []
-    return items_field
+def _publicar(envio_id, detail):
+    """Publica DespachoConfirmado y baja `eventoPendiente` de Envios. False si no salió."""
+    try:
+        resp = eventos.put_events(ev, [{
+            'Source': EVENT_SOURCE,
+            'DetailType': 'DespachoConfirmado',
+            'Detail': json.dumps(detail, default=str),
+            'EventBusName': EVENT_BUS
+        }])
+        if resp.get('FailedEntryCount'):
+            print("[EVENTO] DespachoConfirmado rechazado", envio_id, json.dumps(resp.get('Entries')))
+            return False
+    except ClientError as e:
+        print("[EVENTO] no se pudo publicar DespachoConfirmado", envio_id, str(e))
+        return False
+    try:
+        ddb.update_item(TableName=ENVIOS_TABLE, Key={'envioId': {'S': envio_id}},
+                        UpdateExpression='REMOVE eventoPendiente')
+    except ClientError as e:
+        # a lo sumo se reemite en otro intento: el consumidor es idempotente por evento y por SKU
+        print("[EVENTO] no se pudo bajar eventoPendiente", envio_id, str(e))
+    return True
+
+def _reemitir(order_id, envio_id, ord_item):
+    """Despacho ya confirmado cuyo DespachoConfirmado no salió: lo arma desde Envios y lo publica.
+    None si no había nada pendiente; si no, True/False según haya salido."""
+    item = ddb.get_item(TableName=ENVIOS_TABLE, Key={'envioId': {'S': envio_id}},
+                        ConsistentRead=True).get('Item') or {}
+    if not item.get('eventoPendiente', {}).get('BOOL'):
+        return None
+    reparto = json.loads(item['asignacion']['S']) if 'asignacion' in item else None
+    plan = {
+        'sucursales': [x['S'] for x in item.get('sucursales', {}).get('L', [])],
+        'unidades': {suc: Decimal(v['N']) for suc, v in item.get('unidadesPorSucursal', {}).get('M', {}).items()},
+        'reparto': reparto,
+        'detalle': item['asignacion']['S'] if reparto is not None else None,
+        'ref': sucursales.ref_de_item(item['asignacionRef']) if 'asignacionRef' in item else None,
+    }
+    totales = _totales(_parse_items(ord_item.get('items')))
+    detail = _detalle_evento(order_id, envio_id, item.get('dispatchedAt', {}).get('S'), plan,
+                             stock.skus_evento(totales), ord_item.get('prioridad'))
+    return _publicar(envio_id, detail)
+
+def _evento_html(order_id):
+    # 5xx: el ledger de idempotencia libera la clave y el mismo link reintenta el evento
+    return _html(f"<html><body><h3>Despacho de la OC {order_id} CONFIRMADO 🚚✅</h3>"
+                 f"<p>❗ No se pudo avisar a sucursales (las altas de stock en sucursales dependen de ese aviso). "
+                 f"Volver a abrir este link para reenviarlo.</p></body></html>", 503)
 
-def _to_decimal(n):
-    try: return Decimal(str(n))
-    except Exception: return Decimal(0)
+def _rechazo_cabecera(reasons):
+    """(estado, detalle) si la transacción se canceló por Envios o por la orden; None si no."""
+    if (reasons[0] or {}).get('Code') == 'ConditionalCheckFailed':
+        return 'ALREADY_DISPATCHED', []
+    if len(reasons) > 1 and (reasons[1] or {}).get('Code') == 'ConditionalCheckFailed':
+        actual = estados.estado_de(reasons[1])
+        if actual == estados.DISPATCHED:
+            return 'ALREADY_DISPATCHED', []
+        return ('NOT_FOUND' if not actual else 'INVALID_STATE'), actual
+    return None
 
-def _html(body, code=200):
-    return {'statusCode': code, 'headers': {'Content-Type':'text/html; charset=UTF-8'}, 'body': body}
+def _despachar_transaccion(order_id, envio_id, totales, plan, now):
+    """Envios + transición de la orden + decrementos condicionales en una sola TransactWriteItems.
+    Los SKUs con shards se leen antes para elegir de qué shards restar; si otro despacho
+    cambió esos shards en el medio, la transacción se cancela y se replanifica."""
+    skus = list(totales)
+    calientes = [sku for sku in skus if stock.shards(sku) > 1]
+    intento = 0
+    while True:
+        # 1) Shards actuales de los SKUs calientes (los simples se validan en la condición)
+        leidos = stock.leer_shards(calientes) if calientes else {}
+        acciones, faltantes = _cabecera(order_id, envio_id, plan, now), []
+        dueños = [None] * len(acciones)
+        for sku in skus:
+            retiro = stock.acciones_retiro(sku, totales[sku], now, order_id, leidos.get(sku), intento)
+            if retiro is None:
+                faltantes.append(_faltante(sku, totales[sku], sum(leidos[sku].values(), Decimal(0))))
+                continue
+            acciones += retiro
+            dueños += [sku] * len(retiro)
+        if faltantes:
+            return ('ALREADY_DISPATCHED', []) if _ya_despachado(envio_id) else ('SHORTFALL', faltantes)
 
+        # 2) Todo o nada
+        try:
+            ddb.transact_write_items(TransactItems=acciones)
+            return 'DISPATCHED', []
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                raise
+            reasons = e.response.get('CancellationReasons') or []
+            fallidos = [(i, r) for i, r in enumerate(reasons)
+                        if (r or {}).get('Code') in ('ConditionalCheckFailed', 'TransactionConflict')]
+            if not fallidos:
+                raise
+            rechazo = _rechazo_cabecera(reasons)
+            if rechazo:
+                return rechazo
+            simples = [(dueños[i], r) for i, r in fallidos
+                       if i < len(dueños) and stock.shards(dueños[i]) == 1 and r.get('Code') == 'ConditionalCheckFailed']
+            if simples:
+                return 'SHORTFALL', [_faltante(sku, totales[sku], (r.get('Item') or {}).get('qty', {}).get('N', '0'))
+                                     for sku, r in simples]
+            # 3) Contención en shards: releer y volver a planificar
+            if intento >= MAX_RETRIES:
+                raise
+            time.sleep(random.uniform(0, 0.01 * (2 ** intento)))
+            intento += 1
+
+def _despachar_pool(order_id, envio_id, totales, plan, now):
+    """Órdenes que exceden el límite transaccional: decrementos condicionales en
+    un pool acotado; si algún SKU no alcanza se compensan los ya aplicados, y también si
+    la orden no está RECEIVED al confirmar Envios + la transición."""
+    def reservar(sku):
+        try:
+            disponible = stock.retirar(sku, totales[sku], now, order_id)
+            return sku, (None if disponible is None else _faltante(sku, totales[sku], disponible))
+        except ClientError as e:
+            return sku, e
+
+    def compensar(skus):
+        def devolver(sku):
+            stock.ingresar(sku, totales[sku], now, order_id, ledger.COMPENSACION)
+        with ThreadPoolExecutor(max_workers=STOCK_WORKERS) as pool:
+            list(pool.map(trazas.propagar(devolver), skus))
+
+    with ThreadPoolExecutor(max_workers=STOCK_WORKERS) as pool:
+        resultados = list(pool.map(trazas.propagar(reservar), totales))
+
+    aplicados = [sku for sku, r in resultados if r is None]
+    errores   = [r for _, r in resultados if isinstance(r, Exception)]
+    faltantes = [r for _, r in resultados if isinstance(r, dict)]
+    if errores or faltantes:
+        compensar(aplicados)
+        if errores:
+            raise errores[0]
+        return 'SHORTFALL', faltantes
+
+    try:
+        ddb.transact_write_items(TransactItems=_cabecera(order_id, envio_id, plan, now))
+    except ClientError as e:
+        compensar(aplicados)
+        rechazo = (_rechazo_cabecera(e.response.get('CancellationReasons') or [{}])
+                   if e.response.get('Error', {}).get('Code') == 'TransactionCanceledException' else None)
+        if rechazo:
+            return rechazo
+        raise
+    return 'DISPATCHED', []
+
+@trazas.instrumentar(__file__)
+@idempotencia.idempotente(idempotencia.por_transicion('DISPATCH', _get_order_id))
 def lambda_handler(event, context):
     order_id = _get_order_id(event)
     if not order_id:
@@ -56,105 +294,83 @@ def lambda_handler(event, context):
     envio_id = order_id
 
     # 0) Leer orden para obtener items
+    ordenes.reset_stats()
     try:
-        resp = orders.get_item(Key={'orderId': order_id})
-        ord_item = resp.get('Item')
+        ord_item = ordenes.get_order(order_id)
         if not ord_item:
             return _html(f"<html><body><h3>❗ Orden {order_id} no encontrada</h3></body></html>", 404)
+        trazas.adoptar(ord_item.get('traceId'))
         items = _parse_items(ord_item.get('items'))
     except ClientError as e:
         return _html(f"<html><body><h3>❗ Error leyendo OrdenesCompra</h3><pre>{str(e)}</pre></body></html>", 500)
 
-    # 1) Elegir 2 o 3 sucursales (demo). Si querés fijo, pasalas por body.
-    k = random.choice((2, 3))
-    seleccionadas = random.sample(SUCURSALES_DEFAULT, k)
+    # 1) Agregar cantidades por SKU
+    totales = _totales(items)
 
-    # 2) Upsert en Envios (PK envioId)
+    # 2) Repartir entre sucursales según demanda y stock de cada una
     try:
+        plan = _planificar(totales, _sucursales_pedidas(event))
+    except ClientError as e:
+        return _html(f"<html><body><h3>❗ Error leyendo StockSucursal</h3><pre>{str(e)}</pre></body></html>", 500)
+
+    # 2b) Detalle que no entra en Envios / el evento: a AsignacionesEnvio antes de confirmar,
+    #     así la referencia que queda en Envios apunta a partes ya escritas
+    if plan['detalle'] is None:
         try:
-            envios.put_item(
-                Item={
-                    'envioId': envio_id,
-                    'orderId': order_id,
-                    'status': 'DISPATCH_CONFIRMED',
-                    'dispatchedAt': now,
-                    'updatedAt': now,
-                    'confirmedBy': 'Logistica',
-                    'sucursales': seleccionadas
-                },
-                ConditionExpression='attribute_not_exists(envioId)'
-            )
+            plan['ref'] = sucursales.guardar_asignacion(envio_id, now, plan['reparto'])
         except ClientError as e:
-            if e.response.get('Error',{}).get('Code') != 'ConditionalCheckFailedException':
-                raise
-            envios.update_item(
-                Key={'envioId': envio_id},
-                UpdateExpression='SET #st=:st, dispatchedAt=:ts, updatedAt=:ts, confirmedBy=:by, sucursales=:s',
-                ExpressionAttributeNames={'#st': 'status'},
-                ExpressionAttributeValues={':st':'DISPATCH_CONFIRMED', ':ts': now, ':by':'Logistica', ':s': seleccionadas}
-            )
-    except ClientError as e:
-        return _html(f"<html><body><h3>❗ Error actualizando Envios</h3><pre>{str(e)}</pre></body></html>", 500)
+            return _html(f"<html><body><h3>❗ Error guardando la asignación</h3><pre>{str(e)}</pre></body></html>", 500)
 
-    # 3) Restar stock global por SKU (si no alcanza, setear 0 — no borra filas)
-    ajustados = []
+    # 3) Upsert en Envios + restar StockGlobal como una sola unidad
     try:
-        totales = {}
-        for it in _parse_items(ord_item.get('items')):
-            if isinstance(it, dict):
-                sku = str(it.get('sku') or '').strip()
-                qty = _to_decimal(it.get('qty') or 0)
-                if sku and qty > 0:
-                    totales[sku] = totales.get(sku, Decimal(0)) + qty
-
-        for sku, dec in totales.items():
-            try:
-                stock.update_item(
-                    Key={'sku': sku},
-                    UpdateExpression='ADD qty :dec SET updatedAt = :ts, lastOrderId = :oid',
-                    ExpressionAttributeValues={
-                        ':dec': Decimal(0) - dec,
-                        ':ts':  now,
-                        ':oid': order_id,
-                        ':need': dec
-                    },
-                    ConditionExpression='attribute_exists(qty) AND qty >= :need'
-                )
-                ajustados.append(f"{sku} -{dec}")
-            except ClientError as e:
-                if e.response.get('Error',{}).get('Code') == 'ConditionalCheckFailedException':
-                    stock.update_item(
-                        Key={'sku': sku},
-                        UpdateExpression='SET qty = :zero, updatedAt = :ts, lastOrderId = :oid',
-                        ExpressionAttributeValues={':zero': Decimal(0), ':ts': now, ':oid': order_id}
-                    )
-                    ajustados.append(f"{sku} -> 0")
-                else:
-                    raise
+        if _acciones_tx(totales) + 1 + estados.acciones_por_transicion() <= TX_MAX_ITEMS:
+            estado, detalle = _despachar_transaccion(order_id, envio_id, totales, plan, now)
+        else:
+            estado, detalle = _despachar_pool(order_id, envio_id, totales, plan, now)
     except ClientError as e:
-        return _html(f"<html><body><h3>❗ Error ajustando StockGlobal</h3><pre>{str(e)}</pre></body></html>", 500)
+        return _html(f"<html><body><h3>❗ Error confirmando despacho (Envios/StockGlobal)</h3><pre>{str(e)}</pre></body></html>", 500)
+    ordenes.invalidate(order_id)
+    if plan['ref'] and estado != 'DISPATCHED':
+        # este intento no confirmó: sus partes no las referencia nadie (si ya estaba
+        # despachado, Envios apunta a las del intento que sí confirmó)
+        sucursales.descartar_asignacion(envio_id, plan['ref'])
 
-    # 4) Publicar evento para que otros (Sucursales/Proveedores) notifiquen
-    detail = {
-        'orderId': order_id,
-        'envioId': envio_id,
-        'dispatchedAt': now,
-        'status': 'DISPATCH_CONFIRMED',
-        'sucursales': seleccionadas
-    }
-    try:
-        ev.put_events(Entries=[{
-            'Source': EVENT_SOURCE,
-            'DetailType': 'DespachoConfirmado',
-            'Detail': json.dumps(detail),
-            'EventBusName': EVENT_BUS
-        }])
-    except Exception as _:
-        pass
+    if estado == 'ALREADY_DISPATCHED':
+        try:
+            enviado = _reemitir(order_id, envio_id, ord_item)
+        except ClientError as e:
+            enviado = False
+            print("[EVENTO] no se pudo leer Envios para reemitir", order_id, str(e))
+        if enviado is False:
+            return _evento_html(order_id)
+        return _html(f"<html><body><h3>El despacho de la OC {order_id} ya estaba confirmado 🚚✅</h3></body></html>")
+    if estado == 'NOT_FOUND':
+        return _html(f"<html><body><h3>❗ Orden {order_id} no encontrada</h3></body></html>", 404)
+    if estado == 'INVALID_STATE':
+        return _html(f"<html><body><h3>❗ No se puede despachar la OC {order_id}</h3>"
+                     f"<p>Estado actual: {detalle} (se esperaba RECEIVED). No se aplicó ningún cambio.</p></body></html>", 409)
+    if estado == 'SHORTFALL':
+        filas = "".join(
+            f"<li>{f['sku']}: pedido {f['requested']}, disponible {f['available']}</li>" for f in detalle
+        )
+        return _html(
+            f"<html><body><h3>❗ Stock insuficiente para despachar la OC {order_id}</h3>"
+            f"<p>No se aplicó ningún cambio. Faltantes por SKU:</p><ul>{filas}</ul></body></html>", 409
+        )
+    ajustados = [f"{sku} -{dec}" for sku, dec in totales.items()]
+
+    # 4) Publicar evento: Stock-SumarSucursales suma lo asignado en StockSucursal y
+    #    Sucursales/Proveedores notifican. Si no sale, Envios queda con eventoPendiente
+    detail = _detalle_evento(order_id, envio_id, now, plan, stock.skus_evento(totales), ord_item.get('prioridad'))
+    enviado = _publicar(envio_id, detail)
 
+    print("[CACHE]", json.dumps(ordenes.stats()))
+    if not enviado:
+        return _evento_html(order_id)
     resumen = " | ".join(ajustados) if ajustados else "(sin SKUs para ajustar)"
+    destinos = ", ".join(f"{suc} ({plan['unidades'][suc]} u.)" for suc in plan['sucursales'])
     return _html(
         f"<html><body><h3>Despacho de la OC {order_id} CONFIRMADO 🚚✅</h3>"
-        f"<p>Sucursales destino: {', '.join(seleccionadas)}</p>"
+        f"<p>Sucursales destino: {destinos}</p>"
         f"<p>Ajustes de StockGlobal: {resumen}</p></body></html>"
     )
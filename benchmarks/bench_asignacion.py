@@ -0,0 +1,89 @@
+"""Motor de asignación a sucursales (comun/asignacion.py): tiempo por tamaño SKU × sucursal.
+
+`plan ms` es lo que paga el request de despacho además de las lecturas: asignar + armar
+{sucursal: {sku: qty}} + serializarlo (y partirlo si no entra inline, comun/sucursales.py).
+Se compara contra `--budget-ms`; sale con código 1 si algún tamaño lo excede.
+
+Uso: python benchmarks/bench_asignacion.py [--sizes 10x5,100x50,1000x500] [--density 0.6]
+                                           [--budget-ms 500] [--json]
+"""
+import os, sys, json, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local import fakes
+fakes.install()   # comun/sucursales importa botocore; el bench no llama a AWS
+from comun.asignacion import asignar, por_sucursal
+from comun import sucursales
+
+BUDGET_MS = float(os.environ.get('ASIGNACION_BUDGET_MS', '500'))
+ASIGNACION_MAX_BYTES = 150000   # default de Logistica-ConfirmarDespacho
+
+def _caso(skus, sucursales, density, seed=7):
+    rnd = random.Random(seed)
+    cantidades = [rnd.randrange(1, 4 * sucursales) for _ in range(skus)]
+    stock = [[float(rnd.randrange(0, 20)) for _ in range(sucursales)] for _ in range(skus)]
+    demanda = [[rnd.random() * 3 if rnd.random() < density else 0.0 for _ in range(sucursales)]
+               for _ in range(skus)]
+    return cantidades, stock, demanda
+
+def _best(fn, repeat):
+    mejor, res = float('inf'), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor * 1000, res  # ms
+
+def _plan(cantidades, stock, demanda, ids_sku, ids_suc):
+    # mismo camino que Logistica-ConfirmarDespacho._planificar después de leer StockSucursal
+    reparto = por_sucursal(ids_sku, ids_suc, asignar(cantidades, stock, demanda))
+    detalle = json.dumps(reparto, default=str, separators=(',', ':'))
+    if len(detalle) > ASIGNACION_MAX_BYTES:
+        list(sucursales._partes(reparto))
+    return reparto
+
+def run(sizes, density, repeat=5, budget_ms=BUDGET_MS):
+    filas = []
+    for skus, sucursales in sizes:
+        cantidades, stock, demanda = _caso(skus, sucursales, density)
+        ms, matriz = _best(lambda: asignar(cantidades, stock, demanda), repeat)
+        assert all(sum(f) == q for f, q in zip(matriz, cantidades)), 'la asignación no suma lo despachado'
+        ids_sku = [f"SKU-{i:05d}" for i in range(skus)]
+        ids_suc = [f"S{j:03d}" for j in range(sucursales)]
+        ms_reparto, reparto = _best(lambda: por_sucursal(ids_sku, ids_suc, matriz), repeat)
+        ms_plan, _ = _best(lambda: _plan(cantidades, stock, demanda, ids_sku, ids_suc), repeat)
+        filas.append({
+            'skus': skus, 'sucursales': sucursales, 'cells': skus * sucursales,
+            'allocate_ms': round(ms, 3), 'to_dict_ms': round(ms_reparto, 3),
+            'plan_ms': round(ms_plan, 3), 'budget_ms': budget_ms, 'within_budget': ms_plan <= budget_ms,
+            'ns_per_cell': round(ms * 1e6 / (skus * sucursales), 1),
+            'nonzero_cells': sum(len(v) for v in reparto.values()),
+            'record_bytes': len(json.dumps(reparto, separators=(',', ':'))),
+        })
+    return filas
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--sizes', default='10x5,100x50,1000x500', help='SKUsxSucursales separados por coma')
+    ap.add_argument('--density', type=float, default=0.6, help='fracción de sucursales con demanda > 0')
+    ap.add_argument('--repeat', type=int, default=5)
+    ap.add_argument('--budget-ms', type=float, default=BUDGET_MS,
+                    help='presupuesto del plan dentro del request de despacho (ASIGNACION_BUDGET_MS)')
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args()
+    sizes = [tuple(int(x) for x in s.lower().split('x')) for s in args.sizes.split(',')]
+    filas = run(sizes, args.density, args.repeat, args.budget_ms)
+    if args.json:
+        print(json.dumps(filas, indent=2))
+    else:
+        print(f"{'SKUs':>6} {'suc':>5} {'celdas':>8} {'asignar ms':>11} {'dict ms':>8} {'plan ms':>8} "
+              f"{'ns/celda':>9} {'≠0':>8} {'bytes':>9}  presupuesto")
+        for f in filas:
+            print(f"{f['skus']:>6} {f['sucursales']:>5} {f['cells']:>8} {f['allocate_ms']:>11.2f} {f['to_dict_ms']:>8.2f} "
+                  f"{f['plan_ms']:>8.2f} {f['ns_per_cell']:>9.1f} {f['nonzero_cells']:>8} {f['record_bytes']:>9}  "
+                  f"{'OK' if f['within_budget'] else 'EXCEDE'} ({f['budget_ms']:.0f} ms)")
+    if not all(f['within_budget'] for f in filas):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
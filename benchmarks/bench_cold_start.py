@@ -0,0 +1,131 @@
+"""Cold start por handler: tiempo de import y de la primera invocación.
+
+Cada handler corre en un proceso Python nuevo (como un contenedor Lambda frío).
+
+    python benchmarks/bench_cold_start.py                      # árbol actual
+    python benchmarks/bench_cold_start.py --compare HEAD~1     # antes (rev) vs después (árbol actual)
+    python benchmarks/bench_cold_start.py --backend real --endpoint-url http://localhost:4566
+
+Backends:
+  fake  (default) boto3/botocore falsos de local/fakes.py: mide el costo propio del handler.
+  real  boto3 instalado. El import mide la creación de clientes/resources; la primera
+        invocación sólo se mide si hay --endpoint-url (LocalStack, DynamoDB Local, moto).
+"""
+import os, sys, json, glob, argparse, subprocess, tempfile, statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Evento de ejemplo por handler (la primera invocación ejercita clientes y llamadas AWS)
+EVENTS = {
+    'Compras-CrearOrden-CasaCentral': {'body': json.dumps({'orderId': 'OC-BENCH', 'items': [{'sku': 'A', 'qty': 1}]})},
+    'CasaCentral-ProcesarOrden-Deposito': {'id': 'bench-1', 'detail-type': 'OrdenCreada', 'detail': {'orderId': 'OC-BENCH'}},
+    'Notificaciones-OC': {'id': 'bench-2', 'detail-type': 'OrdenPendienteAprobacion', 'detail': {'orderId': 'OC-BENCH'}},
+    'CasaCentral-AprobarOrden': {'pathParameters': {'orderId': 'OC-BENCH'}},
+    'CasaCentral-RechazarOrden': {'pathParameters': {'orderId': 'OC-BENCH'}},
+    'Notificaciones-Proveedor': {'id': 'bench-3', 'detail-type': 'OrdenAprobada', 'detail': {'orderId': 'OC-BENCH'}},
+    'Notificaciones-Deposito-A-R': {'id': 'bench-4', 'detail-type': 'OrdenAprobada', 'detail': {'orderId': 'OC-BENCH'}},
+    'Deposito-AceptarRecepcion': {'pathParameters': {'orderId': 'OC-BENCH'}},
+    'Notificaciones-Logistica-Recepcion': {'id': 'bench-5', 'detail-type': 'RecepcionRecibida', 'detail': {'orderId': 'OC-BENCH'}},
+    'Logistica-ConfirmarDespacho': {'pathParameters': {'orderId': 'OC-BENCH'}},
+    'Notificaciones-Sucursales': {'id': 'bench-6', 'detail-type': 'DespachoConfirmado', 'detail': {'orderId': 'OC-BENCH', 'sucursales': ['S1', 'S2']}},
+    'CasaCentral-ConsultarOrdenes': {'queryStringParameters': {'status': 'CREATED'}},
+    'CasaCentral-DecidirOrdenes': {'body': json.dumps([{'orderId': 'OC-BENCH', 'decision': 'approve'}])},
+}
+
+ENV = {
+    'ROLE_TOPIC_MAP': json.dumps({'COMPRAS_APROBADORES': 'arn:aws:sns:us-east-2:000000000000:COMPRAS_APROBADORES'}),
+    'PROVEEDORES': 'arn:aws:sns:us-east-2:000000000000:PROVEEDORES',
+    'DEPOSITO': 'arn:aws:sns:us-east-2:000000000000:DEPOSITO',
+    'LOGISTICA': 'arn:aws:sns:us-east-2:000000000000:LOGISTICA',
+    'SUCURSALES_TOPIC_ARN': 'arn:aws:sns:us-east-2:000000000000:SUCURSALES',
+    'AWS_DEFAULT_REGION': 'us-east-2',
+}
+
+# Corre dentro del proceso hijo: argv = root, archivo, backend, evento JSON, invocar(0/1)
+CHILD = r'''
+import sys, time, json, io, contextlib, importlib.util
+t0 = time.perf_counter()
+root, path, backend, event, invoke = sys.argv[1], sys.argv[2], sys.argv[3], json.loads(sys.argv[4]), sys.argv[5] == '1'
+sys.path.insert(0, root)
+if backend == 'fake':
+    sys.path.insert(0, sys.argv[6])
+    from local import fakes
+    fakes.install()
+    # orden de ejemplo para que la primera invocación haga el trabajo real (no un 404)
+    sys.modules['boto3'].client('dynamodb').put_item(TableName='OrdenesCompra', Item={
+        'orderId': {'S': 'OC-BENCH'}, 'status': {'S': 'PENDING_APPROVAL'}, 'updatedAt': {'S': '2000-01-01T00:00:00'},
+        'items': {'S': json.dumps([{'sku': 'A', 'qty': 1}])}})
+spec = importlib.util.spec_from_file_location('handler', path)
+mod = importlib.util.module_from_spec(spec)
+with contextlib.redirect_stdout(io.StringIO()):
+    spec.loader.exec_module(mod)
+t1 = time.perf_counter()
+first = None
+if invoke:
+    with contextlib.redirect_stdout(io.StringIO()):
+        try:
+            mod.lambda_handler(event, None)
+        except Exception:
+            pass
+    first = time.perf_counter() - t1
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'first_invoke_ms': first * 1000 if first is not None else None}))
+'''
+
+def measure(root, backend, repeat, endpoint=None):
+    env = dict(os.environ, **ENV)
+    if endpoint:
+        env['AWS_ENDPOINT_URL'] = endpoint
+    invoke = backend == 'fake' or bool(endpoint)
+    out = {}
+    for path in sorted(glob.glob(os.path.join(root, '[0-9]* *.py')), key=lambda p: int(os.path.basename(p).split(' ')[0])):
+        name = os.path.basename(path)[:-3].split(' ', 1)[1]
+        runs = []
+        for _ in range(repeat):
+            r = subprocess.run([sys.executable, '-c', CHILD, root, path, backend, json.dumps(EVENTS.get(name, {})),
+                                '1' if invoke else '0', ROOT],
+                               capture_output=True, text=True, env=env, cwd=root)
+            if r.returncode != 0:
+                runs = None
+                out[name] = {'error': r.stderr.strip().splitlines()[-1] if r.stderr.strip() else 'falló'}
+                break
+            runs.append(json.loads(r.stdout.strip().splitlines()[-1]))
+        if runs:
+            med = lambda k: round(statistics.median(x[k] for x in runs), 2) if runs[0][k] is not None else None
+            out[name] = {'import_ms': med('import_ms'), 'first_invoke_ms': med('first_invoke_ms')}
+    return out
+
+def checkout(rev):
+    tmp = tempfile.mkdtemp(prefix='coldstart-')
+    archive = subprocess.run(['git', '-C', ROOT, 'archive', rev], capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', tmp], input=archive, check=True)
+    return tmp
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--backend', choices=('fake', 'real'), default='fake')
+    ap.add_argument('--endpoint-url', default=None)
+    ap.add_argument('--repeat', type=int, default=5)
+    ap.add_argument('--compare', metavar='REV', help='revisión git para el "antes"')
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args()
+
+    after = measure(ROOT, args.backend, args.repeat, args.endpoint_url)
+    before = measure(checkout(args.compare), args.backend, args.repeat, args.endpoint_url) if args.compare else None
+    if args.json:
+        print(json.dumps({'backend': args.backend, 'before': before, 'after': after}, indent=2))
+        return
+
+    fmt = lambda v: '-' if v is None else f"{v:.2f}"
+    if before is None:
+        print(f"{'handler':<38} {'import ms':>10} {'1ª inv ms':>10}")
+        for name, r in after.items():
+            print(f"{name:<38} {fmt(r.get('import_ms')):>10} {fmt(r.get('first_invoke_ms')):>10}  {r.get('error', '')}")
+        return
+    print(f"{'handler':<38} {'import antes':>13} {'después':>9} {'1ª inv antes':>13} {'después':>9}")
+    for name, r in after.items():
+        b = before.get(name, {})
+        print(f"{name:<38} {fmt(b.get('import_ms')):>13} {fmt(r.get('import_ms')):>9} "
+              f"{fmt(b.get('first_invoke_ms')):>13} {fmt(r.get('first_invoke_ms')):>9}  {r.get('error', '') or b.get('error', '')}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+"""Patrones de acceso a DynamoDB por handler: round-trips, tiempo y capacidad según el tamaño de la OC.
+
+Cada caso (líneas × fracción de SKUs repetidos × concurrencia) lleva `--orders` OCs por el
+flujo completo sobre los fakes de local/fakes.py, una etapa a la vez: primero el endpoint
+(alta, aprobación, recepción, despacho) para todas las OCs con `concurrencia` hilos, después
+los eventos que publicó, enrutados con la tabla de reglas del README (local/harness.py)
+target por target. Así los contadores de cada etapa son sólo de ese handler:
+  - round-trips por API y por OC (GetItem repetidos, UpdateItem por línea, ...)
+  - RCU / WCU estimadas por tamaño de item (FakeAWS.capacity, reglas de DynamoDB)
+  - wall de la etapa y p50 / p95 por invocación, con `--rtt-ms` de latencia por llamada AWS
+
+Las OCs por caso bajan con el tamaño (`--line-budget` líneas en total, mínimo 1 OC): el
+barrido completo hasta 10k líneas tarda unos minutos con la latencia default; para una
+pasada rápida, `--lines 1,10,100`. `ITEMS_FORMAT=v1` mide el formato columnar de `items`.
+
+La salida `--json` es estable (claves ordenadas) para guardarla y comparar entre versiones:
+
+    python benchmarks/bench_handlers.py --json > antes.json
+    python benchmarks/bench_handlers.py --baseline antes.json
+
+Uso: python benchmarks/bench_handlers.py [--lines 1,10,100,1000,10000] [--dup 0,0.5] [--concurrency 1,8] [--json]
+"""
+import os, sys, json, time, uuid, random, argparse, threading, contextlib, io
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('TRACE_SPANS', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local import fakes, harness
+
+# Endpoints en el orden del flujo; después de cada uno se entregan sus eventos
+PASOS = (harness.CREATE, harness.APPROVE, harness.RECEIVE, harness.DISPATCH)
+
+def _orden(lines, dup, rnd, sku_pool):
+    """`lines` líneas; una fracción `dup` repite un SKU que ya está en la OC."""
+    distintos = max(1, round(lines * (1 - dup)))
+    skus = [f"SKU-{n:05d}" for n in rnd.sample(range(max(sku_pool, distintos)), distintos)]
+    items = [{'sku': s, 'qty': rnd.randrange(1, 50)} for s in skus]
+    items += [{'sku': rnd.choice(skus), 'qty': rnd.randrange(1, 50)} for _ in range(lines - distintos)]
+    rnd.shuffle(items)
+    return items
+
+def _evento_http(paso, order_id, items):
+    if paso == harness.CREATE:
+        return {'body': json.dumps({'orderId': order_id, 'items': items, 'origen': 'Benchmark'})}
+    return harness._http(order_id)
+
+def _evento(entry):
+    # id único: los handlers descartan eventos repetidos
+    return {'version': '0', 'id': str(uuid.uuid4()), 'source': entry.get('Source'),
+            'detail-type': entry.get('DetailType'), 'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'detail': json.loads(entry.get('Detail') or '{}')}
+
+def _targets(rules, entry):
+    fused = json.loads(entry.get('Detail') or '{}').get('fusedTargets') or []
+    return [r['target'] for r in rules
+            if r['source'] == entry.get('Source') and r['detailType'] == entry.get('DetailType')
+            and r['target'] not in fused]
+
+def _fallo(res):
+    return isinstance(res, dict) and (res.get('statusCode', 200) >= 400 or res.get('ok') is False
+                                      or bool(res.get('batchItemFailures')))
+
+class _Banco:
+    """Handlers cargados una vez sobre un FakeAWS; cada caso vacía las tablas y los contadores."""
+
+    def __init__(self, rtt_ms):
+        for k, v in harness.FAKE_ENV.items():
+            os.environ.setdefault(k, v)
+        os.environ['INTAKE_MODE'] = 'sync'
+        latency = {s + '.*': rtt_ms / 1000.0 for s in ('dynamodb', 'events', 'sns', 'sqs')} if rtt_ms else None
+        self.aws = fakes.install(fakes.FakeAWS(latency=latency))
+        self.rules = harness.load_rules()
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.handlers = harness.load_handlers()
+        self.pendientes, self.lock = [], threading.Lock()
+        self.casos = 0
+        self.aws.event_listeners.append(self._on_put_event)
+
+    def _on_put_event(self, entry):
+        with self.lock:
+            self.pendientes.append(entry)
+
+    def _reset(self):
+        for t in self.aws.tables.values():
+            t.clear()
+        self.aws.calls.clear()
+        self.aws.capacity.clear()
+        self.aws.sns_messages.clear()
+        self.pendientes = []
+
+    def _etapa(self, etapas, name, eventos, concurrencia):
+        """Invoca `name` con todos sus eventos en paralelo y acumula lo que consumió."""
+        calls0 = Counter(self.aws.calls)
+        cap0 = {t: Counter(c) for t, c in self.aws.capacity.items()}
+        tiempos, errores = [], [0]
+
+        def invocar(ev):
+            t0 = time.perf_counter()
+            try:
+                res = self.handlers[name].lambda_handler(ev, None)
+            except Exception as e:
+                res = {'statusCode': 599, 'body': repr(e)}
+            dt = time.perf_counter() - t0
+            with self.lock:
+                tiempos.append(dt)
+                errores[0] += _fallo(res)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrencia, len(eventos)))) as pool:
+            list(pool.map(invocar, eventos))
+        e = etapas[name]
+        e['wall'] += time.perf_counter() - t0
+        e['tiempos'] += tiempos
+        e['errores'] += errores[0]
+        e['calls'].update(Counter(self.aws.calls) - calls0)
+        for t, c in self.aws.capacity.items():
+            for u, v in c.items():
+                d = v - cap0.get(t, {}).get(u, 0)
+                if d:
+                    e['capacidad'][t][u] += d
+
+    def _entregar(self, etapas, concurrencia):
+        """Entrega los eventos pendientes (por rondas, un target a la vez) hasta que no quede ninguno."""
+        while self.pendientes:
+            ronda, self.pendientes = self.pendientes, []
+            por_target = defaultdict(list)
+            for entry in ronda:
+                for target in _targets(self.rules, entry):
+                    por_target[target].append(_evento(entry))
+            for target, eventos in por_target.items():
+                self._etapa(etapas, target, eventos, concurrencia)
+
+    def caso(self, lines, dup, concurrencia, orders, sku_pool, seed=7):
+        self._reset()
+        self.casos += 1   # orderIds nuevos en cada caso (cachés en memoria de los handlers)
+        rnd = random.Random(seed)
+        ocs = [(f"OC-B{self.casos:03d}-{i:05d}", _orden(lines, dup, rnd, sku_pool)) for i in range(orders)]
+        etapas = defaultdict(lambda: {'wall': 0.0, 'tiempos': [], 'errores': 0, 'calls': Counter(),
+                                      'capacidad': defaultdict(Counter)})
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for paso in PASOS:
+                self._etapa(etapas, paso, [_evento_http(paso, oid, items) for oid, items in ocs], concurrencia)
+                self._entregar(etapas, concurrencia)
+        wall = time.perf_counter() - t0
+        return {'lines': lines, 'dup': dup, 'concurrency': concurrencia, 'orders': orders,
+                'wall_s': round(wall, 3), 'stages': {k: _resumen(v, orders) for k, v in sorted(etapas.items())},
+                'totals': _totales(etapas, orders)}
+
+def _ms(vals, p):
+    v = harness.percentile(vals, p)
+    return round(v * 1000, 3) if v is not None else None
+
+def _resumen(e, orders):
+    rcu = sum(c['RCU'] for c in e['capacidad'].values())
+    wcu = sum(c['WCU'] for c in e['capacidad'].values())
+    return {
+        'invocations': len(e['tiempos']), 'errors': e['errores'], 'wall_s': round(e['wall'], 3),
+        'p50_ms': _ms(e['tiempos'], 50), 'p95_ms': _ms(e['tiempos'], 95),
+        'round_trips_per_order': round(sum(e['calls'].values()) / orders, 2),
+        'calls_per_order': {api: round(v / orders, 2) for api, v in sorted(e['calls'].items())},
+        'rcu_per_order': round(rcu / orders, 2), 'wcu_per_order': round(wcu / orders, 2),
+        'capacity_by_table': {t: {u: round(v / orders, 2) for u, v in sorted(c.items())}
+                              for t, c in sorted(e['capacidad'].items())},
+    }
+
+def _totales(etapas, orders):
+    calls = sum(sum(e['calls'].values()) for e in etapas.values())
+    rcu = sum(c['RCU'] for e in etapas.values() for c in e['capacidad'].values())
+    wcu = sum(c['WCU'] for e in etapas.values() for c in e['capacidad'].values())
+    return {'round_trips_per_order': round(calls / orders, 2), 'rcu_per_order': round(rcu / orders, 2),
+            'wcu_per_order': round(wcu / orders, 2), 'errors': sum(e['errores'] for e in etapas.values())}
+
+# ----------------------------------------------------------------------------
+# Comparación con una corrida anterior (--baseline)
+# ----------------------------------------------------------------------------
+
+def _clave(c):
+    return (c['lines'], c['dup'], c['concurrency'])
+
+def comparar(antes, despues):
+    """Filas (caso, etapa, métrica, antes, después) donde cambió algo de lo determinístico."""
+    previos = {_clave(c): c for c in antes.get('cases', [])}
+    filas = []
+    for c in despues['cases']:
+        b = previos.get(_clave(c))
+        if not b:
+            continue
+        for etapa in sorted(set(b['stages']) | set(c['stages'])):
+            x, y = b['stages'].get(etapa, {}), c['stages'].get(etapa, {})
+            for m in ('round_trips_per_order', 'rcu_per_order', 'wcu_per_order', 'errors'):
+                if x.get(m) != y.get(m):
+                    filas.append((_clave(c), etapa, m, x.get(m), y.get(m)))
+    return filas
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--lines', default='1,10,100,1000,10000', help='líneas por OC')
+    ap.add_argument('--dup', default='0,0.5', help='fracción de líneas con un SKU ya presente en la OC')
+    ap.add_argument('--concurrency', default='1,8', help='invocaciones en paralelo por etapa')
+    ap.add_argument('--orders', type=int, default=8, help='OCs por caso (máximo)')
+    ap.add_argument('--line-budget', type=int, default=10000, help='líneas en total por caso')
+    ap.add_argument('--sku-pool', type=int, default=20000, help='SKUs distintos entre todas las OCs')
+    ap.add_argument('--rtt-ms', type=float, default=1.0, help='latencia simulada por llamada AWS')
+    ap.add_argument('--stage', action='append', help='mostrar sólo estas etapas (tabla)')
+    ap.add_argument('--baseline', help='JSON de una corrida anterior: muestra qué cambió')
+    ap.add_argument('--json', action='store_true', help='salida JSON (para comparar entre versiones)')
+    args = ap.parse_args()
+
+    banco = _Banco(args.rtt_ms)
+    casos = [banco.caso(int(l), float(d), int(c), max(1, min(args.orders, args.line_budget // int(l))), args.sku_pool)
+             for l in args.lines.split(',') for d in args.dup.split(',') for c in args.concurrency.split(',')]
+    reporte = {'rtt_ms': args.rtt_ms, 'sku_pool': args.sku_pool, 'items_format': os.environ.get('ITEMS_FORMAT', 'json'),
+               'cases': casos}
+    if args.json:
+        print(json.dumps(reporte, indent=2, sort_keys=True))
+        return
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            filas = comparar(json.load(f), reporte)
+        print(f"{'líneas':>6} {'dup':>4} {'conc':>4}  {'etapa':<38} {'métrica':<22} {'antes':>9} {'después':>9}")
+        for (l, d, c), etapa, m, x, y in filas:
+            print(f"{l:>6} {d:>4} {c:>4}  {etapa:<38} {m:<22} {str(x):>9} {str(y):>9}")
+        if not filas:
+            print("sin cambios en round-trips, capacidad ni errores")
+        return
+    print(f"{'líneas':>6} {'dup':>4} {'conc':>4}  {'etapa':<38} {'RT/OC':>8} {'RCU/OC':>8} {'WCU/OC':>8} "
+          f"{'wall s':>7} {'p50 ms':>8} {'p95 ms':>8} {'err':>4}")
+    for c in casos:
+        for etapa, s in c['stages'].items():
+            if args.stage and etapa not in args.stage:
+                continue
+            print(f"{c['lines']:>6} {c['dup']:>4} {c['concurrency']:>4}  {etapa:<38} {s['round_trips_per_order']:>8} "
+                  f"{s['rcu_per_order']:>8} {s['wcu_per_order']:>8} {s['wall_s']:>7} {s['p50_ms']:>8} "
+                  f"{s['p95_ms']:>8} {s['errors']:>4}")
+        t = c['totals']
+        print(f"{c['lines']:>6} {c['dup']:>4} {c['concurrency']:>4}  {'TOTAL':<38} {t['round_trips_per_order']:>8} "
+              f"{t['rcu_per_order']:>8} {t['wcu_per_order']:>8} {c['wall_s']:>7} {'':>8} {'':>8} {t['errors']:>4}\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Compara el atributo `items` de OrdenesCompra: JSON legacy vs v1 columnar.
+
+Uso: python benchmarks/bench_items.py [--lines 10,1000,10000] [--json]
+"""
+import os, sys, json, time, random, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from comun.items import encode_items, parse_items
+
+def _orden(n, seed=7):
+    rnd = random.Random(seed)
+    return [{'sku': f"SKU-{rnd.randrange(100000):05d}", 'qty': rnd.randrange(1, 500)} for _ in range(n)]
+
+def _best(fn, repeat):
+    mejor = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor * 1e6  # µs
+
+def run(lines, repeat=20):
+    filas = []
+    for n in lines:
+        items = _orden(n)
+        legacy = json.dumps(items)
+        blob = encode_items(items)
+        rep = max(3, repeat if n <= 1000 else repeat // 4)
+        filas.append({
+            'lines': n,
+            'json_bytes': len(legacy.encode()),
+            'v1_bytes': len(blob),
+            'json_decode_us': _best(lambda: parse_items(legacy), rep),
+            'v1_decode_us': _best(lambda: list(parse_items(blob)), rep),
+            'v1_len_us': _best(lambda: len(parse_items(blob)), rep),
+            'v1_columns_us': _best(lambda: parse_items(blob).qtys, rep),
+        })
+    return filas
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--lines', default='10,1000,10000')
+    ap.add_argument('--repeat', type=int, default=20)
+    ap.add_argument('--json', action='store_true', help='salida JSON (para comparar entre versiones)')
+    args = ap.parse_args()
+    filas = run([int(x) for x in args.lines.split(',')], args.repeat)
+    if args.json:
+        print(json.dumps(filas, indent=2))
+        return
+    print(f"{'lines':>6} {'json B':>9} {'v1 B':>8} {'ratio':>6} {'json µs':>9} {'v1 full µs':>11} {'v1 len µs':>10} {'v1 cols µs':>11}")
+    for f in filas:
+        print(f"{f['lines']:>6} {f['json_bytes']:>9} {f['v1_bytes']:>8} {f['json_bytes'] / f['v1_bytes']:>6.1f} "
+              f"{f['json_decode_us']:>9.1f} {f['v1_decode_us']:>11.1f} {f['v1_len_us']:>10.1f} {f['v1_columns_us']:>11.1f}")
+
+if __name__ == '__main__':
+    main()
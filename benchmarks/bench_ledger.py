@@ -0,0 +1,191 @@
+"""Ledger de stock (comun/ledger.py): throughput de escritura y consulta a un instante.
+
+1) append: writers concurrentes haciendo stock.ingresar (Update de qty + Put del movimiento
+   en una TransactWriteItems) sobre los fakes de local/fakes.py → movimientos/s del lado cliente.
+2) consulta: `--movements` movimientos repartidos en `--skus` SKUs (10M / 1000 = 10k por SKU).
+   Un Query sólo lee su partición, así que se materializan `--sample` SKUs completos en un
+   cliente en memoria con páginas de 1 MB como DynamoDB. Se compara snapshot + cola
+   (ledger.saldo) contra reproducir toda la historia; la latencia "modelo" suma `--rtt-ms`
+   por página y `--mb-s` de transferencia sobre el tamaño leído.
+
+Uso: python benchmarks/bench_ledger.py [--movements 10000000] [--skus 1000] [--compact-every 500] [--json]
+"""
+import os, sys, json, time, random, bisect, argparse, threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+os.environ.setdefault('TRACE_SPANS', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local import fakes
+
+PAGE_BYTES = 1024 * 1024
+
+# ----------------------------------------------------------------------------
+# 1) Append
+# ----------------------------------------------------------------------------
+
+def append(writers, seconds):
+    aws = fakes.install()
+    from comun import aws as comun_aws, ledger, stock
+    comun_aws.reset()
+    fin = time.perf_counter() + seconds
+    hechos, lock = [0], threading.Lock()
+
+    def writer(w):
+        n = 0
+        while time.perf_counter() < fin:
+            stock.ingresar(f"SKU-{w:03d}-{n % 50:02d}", 1, datetime.utcnow().isoformat(), f"OC-{w}-{n}")
+            n += 1
+        with lock:
+            hechos[0] += n
+
+    hilos = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    t0 = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    wall = time.perf_counter() - t0
+    assert len(aws.tables[ledger.LEDGER_TABLE]) == hechos[0], 'falta algún movimiento en el ledger'
+    return {'writers': writers, 'movements': hechos[0], 'movements_per_s': round(hechos[0] / wall, 1),
+            # TransactWriteItems cobra 2 WCU por item: Update + Put = 4 WCU (in-place: 1)
+            'wcu_per_movement': 2 * stock.acciones_por_update()}
+
+# ----------------------------------------------------------------------------
+# 2) Consulta a un instante
+# ----------------------------------------------------------------------------
+
+class _Particiones:
+    """Cliente dynamodb mínimo para Query por partición (listas ordenadas + bisect),
+    paginado a 1 MB. Cuenta páginas, items y bytes leídos."""
+
+    def __init__(self, esquemas):
+        self.esquemas = esquemas          # tabla -> nombre de la sort key
+        self.datos = {t: {} for t in esquemas}
+        self.paginas = self.items = self.bytes = 0
+
+    def cargar(self, tabla, pk, filas):
+        """filas: [(sk, item low-level, tamaño)] ya ordenadas por sk."""
+        self.datos[tabla][pk] = ([sk for sk, _, _ in filas], [(it, sz) for _, it, sz in filas])
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues,
+              ScanIndexForward=True, Limit=None, ExclusiveStartKey=None, **kw):
+        v = {k: x['S'] for k, x in ExpressionAttributeValues.items()}
+        sk = self.esquemas[TableName]
+        claves, filas = self.datos[TableName].get(v[':k'], ([], []))
+        cond = KeyConditionExpression.split(' AND ', 1)[1]
+        if ' BETWEEN ' in cond:
+            lo, hi = bisect.bisect_left(claves, v[':d']), bisect.bisect_right(claves, v[':h'])
+        elif '<=' in cond:
+            lo, hi = 0, bisect.bisect_right(claves, v[':h'])
+        else:
+            lo, hi = 0, bisect.bisect_left(claves, v[':h'])
+        if ExclusiveStartKey:
+            pos = ExclusiveStartKey[sk]['S']
+            if ScanIndexForward:
+                lo = max(lo, bisect.bisect_right(claves, pos))
+            else:
+                hi = min(hi, bisect.bisect_left(claves, pos))
+        idx = range(lo, hi) if ScanIndexForward else range(hi - 1, lo - 1, -1)
+        out, usados = [], 0
+        for i in idx:
+            item, sz = filas[i]
+            if (Limit and len(out) >= Limit) or usados + sz > PAGE_BYTES:
+                break
+            out.append(item)
+            usados += sz
+        self.paginas += 1
+        self.items += len(out)
+        self.bytes += usados
+        resp = {'Items': out}
+        if out and len(out) < len(idx):
+            resp['LastEvaluatedKey'] = {'sku': {'S': v[':k']}, sk: out[-1][sk]}
+        return resp
+
+def _tamaño(item):
+    return sum(len(k) + len(next(iter(x.values()))) for k, x in item.items())
+
+def _historia(n, seed, t0, paso):
+    rnd = random.Random(seed)
+    qty = Decimal(0)
+    for i in range(n):
+        ts = (t0 + timedelta(seconds=i * paso)).isoformat()
+        if qty > 5 and rnd.random() < 0.45:
+            delta, tipo = -Decimal(rnd.randrange(1, 6)), 'DESPACHO'
+        else:
+            delta, tipo = Decimal(rnd.randrange(1, 20)), 'RECEPCION'
+        qty += delta
+        yield ts, delta, tipo, f"OC-{seed}-{i:07d}"
+
+def consulta(movements, skus, sample, compact_every, queries, rtt_ms, mb_s, seed=7):
+    from comun import ledger
+    por_sku = movements // skus
+    cliente = _Particiones({ledger.LEDGER_TABLE: 'mov', ledger.SNAPSHOT_TABLE: 'hasta'})
+    t0, paso = datetime(2026, 1, 1), 30
+    ids = [f"SKU-{i:05d}" for i in range(sample)]
+    for n, sku in enumerate(ids):
+        movs, snaps, qty = [], [], Decimal(0)
+        for i, (ts, delta, tipo, oid) in enumerate(_historia(por_sku, seed + n, t0, paso)):
+            if i and i % compact_every == 0:
+                snaps.append((ts, {'sku': {'S': sku}, 'hasta': {'S': ts}, 'qty': {'N': str(qty)}}, 60))
+            item = {'sku': {'S': sku}, 'mov': {'S': f"{ts}#{tipo}#{oid}"}, 'delta': {'N': str(delta)},
+                    'tipo': {'S': tipo}, 'orderId': {'S': oid}, 'ts': {'S': ts}}
+            movs.append((item['mov']['S'], item, _tamaño(item)))
+            qty += delta
+        cliente.cargar(ledger.LEDGER_TABLE, sku, movs)
+        cliente.cargar(ledger.SNAPSHOT_TABLE, sku, snaps)
+
+    ledger._ddb = cliente
+    rnd = random.Random(seed)
+    fin = (t0 + timedelta(seconds=por_sku * paso)).isoformat()
+    instantes = [(rnd.choice(ids), (t0 + timedelta(seconds=rnd.randrange(por_sku * paso))).isoformat())
+                 for _ in range(queries)] + [(sku, fin) for sku in ids]
+
+    def medir(fn):
+        cliente.paginas = cliente.items = cliente.bytes = 0
+        t = time.perf_counter()
+        res = [fn(sku, ts) for sku, ts in instantes]
+        cpu = (time.perf_counter() - t) * 1000 / len(instantes)
+        n = len(instantes)
+        paginas, items, mb = cliente.paginas / n, cliente.items / n, cliente.bytes / n / 1e6
+        return res, {'cpu_ms': round(cpu, 3), 'pages': round(paginas, 2), 'items_read': round(items, 1),
+                     'kb_read': round(mb * 1000, 1), 'model_ms': round(paginas * rtt_ms + mb / mb_s * 1000, 2)}
+
+    snap, con = medir(lambda sku, ts: ledger.saldo(sku, ts)[0])
+    full, sin = medir(lambda sku, ts: ledger._cola(sku, '', ts + ledger._FIN)[0])
+    assert snap == full, 'snapshot + cola no coincide con la historia completa'
+    return {'movements': movements, 'skus': skus, 'movements_per_sku': por_sku, 'compact_every': compact_every,
+            'queries': len(instantes), 'snapshot_plus_tail': con, 'full_replay': sin}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--writers', default='1,8,32')
+    ap.add_argument('--seconds', type=float, default=1.0)
+    ap.add_argument('--movements', type=int, default=10_000_000)
+    ap.add_argument('--skus', type=int, default=1000)
+    ap.add_argument('--sample', type=int, default=10, help='SKUs materializados para las consultas')
+    ap.add_argument('--compact-every', type=int, default=500, help='movimientos por snapshot')
+    ap.add_argument('--queries', type=int, default=200)
+    ap.add_argument('--rtt-ms', type=float, default=5.0, help='latencia por página (modelo)')
+    ap.add_argument('--mb-s', type=float, default=50.0, help='transferencia por Query (modelo)')
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args()
+
+    escrituras = [append(int(w), args.seconds) for w in args.writers.split(',')]
+    lectura = consulta(args.movements, args.skus, args.sample, args.compact_every, args.queries,
+                       args.rtt_ms, args.mb_s)
+    if args.json:
+        print(json.dumps({'append': escrituras, 'point_in_time': lectura}, indent=2))
+        return
+    print(f"{'writers':>7} {'movs':>8} {'movs/s':>9} {'WCU/mov':>8}")
+    for f in escrituras:
+        print(f"{f['writers']:>7} {f['movements']:>8} {f['movements_per_s']:>9.1f} {f['wcu_per_movement']:>8}")
+    print(f"\n{lectura['movements']} movimientos · {lectura['skus']} SKUs ({lectura['movements_per_sku']} por SKU) · "
+          f"snapshot cada {lectura['compact_every']} · {lectura['queries']} consultas")
+    print(f"{'modo':<20} {'cpu ms':>8} {'páginas':>8} {'items':>9} {'KB':>9} {'modelo ms':>10}")
+    for nombre, k in (('snapshot + cola', 'snapshot_plus_tail'), ('historia completa', 'full_replay')):
+        r = lectura[k]
+        print(f"{nombre:<20} {r['cpu_ms']:>8} {r['pages']:>8} {r['items_read']:>9} {r['kb_read']:>9} {r['model_ms']:>10}")
+
+if __name__ == '__main__':
+    main()
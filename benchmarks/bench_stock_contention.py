@@ -0,0 +1,139 @@
+"""Contención de escritura en StockGlobal: un SKU caliente con 1 / 8 / 16 shards (comun/stock.py).
+
+Modelo offline: sobre los fakes de local/fakes.py cada escritura a un item lo ocupa
+`--service-ms` (DynamoDB sostiene ~1000 WCU/s por item, 1 ms por escritura de 1 KB);
+escrituras concurrentes al mismo item hacen cola, a items distintos no. Cada writer
+alterna ingresos (ADD en un shard) y retiros (lectura de shards + decremento condicional)
+durante `--seconds`.
+
+Uso: python benchmarks/bench_stock_contention.py [--shards 1,8,16] [--writers 1,4,16,64] [--initial 1000000] [--json]
+"""
+import os, sys, json, time, random, argparse, threading
+from decimal import Decimal
+
+os.environ.setdefault('TRACE_SPANS', '0')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from local import fakes
+
+SKU = 'SKU-HOT'
+
+class _Particiones:
+    """Cliente dynamodb que serializa las escrituras por item y cobra `servicio` s por cada una."""
+
+    def __init__(self, inner, servicio):
+        self.inner, self.servicio = inner, servicio
+        self.locks, self.guard = {}, threading.Lock()
+        self.cancelaciones = 0
+
+    def _lock(self, p):
+        k = (p['TableName'], json.dumps(p.get('Key') or p['Item'], sort_keys=True, default=str))
+        with self.guard:
+            return k, self.locks.setdefault(k, threading.Lock())
+
+    def _escribir(self, payloads, fn):
+        locks = sorted((self._lock(p) for p in payloads), key=lambda kl: kl[0])
+        for _, l in locks:
+            l.acquire()
+        try:
+            time.sleep(self.servicio * len(locks))
+            return fn()
+        finally:
+            for _, l in reversed(locks):
+                l.release()
+
+    def update_item(self, **kw):
+        return self._escribir([kw], lambda: self.inner.update_item(**kw))
+
+    def transact_write_items(self, TransactItems, **kw):
+        try:
+            return self._escribir([next(iter(t.values())) for t in TransactItems],
+                                  lambda: self.inner.transact_write_items(TransactItems=TransactItems, **kw))
+        except fakes.ClientError:
+            with self.guard:
+                self.cancelaciones += 1
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+def _preparar(shards, servicio, inicial):
+    aws = fakes.install()
+    boto3 = sys.modules['boto3']
+    real = boto3.client('dynamodb')
+    cliente = _Particiones(real, servicio)
+    crear = boto3.client
+    boto3.client = lambda name, *a, **kw: cliente if name == 'dynamodb' else crear(name, *a, **kw)
+    from comun import aws as comun_aws, stock
+    comun_aws.reset()
+    stock.STOCK_HOT_SKUS = {SKU: shards} if shards > 1 else {}
+    por_shard = inicial // shards
+    for key in stock.shard_keys(SKU):
+        aws.tables[stock.STOCK_TABLE][(key,)] = {'sku': key, 'qty': Decimal(por_shard)}
+    return aws, cliente, stock
+
+def _total(aws, stock):
+    return sum(aws.tables[stock.STOCK_TABLE].get((k,), {}).get('qty', 0) for k in stock.shard_keys(SKU))
+
+def correr(shards, writers, seconds, servicio, inicial=1_000_000, seed=7):
+    aws, cliente, stock = _preparar(shards, servicio, inicial)
+    hecho = {'in': 0, 'out': 0, 'faltante': 0, 'agotado': 0}
+    neto, lock = [0], threading.Lock()
+    fin = time.perf_counter() + seconds
+
+    def writer(w):
+        rnd = random.Random(seed * 1000 + w)
+        n = 0
+        while time.perf_counter() < fin:
+            qty = rnd.randrange(1, 6)
+            oid = f"OC-{w}-{n}"
+            n += 1
+            try:
+                if rnd.random() < 0.5:
+                    stock.ingresar(SKU, qty, 'now', oid)
+                    r, d = 'in', qty
+                elif stock.retirar(SKU, qty, 'now', oid) is None:
+                    r, d = 'out', -qty
+                else:
+                    r, d = 'faltante', 0
+            except fakes.ClientError:
+                r, d = 'agotado', 0
+            with lock:
+                hecho[r] += 1
+                neto[0] += d
+
+    hilos = [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    t0 = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    wall = time.perf_counter() - t0
+    assert _total(aws, stock) == inicial + neto[0], 'la suma de shards no coincide con los movimientos'
+    ops = hecho['in'] + hecho['out']
+    return {
+        'shards': shards, 'writers': writers, 'ops': ops, 'ops_per_s': round(ops / wall, 1),
+        'increments': hecho['in'], 'decrements': hecho['out'],
+        'retries': cliente.cancelaciones, 'shortfalls': hecho['faltante'], 'gave_up': hecho['agotado'],
+    }
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--shards', default='1,8,16')
+    ap.add_argument('--writers', default='1,4,16,64')
+    ap.add_argument('--seconds', type=float, default=1.0)
+    ap.add_argument('--service-ms', type=float, default=1.0, help='tiempo de servicio por escritura a un item')
+    ap.add_argument('--initial', type=int, default=1_000_000, help='stock inicial (bajo = más retiros rechazados)')
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args()
+    filas = [correr(int(s), int(w), args.seconds, args.service_ms / 1000, args.initial)
+             for s in args.shards.split(',') for w in args.writers.split(',')]
+    if args.json:
+        print(json.dumps(filas, indent=2))
+        return
+    print(f"{'shards':>6} {'writers':>7} {'ops/s':>9} {'ingresos':>9} {'retiros':>8} {'reintentos':>10} {'faltantes':>9} {'agotados':>8}")
+    for f in filas:
+        print(f"{f['shards']:>6} {f['writers']:>7} {f['ops_per_s']:>9.1f} {f['increments']:>9} {f['decrements']:>8} "
+              f"{f['retries']:>10} {f['shortfalls']:>9} {f['gave_up']:>8}")
+
+if __name__ == '__main__':
+    main()
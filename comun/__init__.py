@@ -0,0 +1 @@
+# Código compartido entre las Lambdas (se despliega como Lambda Layer: python/comun/...)
@@ -0,0 +1,74 @@
+import os
+from decimal import Decimal
+
+# Motor de asignación de un despacho a sucursales (SKU × sucursal).
+# Por SKU, la cantidad despachada se reparte así:
+#   1) faltante de cada sucursal = demanda diaria × COBERTURA_DIAS − stock actual (≥ 0)
+#   2) si el despacho no cubre todos los faltantes, se reparte proporcional al faltante
+#   3) si sobra, el excedente va proporcional a la demanda (o parejo si no hay demanda)
+#   4) redondeo a unidades por mayor resto; empates por orden de sucursal
+# Determinístico: mismas entradas → misma asignación (sin random).
+# Python puro, fila por fila (un SKU por vez, list comprehensions sobre las sucursales): la
+# layer no trae numpy. 1k SKUs × 500 sucursales ≈ 0,2 s; benchmarks/bench_asignacion.py
+# lo mide contra el presupuesto del request de despacho (--budget-ms).
+COBERTURA_DIAS = float(os.environ.get('COBERTURA_DIAS', '7'))
+
+def _objetivos(q, stock, demanda, cobertura):
+    """Cantidades continuas por sucursal que suman q."""
+    faltante = [d * cobertura - s for d, s in zip(demanda, stock)]
+    faltante = [f if f > 0 else 0.0 for f in faltante]
+    total = sum(faltante)
+    if total >= q:
+        k = q / total
+        return [f * k for f in faltante]
+    sobra = q - total
+    dem_total = sum(d for d in demanda if d > 0)
+    if dem_total > 0:
+        k = sobra / dem_total
+        return [f + (d * k if d > 0 else 0.0) for f, d in zip(faltante, demanda)]
+    parejo = sobra / len(stock)
+    return [f + parejo for f in faltante]
+
+def _redondear(q, objetivos):
+    """Enteros que suman q, lo más cerca posible de `objetivos` (mayor resto)."""
+    base = list(map(int, objetivos))
+    resto = q - sum(base)
+    if resto > 0:
+        restos = [t - b for t, b in zip(objetivos, base)]
+        # sorted es estable: a igual resto gana la sucursal que viene antes
+        for i in sorted(range(len(base)), key=restos.__getitem__, reverse=True)[:resto]:
+            base[i] += 1
+    return base
+
+def asignar(cantidades, stock, demanda, cobertura=None):
+    """Matriz de asignación [SKU][sucursal] del despacho (cada SKU se reparte por separado).
+
+    `cantidades`: unidades a despachar por SKU (int o Decimal).
+    `stock`, `demanda`: matrices [SKU][sucursal] (mismo orden de sucursales en todas las filas).
+    Las cantidades fraccionarias se redondean en unidades y la fracción va a la
+    sucursal con más asignado.
+    """
+    cobertura = COBERTURA_DIAS if cobertura is None else cobertura
+    salida = []
+    for q, stk, dem in zip(cantidades, stock, demanda):
+        if not stk:
+            salida.append([])
+            continue
+        entero = int(q)
+        fila = _redondear(entero, _objetivos(float(entero), stk, dem, cobertura)) if entero > 0 else [0] * len(stk)
+        fraccion = Decimal(str(q)) - entero
+        if fraccion:
+            i = max(range(len(fila)), key=lambda j: (fila[j], -j))
+            fila = [Decimal(x) for x in fila]
+            fila[i] += fraccion
+        salida.append(fila)
+    return salida
+
+def por_sucursal(skus, sucursales, matriz):
+    """{sucursal: {sku: qty}} sólo con las celdas > 0 (forma del registro en Envios / evento)."""
+    out = {}
+    for sku, fila in zip(skus, matriz):
+        for suc, qty in zip(sucursales, fila):
+            if qty:
+                out.setdefault(suc, {})[sku] = qty
+    return out
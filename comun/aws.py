@@ -0,0 +1,166 @@
+import os, threading
+from decimal import Decimal
+from comun import trazas
+
+# Clientes low-level compartidos por contenedor, creados recién en la primera
+# llamada (el import del handler no paga boto3 ni la red). Reemplaza a
+# boto3.resource('dynamodb'), que carga los modelos de recursos y es lo más lento
+# del cold start.
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '2'))
+AWS_READ_TIMEOUT    = float(os.environ.get('AWS_READ_TIMEOUT', '5'))
+AWS_MAX_ATTEMPTS    = int(os.environ.get('AWS_MAX_ATTEMPTS', '4'))
+AWS_MAX_POOL        = int(os.environ.get('AWS_MAX_POOL', '32'))
+
+_clients = {}
+_lock = threading.Lock()
+_SIN_SPAN = ('get_paginator', 'get_waiter', 'can_paginate', 'close')
+_medidos = {}   # (servicio, método) -> (cliente, método con span)
+
+def _config():
+    from botocore.config import Config
+    return Config(
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        retries={'mode': 'standard', 'max_attempts': AWS_MAX_ATTEMPTS},
+        max_pool_connections=AWS_MAX_POOL,   # alcanza para los ThreadPoolExecutor de los handlers
+        tcp_keepalive=True,
+    )
+
+def _build(service):
+    with _lock:
+        if service not in _clients:
+            import boto3
+            _clients[service] = boto3.client(service, config=_config())
+        return _clients[service]
+
+class _LazyClient:
+    """Proxy: el cliente real se construye en el primer método que se usa.
+    Cada llamada a la API loguea un span EMF (comun.trazas)."""
+    __slots__ = ('_service',)
+
+    def __init__(self, service):
+        self._service = service
+
+    def __getattr__(self, name):
+        real = _clients.get(self._service) or _build(self._service)
+        if not trazas.TRACE_SPANS or name.startswith('_') or name in _SIN_SPAN:
+            return getattr(real, name)
+        cached = _medidos.get((self._service, name))
+        if cached is None or cached[0] is not real:
+            attr = getattr(real, name)
+            if not callable(attr):
+                return attr
+            cached = _medidos[(self._service, name)] = (real, trazas.medido(self._service, name, attr))
+        return cached[1]
+
+def client(service):
+    return _LazyClient(service)
+
+def reset():
+    """Olvida los clientes construidos (tests / harness)."""
+    with _lock:
+        _clients.clear()
+
+# ----------------------------------------------------------------------------
+# Tipos DynamoDB (sin boto3.dynamodb): Python <-> low-level
+# ----------------------------------------------------------------------------
+
+def to_ddb(v):
+    if v is None:
+        return {'NULL': True}
+    if isinstance(v, bool):
+        return {'BOOL': v}
+    if isinstance(v, str):
+        return {'S': v}
+    if isinstance(v, float):
+        raise TypeError('Float types are not supported. Use Decimal types instead.')
+    if isinstance(v, (int, Decimal)):
+        return {'N': str(v)}
+    if isinstance(v, (bytes, bytearray)):
+        return {'B': bytes(v)}
+    if isinstance(v, (set, frozenset)):
+        sample = next(iter(v))
+        if isinstance(sample, str):
+            return {'SS': list(v)}
+        if isinstance(sample, (bytes, bytearray)):
+            return {'BS': [bytes(x) for x in v]}
+        return {'NS': [str(x) for x in v]}
+    if isinstance(v, (list, tuple)):
+        return {'L': [to_ddb(x) for x in v]}
+    if isinstance(v, dict):
+        return {'M': {k: to_ddb(x) for k, x in v.items()}}
+    raise TypeError(f'Tipo no soportado por DynamoDB: {type(v)!r}')
+
+def from_ddb(av):
+    (t, v), = av.items()
+    if t == 'S':
+        return v
+    if t == 'N':
+        return Decimal(v)
+    if t == 'B':
+        return getattr(v, 'value', v)
+    if t == 'BOOL':
+        return v
+    if t == 'NULL':
+        return None
+    if t == 'SS':
+        return set(v)
+    if t == 'NS':
+        return {Decimal(x) for x in v}
+    if t == 'BS':
+        return {getattr(x, 'value', x) for x in v}
+    if t == 'L':
+        return [from_ddb(x) for x in v]
+    if t == 'M':
+        return {k: from_ddb(x) for k, x in v.items()}
+    raise TypeError(f'Tipo DynamoDB desconocido: {t}')
+
+def to_item(d):
+    return {k: to_ddb(v) for k, v in d.items()}
+
+def from_item(d):
+    return {k: from_ddb(v) for k, v in (d or {}).items()}
+
+class Table:
+    """Subconjunto de boto3 Table (get/put/update/delete/query) sobre el cliente low-level.
+    Acepta y devuelve tipos Python (str, Decimal, set, ...), igual que el resource."""
+
+    def __init__(self, name):
+        self.name = name
+        self.table_name = name
+        self._ddb = client('dynamodb')
+
+    def _kw(self, kw):
+        out = dict(kw, TableName=self.name)
+        for f in ('Key', 'Item', 'ExclusiveStartKey'):
+            if f in out:
+                out[f] = to_item(out[f])
+        if 'ExpressionAttributeValues' in out:
+            out['ExpressionAttributeValues'] = to_item(out['ExpressionAttributeValues'])
+        return out
+
+    def _out(self, resp):
+        for f in ('Item', 'Attributes', 'LastEvaluatedKey'):
+            if f in resp:
+                resp[f] = from_item(resp[f])
+        if 'Items' in resp:
+            resp['Items'] = [from_item(i) for i in resp['Items']]
+        return resp
+
+    def get_item(self, **kw):
+        return self._out(self._ddb.get_item(**self._kw(kw)))
+
+    def put_item(self, **kw):
+        return self._out(self._ddb.put_item(**self._kw(kw)))
+
+    def update_item(self, **kw):
+        return self._out(self._ddb.update_item(**self._kw(kw)))
+
+    def delete_item(self, **kw):
+        return self._out(self._ddb.delete_item(**self._kw(kw)))
+
+    def query(self, **kw):
+        return self._out(self._ddb.query(**self._kw(kw)))
+
+def table(name):
+    return Table(name)
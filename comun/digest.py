@@ -0,0 +1,192 @@
+import os, json, time, random
+from datetime import datetime
+from botocore.exceptions import ClientError
+from comun import aws, plantillas
+
+# Modo digest de las notificaciones SNS: en vez de un mail por orden, cada aviso se
+# guarda en NotificacionesPendientes y se envía un único mensaje consolidado por
+# destinatario (rol / sucursal) con todas sus órdenes y links:
+#   - programado: Notificaciones-Digest (rate(15 minutes)) vacía todos los destinos
+#   - por tamaño: al llegar a DIGEST_MAX_PENDING avisos el que encola envía en el momento
+# Las órdenes urgentes (prioridad en DIGEST_URGENT_PRIORITIES) se siguen enviando al instante.
+#   NOTIF_MODE=digest | immediate (default)   o por rol: '{"COMPRAS_APROBADORES": "digest"}'
+DIGEST_TABLE       = os.environ.get('DIGEST_TABLE', 'NotificacionesPendientes')   # PK destino, SK entrada
+DIGEST_MAX_PENDING = int(os.environ.get('DIGEST_MAX_PENDING', '50'))
+DIGEST_MAX_ENTRIES = int(os.environ.get('DIGEST_MAX_ENTRIES', '100'))   # órdenes por mensaje consolidado
+DIGEST_LOCK_S      = int(os.environ.get('DIGEST_LOCK_S', '120'))
+DIGEST_TTL_DAYS    = int(os.environ.get('DIGEST_TTL_DAYS', '7'))
+DIGEST_URGENT      = {p.strip().upper() for p in os.environ.get('DIGEST_URGENT_PRIORITIES', 'URGENTE,ALTA').split(',') if p.strip()}
+
+_META = '#META'   # item contador por destino; ordena antes que cualquier entrada ('<ts>#...')
+BATCH_WRITE_MAX = 25
+
+_ddb = aws.client('dynamodb')
+_sns = aws.client('sns')
+
+def _load_modos():
+    raw = os.environ.get('NOTIF_MODE', '').strip()
+    if raw.startswith('{'):
+        try:
+            return {str(k): str(v).lower() for k, v in json.loads(raw).items()}
+        except Exception:
+            print("[DIGEST] NOTIF_MODE inválido, se usa immediate:", raw)
+            return {}
+    return {'*': raw.lower()} if raw else {}
+
+NOTIF_MODE = _load_modos()
+
+def modo(rol):
+    return NOTIF_MODE.get(rol, NOTIF_MODE.get('*', 'immediate'))
+
+def urgente(*fuentes):
+    """True si alguna fuente (detail del evento, orden) marca la orden como urgente."""
+    for f in fuentes:
+        if isinstance(f, dict) and (f.get('urgent') is True or str(f.get('prioridad') or '').upper() in DIGEST_URGENT):
+            return True
+    return False
+
+def activo(rol, es_urgente=False):
+    return modo(rol) == 'digest' and not es_urgente
+
+def entrada(destino, topic_arn, order_id, texto, titulo, rol=None):
+    """Aviso a encolar. `texto`: bloque de la orden en el consolidado (con sus links);
+    `titulo`: asunto del consolidado del destino; `rol`: variante de plantilla (default: destino)."""
+    return {'destino': destino, 'topicArn': topic_arn, 'orderId': order_id or '-',
+            'texto': texto, 'titulo': titulo, 'rol': rol or destino}
+
+# ----------------------------------------------------------------------------
+# Encolar
+# ----------------------------------------------------------------------------
+
+def _batch_write(table, requests):
+    for i in range(0, len(requests), BATCH_WRITE_MAX):
+        pendientes, intento = {table: requests[i:i + BATCH_WRITE_MAX]}, 0
+        while pendientes:
+            resp = _ddb.batch_write_item(RequestItems=pendientes)
+            pendientes = resp.get('UnprocessedItems') or None
+            if pendientes:
+                time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+                intento += 1
+
+def encolar(entradas):
+    """Guarda los avisos y suma el contador de cada destino. Si un destino llega a
+    DIGEST_MAX_PENDING se envía su consolidado en el momento."""
+    if not entradas:
+        return {'queued': 0, 'flushed': []}
+    now = datetime.utcnow().isoformat()
+    expira = int(time.time()) + DIGEST_TTL_DAYS * 86400
+    puts, por_destino = [], {}
+    for n, e in enumerate(entradas):
+        item = {
+            'destino': {'S': e['destino']}, 'entrada': {'S': f"{now}#{e['orderId']}#{n:04d}"},
+            'orderId': {'S': e['orderId']}, 'texto': {'S': e['texto']}, 'expiresAt': {'N': str(expira)},
+        }
+        puts.append({'PutRequest': {'Item': item}})
+        por_destino.setdefault(e['destino'], [0, e])[0] += 1
+    _batch_write(DIGEST_TABLE, puts)
+
+    enviados = []
+    for destino, (n, e) in por_destino.items():
+        resp = _ddb.update_item(TableName=DIGEST_TABLE, Key=_meta_key(destino),
+                                UpdateExpression='ADD pendientes :n SET topicArn = :arn, titulo = :t, rol = :r',
+                                ExpressionAttributeValues={':n': {'N': str(n)}, ':arn': {'S': e['topicArn']},
+                                                           ':t': {'S': e['titulo']}, ':r': {'S': e['rol']}},
+                                ReturnValues='UPDATED_NEW')
+        if int(resp['Attributes']['pendientes']['N']) >= DIGEST_MAX_PENDING:
+            res = flush(destino)
+            if res:
+                enviados.append(res)
+    return {'queued': len(entradas), 'flushed': enviados}
+
+# ----------------------------------------------------------------------------
+# Enviar consolidados
+# ----------------------------------------------------------------------------
+
+def _meta_key(destino):
+    return {'destino': {'S': destino}, 'entrada': {'S': _META}}
+
+def _tomar(destino):
+    """Lock del destino (un solo envío a la vez); devuelve el item META o None si está tomado."""
+    ahora = int(time.time())
+    try:
+        resp = _ddb.update_item(TableName=DIGEST_TABLE, Key=_meta_key(destino),
+                                UpdateExpression='SET lockUntil = :hasta',
+                                ConditionExpression='attribute_exists(destino) AND '
+                                                    '(attribute_not_exists(lockUntil) OR lockUntil < :ahora)',
+                                ExpressionAttributeValues={':hasta': {'N': str(ahora + DIGEST_LOCK_S)},
+                                                           ':ahora': {'N': str(ahora)}},
+                                ReturnValues='ALL_NEW')
+        return resp['Attributes']
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return None
+        raise
+
+def consolidado(titulo, textos, desde=None, hasta=None, rol=None, info=None):
+    """(subject, message) del resumen de varias órdenes (plantilla 'digest' de comun/plantillas.py).
+    Si no entran todas en el límite de SNS, info['lineas'] dice cuántas se incluyeron."""
+    n = len(textos)
+    ctx = {'titulo': titulo, 'n': n, 'desde': desde and desde[:16], 'hasta': hasta and hasta[:16],
+           'ordenes': plantillas.texto('digest', 'orden' if n == 1 else 'orden_plural', rol=rol)}
+    return plantillas.mensaje('digest', ctx, [{'texto': t} for t in textos], rol, info=info)
+
+def _recortado(fila):
+    """Aviso que solo no entra en un mensaje: su texto recortado y el link a la orden completa."""
+    order_id = fila.get('orderId', {}).get('S', '-')
+    texto = fila['texto']['S'].encode()[:plantillas.SNS_MAX_BYTES // 2].decode(errors='ignore')
+    return f"{texto} ...\n  {plantillas.contexto({'orderId': order_id})['orden_url']}"
+
+def flush(destino):
+    """Envía todos los avisos pendientes de `destino` en mensajes de hasta DIGEST_MAX_ENTRIES órdenes.
+    None si otro envío del mismo destino está en curso."""
+    meta = _tomar(destino)
+    if meta is None:
+        return None
+    topic_arn, titulo = meta['topicArn']['S'], meta.get('titulo', {}).get('S', 'Notificaciones')
+    rol = meta.get('rol', {}).get('S', destino)
+    mensajes, avisos = [], 0
+    try:
+        while True:
+            resp = _ddb.query(TableName=DIGEST_TABLE, KeyConditionExpression='destino = :d AND entrada > :m',
+                              ExpressionAttributeValues={':d': {'S': destino}, ':m': {'S': _META}},
+                              Limit=DIGEST_MAX_ENTRIES, ConsistentRead=True)
+            filas = resp.get('Items', [])
+            if not filas:
+                break
+            info = {}
+            subject, message = consolidado(titulo, [f['texto']['S'] for f in filas],
+                                           filas[0]['entrada']['S'], filas[-1]['entrada']['S'], rol, info)
+            if not info.get('lineas'):
+                # el primer aviso solo no entra en el límite de SNS: sale recortado, con el link a la orden
+                print(f"[DIGEST] {destino}: aviso de {filas[0].get('orderId', {}).get('S', '-')} "
+                      f"({len(filas[0]['texto']['S'].encode())} bytes) no entra en un mensaje, se envía recortado")
+                subject, message = consolidado(titulo, [_recortado(filas[0])], filas[0]['entrada']['S'],
+                                               filas[0]['entrada']['S'], rol, info)
+            res = _sns.publish(TopicArn=topic_arn, Subject=subject, Message=message)
+            mensajes.append(res.get('MessageId'))
+            # sólo los avisos que entraron en el mensaje (límite de SNS); el resto va en el siguiente
+            enviadas = filas[:info.get('lineas') or 1]
+            # recién después de publicar: si algo falla en el medio se reenvía, no se pierde
+            _batch_write(DIGEST_TABLE, [{'DeleteRequest': {'Key': {'destino': f['destino'], 'entrada': f['entrada']}}}
+                                        for f in enviadas])
+            _ddb.update_item(TableName=DIGEST_TABLE, Key=_meta_key(destino),
+                             UpdateExpression='ADD pendientes :n',
+                             ExpressionAttributeValues={':n': {'N': str(-len(enviadas))}})
+            avisos += len(enviadas)
+            if len(filas) < DIGEST_MAX_ENTRIES and len(enviadas) == len(filas):
+                break
+    finally:
+        _ddb.update_item(TableName=DIGEST_TABLE, Key=_meta_key(destino), UpdateExpression='REMOVE lockUntil')
+    return {'destino': destino, 'avisos': avisos, 'mensajes': mensajes}
+
+def destinos_pendientes():
+    """Destinos con avisos sin enviar (Scan de los items META: la tabla sólo guarda lo pendiente)."""
+    out, kw = [], {'TableName': DIGEST_TABLE, 'FilterExpression': 'entrada = :m AND pendientes > :z',
+                   'ExpressionAttributeValues': {':m': {'S': _META}, ':z': {'N': '0'}},
+                   'ProjectionExpression': 'destino'}
+    while True:
+        resp = _ddb.scan(**kw)
+        out += [it['destino']['S'] for it in resp.get('Items', [])]
+        if 'LastEvaluatedKey' not in resp:
+            return out
+        kw['ExclusiveStartKey'] = resp['LastEvaluatedKey']
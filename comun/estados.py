@@ -0,0 +1,173 @@
+import os, time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from comun import aws, trazas
+
+# Máquina de estados de OrdenesCompra. Todas las transiciones pasan por acá: el Update de
+# la orden lleva la condición "estado actual en los orígenes permitidos" y, en la misma
+# TransactWriteItems, el Put de una entrada en el historial:
+#   HistorialOrdenes  PK orderId, SK evento = '<ts>#<estado>'  → por (quién la hizo)
+# replay(orderId) reconstruye la vida de la orden con un único Query (sin leer los
+# approvedAt / receivedAt / ... sueltos en la orden).
+#
+#   CREATED ─► PENDING_APPROVAL ─┬─► APPROVED ─► RECEIVED ─► DISPATCHED
+#                                └─► REJECTED
+ORDERS_TABLE      = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
+HISTORY_TABLE     = os.environ.get('HISTORY_TABLE', 'HistorialOrdenes')
+HISTORY_ENABLED   = os.environ.get('HISTORY_ENABLED', '1') not in ('0', 'false', 'no')
+HISTORY_TTL_DAYS  = int(os.environ.get('HISTORY_TTL_DAYS', '0'))   # 0 = no vence
+REPLAY_WORKERS    = int(os.environ.get('REPLAY_WORKERS', '16'))
+
+CREATED, PENDING_APPROVAL, APPROVED, REJECTED = 'CREATED', 'PENDING_APPROVAL', 'APPROVED', 'REJECTED'
+RECEIVED, DISPATCHED = 'RECEIVED', 'DISPATCHED'
+
+# destino -> orígenes permitidos
+TRANSICIONES = {
+    PENDING_APPROVAL: (CREATED,),
+    APPROVED:         (PENDING_APPROVAL,),
+    REJECTED:         (PENDING_APPROVAL,),
+    RECEIVED:         (APPROVED,),
+    DISPATCHED:       (RECEIVED,),
+}
+ESTADOS    = (CREATED,) + tuple(TRANSICIONES)
+TERMINALES = (REJECTED, DISPATCHED)
+
+# atributo de la orden con el instante en que entró a cada estado (compatibilidad con lo existente)
+SELLOS = {CREATED: 'createdAt', APPROVED: 'approvedAt', REJECTED: 'rejectedAt',
+          RECEIVED: 'receivedAt', DISPATCHED: 'dispatchedAt'}
+
+_ddb = aws.client('dynamodb')
+
+def permitida(actual, destino):
+    return actual in TRANSICIONES.get(destino, ())
+
+def acciones_por_transicion():
+    return 2 if HISTORY_ENABLED else 1
+
+def _condicion(destino, values):
+    origenes = TRANSICIONES[destino]
+    for i, o in enumerate(origenes):
+        values[f":o{i}"] = {'S': o}
+    if len(origenes) == 1:
+        return '#st = :o0'
+    return '#st IN (' + ', '.join(f":o{i}" for i in range(len(origenes))) + ')'
+
+def update(order_id, destino, now, sets=None, condicion=None):
+    """Update (low-level, para TransactWriteItems) de la orden a `destino`.
+
+    SET status, updatedAt, el sello del estado y `sets` ({atributo: valor low-level}).
+    Condición: estado actual en TRANSICIONES[destino] (+ `condicion`, si viene).
+    Si falla, la cancelación trae el item actual (ALL_OLD): ver `estado_de`."""
+    if destino not in TRANSICIONES:
+        raise ValueError(f"estado desconocido: {destino}")
+    values = {':st': {'S': destino}, ':ts': {'S': now}}
+    names = {'#st': 'status'}
+    expr = ['#st = :st', 'updatedAt = :ts']
+    if destino in SELLOS:
+        expr.append(f"{SELLOS[destino]} = :ts")
+    for n, (attr, val) in enumerate((sets or {}).items()):
+        names[f"#s{n}"] = attr
+        values[f":s{n}"] = val
+        expr.append(f"#s{n} = :s{n}")
+    cond = _condicion(destino, values)
+    if condicion:
+        cond = f"{cond} AND ({condicion})"
+    return {
+        'TableName': ORDERS_TABLE, 'Key': {'orderId': {'S': order_id}},
+        'UpdateExpression': 'SET ' + ', '.join(expr),
+        'ConditionExpression': cond,
+        'ExpressionAttributeNames': names, 'ExpressionAttributeValues': values,
+        'ReturnValuesOnConditionCheckFailure': 'ALL_OLD',
+    }
+
+def historial(order_id, estado, now, por=None):
+    """Put (low-level) de la entrada del historial."""
+    item = {'orderId': {'S': order_id}, 'evento': {'S': f"{now}#{estado}"}}
+    if por:
+        item['por'] = {'S': por}
+    if HISTORY_TTL_DAYS > 0:
+        item['expiresAt'] = {'N': str(int(time.time()) + HISTORY_TTL_DAYS * 86400)}
+    return {'TableName': HISTORY_TABLE, 'Item': item}
+
+def acciones(order_id, destino, now, sets=None, por=None, condicion=None):
+    """TransactItems de la transición: [Update de la orden] + [Put del historial]."""
+    out = [{'Update': update(order_id, destino, now, sets, condicion)}]
+    if HISTORY_ENABLED:
+        out.append({'Put': historial(order_id, destino, now, por)})
+    return out
+
+def alta(order_id, now, por=None):
+    """TransactItems que acompañan al Put de una orden nueva (CREATED)."""
+    return [{'Put': historial(order_id, CREATED, now, por)}] if HISTORY_ENABLED else []
+
+def estado_de(razon):
+    """Estado actual según la razón de cancelación de la transacción ('' si la orden no existe)."""
+    return ((razon or {}).get('Item') or {}).get('status', {}).get('S', '')
+
+def aplicar(order_id, destino, now, sets=None, por=None, condicion=None):
+    """Ejecuta la transición sola. Devuelve None si se aplicó, o el estado actual de la
+    orden si no estaba en un origen permitido ('' si no existe)."""
+    try:
+        _ddb.transact_write_items(TransactItems=acciones(order_id, destino, now, sets, por, condicion))
+        return None
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+            raise
+        reasons = e.response.get('CancellationReasons') or []
+        if not reasons or reasons[0].get('Code') != 'ConditionalCheckFailed':
+            raise
+        return estado_de(reasons[0])
+
+# ----------------------------------------------------------------------------
+# Replay
+# ----------------------------------------------------------------------------
+
+def _segundos(desde, hasta):
+    return round((datetime.fromisoformat(hasta) - datetime.fromisoformat(desde)).total_seconds(), 3)
+
+def replay(order_id, ahora=None):
+    """Vida de la orden desde el historial (un Query): estado actual, desde cuándo y cuánto
+    estuvo en cada estado. None si la orden no tiene historial."""
+    ahora = ahora or datetime.utcnow().isoformat()
+    filas, kw = [], {'TableName': HISTORY_TABLE, 'KeyConditionExpression': 'orderId = :o',
+                     'ExpressionAttributeValues': {':o': {'S': order_id}}}
+    while True:
+        resp = _ddb.query(**kw)
+        filas += resp.get('Items', [])
+        if 'LastEvaluatedKey' not in resp:
+            break
+        kw['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+    if not filas:
+        return None
+
+    pasos = []
+    for f in filas:
+        ts, estado = f['evento']['S'].rsplit('#', 1)
+        paso = {'estado': estado, 'ts': ts}
+        if 'por' in f:
+            paso['por'] = f['por']['S']
+        if pasos:
+            pasos[-1]['duracionS'] = _segundos(pasos[-1]['ts'], ts)
+        pasos.append(paso)
+    ultimo = pasos[-1]
+    terminal = ultimo['estado'] in TERMINALES
+    return {
+        'orderId': order_id, 'estado': ultimo['estado'], 'desde': ultimo['ts'], 'terminal': terminal,
+        'enEstadoS': None if terminal else _segundos(ultimo['ts'], ahora),
+        'totalS': _segundos(pasos[0]['ts'], ultimo['ts'] if terminal else ahora),
+        'historial': pasos,
+    }
+
+def atascadas(order_ids, umbral_s=0, ahora=None):
+    """Dónde está trabada cada orden: replay en paralelo (un Query por orden) y las que
+    siguen sin terminar hace más de `umbral_s`, de la más vieja a la más nueva."""
+    ahora = ahora or datetime.utcnow().isoformat()
+    ids = list(dict.fromkeys(order_ids))
+    if not ids:
+        return []
+    with ThreadPoolExecutor(max_workers=min(REPLAY_WORKERS, len(ids))) as pool:
+        vidas = list(pool.map(trazas.propagar(lambda oid: replay(oid, ahora)), ids))
+    out = [{k: v[k] for k in ('orderId', 'estado', 'desde', 'enEstadoS')}
+           for v in vidas if v and not v['terminal'] and v['enEstadoS'] >= umbral_s]
+    return sorted(out, key=lambda v: v['desde'])
@@ -0,0 +1,95 @@
+import os, json, glob, uuid, importlib.util
+from datetime import datetime
+from comun import trazas
+from comun.util import handler_name
+
+# Modo "fusionado": el productor corre en proceso el handler destino de ciertos
+# DetailType y publica igual el evento (para auditoría), marcado con `fusedTargets`.
+#   FUSED_DISPATCH='{"OrdenCreada": ["CasaCentral-ProcesarOrden-Deposito"],
+#                    "OrdenPendienteAprobacion": ["Notificaciones-OC"]}'
+# El código del handler destino tiene que estar en el paquete del productor
+# (FUSED_CODE_ROOT, por defecto la raíz del código de la Lambda).
+def _load_config():
+    raw = os.environ.get('FUSED_DISPATCH', '').strip()
+    if not raw:
+        return {}
+    try:
+        cfg = json.loads(raw)
+    except Exception:
+        print("[FUSED] FUSED_DISPATCH inválido, se ignora:", raw)
+        return {}
+    return {dt: ([t] if isinstance(t, str) else list(t)) for dt, t in cfg.items()} if isinstance(cfg, dict) else {}
+
+FUSED_DISPATCH  = _load_config()
+FUSED_CODE_ROOT = os.environ.get('FUSED_CODE_ROOT') or os.environ.get('LAMBDA_TASK_ROOT') or \
+                  os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_handlers = {}
+
+def _handler(name):
+    """Carga '<n> <name>.py' una vez por contenedor."""
+    if name not in _handlers:
+        matches = glob.glob(os.path.join(FUSED_CODE_ROOT, f"[0-9]* {name}.py"))
+        if not matches:
+            raise RuntimeError(f"Handler fusionado '{name}' no está en {FUSED_CODE_ROOT}")
+        spec = importlib.util.spec_from_file_location(f"fused_{name.replace('-', '_')}", matches[0])
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        _handlers[name] = mod.lambda_handler
+    return _handlers[name]
+
+def _event_id(entry):
+    # id determinístico: si el productor reintenta el mismo evento, el handler fusionado recibe
+    # el mismo id y su clave de idempotencia (idempotencia.por_evento) descarta la repetición
+    firma = json.dumps([entry.get(k) for k in ('Source', 'DetailType', 'Detail', 'EventBusName')])
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, firma))
+
+def _run_fused(entry, targets):
+    event = {
+        'version': '0', 'id': _event_id(entry),
+        'source': entry.get('Source'), 'detail-type': entry.get('DetailType'),
+        'time': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'detail': json.loads(entry.get('Detail') or '{}'),
+    }
+    ok = []
+    for name in targets:
+        try:
+            res = _handler(name)(event, None)
+            if isinstance(res, dict) and res.get('statusCode', 200) >= 400:
+                print(f"[FUSED] {name} devolvió {res.get('statusCode')}: se delega en EventBridge")
+                continue
+            ok.append(name)
+        except Exception as e:
+            print(f"[FUSED] {name} falló ({e!r}): se delega en EventBridge")
+    return ok
+
+def put_events(client, entries):
+    """Igual que `client.put_events(Entries=entries)`, pero ejecuta antes en proceso
+    los targets configurados. Los que terminan bien quedan en `detail.fusedTargets`
+    para que su regla (y `fusionado()`) descarten la copia de auditoría.
+    Si hay una traza en curso, cada Detail sin `traceId` lo recibe."""
+    salida = []
+    trace = trazas.trace_id()
+    for entry in entries:
+        if trace:
+            detail = json.loads(entry.get('Detail') or '{}')
+            if 'traceId' not in detail:
+                detail['traceId'] = trace
+                entry = dict(entry, Detail=json.dumps(detail, default=str))
+        targets = FUSED_DISPATCH.get(entry.get('DetailType'))
+        if targets:
+            hechos = _run_fused(entry, targets)
+            if hechos:
+                detail = json.loads(entry.get('Detail') or '{}')
+                detail['fusedTargets'] = hechos
+                entry = dict(entry, Detail=json.dumps(detail, default=str))
+        salida.append(entry)
+    return client.put_events(Entries=salida)
+
+def fusionado(event, handler_file):
+    """True si el handler `handler_file` ya procesó este evento en proceso (copia de auditoría)."""
+    detail = event.get('detail') if isinstance(event, dict) else None
+    if isinstance(detail, str):
+        try: detail = json.loads(detail)
+        except Exception: detail = None
+    return isinstance(detail, dict) and handler_name(handler_file) in (detail.get('fusedTargets') or [])
@@ -0,0 +1,177 @@
+import os, csv, gzip, json, time, base64, threading
+from decimal import Decimal
+from comun.items import parse_items
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:   # sin la layer de pyarrow: CSV gzip con el mismo layout
+    pa = pq = None
+
+# Exportación de tablas para reporting (Reportes-ExportarTablas). Cada item se convierte en
+# filas planas y se escribe particionado estilo Hive, que Athena / Glue / Spark descubren solos:
+#   <tabla>/fecha=YYYY-MM-DD/status=<status>/<corrida>-<tarea>-<n>.parquet
+# Parquet (snappy) si está pyarrow; si no (o EXPORT_FORMAT=csv) .csv.gz con encabezado.
+EXPORT_FORMAT = os.environ.get('EXPORT_FORMAT', 'parquet' if pa else 'csv').strip().lower()
+if EXPORT_FORMAT == 'parquet' and pa is None:
+    print("[EXPORT] EXPORT_FORMAT=parquet sin pyarrow instalado: se escribe csv")
+    EXPORT_FORMAT = 'csv'
+EXTENSION = '.parquet' if EXPORT_FORMAT == 'parquet' else '.csv.gz'
+
+_SIN_VALOR = '_'   # partición de un item sin fecha / sin status
+
+# ----------------------------------------------------------------------------
+# Item → filas
+# ----------------------------------------------------------------------------
+
+def _numero(v):
+    return int(v) if v == v.to_integral_value() else float(v)
+
+def _json(o):
+    if isinstance(o, Decimal):
+        return _numero(o)
+    if isinstance(o, (bytes, bytearray)):
+        return base64.b64encode(bytes(o)).decode()
+    if isinstance(o, (set, frozenset)):
+        return sorted(o, key=str)
+    raise TypeError(f'{type(o).__name__} no serializable')
+
+def valor(v):
+    """Valor de columna: Decimal → int/float, binario → base64, mapas/listas/sets → JSON."""
+    if isinstance(v, Decimal):
+        return _numero(v)
+    if isinstance(v, (bytes, bytearray)):
+        return base64.b64encode(bytes(v)).decode()
+    if isinstance(v, (set, frozenset)):
+        v = sorted(v, key=str)
+    if isinstance(v, (list, tuple, dict)):
+        return json.dumps(v, default=_json, separators=(',', ':'), sort_keys=True)
+    return v
+
+def filas(item, aplanar=None):
+    """Filas de un item (tipos Python). Con `aplanar` (el atributo `items` de la OC) sale una
+    fila por línea con `linea`, `sku` y `qty`, repitiendo las columnas de la orden; los demás
+    campos de la línea van en `lineaExtras` (JSON). Una orden sin líneas da una fila sin sku."""
+    base = {k: valor(v) for k, v in item.items() if k != aplanar}
+    if not aplanar:
+        return [base]
+    lineas = [it for it in parse_items(item.get(aplanar)) if isinstance(it, dict)]
+    if not lineas:
+        return [dict(base, linea=None, sku=None, qty=None)]
+    out = []
+    for i, it in enumerate(lineas):
+        fila = dict(base, linea=i, sku=str(it.get('sku', '')), qty=valor(it.get('qty')))
+        extras = {k: v for k, v in it.items() if k not in ('sku', 'qty')}
+        if extras:
+            fila['lineaExtras'] = valor(extras)
+        out.append(fila)
+    return out
+
+# ----------------------------------------------------------------------------
+# Escritura particionada
+# ----------------------------------------------------------------------------
+
+def _segmento(v):
+    return str(v).replace('/', '-').replace('=', '-') or _SIN_VALOR
+
+def _columnas(rows):
+    return list(dict.fromkeys(c for r in rows for c in r))
+
+def _parquet(path, rows):
+    columnas = _columnas(rows)
+    arrays = []
+    for c in columnas:
+        vals = [r.get(c) for r in rows]
+        try:
+            arr = pa.array(vals)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):   # tipos mezclados en la columna
+            arr = pa.array([None if v is None else str(v) for v in vals], type=pa.string())
+        if pa.types.is_null(arr.type):
+            arr = arr.cast(pa.string())
+        arrays.append(arr)
+    pq.write_table(pa.table(dict(zip(columnas, arrays))), path, compression='snappy')
+
+def _csv(path, rows):
+    columnas = _columnas(rows)
+    with gzip.open(path, 'wt', newline='', encoding='utf-8') as f:
+        w = csv.DictWriter(f, fieldnames=columnas, restval='')
+        w.writeheader()
+        w.writerows(rows)
+
+class Escritor:
+    """Junta filas por partición y las escribe en archivos de `directorio`.
+
+    `agregar()` devuelve True cuando hay `max_filas` en memoria (entre todas las particiones);
+    `flush()` escribe un archivo por partición y llama `al_cerrar(path, relativo)` por cada uno
+    (p.ej. subirlo a S3). Quien llama guarda su cursor recién después del flush.
+    """
+
+    def __init__(self, directorio, tabla, particion, nombre, max_filas, al_cerrar=None):
+        self.directorio, self.tabla, self.particion = directorio, tabla, tuple(particion or ())
+        self.nombre, self.max_filas, self.al_cerrar = nombre, max_filas, al_cerrar
+        self.buffers, self.n, self.secuencia = {}, 0, 0
+
+    def agregar(self, fila, fecha):
+        clave = (('fecha', (fecha or '')[:10] or _SIN_VALOR),) + \
+                tuple((c, fila.get(c) or _SIN_VALOR) for c in self.particion)
+        self.buffers.setdefault(clave, []).append(fila)
+        self.n += 1
+        return self.n >= self.max_filas
+
+    def flush(self):
+        archivos = []
+        for clave, rows in sorted(self.buffers.items()):
+            carpeta = '/'.join([self.tabla] + [f"{c}={_segmento(v)}" for c, v in clave])
+            relativo = f"{carpeta}/{self.nombre}-{self.secuencia:05d}{EXTENSION}"
+            path = os.path.join(self.directorio, *relativo.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            (_parquet if EXPORT_FORMAT == 'parquet' else _csv)(path, rows)
+            self.secuencia += 1
+            if self.al_cerrar:
+                self.al_cerrar(path, relativo)
+            archivos.append(relativo)
+        self.buffers, self.n = {}, 0
+        return archivos
+
+# ----------------------------------------------------------------------------
+# Presupuesto de capacidad
+# ----------------------------------------------------------------------------
+
+class Presupuesto:
+    """Token bucket de RCU por segundo compartido por todos los hilos (0 = sin límite).
+
+    `esperar()` antes de cada página bloquea mientras el saldo esté en negativo; `cobrar()`
+    descuenta lo que informó DynamoDB (ConsumedCapacity). Con páginas chicas el exceso de una
+    página sobre el saldo queda acotado y se paga con espera en la siguiente.
+    """
+
+    def __init__(self, rcu_por_s):
+        self.tasa = float(rcu_por_s or 0)
+        self.saldo = self.tasa   # ráfaga inicial de un segundo
+        self.t = time.monotonic()
+        self.consumido = 0.0
+        self.esperado = 0.0
+        self.lock = threading.Lock()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self.saldo = min(self.tasa, self.saldo + (ahora - self.t) * self.tasa)
+        self.t = ahora
+
+    def esperar(self):
+        if not self.tasa:
+            return
+        while True:
+            with self.lock:
+                self._recargar()
+                if self.saldo > 0:
+                    return
+                espera = -self.saldo / self.tasa
+                self.esperado += espera
+            time.sleep(espera)
+
+    def cobrar(self, unidades):
+        with self.lock:
+            self._recargar()
+            self.saldo -= unidades
+            self.consumido += unidades
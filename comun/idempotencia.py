@@ -0,0 +1,140 @@
+import os, json, time, functools
+from collections import OrderedDict
+from botocore.exceptions import ClientError
+from comun import aws
+from comun.eventos import handler_name
+
+# Ledger de idempotencia: un item por (evento, handler) o (orderId, transición).
+# La primera invocación toma la clave con un put condicional; las repeticiones
+# (reentregas de EventBridge, prefetch de links del mail) devuelven la respuesta
+# guardada sin tocar OrdenesCompra / StockGlobal.
+IDEMPOTENCY_TABLE   = os.environ.get('IDEMPOTENCY_TABLE', 'Idempotencia')
+IDEMPOTENCY_ENABLED = os.environ.get('IDEMPOTENCY_ENABLED', '1') not in ('0', 'false', 'no')
+IDEMPOTENCY_TTL     = int(os.environ.get('IDEMPOTENCY_TTL', str(24 * 3600)))   # expiresAt (TTL de DynamoDB)
+IDEMPOTENCY_LOCK_S  = int(os.environ.get('IDEMPOTENCY_LOCK_S', '300'))          # IN_PROGRESS colgado
+MAX_STORED_BYTES    = 350000
+LOCAL_CACHE_SIZE    = 128
+
+_ddb = aws.client('dynamodb')
+_local = OrderedDict()   # clave -> respuesta (duplicados en el mismo contenedor ni van a DynamoDB)
+
+def _remember(key, res):
+    _local[key] = res
+    _local.move_to_end(key)
+    while len(_local) > LOCAL_CACHE_SIZE:
+        _local.popitem(last=False)
+
+# ----------------------------------------------------------------------------
+# Claves
+# ----------------------------------------------------------------------------
+
+def por_evento(handler_file):
+    """Clave = '<handler>#<event id>' para eventos de EventBridge."""
+    nombre = handler_name(handler_file)
+    def clave(event):
+        if isinstance(event, dict) and event.get('id') and (event.get('detail-type') or event.get('detailType')):
+            return f"{nombre}#{event['id']}"
+        return None
+    return clave
+
+def por_transicion(transicion, get_order_id):
+    """Clave = '<orderId>#<transición>' para endpoints (links de los mails)."""
+    def clave(event):
+        order_id = get_order_id(event) if isinstance(event, dict) else None
+        return f"{order_id}#{transicion}" if order_id else None
+    return clave
+
+# ----------------------------------------------------------------------------
+# Wrapper
+# ----------------------------------------------------------------------------
+
+def _fallo(res):
+    if not isinstance(res, dict):
+        return False
+    return res.get('statusCode', 200) >= 400 or res.get('ok') is False
+
+def _en_proceso(key):
+    return {'statusCode': 409, 'body': json.dumps({'info': 'evento duplicado en proceso', 'idempotencyKey': key})}
+
+def _tomar(key, now):
+    """True si esta invocación tomó la clave; si no, (False, item_actual)."""
+    try:
+        _ddb.put_item(
+            TableName=IDEMPOTENCY_TABLE,
+            Item={'idemKey': {'S': key}, 'status': {'S': 'IN_PROGRESS'},
+                  'lockUntil': {'N': str(now + IDEMPOTENCY_LOCK_S)},
+                  'expiresAt': {'N': str(now + IDEMPOTENCY_TTL)}},
+            ConditionExpression='attribute_not_exists(idemKey) OR expiresAt < :now OR '
+                                '(#st = :prog AND lockUntil < :now)',
+            ExpressionAttributeNames={'#st': 'status'},
+            ExpressionAttributeValues={':now': {'N': str(now)}, ':prog': {'S': 'IN_PROGRESS'}},
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return True, None
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        return False, e.response.get('Item') or {}
+
+def _completar(key, res, now):
+    body = json.dumps(res, default=str)
+    values = {':done': {'S': 'COMPLETED'}, ':exp': {'N': str(now + IDEMPOTENCY_TTL)}}
+    expr = 'SET #st = :done, expiresAt = :exp REMOVE lockUntil'
+    if len(body) <= MAX_STORED_BYTES:
+        expr = 'SET #st = :done, expiresAt = :exp, response = :res REMOVE lockUntil'
+        values[':res'] = {'S': body}
+    _ddb.update_item(TableName=IDEMPOTENCY_TABLE, Key={'idemKey': {'S': key}}, UpdateExpression=expr,
+                          ExpressionAttributeNames={'#st': 'status'}, ExpressionAttributeValues=values)
+
+def _liberar(key):
+    try:
+        _ddb.delete_item(TableName=IDEMPOTENCY_TABLE, Key={'idemKey': {'S': key}})
+    except ClientError as e:
+        print("[IDEMPOTENCY] no se pudo liberar", key, str(e))
+
+def idempotente(clave):
+    """Decorador para `lambda_handler`. `clave(event)` → str o None (sin deduplicar).
+
+    Sólo se guardan respuestas < 400: un 409 por stock o un error se pueden reintentar.
+    Si el ledger no responde se procesa igual (fail-open) y se loguea.
+    """
+    def wrap(handler):
+        @functools.wraps(handler)
+        def inner(event, context):
+            key = clave(event) if IDEMPOTENCY_ENABLED else None
+            if not key:
+                return handler(event, context)
+            if key in _local:
+                return _local[key]
+
+            now = int(time.time())
+            try:
+                tomada, actual = _tomar(key, now)
+            except ClientError as e:
+                print("[IDEMPOTENCY] ledger no disponible, se procesa sin deduplicar:", str(e))
+                return handler(event, context)
+            if not tomada:
+                if (actual.get('status') or {}).get('S') == 'COMPLETED':
+                    guardada = (actual.get('response') or {}).get('S')
+                    res = json.loads(guardada) if guardada else {'statusCode': 200, 'body': json.dumps({'info': 'duplicado'})}
+                    _remember(key, res)
+                    print("[IDEMPOTENCY] duplicado:", key)
+                    return res
+                return _en_proceso(key)
+
+            try:
+                res = handler(event, context)
+            except Exception:
+                _liberar(key)
+                raise
+            if _fallo(res):
+                _liberar(key)
+                return res
+            try:
+                _completar(key, res, int(time.time()))
+                _remember(key, res)
+            except ClientError as e:
+                print("[IDEMPOTENCY] no se pudo guardar la respuesta de", key, str(e))
+            return res
+        return inner
+    return wrap
@@ -0,0 +1,146 @@
+import os, sys, json, zlib, struct, base64
+from array import array
+from collections.abc import Sequence
+
+# Formato de escritura del atributo `items` en OrdenesCompra:
+#   'json' → string JSON (legacy, lo que entienden todas las versiones)
+#   'v1'   → binario columnar comprimido (activar cuando todos los consumidores usen esta capa)
+ITEMS_FORMAT = os.environ.get('ITEMS_FORMAT', 'json').strip().lower()
+
+# v1: MAGIC(3) | versión(1) | flags(1) | n(4, uint32 BE) | zlib(payload)
+#     payload = [len+skus separados por \x1f] [len+qtys] [len+extras JSON]
+MAGIC       = b'OCI'
+VERSION     = 1
+F_QTY_INT64 = 0x01   # qty como array int64 little-endian; si no, JSON
+F_EXTRAS    = 0x02   # hay otros campos por línea (desc, etc.) en JSON
+SEP         = '\x1f'
+TEXT_PREFIX = 'OCI1:'  # v1 en base64 cuando tiene que viajar como texto (eventos)
+_HEADER     = struct.Struct('>3sBBI')
+_LEN        = struct.Struct('>I')
+
+def _is_int(v):
+    return isinstance(v, int) and not isinstance(v, bool) and -2**63 <= v < 2**63
+
+def encode_items(items):
+    """Codifica una lista de items ({sku, qty, ...}) en el formato binario v1."""
+    items = list(items)
+    skus, qtys, extras = [], [], []
+    for it in items:
+        it = it if isinstance(it, dict) else {'sku': str(it)}
+        skus.append(str(it.get('sku', '')))
+        qtys.append(it.get('qty'))
+        extras.append({k: v for k, v in it.items() if k not in ('sku', 'qty')} or None)
+    flags = 0
+    if all(_is_int(q) for q in qtys):
+        flags |= F_QTY_INT64
+        qty_col = array('q', qtys)
+        if sys.byteorder == 'big':
+            qty_col.byteswap()  # en disco siempre little-endian
+        qty_bytes = qty_col.tobytes()
+    else:
+        qty_bytes = json.dumps(qtys, default=str, separators=(',', ':')).encode()
+    extra_bytes = b''
+    if any(extras):
+        flags |= F_EXTRAS
+        extra_bytes = json.dumps(extras, default=str, separators=(',', ':')).encode()
+    sku_bytes = SEP.join(skus).encode()
+    payload = b''.join(_LEN.pack(len(b)) + b for b in (sku_bytes, qty_bytes, extra_bytes))
+    return _HEADER.pack(MAGIC, VERSION, flags, len(items)) + zlib.compress(payload)
+
+def encode_for_dynamo(items):
+    """Atributo `items` en formato low-level de DynamoDB según ITEMS_FORMAT."""
+    if ITEMS_FORMAT == 'v1':
+        return {'B': encode_items(items)}
+    return {'S': json.dumps(items)}
+
+def to_text(field):
+    """`items` tal como viaja en JSON (eventos): v1 → 'OCI1:<base64>'."""
+    raw = getattr(field, 'value', field)
+    if isinstance(raw, (bytes, bytearray)):
+        return TEXT_PREFIX + base64.b64encode(bytes(raw)).decode()
+    return field
+
+class ItemsView(Sequence):
+    """Lista de items v1 decodificada a demanda.
+
+    `len()` sale del header sin descomprimir; `skus`/`qtys` descomprimen una vez y
+    devuelven las columnas; los dicts por línea se arman recién al indexar/iterar.
+    """
+    __slots__ = ('_blob', '_flags', '_n', '_skus', '_qtys', '_extras')
+
+    def __init__(self, blob):
+        magic, version, flags, n = _HEADER.unpack_from(blob)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"formato de items desconocido: {magic!r} v{version}")
+        self._blob, self._flags, self._n = blob, flags, n
+        self._skus = self._qtys = self._extras = None
+
+    def _decode(self):
+        if self._skus is not None:
+            return
+        payload = zlib.decompress(memoryview(self._blob)[_HEADER.size:])
+        cols, off = [], 0
+        for _ in range(3):
+            (size,) = _LEN.unpack_from(payload, off)
+            off += _LEN.size
+            cols.append(payload[off:off + size])
+            off += size
+        sku_b, qty_b, extra_b = cols
+        self._skus = sku_b.decode().split(SEP) if self._n else []
+        if self._flags & F_QTY_INT64:
+            q = array('q')
+            q.frombytes(qty_b)
+            if sys.byteorder == 'big':
+                q.byteswap()
+            self._qtys = q.tolist()
+        else:
+            self._qtys = json.loads(qty_b)
+        self._extras = json.loads(extra_b) if self._flags & F_EXTRAS else None
+
+    @property
+    def skus(self):
+        self._decode()
+        return self._skus
+
+    @property
+    def qtys(self):
+        self._decode()
+        return self._qtys
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        self._decode()
+        it = {'sku': self._skus[i], 'qty': self._qtys[i]}
+        if self._extras and self._extras[i]:
+            it.update(self._extras[i])
+        return it
+
+    def __iter__(self):
+        self._decode()
+        extras = self._extras or ()
+        for i, (sku, qty) in enumerate(zip(self._skus, self._qtys)):
+            it = {'sku': sku, 'qty': qty}
+            if extras and extras[i]:
+                it.update(extras[i])
+            yield it
+
+def parse_items(items_field):
+    """Reemplazo único de `_parse_items`: acepta lista, JSON legacy, v1 binario
+    (bytes / boto3 Binary) o v1 en texto ('OCI1:...'). Nunca lanza: [] si no entiende."""
+    if items_field is None:
+        return []
+    raw = getattr(items_field, 'value', items_field)
+    try:
+        if isinstance(raw, (bytes, bytearray, memoryview)):
+            return ItemsView(bytes(raw))
+        if isinstance(raw, str):
+            if raw.startswith(TEXT_PREFIX):
+                return ItemsView(base64.b64decode(raw[len(TEXT_PREFIX):]))
+            return json.loads(raw)
+    except Exception:
+        return []
+    return items_field
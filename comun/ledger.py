@@ -0,0 +1,141 @@
+import os, time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from comun import aws
+
+# Libro de movimientos de StockGlobal (append-only) + snapshots compactados.
+# Cada cambio de qty en un item de StockGlobal escribe, en la misma transacción,
+# un movimiento en MovimientosStock con la misma clave (`sku`, que para SKUs con
+# shards es `sku#i`, ver comun/stock.py):
+#   MovimientosStock  PK sku, SK mov = '<ts>#<tipo>#<orderId>'  → delta, tipo, orderId, ts
+#   SnapshotsStock    PK sku, SK hasta = '<ts>'                  → qty de todos los movimientos con ts < hasta
+# El stock en un instante t = último snapshot con hasta <= t + movimientos en [hasta, t].
+# Stock-CompactarLedger genera los snapshots periódicamente.
+STOCK_TABLE     = os.environ.get('STOCK_TABLE', 'StockGlobal')
+LEDGER_TABLE    = os.environ.get('LEDGER_TABLE', 'MovimientosStock')
+SNAPSHOT_TABLE  = os.environ.get('SNAPSHOT_TABLE', 'SnapshotsStock')
+LEDGER_ENABLED  = os.environ.get('LEDGER_ENABLED', '1') not in ('0', 'false', 'no')
+LEDGER_TTL_DAYS = int(os.environ.get('LEDGER_TTL_DAYS', '0'))   # 0 = los movimientos no vencen
+# No compactar lo más reciente: el `ts` de un movimiento es el `now` del handler, tomado al
+# empezar la invocación, y puede confirmarse hasta el timeout de la Lambda después (despacho
+# por pool, recepción en chunks con throttling). Un movimiento que llega con ts < hasta de un
+# snapshot ya escrito no entra en ningún snapshot: el lag tiene que ser mayor que el timeout
+# más largo de los handlers que escriben stock (máximo de Lambda: 900 s).
+LAMBDA_MAX_TIMEOUT_S = 900
+COMPACT_LAG_S   = int(os.environ.get('COMPACT_LAG_S', '1200'))
+if COMPACT_LAG_S <= LAMBDA_MAX_TIMEOUT_S:
+    print(f"[LEDGER] COMPACT_LAG_S={COMPACT_LAG_S} no cubre el timeout de Lambda ({LAMBDA_MAX_TIMEOUT_S} s):"
+          " asegurarse de que los handlers de stock tengan un timeout menor")
+
+RECEPCION, DESPACHO, COMPENSACION = 'RECEPCION', 'DESPACHO', 'COMPENSACION'
+_FIN = '#~'        # '<ts>#~' ordena después de cualquier '<ts>#<tipo>#...'
+APERTURA = '0'     # `hasta` del snapshot de apertura: ordena antes de cualquier ts
+
+_ddb = aws.client('dynamodb')
+
+def movimiento(key, delta, now, order_id, tipo):
+    """Put (low-level) del movimiento para el item `key` de StockGlobal."""
+    item = {
+        'sku': {'S': key}, 'mov': {'S': f"{now}#{tipo}#{order_id}"},
+        'delta': {'N': str(delta)}, 'tipo': {'S': tipo}, 'orderId': {'S': order_id}, 'ts': {'S': now},
+    }
+    if LEDGER_TTL_DAYS > 0:
+        item['expiresAt'] = {'N': str(int(time.time()) + LEDGER_TTL_DAYS * 86400)}
+    return {'TableName': LEDGER_TABLE, 'Item': item}
+
+def _query_todo(**kw):
+    """Todas las páginas de un Query (low-level)."""
+    while True:
+        resp = _ddb.query(**kw)
+        yield from resp.get('Items', [])
+        if 'LastEvaluatedKey' not in resp:
+            return
+        kw['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+def _snapshot(key, hasta, inclusivo=True):
+    """Último snapshot del item con hasta <= `hasta` (o < si no es inclusivo); None si no hay."""
+    resp = _ddb.query(
+        TableName=SNAPSHOT_TABLE,
+        KeyConditionExpression='sku = :k AND hasta ' + ('<=' if inclusivo else '<') + ' :h',
+        ExpressionAttributeValues={':k': {'S': key}, ':h': {'S': hasta}},
+        ScanIndexForward=False, Limit=1,
+    )
+    items = resp.get('Items') or []
+    return items[0] if items else None
+
+def _cola(key, desde, hasta_mov):
+    """(suma de deltas, cantidad) de los movimientos con desde <= mov <= hasta_mov."""
+    total, n = Decimal(0), 0
+    for it in _query_todo(TableName=LEDGER_TABLE,
+                          KeyConditionExpression='sku = :k AND mov BETWEEN :d AND :h',
+                          ExpressionAttributeValues={':k': {'S': key}, ':d': {'S': desde}, ':h': {'S': hasta_mov}},
+                          ProjectionExpression='delta'):
+        total += Decimal(it['delta']['N'])
+        n += 1
+    return total, n
+
+def saldo(key, hasta=None):
+    """Stock del item `key` al instante `hasta` (ISO, inclusive; None = ahora): snapshot + cola.
+    Devuelve (qty, {'snapshot': hasta del snapshot usado | None, 'movimientos': leídos de la cola})."""
+    hasta = hasta or datetime.utcnow().isoformat()
+    snap = _snapshot(key, hasta)
+    base = Decimal(snap['qty']['N']) if snap else Decimal(0)
+    desde = snap['hasta']['S'] if snap else ''
+    cola, n = _cola(key, desde, hasta + _FIN)
+    return base + cola, {'snapshot': desde or None, 'movimientos': n}
+
+def compactar(key, hasta):
+    """Snapshot del item `key` con todo lo anterior a `hasta`, partiendo del snapshot previo.
+    Idempotente (condición sobre la clave). Devuelve los movimientos compactados (0 = no escribió)."""
+    prev = _snapshot(key, hasta, inclusivo=False)
+    base = Decimal(prev['qty']['N']) if prev else Decimal(0)
+    desde = prev['hasta']['S'] if prev else ''
+    # BETWEEN es inclusivo, pero ningún mov es igual a un '<ts>' pelado: [desde, hasta) sin solaparse
+    delta, n = _cola(key, desde, hasta)
+    if not n:
+        return 0
+    try:
+        _ddb.put_item(
+            TableName=SNAPSHOT_TABLE,
+            Item={'sku': {'S': key}, 'hasta': {'S': hasta}, 'qty': {'N': str(base + delta)},
+                  'desde': {'S': desde}, 'movimientos': {'N': str(n)},
+                  'compactadoEn': {'S': datetime.utcnow().isoformat()}},
+            ConditionExpression='attribute_not_exists(hasta)',
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        return 0
+    return n
+
+def apertura(key, intentos=5):
+    """Snapshot inicial para un item que ya tenía stock antes del ledger:
+    qty actual − movimientos ya registrados. False si el item ya tenía apertura.
+    Si entra un movimiento mientras se lee, se vuelve a leer."""
+    if _snapshot(key, APERTURA):
+        return False
+    for _ in range(intentos):
+        antes = _cola(key, '', '~')
+        resp = _ddb.get_item(TableName=STOCK_TABLE, Key={'sku': {'S': key}}, ConsistentRead=True)
+        qty = Decimal(resp.get('Item', {}).get('qty', {}).get('N', '0'))
+        if _cola(key, '', '~') == antes:
+            break
+    else:
+        raise RuntimeError(f"{key}: movimientos concurrentes, reintentar la apertura")
+    try:
+        _ddb.put_item(
+            TableName=SNAPSHOT_TABLE,
+            Item={'sku': {'S': key}, 'hasta': {'S': APERTURA}, 'qty': {'N': str(qty - antes[0])},
+                  'movimientos': {'N': '0'}, 'compactadoEn': {'S': datetime.utcnow().isoformat()}},
+            ConditionExpression='attribute_not_exists(hasta)',
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        return False
+    return True
+
+def corte(ahora=None):
+    """`hasta` de la compactación: ahora − COMPACT_LAG_S."""
+    return ((ahora or datetime.utcnow()) - timedelta(seconds=COMPACT_LAG_S)).isoformat()
@@ -0,0 +1,85 @@
+import os, time, json, threading
+from collections import OrderedDict
+from comun import aws
+from comun.items import to_text
+
+# Cache por contenedor (sobrevive entre invocaciones "warm" de la misma Lambda)
+ORDERS_TABLE      = os.environ.get('ORDERS_TABLE', 'OrdenesCompra')
+ORDER_CACHE_SIZE  = int(os.environ.get('ORDER_CACHE_SIZE', '256'))
+ORDER_CACHE_TTL   = float(os.environ.get('ORDER_CACHE_TTL', '30'))
+
+# Snapshot de la orden dentro del evento: sólo si entra cómodo en los 256KB de EventBridge
+SNAPSHOT_MAX_BYTES = int(os.environ.get('ORDER_SNAPSHOT_MAX_BYTES', '150000'))
+
+_cache = OrderedDict()   # orderId -> (expira_en, item)
+_stats = {'hits': 0, 'misses': 0, 'snapshots': 0}
+_lock = threading.Lock()   # cache y contadores se comparten entre hilos (pools de los handlers)
+_table = aws.table(ORDERS_TABLE)
+
+def _put(order_id, item):
+    with _lock:
+        _cache[order_id] = (time.monotonic() + ORDER_CACHE_TTL, item)
+        _cache.move_to_end(order_id)
+        while len(_cache) > ORDER_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def _fresh(item, min_updated_at):
+    # updatedAt es ISO-8601: la comparación de strings respeta el orden temporal
+    return not min_updated_at or str(item.get('updatedAt') or '') >= str(min_updated_at)
+
+def get_order(order_id, min_updated_at=None, snapshot=None):
+    """Devuelve el item de OrdenesCompra (o None si no existe).
+
+    - `snapshot`: orden embebida en el evento ({orderId, items, updatedAt, ...});
+      si es tan nueva como `min_updated_at` se usa sin ir a DynamoDB.
+    - `min_updated_at`: una entrada cacheada más vieja que esto se descarta.
+    """
+    if isinstance(snapshot, dict) and snapshot.get('items') is not None and _fresh(snapshot, min_updated_at):
+        with _lock:
+            _stats['snapshots'] += 1
+        item = dict(snapshot, orderId=order_id)
+        _put(order_id, item)
+        return item
+
+    with _lock:
+        hit = _cache.get(order_id)
+        if hit and hit[0] > time.monotonic() and _fresh(hit[1], min_updated_at):
+            _cache.move_to_end(order_id)
+            _stats['hits'] += 1
+            return hit[1]
+        _stats['misses'] += 1
+
+    # la lectura va fuera del lock: dos hilos con la misma orden pueden leerla los dos
+    item = _table.get_item(Key={'orderId': order_id}).get('Item')
+    if item:
+        _put(order_id, item)
+    else:
+        invalidate(order_id)
+    return item
+
+def invalidate(order_id):
+    with _lock:
+        _cache.pop(order_id, None)
+
+def snapshot_for_event(item):
+    """Snapshot compacto (items + updatedAt) para viajar en el Detail del evento."""
+    if not item:
+        return None
+    snap = {k: item[k] for k in ('items', 'origen', 'prioridad', 'status', 'traceId', 'updatedAt') if k in item}
+    if 'items' in snap:
+        snap['items'] = to_text(snap['items'])
+    if len(json.dumps(snap, default=str)) > SNAPSHOT_MAX_BYTES:
+        return None
+    return snap
+
+def reset_stats():
+    with _lock:
+        for k in _stats:
+            _stats[k] = 0
+
+def stats():
+    with _lock:
+        actual, size = dict(_stats), len(_cache)
+    total = sum(actual.values())
+    servidos = actual['hits'] + actual['snapshots']
+    return dict(actual, size=size, hitRate=round(servidos / total, 3) if total else None)
@@ -0,0 +1,312 @@
+import os, json
+from string import Formatter
+
+# Plantillas de los mensajes SNS (asunto, cuerpo y línea del consolidado de comun/digest.py).
+# Se compilan una vez por contenedor y se renderizan en chunks: las líneas de items se
+# generan a medida que se iteran (ItemsView no arma la lista) y se recortan para que el
+# mensaje entre en SNS_MAX_BYTES, terminando con el link a la orden completa.
+#
+# Variantes: PLANTILLAS[nombre][locale]; 'nombre@ROL' pisa a 'nombre' para ese rol.
+#   NOTIF_LOCALE=es (default) | en    NOTIF_LOCALES='{"PROVEEDORES": "en"}' por rol
+#   PLANTILLAS_EXTRA='{"proveedor@PROVEEDORES": {"es": {"asunto": "..."}}}' agrega / pisa partes
+# Partes: asunto, cabecera, titulo_lineas (sólo si hay items), linea, vacio, recorte, pie,
+# resumen, resumen_linea. Una parte puede ser una lista; un elemento '?campo texto' sólo se
+# incluye si `campo` viene en el contexto (no None). Un campo faltante se renderiza vacío.
+NOTIF_LOCALE  = os.environ.get('NOTIF_LOCALE', 'es')
+API_BASE_URL  = os.environ.get('API_BASE_URL', 'https://1y4g8pdtm1.execute-api.us-east-2.amazonaws.com')
+APP_NAME      = os.environ.get('APP_NAME', 'NBA')
+SNS_MAX_BYTES = int(os.environ.get('SNS_MAX_BYTES', str(256 * 1024)))   # Publish (y un publish_batch entero)
+SNS_SUBJECT_MAX = 100
+MAX_LINEAS         = int(os.environ.get('PLANTILLAS_MAX_LINEAS', '1000'))
+RESUMEN_MAX_LINEAS = int(os.environ.get('PLANTILLAS_RESUMEN_MAX_LINEAS', '20'))
+CHUNK_BYTES = 8192
+
+_LINEA_ITEM = " - SKU: {sku}  Qty: {qty}  {desc}"
+_RECORTE = " ... y {restantes} productos más. Orden completa: {orden_url}"
+_RECORTE_EN = " ... and {restantes} more items. Full order: {orden_url}"
+# recordatorios de Ordenes-VigilarSLA (campos de comun/sla.py: recordatorio | escalado, demora)
+_SLA_ASUNTO = ["?recordatorio [Recordatorio] ", "?escalado [ESCALADO {escalado}] "]
+_SLA_ASUNTO_EN = ["?recordatorio [Reminder] ", "?escalado [ESCALATED {escalado}] "]
+_SLA_AVISO = "?demora ⏰ Sigue pendiente hace {demora}.\n\n"
+_SLA_AVISO_EN = "?demora ⏰ Still pending after {demora}.\n\n"
+
+PLANTILLAS = {
+    'aprobacion': {
+        'es': {
+            'asunto': _SLA_ASUNTO + ["OC {orderId} pendiente de aprobación (Rol: {rol})"],
+            'cabecera': [_SLA_AVISO,
+                         "Se creó la Orden de Compra {orderId} y requiere aprobación.\n\n"
+                         "Aprobar: {api}/approvals/{orderId}/approve?ROL={rol}\n"
+                         "Rechazar: {api}/approvals/{orderId}/reject?ROL={rol}\n"],
+            'resumen': _SLA_ASUNTO + ["OC {orderId} (Rol: {rol})\n"
+                                      "  Aprobar: {api}/approvals/{orderId}/approve?ROL={rol}\n"
+                                      "  Rechazar: {api}/approvals/{orderId}/reject?ROL={rol}"],
+        },
+        'en': {
+            'asunto': _SLA_ASUNTO_EN + ["PO {orderId} awaiting approval (Role: {rol})"],
+            'cabecera': [_SLA_AVISO_EN,
+                         "Purchase Order {orderId} was created and requires approval.\n\n"
+                         "Approve: {api}/approvals/{orderId}/approve?ROL={rol}\n"
+                         "Reject: {api}/approvals/{orderId}/reject?ROL={rol}\n"],
+            'resumen': _SLA_ASUNTO_EN + ["PO {orderId} (Role: {rol})\n"
+                                         "  Approve: {api}/approvals/{orderId}/approve?ROL={rol}\n"
+                                         "  Reject: {api}/approvals/{orderId}/reject?ROL={rol}"],
+        },
+    },
+    'proveedor': {
+        'es': {
+            'asunto': "OC {orderId} Aprobada – Detalle para proveedor (Rol: PROVEEDOR)",
+            'cabecera': "Orden de Compra APROBADA\nOC: {orderId}\nFecha aprobación: {aprobada}\n\nProductos:\n",
+            'linea': _LINEA_ITEM, 'vacio': " (sin items)\n", 'recorte': _RECORTE,
+            'resumen': "OC {orderId} – aprobada {aprobada}\n",
+            'resumen_linea': "  - SKU: {sku}  Qty: {qty}",
+        },
+        'en': {
+            'asunto': "PO {orderId} Approved – Supplier details (Role: SUPPLIER)",
+            'cabecera': "Purchase Order APPROVED\nPO: {orderId}\nApproval date: {aprobada}\n\nItems:\n",
+            'linea': " - SKU: {sku}  Qty: {qty}  {desc}", 'vacio': " (no items)\n", 'recorte': _RECORTE_EN,
+            'resumen': "PO {orderId} – approved {aprobada}\n",
+            'resumen_linea': "  - SKU: {sku}  Qty: {qty}",
+        },
+    },
+    'deposito': {
+        'es': {
+            'asunto': _SLA_ASUNTO + ["Depósito: OC {orderId} aprobada (confirmar recepción al arribo) (Rol: DEPOSITO)"],
+            'cabecera': [_SLA_AVISO,
+                         "Pedido aprobado y en camino a Depósito\nOC: {orderId}\nFecha aprobación: {aprobada}\n"
+                         "Rol: Deposito\n\nProductos:\n"],
+            'linea': _LINEA_ITEM, 'vacio': " (sin items)\n", 'recorte': _RECORTE,
+            'pie': "\nCuando llegue el pedido a Depósito, confirmá la recepción:\n"
+                   "{api}/recepciones/{orderId}/accept\n\nEste es un aviso automático.",
+            'resumen': _SLA_ASUNTO + ["OC {orderId} – aprobada {aprobada}\n  Confirmar recepción: {api}/recepciones/{orderId}/accept"],
+        },
+        'en': {
+            'asunto': _SLA_ASUNTO_EN + ["Warehouse: PO {orderId} approved (confirm receipt on arrival) (Role: WAREHOUSE)"],
+            'cabecera': [_SLA_AVISO_EN,
+                         "Order approved and on its way to the Warehouse\nPO: {orderId}\nApproval date: {aprobada}\n"
+                         "Role: Warehouse\n\nItems:\n"],
+            'linea': _LINEA_ITEM, 'vacio': " (no items)\n", 'recorte': _RECORTE_EN,
+            'pie': "\nWhen the order arrives at the Warehouse, confirm receipt:\n"
+                   "{api}/recepciones/{orderId}/accept\n\nThis is an automated message.",
+            'resumen': _SLA_ASUNTO_EN + ["PO {orderId} – approved {aprobada}\n  Confirm receipt: {api}/recepciones/{orderId}/accept"],
+        },
+    },
+    'logistica': {
+        'es': {
+            'asunto': _SLA_ASUNTO + ["[{app}] Logística: stock disponible para OC {orderId}"],
+            'cabecera': [_SLA_AVISO,
+                         "Se confirmó la recepción en Depósito.\n\nOC: {orderId}\nFecha recepción: {recibida}\n\n"
+                         "Confirmá el despacho aquí:\n{api}/despachos/{orderId}/confirm\n"],
+            'resumen': _SLA_ASUNTO + ["OC {orderId} – recibida {recibida}\n  Confirmar despacho: {api}/despachos/{orderId}/confirm"],
+        },
+        'en': {
+            'asunto': _SLA_ASUNTO_EN + ["[{app}] Logistics: stock available for PO {orderId}"],
+            'cabecera': [_SLA_AVISO_EN,
+                         "Receipt at the Warehouse was confirmed.\n\nPO: {orderId}\nReceived at: {recibida}\n\n"
+                         "Confirm the dispatch here:\n{api}/despachos/{orderId}/confirm\n"],
+            'resumen': _SLA_ASUNTO_EN + ["PO {orderId} – received {recibida}\n  Confirm dispatch: {api}/despachos/{orderId}/confirm"],
+        },
+    },
+    'sucursal': {
+        'es': {
+            'asunto': "[{app}] {sucursal}: Despacho confirmado – OC {orderId}",
+            'cabecera': ["Hola {sucursal},\n\nSe confirmó el despacho de la Orden de Compra {orderId}.\n"
+                         "Fecha/Hora: {despachada}\n",
+                         "?unidades Unidades asignadas a tu sucursal: {unidades}\n"],
+            'titulo_lineas': "\n", 'linea': " - SKU: {sku}  Qty: {qty}",
+            'recorte': " ... y {restantes} SKUs más. Orden completa: {orden_url}",
+            'pie': "\nEste es un aviso automático.",
+            'resumen': ["OC {orderId} – despachada {despachada}", "?unidades : {unidades} unidades"],
+        },
+        'en': {
+            'asunto': "[{app}] {sucursal}: Dispatch confirmed – PO {orderId}",
+            'cabecera': ["Hello {sucursal},\n\nThe dispatch of Purchase Order {orderId} was confirmed.\n"
+                         "Date/Time: {despachada}\n",
+                         "?unidades Units assigned to your branch: {unidades}\n"],
+            'titulo_lineas': "\n", 'linea': " - SKU: {sku}  Qty: {qty}",
+            'recorte': " ... and {restantes} more SKUs. Full order: {orden_url}",
+            'pie': "\nThis is an automated message.",
+            'resumen': ["PO {orderId} – dispatched {despachada}", "?unidades : {unidades} units"],
+        },
+    },
+    # escalamiento de Ordenes-VigilarSLA: bloque por orden dentro del consolidado 'digest'
+    'sla': {
+        'es': {
+            'titulo': "SLA vencido ({status})",
+            'resumen': "OC {orderId} – en {status} hace {demora} (desde {desde} UTC)\n  Orden: {orden_url}",
+        },
+        'en': {
+            'titulo': "SLA breached ({status})",
+            'resumen': "PO {orderId} – in {status} for {demora} (since {desde} UTC)\n  Order: {orden_url}",
+        },
+    },
+    # consolidado de comun/digest.py: una "línea" por orden
+    'digest': {
+        'es': {
+            'asunto': "[{app}] {titulo} – {n} {ordenes}",
+            'cabecera': ["Resumen de {n} {ordenes}", "?desde  ({desde} – {hasta} UTC)", ":\n\n"],
+            'orden': "orden", 'orden_plural': "órdenes",
+            'linea': "{texto}\n", 'recorte': "... y {restantes} órdenes más en el próximo resumen.",
+            'pie': "Este es un aviso automático (modo resumen).",
+        },
+        'en': {
+            'asunto': "[{app}] {titulo} – {n} {ordenes}",
+            'cabecera': ["Summary of {n} {ordenes}", "?desde  ({desde} – {hasta} UTC)", ":\n\n"],
+            'orden': "order", 'orden_plural': "orders",
+            'linea': "{texto}\n", 'recorte': "... and {restantes} more orders in the next summary.",
+            'pie': "This is an automated message (summary mode).",
+        },
+    },
+}
+
+def _load_json(var):
+    raw = os.environ.get(var, '').strip()
+    if not raw:
+        return {}
+    try:
+        m = json.loads(raw)
+        return m if isinstance(m, dict) else {}
+    except Exception:
+        print(f"[PLANTILLAS] {var} inválido, se ignora")
+        return {}
+
+NOTIF_LOCALES = _load_json('NOTIF_LOCALES')
+for _nombre, _locales in _load_json('PLANTILLAS_EXTRA').items():
+    for _loc, _partes in (_locales or {}).items():
+        PLANTILLAS.setdefault(_nombre, {}).setdefault(_loc, {}).update(_partes or {})
+
+# ----------------------------------------------------------------------------
+# Compilación (una vez por contenedor)
+# ----------------------------------------------------------------------------
+
+_fmt = Formatter()
+_compiladas = {}
+
+def _compilar_texto(texto):
+    # (literal, campo, format_spec): sólo nombres simples, sin atributos ni índices
+    return tuple((lit, campo, spec or '') for lit, campo, spec, _ in _fmt.parse(texto))
+
+def _compilar_parte(parte):
+    """Lista de (condición | None, piezas)."""
+    out = []
+    for texto in parte if isinstance(parte, list) else [parte]:
+        cond = None
+        if texto.startswith('?'):
+            cond, _, texto = texto[1:].partition(' ')
+        out.append((cond, _compilar_texto(texto)))
+    return tuple(out)
+
+def plantilla(nombre, rol=None, locale=None):
+    """Partes compiladas de `nombre` para el rol / locale (fallback: sin rol, locale default, 'es')."""
+    locale = locale or NOTIF_LOCALES.get(rol) or NOTIF_LOCALE
+    clave = (nombre, rol, locale)
+    hit = _compiladas.get(clave)
+    if hit is not None:
+        return hit
+    partes = {}
+    for loc in dict.fromkeys(('es', NOTIF_LOCALE, locale)):   # de menor a mayor prioridad
+        partes.update(PLANTILLAS.get(nombre, {}).get(loc, {}))
+        if rol:
+            partes.update(PLANTILLAS.get(f"{nombre}@{rol}", {}).get(loc, {}))
+    if not partes:
+        raise KeyError(f"plantilla desconocida: {nombre}")
+    hit = _compiladas[clave] = {k: _compilar_parte(v) for k, v in partes.items()}
+    return hit
+
+# ----------------------------------------------------------------------------
+# Render
+# ----------------------------------------------------------------------------
+
+def _llenar(parte, ctx):
+    out = []
+    for cond, piezas in parte or ():
+        if cond and ctx.get(cond) is None:
+            continue
+        for lit, campo, spec in piezas:
+            out.append(lit)
+            if campo is not None:
+                v = ctx.get(campo)
+                out.append('' if v is None else format(v, spec) if spec else str(v))
+    return ''.join(out)
+
+def contexto(ctx, order_id=None):
+    """Agrega los campos comunes (app, api, orden_url) sin pisar los del handler."""
+    base = {'app': APP_NAME, 'api': API_BASE_URL}
+    base.update(ctx)
+    oid = order_id or base.get('orderId')
+    if oid and 'orden_url' not in base:
+        base['orden_url'] = f"{base['api']}/ordenes-compra?orderId={oid}"
+    return base
+
+def _ctx_item(ctx, item):
+    item = dict(item)
+    if item.get('desc') is None:
+        item['desc'] = item.get('descripcion') or ''
+    return dict(ctx, **item)
+
+def _lineas(items):
+    if isinstance(items, dict):                     # {sku: qty}
+        return len(items), ({'sku': k, 'qty': v} for k, v in items.items())
+    return len(items), iter(items)
+
+def stream(p, ctx, items=None, cabecera='cabecera', linea='linea', pie='pie',
+           max_bytes=SNS_MAX_BYTES, max_lineas=MAX_LINEAS, info=None):
+    """Genera el texto en chunks de ~CHUNK_BYTES. Las líneas de items que no entran en
+    `max_bytes` (UTF-8) o pasan de `max_lineas` se reemplazan por la parte 'recorte'.
+    Si se pasa `info` (dict), deja en info['lineas'] cuántos items entraron."""
+    cab, fin = _llenar(p.get(cabecera), ctx), _llenar(p.get(pie), ctx)
+    yield cab
+    if items is not None and linea in p:
+        total, it = _lineas(items)
+        if not total:
+            yield _llenar(p.get('vacio'), ctx)
+        else:
+            yield _llenar(p.get('titulo_lineas'), ctx)
+            recorte = p.get('recorte')
+            # reserva para el pie y el peor recorte (todas las líneas afuera)
+            libre = max_bytes - len(cab.encode()) - len(fin.encode()) - \
+                len(_llenar(recorte, dict(ctx, restantes=total)).encode()) - 1
+            buf, n_buf, usados, n = [], 0, 0, 0
+            for item in it:
+                if isinstance(item, dict):
+                    texto = _llenar(p[linea], _ctx_item(ctx, item)).rstrip(' ') + '\n'
+                else:
+                    texto = f" - {item}\n"
+                tam = len(texto.encode())
+                if n >= max_lineas or usados + tam > libre:
+                    buf.append(_llenar(recorte, dict(ctx, restantes=total - n)) + '\n')
+                    break
+                buf.append(texto)
+                n += 1
+                usados += tam
+                n_buf += tam
+                if n_buf >= CHUNK_BYTES:
+                    yield ''.join(buf)
+                    buf, n_buf = [], 0
+            if buf:
+                yield ''.join(buf)
+            if info is not None:
+                info['lineas'] = n
+    yield fin
+
+def texto(nombre, parte, ctx=None, rol=None, locale=None):
+    """Una parte suelta de la plantilla ('' si no existe)."""
+    return _llenar(plantilla(nombre, rol, locale).get(parte), contexto(ctx or {}))
+
+def asunto(p, ctx):
+    return _llenar(p.get('asunto'), ctx)[:SNS_SUBJECT_MAX]   # límite de SNS
+
+def mensaje(nombre, ctx, items=None, rol=None, locale=None, max_bytes=SNS_MAX_BYTES, max_lineas=MAX_LINEAS,
+            info=None):
+    """(subject, message) listos para sns.publish."""
+    p = plantilla(nombre, rol, locale)
+    ctx = contexto(ctx)
+    return asunto(p, ctx), ''.join(stream(p, ctx, items, max_bytes=max_bytes, max_lineas=max_lineas, info=info))
+
+def resumen(nombre, ctx, items=None, rol=None, locale=None, max_lineas=RESUMEN_MAX_LINEAS):
+    """Bloque de la orden dentro del consolidado del modo digest."""
+    p = plantilla(nombre, rol, locale)
+    ctx = contexto(ctx)
+    texto = ''.join(stream(p, ctx, items if 'resumen_linea' in p else None, cabecera='resumen',
+                           linea='resumen_linea', pie=None, max_lineas=max_lineas))
+    return texto.rstrip('\n')
@@ -0,0 +1,76 @@
+import os, json
+from datetime import datetime, timedelta
+from comun import estados
+
+# SLA de las órdenes abiertas: cuánto puede quedar una orden en cada estado antes de
+# volver a mandar el link de la acción pendiente. Cada umbral es un nivel de escalamiento:
+#   nivel 1      recordatorio al mismo destinatario (respeta el modo digest)
+#   nivel 2..n   escalado: aviso inmediato (urgente, sin digest)
+#   último nivel además va al consolidado de SLA_ESCALATION_TOPIC_ARN (Ordenes-VigilarSLA)
+#   SLA_TIERS='{"PENDING_APPROVAL": [120, 480, 1440]}'  (minutos desde el último cambio de estado)
+SLA_SOURCE = os.environ.get('SLA_SOURCE', 'com.casacentral.sla')
+
+_DEFAULT_TIERS = {
+    estados.PENDING_APPROVAL: [120, 480, 1440],     # link de aprobación sin usar
+    estados.APPROVED:         [1440, 2880, 4320],   # recepción sin confirmar
+    estados.RECEIVED:         [240, 720, 1440],     # despacho sin confirmar
+}
+
+# Mismo DetailType que consume cada Notificaciones-* (las reglas de SLA filtran por SLA_SOURCE,
+# así el recordatorio de OrdenAprobada no vuelve a Proveedor ni a Stock).
+DETAIL_TYPES = {
+    estados.PENDING_APPROVAL: 'OrdenPendienteAprobacion',
+    estados.APPROVED:         'OrdenAprobada',
+    estados.RECEIVED:         'RecepcionRecibida',
+}
+SELLOS_EVENTO = {estados.APPROVED: 'approvedAt', estados.RECEIVED: 'receivedAt'}
+
+def _load_tiers():
+    tiers = {k: list(v) for k, v in _DEFAULT_TIERS.items()}
+    raw = os.environ.get('SLA_TIERS', '').strip()
+    if raw:
+        try:
+            for st, mins in json.loads(raw).items():
+                if st in DETAIL_TYPES:
+                    tiers[st] = sorted(float(m) for m in mins)
+        except Exception:
+            print("[SLA] SLA_TIERS inválido, se usan los default:", raw)
+    return {st: mins for st, mins in tiers.items() if mins}
+
+SLA_TIERS = _load_tiers()
+
+def limite(status, nivel, ahora):
+    """updatedAt máximo de una orden que ya cruzó el umbral `nivel` (1..n) de `status`."""
+    return (ahora - timedelta(minutes=SLA_TIERS[status][nivel - 1])).isoformat()
+
+def detalle(status, order_id, updated_at, nivel, ahora):
+    """Detail del recordatorio: lo que espera el Notificaciones-* de ese estado + `recordatorio`."""
+    niveles = len(SLA_TIERS[status])
+    det = {
+        'orderId': order_id,
+        'recordatorio': {'status': status, 'nivel': nivel, 'niveles': niveles, 'desde': updated_at,
+                         'minutos': int((ahora - datetime.fromisoformat(updated_at)).total_seconds() // 60)},
+    }
+    if status in SELLOS_EVENTO:
+        det[SELLOS_EVENTO[status]] = updated_at    # sin otro cambio, updatedAt = instante de la transición
+    if nivel > 1:
+        det['prioridad'] = 'URGENTE'               # escalado: sin digest (comun/digest.py)
+    return det
+
+def _demora(minutos):
+    if minutos < 120:
+        return f"{minutos} min"
+    if minutos < 48 * 60:
+        return f"{minutos // 60} h"
+    return f"{minutos // 1440} d"
+
+def contexto(det):
+    """Campos de plantilla de un recordatorio ({} si el evento no es de SLA):
+    `recordatorio` (nivel 1) o `escalado` (nivel >= 2) y `demora`."""
+    r = (det or {}).get('recordatorio') if isinstance(det, dict) else None
+    if not isinstance(r, dict):
+        return {}
+    nivel = int(r.get('nivel') or 1)
+    ctx = {'demora': _demora(int(r.get('minutos') or 0))}
+    ctx['escalado' if nivel > 1 else 'recordatorio'] = nivel
+    return ctx
@@ -0,0 +1,251 @@
+import os, json, time, random, zlib, threading
+from collections import OrderedDict
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from comun import aws, ledger
+
+# StockGlobal con contadores repartidos ("sharded") para SKUs calientes.
+# Un SKU con N shards guarda su stock en N items: el original (`sku`, shard 0)
+# y `sku#1` … `sku#N-1`. Como el shard 0 es el item de siempre, activar el modo
+# para un SKU no requiere migrar nada (bajar N sí: hay que consolidar antes).
+#   STOCK_HOT_SKUS='{"SKU-0001": 8, "SKU-0002": 16}'   (o 'SKU-0001,SKU-0002' con STOCK_SHARDS)
+#   - ingresos: ADD en un shard elegido por hash(orderId, sku) → se reparten entre shards
+#   - retiros: se lee cada shard y se descuenta de la menor cantidad de shards posible
+#     (los de más stock primero), todo en una transacción condicional
+#   - lectura: suma de shards; STOCK_AGGREGATE_TTL > 0 la cachea por contenedor
+# Con LEDGER_ENABLED cada Update de qty va acompañado del Put de su movimiento
+# (comun/ledger.py) en la misma transacción: `acciones_ingreso` / `acciones_retiro`.
+STOCK_TABLE         = os.environ.get('STOCK_TABLE', 'StockGlobal')
+STOCK_SHARDS        = int(os.environ.get('STOCK_SHARDS', '8'))
+STOCK_AGGREGATE_TTL = float(os.environ.get('STOCK_AGGREGATE_TTL', '0'))
+STOCK_AGGREGATE_MAX = int(os.environ.get('STOCK_AGGREGATE_MAX', '10000'))
+STOCK_MAX_RETRIES   = int(os.environ.get('STOCK_MAX_RETRIES', '5'))
+STOCK_EVENT_SKUS    = int(os.environ.get('STOCK_EVENT_SKUS', '500'))   # SKUs listados en el evento (si no, leer la orden)
+BATCH_GET_MAX       = 100
+
+def _load_hot():
+    raw = os.environ.get('STOCK_HOT_SKUS', '').strip()
+    if not raw:
+        return {}
+    try:
+        cfg = json.loads(raw)
+    except ValueError:
+        cfg = [s.strip() for s in raw.split(',') if s.strip()]
+    if isinstance(cfg, list):
+        return {str(s): STOCK_SHARDS for s in cfg}
+    if isinstance(cfg, dict):
+        return {str(s): max(1, int(n)) for s, n in cfg.items()}
+    print("[STOCK] STOCK_HOT_SKUS inválido, se ignora:", raw)
+    return {}
+
+STOCK_HOT_SKUS = _load_hot()
+
+_ddb = aws.client('dynamodb')
+_agregados = OrderedDict()   # sku -> (expira_en, total), LRU de STOCK_AGGREGATE_MAX
+_lock = threading.Lock()
+
+def shards(sku):
+    return STOCK_HOT_SKUS.get(sku, 1)
+
+def shard_keys(sku):
+    return [sku] + [f"{sku}#{i}" for i in range(1, shards(sku))]
+
+def _shard_para(sku, order_id):
+    n = shards(sku)
+    return shard_keys(sku)[zlib.crc32(f"{order_id}#{sku}".encode()) % n] if n > 1 else sku
+
+# ----------------------------------------------------------------------------
+# Acciones (para TransactWriteItems / update_item)
+# ----------------------------------------------------------------------------
+
+def sumar(sku, qty, now, order_id):
+    """Update (low-level) que suma `qty` al stock de `sku` en un solo shard."""
+    return {
+        'TableName': STOCK_TABLE,
+        'Key': {'sku': {'S': _shard_para(sku, order_id)}},
+        'UpdateExpression': 'ADD qty :inc SET updatedAt = :ts, lastOrderId = :oid',
+        'ExpressionAttributeValues': {':inc': {'N': str(qty)}, ':ts': {'S': now}, ':oid': {'S': order_id}}
+    }
+
+def _restar_de(key, qty, now, order_id):
+    return {
+        'TableName': STOCK_TABLE,
+        'Key': {'sku': {'S': key}},
+        'UpdateExpression': 'ADD qty :dec SET updatedAt = :ts, lastOrderId = :oid',
+        'ConditionExpression': 'attribute_exists(qty) AND qty >= :need',
+        'ExpressionAttributeValues': {
+            ':dec': {'N': str(Decimal(0) - qty)}, ':need': {'N': str(qty)},
+            ':ts': {'S': now}, ':oid': {'S': order_id}
+        },
+        'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+    }
+
+def plan_retiro(por_shard, qty, semilla=''):
+    """[(shard, cantidad)] tocando la menor cantidad de shards; None si la suma no alcanza.
+    Si un solo shard alcanza se elige entre los que alcanzan por hash de `semilla` (retiros
+    concurrentes no van todos al mismo); si no, los de más stock primero."""
+    if sum(por_shard.values(), Decimal(0)) < qty:
+        return None
+    alcanzan = sorted(key for key, disp in por_shard.items() if disp >= qty)
+    if alcanzan:
+        return [(alcanzan[zlib.crc32(semilla.encode()) % len(alcanzan)], Decimal(qty))]
+    plan, falta = [], Decimal(qty)
+    for key, disp in sorted(por_shard.items(), key=lambda kv: (-kv[1], kv[0])):
+        if falta <= 0:
+            break
+        if disp <= 0:
+            continue
+        toma = min(disp, falta)
+        plan.append((key, toma))
+        falta -= toma
+    return plan
+
+def restar(sku, qty, now, order_id, por_shard=None, intento=0):
+    """Updates condicionales que restan `qty` de `sku`.
+    SKU simple: un decremento condicional (qty >= pedido) sobre el item.
+    SKU con shards: `por_shard` ({shard: qty}, de `leer_shards`) es obligatorio; None si no alcanza.
+    `intento` cambia el shard elegido al reintentar tras un choque con otro retiro."""
+    if shards(sku) == 1:
+        return [_restar_de(sku, qty, now, order_id)]
+    plan = plan_retiro(por_shard or {}, qty, f"{order_id}#{sku}#{intento}")
+    if plan is None:
+        return None
+    return [_restar_de(key, parte, now, order_id) for key, parte in plan]
+
+def _con_movimiento(updates, signo, now, order_id, tipo):
+    """TransactItems: cada Update de qty seguido del Put de su movimiento en el ledger."""
+    out = []
+    for u in updates:
+        out.append({'Update': u})
+        if ledger.LEDGER_ENABLED:
+            delta = Decimal(u['ExpressionAttributeValues'][':inc' if signo > 0 else ':dec']['N'])
+            out.append({'Put': ledger.movimiento(u['Key']['sku']['S'], delta, now, order_id, tipo)})
+    return out
+
+def acciones_por_update():
+    return 2 if ledger.LEDGER_ENABLED else 1
+
+def acciones_ingreso(sku, qty, now, order_id, tipo=ledger.RECEPCION):
+    return _con_movimiento([sumar(sku, qty, now, order_id)], 1, now, order_id, tipo)
+
+def acciones_retiro(sku, qty, now, order_id, por_shard=None, intento=0, tipo=ledger.DESPACHO):
+    """Como `restar`, en TransactItems y con los movimientos; None si no alcanza."""
+    updates = restar(sku, qty, now, order_id, por_shard, intento)
+    return None if updates is None else _con_movimiento(updates, -1, now, order_id, tipo)
+
+# ----------------------------------------------------------------------------
+# Lectura
+# ----------------------------------------------------------------------------
+
+def leer_shards(skus, consistente=True):
+    """{sku: {shard: qty}} con BatchGetItem (100 claves por llamada)."""
+    claves = [(sku, key) for sku in skus for key in shard_keys(sku)]
+    dueño = {key: sku for sku, key in claves}
+    out = {sku: {key: Decimal(0) for key in shard_keys(sku)} for sku in skus}
+    for i in range(0, len(claves), BATCH_GET_MAX):
+        request = {STOCK_TABLE: {'Keys': [{'sku': {'S': key}} for _, key in claves[i:i + BATCH_GET_MAX]],
+                                 'ProjectionExpression': 'sku, qty', 'ConsistentRead': consistente}}
+        intento = 0
+        while request:
+            resp = _ddb.batch_get_item(RequestItems=request)
+            for row in resp.get('Responses', {}).get(STOCK_TABLE, []):
+                key = row['sku']['S']
+                out[dueño[key]][key] = Decimal(row.get('qty', {}).get('N', '0'))
+            request = resp.get('UnprocessedKeys') or None
+            if request:
+                time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+                intento += 1
+    return out
+
+def disponible(skus, ttl=None):
+    """{sku: total} sumando los shards. Con `ttl` (default STOCK_AGGREGATE_TTL) > 0 usa el
+    agregado cacheado por contenedor; `invalidar` lo descarta antes de tiempo."""
+    ttl = STOCK_AGGREGATE_TTL if ttl is None else ttl
+    ahora = time.monotonic()
+    out, faltan = {}, []
+    with _lock:
+        for sku in skus:
+            hit = _agregados.get(sku) if ttl > 0 else None
+            if hit and hit[0] > ahora:
+                _agregados.move_to_end(sku)
+                out[sku] = hit[1]
+            else:
+                faltan.append(sku)
+    if faltan:
+        leidos = leer_shards(faltan, consistente=False)
+        with _lock:
+            for sku, por_shard in leidos.items():
+                out[sku] = sum(por_shard.values(), Decimal(0))
+                if ttl > 0:
+                    _agregados[sku] = (ahora + ttl, out[sku])
+                    _agregados.move_to_end(sku)
+            while len(_agregados) > STOCK_AGGREGATE_MAX:
+                _agregados.popitem(last=False)
+    return out
+
+def historico(sku, hasta=None):
+    """Stock de `sku` al instante `hasta` (ISO) según el ledger: snapshot + cola por shard."""
+    return sum((ledger.saldo(key, hasta)[0] for key in shard_keys(sku)), Decimal(0))
+
+def skus_evento(totales):
+    """SKUs tocados, para el Detail de RecepcionRecibida / DespachoConfirmado (None si son demasiados)."""
+    return sorted(totales) if len(totales) <= STOCK_EVENT_SKUS else None
+
+def invalidar(skus):
+    with _lock:
+        for sku in skus:
+            _agregados.pop(sku, None)
+
+# ----------------------------------------------------------------------------
+# Operaciones sueltas (fuera de una transacción mayor)
+# ----------------------------------------------------------------------------
+
+def _escribir(acciones):
+    if len(acciones) == 1:
+        _ddb.update_item(**acciones[0]['Update'])
+    else:
+        _ddb.transact_write_items(TransactItems=acciones)
+
+def _disponible_fallido(e):
+    """qty (ALL_OLD) del decremento que no pasó la condición; None si el error es otro."""
+    code = e.response.get('Error', {}).get('Code')
+    if code == 'ConditionalCheckFailedException':
+        item = e.response.get('Item')
+    elif code == 'TransactionCanceledException':
+        r = (e.response.get('CancellationReasons') or [{}])[0] or {}
+        if r.get('Code') != 'ConditionalCheckFailed':
+            return None
+        item = r.get('Item')
+    else:
+        return None
+    return Decimal((item or {}).get('qty', {}).get('N', '0'))
+
+def ingresar(sku, qty, now, order_id, tipo=ledger.RECEPCION):
+    _escribir(acciones_ingreso(sku, qty, now, order_id, tipo))
+    invalidar([sku])
+
+def retirar(sku, qty, now, order_id, tipo=ledger.DESPACHO):
+    """Resta `qty` de `sku`. Devuelve None si se aplicó o el disponible (Decimal) si no alcanza.
+    En SKUs con shards, si otro retiro cambió un shard entre la lectura y la escritura
+    se relee y reintenta (con backoff) hasta STOCK_MAX_RETRIES."""
+    intento = 0
+    while True:
+        por_shard = leer_shards([sku])[sku] if shards(sku) > 1 else None
+        acciones = acciones_retiro(sku, qty, now, order_id, por_shard, intento, tipo)
+        if acciones is None:
+            return sum(por_shard.values(), Decimal(0))
+        try:
+            _escribir(acciones)
+            invalidar([sku])
+            return None
+        except ClientError as e:
+            if shards(sku) == 1:
+                disponible = _disponible_fallido(e)
+                if disponible is None:
+                    raise
+                return disponible
+            code = e.response.get('Error', {}).get('Code')
+            if code not in ('TransactionCanceledException', 'TransactionConflictException') or intento >= STOCK_MAX_RETRIES:
+                raise
+            time.sleep(random.uniform(0, 0.01 * (2 ** intento)))
+            intento += 1
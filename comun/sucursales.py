@@ -0,0 +1,227 @@
+import os, json, time, random
+from decimal import Decimal
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from comun import aws, idempotencia, trazas
+
+# Stock por sucursal: un item por SKU en StockSucursal con `qty` y `demanda` como mapas
+# {sucursal: N}, así el despacho lee 1k SKUs en 10 BatchGetItem en vez de 1k Query.
+# Lo asignado lo suma Stock-SumarSucursales (consumidor de DespachoConfirmado, fuera del
+# request): un Update por SKU que reescribe el mapa `qty` condicionado a `version`
+# (optimista: si otro despacho sumó en el medio se relee) y va en la misma transacción que
+# su marca '<orderId>#SUCURSAL#<sku>' en Idempotencia, así una reentrega no suma dos veces.
+# `demanda` la carga el área comercial (SET demanda.<sucursal> o el mapa entero) y no toca `version`.
+STOCK_SUCURSAL_TABLE = os.environ.get('STOCK_SUCURSAL_TABLE', 'StockSucursal')   # PK sku
+SUCURSAL_TX_SKUS     = int(os.environ.get('SUCURSAL_TX_SKUS', '25'))    # SKUs por transacción (marca + Update)
+SUCURSAL_WORKERS     = int(os.environ.get('SUCURSAL_WORKERS', '8'))
+SUCURSAL_MARCA_DIAS  = int(os.environ.get('SUCURSAL_MARCA_DIAS', '30'))   # TTL de las marcas
+SUCURSAL_MAX_RETRIES = int(os.environ.get('SUCURSAL_MAX_RETRIES', '8'))
+BATCH_GET_MAX = 100
+RETRYABLE = ('ProvisionedThroughputExceededException', 'ThrottlingException',
+             'RequestLimitExceeded', 'TransactionConflictException',
+             'InternalServerError', 'ServiceUnavailable')
+
+# Detalle de la asignación de un despacho (SKU × sucursal) cuando no entra en el item de
+# Envios ni en el evento DespachoConfirmado (1k SKUs × 500 sucursales son ~2.5MB).
+#   AsignacionesEnvio: PK envioId, SK parte = '<version>#<n>' con hasta ASIGNACION_PARTE_CELDAS
+#   celdas cada una (`celdas`: JSON {sucursal: {sku: qty}}). `version` es el dispatchedAt del
+#   intento que las escribió: Envios y el evento llevan `asignacionRef` = {tabla, version,
+#   partes, celdas}, así un intento que no confirmó no se mezcla con el que sí.
+ASIGNACIONES_TABLE      = os.environ.get('ASIGNACIONES_TABLE', 'AsignacionesEnvio')
+ASIGNACION_PARTE_CELDAS = int(os.environ.get('ASIGNACION_PARTE_CELDAS', '2000'))
+BATCH_WRITE_MAX = 25
+
+_ddb = aws.client('dynamodb')
+
+def _backoff(intento):
+    time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+
+def _en_paralelo(fn, tareas):
+    if len(tareas) <= 1:
+        return [fn(t) for t in tareas]
+    with ThreadPoolExecutor(max_workers=min(SUCURSAL_WORKERS, len(tareas))) as pool:
+        return list(pool.map(trazas.propagar(fn), tareas))
+
+# ----------------------------------------------------------------------------
+# StockSucursal
+# ----------------------------------------------------------------------------
+
+def _leer_items(skus, consistente=False):
+    """{sku: item low-level} de StockSucursal (los que no existen no aparecen)."""
+    def leer(chunk):
+        out, intento = {}, 0
+        request = {STOCK_SUCURSAL_TABLE: {'Keys': [{'sku': {'S': s}} for s in chunk], 'ConsistentRead': consistente}}
+        while request:
+            resp = _ddb.batch_get_item(RequestItems=request)
+            for it in resp.get('Responses', {}).get(STOCK_SUCURSAL_TABLE, []):
+                out[it['sku']['S']] = it
+            request = resp.get('UnprocessedKeys') or None
+            if request:
+                _backoff(intento)
+                intento += 1
+        return out
+    out = {}
+    for parte in _en_paralelo(leer, [skus[i:i + BATCH_GET_MAX] for i in range(0, len(skus), BATCH_GET_MAX)]):
+        out.update(parte)
+    return out
+
+def _mapa(item, campo):
+    return {suc: v['N'] for suc, v in (item or {}).get(campo, {}).get('M', {}).items()}
+
+def stock_y_demanda(skus):
+    """{sku: {sucursal: (qty, demanda)}} (floats) para planificar un despacho."""
+    out = {}
+    for sku, it in _leer_items(list(skus)).items():
+        qty, dem = _mapa(it, 'qty'), _mapa(it, 'demanda')
+        out[sku] = {suc: (float(qty.get(suc, 0)), float(dem.get(suc, 0))) for suc in set(qty) | set(dem)}
+    return {sku: out.get(sku, {}) for sku in skus}
+
+def _marca(order_id, sku, expira):
+    return {'Put': {
+        'TableName': idempotencia.IDEMPOTENCY_TABLE,
+        'Item': {'idemKey': {'S': f"{order_id}#SUCURSAL#{sku}"}, 'status': {'S': 'COMPLETED'},
+                 'expiresAt': {'N': str(expira)}},
+        'ConditionExpression': 'attribute_not_exists(idemKey)'
+    }}
+
+def _update(sku, item, suma, now, order_id):
+    qty = {suc: Decimal(n) for suc, n in _mapa(item, 'qty').items()}
+    for suc, q in suma.items():
+        qty[suc] = qty.get(suc, Decimal(0)) + q
+    version = (item or {}).get('version', {}).get('N')
+    values = {':q': {'M': {suc: {'N': str(n)} for suc, n in qty.items()}}, ':ts': {'S': now},
+              ':oid': {'S': order_id}, ':v2': {'N': str(int(version or 0) + 1)}}
+    if version is None:
+        cond = 'attribute_not_exists(#ver)'   # SKU nuevo o cargado sólo con demanda
+    else:
+        cond = '#ver = :v'
+        values[':v'] = {'N': version}
+    return {'Update': {
+        'TableName': STOCK_SUCURSAL_TABLE,
+        'Key': {'sku': {'S': sku}},
+        'UpdateExpression': 'SET qty = :q, #ver = :v2, updatedAt = :ts, lastOrderId = :oid',
+        'ConditionExpression': cond,
+        'ExpressionAttributeNames': {'#ver': 'version'},
+        'ExpressionAttributeValues': values
+    }}
+
+def _sumar_lote(order_id, lote, now, expira):
+    """Una transacción (marca + Update por SKU) con relectura y reintentos. Devuelve los SKUs sin aplicar."""
+    pendientes, intento = sorted(lote), 0
+    while pendientes:
+        items = _leer_items(pendientes, consistente=True)
+        acciones = []
+        for sku in pendientes:
+            acciones += [_marca(order_id, sku, expira), _update(sku, items.get(sku), lote[sku], now, order_id)]
+        try:
+            _ddb.transact_write_items(TransactItems=acciones)
+            return []
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code == 'TransactionCanceledException':
+                reasons = e.response.get('CancellationReasons') or []
+                aplicados = {pendientes[i // 2] for i, r in enumerate(reasons)
+                             if i % 2 == 0 and (r or {}).get('Code') == 'ConditionalCheckFailed'}
+                if aplicados:   # marca existente: ese SKU ya se sumó en una entrega anterior
+                    pendientes = [s for s in pendientes if s not in aplicados]
+                    continue
+                # otro despacho cambió `version` (o conflicto): se relee y se reintenta
+            elif code not in RETRYABLE:
+                print("[SUCURSAL] error no reintentable", order_id, code)
+                return pendientes
+            if intento >= SUCURSAL_MAX_RETRIES:
+                return pendientes
+            _backoff(intento)
+            intento += 1
+    return []
+
+def sumar(order_id, reparto, now):
+    """Suma en StockSucursal la asignación {sucursal: {sku: qty}} de un despacho confirmado,
+    idempotente por orden y SKU. Devuelve los SKUs que no se pudieron aplicar."""
+    por_sku = {}
+    for suc, qtys in reparto.items():
+        for sku, q in qtys.items():
+            if Decimal(str(q)):
+                por_sku.setdefault(sku, {})[suc] = Decimal(str(q))
+    skus = sorted(por_sku)
+    expira = int(time.time()) + SUCURSAL_MARCA_DIAS * 86400
+    lotes = [{s: por_sku[s] for s in skus[i:i + SUCURSAL_TX_SKUS]}
+             for i in range(0, len(skus), max(1, SUCURSAL_TX_SKUS))]
+    return [s for r in _en_paralelo(lambda l: _sumar_lote(order_id, l, now, expira), lotes) for s in r]
+
+# ----------------------------------------------------------------------------
+# AsignacionesEnvio
+# ----------------------------------------------------------------------------
+
+def _batch_write(requests):
+    for i in range(0, len(requests), BATCH_WRITE_MAX):
+        pendientes, intento = {ASIGNACIONES_TABLE: requests[i:i + BATCH_WRITE_MAX]}, 0
+        while pendientes:
+            resp = _ddb.batch_write_item(RequestItems=pendientes)
+            pendientes = resp.get('UnprocessedItems') or None
+            if pendientes:
+                time.sleep(random.uniform(0, 0.05 * (2 ** intento)))
+                intento += 1
+
+def _partes(reparto):
+    """{sucursal: {sku: qty}} en trozos de hasta ASIGNACION_PARTE_CELDAS celdas (orden fijo)."""
+    parte, n = {}, 0
+    for suc in sorted(reparto):
+        for sku in sorted(reparto[suc]):
+            if n == ASIGNACION_PARTE_CELDAS:
+                yield parte
+                parte, n = {}, 0
+            parte.setdefault(suc, {})[sku] = reparto[suc][sku]
+            n += 1
+    if parte:
+        yield parte
+
+def _clave(envio_id, version, n):
+    return {'envioId': {'S': envio_id}, 'parte': {'S': f"{version}#{n:05d}"}}
+
+def guardar_asignacion(envio_id, version, reparto):
+    """Escribe el detalle en AsignacionesEnvio y devuelve la referencia para Envios / el evento."""
+    puts, celdas = [], 0
+    for n, parte in enumerate(_partes(reparto)):
+        texto = json.dumps(parte, default=str, separators=(',', ':'))
+        celdas += sum(len(v) for v in parte.values())
+        puts.append({'PutRequest': {'Item': dict(_clave(envio_id, version, n), celdas={'S': texto})}})
+    _batch_write(puts)
+    return {'tabla': ASIGNACIONES_TABLE, 'version': version, 'partes': len(puts), 'celdas': celdas}
+
+def descartar_asignacion(envio_id, ref):
+    """Borra las partes de un intento que no confirmó el despacho (best effort)."""
+    try:
+        _batch_write([{'DeleteRequest': {'Key': _clave(envio_id, ref['version'], n)}}
+                      for n in range(int(ref['partes']))])
+    except Exception as e:
+        print("[ASIGNACION] no se pudieron borrar las partes de", envio_id, ref.get('version'), repr(e))
+
+def leer_asignacion(envio_id, ref):
+    """{sucursal: {sku: qty}} desde AsignacionesEnvio (Decimal). Falla si falta alguna parte."""
+    reparto, partes, kwargs = {}, 0, {}
+    while True:
+        resp = _ddb.query(TableName=ref.get('tabla') or ASIGNACIONES_TABLE,
+                          KeyConditionExpression='envioId = :e AND begins_with(parte, :v)',
+                          ExpressionAttributeValues={':e': {'S': envio_id}, ':v': {'S': f"{ref['version']}#"}},
+                          ConsistentRead=True, **kwargs)
+        for it in resp.get('Items', []):
+            for suc, qtys in json.loads(it['celdas']['S'], parse_float=Decimal, parse_int=Decimal).items():
+                reparto.setdefault(suc, {}).update(qtys)
+            partes += 1
+        if not resp.get('LastEvaluatedKey'):
+            break
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+    if partes != int(ref['partes']):
+        raise RuntimeError(f"Asignación de {envio_id} incompleta: {partes} de {ref['partes']} partes")
+    return reparto
+
+def ref_de_item(av):
+    """asignacionRef de Envios (map low-level) → dict del evento."""
+    m = av['M']
+    return {'tabla': m['tabla']['S'], 'version': m['version']['S'],
+            'partes': int(m['partes']['N']), 'celdas': int(m['celdas']['N'])}
+
+def ref_item(ref):
+    return {'M': {'tabla': {'S': ref['tabla']}, 'version': {'S': ref['version']},
+                  'partes': {'N': str(ref['partes'])}, 'celdas': {'N': str(ref['celdas'])}}}
@@ -0,0 +1,143 @@
+import os, sys, json, time, uuid, threading, functools
+from comun.util import detail, get_order_id, handler_name
+
+# Trazas del flujo de OC: un traceId nace en Compras-CrearOrden-CasaCentral, viaja
+# en el Detail de cada evento (eventos.put_events) y en el item de la orden, y cada
+# handler loguea spans en formato CloudWatch EMF (una línea JSON por span):
+#   - Operation='handler'        duración total de la invocación
+#   - Operation='dynamodb.GetItem', 'events.PutEvents', 'sns.Publish', ...
+# `python -m local.timeline <logs>` reconstruye la línea de tiempo por orden.
+TRACE_SPANS       = os.environ.get('TRACE_SPANS', '1') not in ('0', 'false', 'no')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'OrdenesCompra')
+
+_ctx = threading.local()   # stage / traceId / orderId de la invocación en curso
+
+def nuevo_trace_id():
+    return uuid.uuid4().hex
+
+def trace_id():
+    return getattr(_ctx, 'trace', None)
+
+def adoptar(trace=None, order_id=None):
+    """Completa el contexto cuando el traceId / orderId se conoce recién al leer la orden."""
+    if trace and not getattr(_ctx, 'trace', None):
+        _ctx.trace = trace
+    if order_id and not getattr(_ctx, 'order', None):
+        _ctx.order = order_id
+
+def _actual():
+    return getattr(_ctx, 'stage', None), getattr(_ctx, 'trace', None), getattr(_ctx, 'order', None)
+
+def _fijar(stage, trace, order):
+    _ctx.stage, _ctx.trace, _ctx.order = stage, trace, order
+
+def propagar(fn):
+    """Envuelve `fn` para que corra con el contexto de traza del hilo que la crea (ThreadPoolExecutor)."""
+    ctx = _actual()
+    @functools.wraps(fn)
+    def inner(*a, **kw):
+        previo = _actual()
+        _fijar(*ctx)
+        try:
+            return fn(*a, **kw)
+        finally:
+            _fijar(*previo)
+    return inner
+
+# ----------------------------------------------------------------------------
+# Salida EMF
+# ----------------------------------------------------------------------------
+
+# Metadatos EMF fijos: se serializan una vez (un span por llamada AWS no puede ser caro)
+_EMF = '{"_aws":{"Timestamp":%d,"CloudWatchMetrics":' + json.dumps([{
+    'Namespace': METRICS_NAMESPACE,
+    'Dimensions': [['Stage', 'Operation']],
+    'Metrics': [{'Name': 'DurationMs', 'Unit': 'Milliseconds'}],
+}], separators=(',', ':')) + '},'
+
+def _emit(record):
+    # una sola write por línea: los spans de hilos distintos no se mezclan
+    sys.stdout.write(json.dumps(record, default=str, separators=(',', ':')) + '\n')
+
+def span(operation, start, duration_s, **campos):
+    if not TRACE_SPANS:
+        return
+    stage, trace, order = _actual()
+    record = {
+        'Stage': stage or 'unknown',
+        'Operation': operation,
+        'DurationMs': round(duration_s * 1000, 3),
+        'startMs': round(start * 1000, 3),
+        'traceId': trace,
+        'orderId': order,
+    }
+    for k, v in campos.items():
+        if v is not None:
+            record[k] = v
+    sys.stdout.write(_EMF % (start * 1000) + json.dumps(record, default=str, separators=(',', ':'))[1:] + '\n')
+
+def log(mensaje, **campos):
+    """Log estructurado con la traza actual (reemplaza los print del evento crudo)."""
+    stage, trace, order = _actual()
+    _emit(dict({'msg': mensaje, 'Stage': stage, 'traceId': trace, 'orderId': order}, **campos))
+
+def medido(servicio, metodo, fn):
+    """`fn` (método de un cliente boto3) con span 'servicio.Operacion'."""
+    operation = servicio + '.' + ''.join(p.title() for p in metodo.split('_'))
+    def llamar(*a, **kw):
+        start, t0 = time.time(), time.perf_counter()
+        error = None
+        try:
+            return fn(*a, **kw)
+        except Exception as e:
+            error = (getattr(e, 'response', None) or {}).get('Error', {}).get('Code') or type(e).__name__
+            raise
+        finally:
+            span(operation, start, time.perf_counter() - t0, error=error)
+    return llamar
+
+# ----------------------------------------------------------------------------
+# Decorador de handlers
+# ----------------------------------------------------------------------------
+
+def _de_evento(event):
+    """(traceId, orderId) de un evento de EventBridge o de un request HTTP."""
+    if not isinstance(event, dict):
+        return None, None
+    det = detail(event) if 'detail' in event else {}
+    det = det if isinstance(det, dict) else {}
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    qp = event.get('queryStringParameters') or {}
+    trace = det.get('traceId') or headers.get('x-trace-id') or qp.get('traceId')
+    try:
+        order = det.get('orderId') or get_order_id(event)
+    except Exception:
+        order = None
+    return trace, order if isinstance(order, str) else None
+
+def instrumentar(handler_file, origen=False):
+    """Decorador (el más externo) de `lambda_handler`: fija el contexto de traza y
+    loguea el span 'handler'. `origen=True` genera el traceId si el request no trae uno."""
+    stage = handler_name(handler_file)
+    def wrap(handler):
+        @functools.wraps(handler)
+        def inner(event, context):
+            trace, order = _de_evento(event)
+            if origen and not trace:
+                trace = nuevo_trace_id()
+            previo = _actual()   # modo fusionado: un handler corre dentro de otro
+            _fijar(stage, trace, order)
+            start, t0 = time.time(), time.perf_counter()
+            res, error = None, None
+            try:
+                res = handler(event, context)
+                return res
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                status = res.get('statusCode') if isinstance(res, dict) else None
+                span('handler', start, time.perf_counter() - t0, statusCode=status, error=error)
+                _fijar(*previo)
+        return inner
+    return wrap
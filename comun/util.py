@@ -0,0 +1,37 @@
+import os, json
+from decimal import Decimal
+
+# Helpers que antes estaban copiados en cada handler
+
+def detail(evt):
+    """`detail` de un evento de EventBridge (dict), o el evento mismo si se invoca a mano."""
+    d = evt.get('detail', evt)
+    if isinstance(d, str):
+        try: d = json.loads(d)
+        except Exception: d = {}
+    return d
+
+def get_order_id(evt):
+    """orderId de un evento HTTP API v2: path, query string, body JSON o raíz del evento."""
+    pp = (evt.get('pathParameters') or {})
+    qp = (evt.get('queryStringParameters') or {})
+    if pp.get('orderId'): return pp['orderId']
+    if qp.get('orderId'): return qp['orderId']
+    body = evt.get('body')
+    if isinstance(body, str):
+        try: body = json.loads(body)
+        except Exception: body = {}
+    if isinstance(body, dict) and body.get('orderId'):
+        return body['orderId']
+    return evt.get('orderId')
+
+def to_decimal(n):
+    try: return Decimal(str(n))
+    except Exception: return Decimal(0)
+
+def handler_name(path):
+    """'.../1 CasaCentral-ProcesarOrden-Deposito.py' → 'CasaCentral-ProcesarOrden-Deposito'."""
+    return os.path.basename(path)[:-3].split(' ', 1)[-1]
+
+def html(body, code=200):
+    return {'statusCode': code, 'headers': {'Content-Type': 'text/html; charset=UTF-8'}, 'body': body}
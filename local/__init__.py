@@ -0,0 +1 @@
+# Herramientas locales: flujo offline (fakes de AWS + harness) e importación de archivos
@@ -0,0 +1,1059 @@
+"""Fakes en proceso de DynamoDB / EventBridge / SNS para correr las Lambdas offline.
+
+`install()` registra módulos `boto3` / `botocore` falsos en `sys.modules`, de modo
+que los handlers se importan sin cambios y sus clientes apuntan a un `FakeAWS`
+compartido que cuenta llamadas por API y puede simular latencia.
+"""
+import re, sys, time, uuid, zlib, types, threading, copy
+from decimal import Decimal
+from collections import Counter, defaultdict
+
+
+class ClientError(Exception):
+    def __init__(self, error_response, operation_name):
+        self.response = error_response
+        self.operation_name = operation_name
+        err = error_response.get('Error', {})
+        super().__init__(f"An error occurred ({err.get('Code')}) when calling the "
+                         f"{operation_name} operation: {err.get('Message', '')}")
+
+
+def _error(op, code, message='', **extra):
+    return ClientError(dict({'Error': {'Code': code, 'Message': message}}, **extra), op)
+
+
+# ---------------------------------------------------------------------------
+# Tipos: low-level ({'S': ...}) <-> Python (str, Decimal, bytes, set, list, dict)
+# ---------------------------------------------------------------------------
+
+def _num(v):
+    if isinstance(v, bool):
+        raise TypeError('bool no es N')
+    if isinstance(v, float):
+        raise TypeError('Float types are not supported. Use Decimal types instead.')
+    return Decimal(str(v))
+
+def serialize(v):
+    if v is None:
+        return {'NULL': True}
+    if isinstance(v, bool):
+        return {'BOOL': v}
+    if isinstance(v, str):
+        return {'S': v}
+    if isinstance(v, (int, float, Decimal)):
+        return {'N': str(_num(v))}
+    if isinstance(v, (bytes, bytearray)):
+        return {'B': bytes(v)}
+    if isinstance(v, (set, frozenset)):
+        sample = next(iter(v))
+        if isinstance(sample, str):
+            return {'SS': sorted(v)}
+        if isinstance(sample, (bytes, bytearray)):
+            return {'BS': [bytes(x) for x in v]}
+        return {'NS': [str(_num(x)) for x in v]}
+    if isinstance(v, (list, tuple)):
+        return {'L': [serialize(x) for x in v]}
+    if isinstance(v, dict):
+        return {'M': {k: serialize(x) for k, x in v.items()}}
+    raise TypeError(f'tipo no soportado: {type(v)!r}')
+
+def deserialize(av):
+    (t, v), = av.items()
+    if t == 'S':
+        return v
+    if t == 'N':
+        return Decimal(v)
+    if t == 'B':
+        return bytes(v)
+    if t == 'BOOL':
+        return bool(v)
+    if t == 'NULL':
+        return None
+    if t == 'SS':
+        return set(v)
+    if t == 'NS':
+        return {Decimal(x) for x in v}
+    if t == 'BS':
+        return {bytes(x) for x in v}
+    if t == 'L':
+        return [deserialize(x) for x in v]
+    if t == 'M':
+        return {k: deserialize(x) for k, x in v.items()}
+    raise TypeError(f'tipo DynamoDB desconocido: {t}')
+
+def _py(v):
+    """Valores del resource API (int/float → Decimal)."""
+    if isinstance(v, bool) or v is None:
+        return v
+    if isinstance(v, (int, float)):
+        return _num(v)
+    if isinstance(v, (list, tuple)):
+        return [_py(x) for x in v]
+    if isinstance(v, dict):
+        return {k: _py(x) for k, x in v.items()}
+    if isinstance(v, (set, frozenset)):
+        return {_py(x) for x in v}
+    return getattr(v, 'value', v) if not isinstance(v, (str, bytes, Decimal)) else v
+
+
+# ---------------------------------------------------------------------------
+# Expresiones (ConditionExpression / UpdateExpression / KeyConditionExpression)
+# ---------------------------------------------------------------------------
+
+_TOKEN = re.compile(r"\s*(?:(<>|<=|>=|=|<|>|\(|\)|,|\+|-)|(#[A-Za-z0-9_]+)|(:[A-Za-z0-9_]+)|([A-Za-z_][A-Za-z0-9_.]*))")
+_MISSING = object()
+
+def _tokens(expr):
+    out, pos = [], 0
+    expr = expr.strip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if not m or m.end() == pos:
+            raise ValueError(f'expresión inválida cerca de: {expr[pos:]!r}')
+        out.append(m.group(0).strip())
+        pos = m.end()
+    return out
+
+
+class _Expr:
+    def __init__(self, expr, names, values):
+        self.toks = _tokens(expr or '')
+        self.i = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def peek(self, k=0):
+        j = self.i + k
+        return self.toks[j] if j < len(self.toks) else None
+
+    def take(self, expected=None):
+        t = self.peek()
+        if expected is not None and (t is None or t.upper() != expected.upper()):
+            raise ValueError(f'se esperaba {expected!r} y vino {t!r}')
+        self.i += 1
+        return t
+
+    def kw(self, word):
+        t = self.peek()
+        return t is not None and t.upper() == word
+
+    def done(self):
+        return self.i >= len(self.toks)
+
+    # -- operandos ----------------------------------------------------------
+    def path(self):
+        t = self.take()
+        return self.names.get(t, t) if t.startswith('#') else t
+
+    def operand(self):
+        t = self.peek()
+        if t.startswith(':'):
+            self.take()
+            if t not in self.values:
+                raise ValueError(f'valor {t} no definido')
+            v = self.values[t]
+            return lambda item: v
+        if t.lower() == 'size' and self.peek(1) == '(':
+            self.take(); self.take('(')
+            p = self.path()
+            self.take(')')
+            return lambda item: (Decimal(len(item[p])) if p in item else _MISSING)
+        if t.lower() in ('if_not_exists', 'list_append') and self.peek(1) == '(':
+            fn = self.take().lower(); self.take('(')
+            a = self.operand() if fn == 'list_append' else self._path_operand()
+            self.take(',')
+            b = self.operand()
+            self.take(')')
+            if fn == 'if_not_exists':
+                return lambda item: (lambda x: b(item) if x is _MISSING else x)(a(item))
+            return lambda item: list(a(item)) + list(b(item))
+        return self._path_operand()
+
+    def _path_operand(self):
+        p = self.path()
+        return lambda item: item.get(p, _MISSING)
+
+    # -- condiciones --------------------------------------------------------
+    def condition(self):
+        left = self._and()
+        while self.kw('OR'):
+            self.take()
+            right = self._and()
+            left = (lambda l, r: lambda item: l(item) or r(item))(left, right)
+        return left
+
+    def _and(self):
+        left = self._not()
+        while self.kw('AND'):
+            self.take()
+            right = self._not()
+            left = (lambda l, r: lambda item: l(item) and r(item))(left, right)
+        return left
+
+    def _not(self):
+        if self.kw('NOT'):
+            self.take()
+            inner = self._not()
+            return lambda item: not inner(item)
+        return self._primary()
+
+    def _primary(self):
+        t = self.peek()
+        if t == '(':
+            self.take()
+            c = self.condition()
+            self.take(')')
+            return c
+        fn = t.lower()
+        if fn in ('attribute_exists', 'attribute_not_exists', 'contains', 'begins_with', 'attribute_type') and self.peek(1) == '(':
+            self.take(); self.take('(')
+            a = self.operand()
+            b = None
+            if self.peek() == ',':
+                self.take()
+                b = self.operand()
+            self.take(')')
+            if fn == 'attribute_exists':
+                return lambda item: a(item) is not _MISSING
+            if fn == 'attribute_not_exists':
+                return lambda item: a(item) is _MISSING
+            if fn == 'contains':
+                def contains(item):
+                    x, y = a(item), b(item)
+                    if x is _MISSING:
+                        return False
+                    if isinstance(x, str):
+                        return isinstance(y, str) and y in x
+                    return y in x
+                return contains
+            if fn == 'begins_with':
+                return lambda item: isinstance(a(item), str) and a(item).startswith(b(item))
+            return lambda item: False
+        left = self.operand()
+        if self.kw('BETWEEN'):
+            self.take()
+            lo = self.operand(); self.take('AND'); hi = self.operand()
+            return lambda item: _cmp(left(item), '>=', lo(item)) and _cmp(left(item), '<=', hi(item))
+        if self.kw('IN'):
+            self.take(); self.take('(')
+            opts = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                opts.append(self.operand())
+            self.take(')')
+            return lambda item: any(_cmp(left(item), '=', o(item)) for o in opts)
+        op = self.take()
+        right = self.operand()
+        return lambda item: _cmp(left(item), op, right(item))
+
+
+def _cmp(a, op, b):
+    if a is _MISSING or b is _MISSING:
+        return op == '<>' and not (a is _MISSING and b is _MISSING)
+    if op == '=':
+        return a == b
+    if op == '<>':
+        return a != b
+    if type(a) is not type(b) and not (isinstance(a, Decimal) and isinstance(b, Decimal)):
+        return False
+    try:
+        return {'<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b}[op]
+    except TypeError:
+        return False
+
+
+def compile_condition(expr, names=None, values=None):
+    if not expr:
+        return lambda item: True
+    p = _Expr(expr, names, values)
+    c = p.condition()
+    if not p.done():
+        raise ValueError(f'sobra en la expresión: {p.toks[p.i:]}')
+    return c
+
+
+def apply_update(item, expr, names=None, values=None):
+    """Aplica un UpdateExpression sobre `item` (dict Python) in place."""
+    p = _Expr(expr, names, values)
+    acciones = []
+    while not p.done():
+        clause = p.take().upper()
+        while True:
+            if clause == 'SET':
+                path = p.path(); p.take('=')
+                val = p.operand()
+                if p.peek() in ('+', '-'):
+                    sign = p.take()
+                    rhs = p.operand()
+                    val = (lambda l, r, s: lambda it: l(it) + r(it) if s == '+' else l(it) - r(it))(val, rhs, sign)
+                acciones.append(('SET', path, val))
+            elif clause in ('ADD', 'DELETE'):
+                path = p.path()
+                acciones.append((clause, path, p.operand()))
+            elif clause == 'REMOVE':
+                acciones.append(('REMOVE', p.path(), None))
+            else:
+                raise ValueError(f'cláusula desconocida {clause}')
+            if p.peek() == ',':
+                p.take()
+                continue
+            break
+    # DynamoDB evalúa todos los operandos contra el item original
+    original = dict(item)
+    for kind, path, val in acciones:
+        v = val(original) if val else None
+        if kind == 'SET':
+            if v is _MISSING:
+                raise ValueError(f'operando inexistente para {path}')
+            item[path] = v
+        elif kind == 'REMOVE':
+            item.pop(path, None)
+        elif kind == 'ADD':
+            cur = item.get(path)
+            if isinstance(v, set):
+                item[path] = (cur or set()) | v
+            else:
+                item[path] = (cur if cur is not None else Decimal(0)) + v
+        elif kind == 'DELETE':
+            cur = item.get(path)
+            if cur is not None:
+                rest = cur - v
+                if rest:
+                    item[path] = rest
+                else:
+                    item.pop(path)
+    return item
+
+
+# ---------------------------------------------------------------------------
+# Capacidad consumida (estimación con las reglas de tamaño de DynamoDB)
+# ---------------------------------------------------------------------------
+
+def _value_size(v):
+    if v is None or isinstance(v, bool):
+        return 1
+    if isinstance(v, str):
+        return len(v.encode())
+    if isinstance(v, (bytes, bytearray)):
+        return len(v)
+    if isinstance(v, (int, float, Decimal)):
+        digitos = len(str(_num(v)).lstrip('-').replace('.', '').lstrip('0')) or 1
+        return (digitos + 1) // 2 + 1
+    if isinstance(v, (set, frozenset)):
+        return sum(_value_size(x) for x in v)
+    if isinstance(v, (list, tuple)):
+        return 3 + sum(_value_size(x) + 1 for x in v)
+    if isinstance(v, dict):
+        return 3 + sum(len(k.encode()) + _value_size(x) + 1 for k, x in v.items())
+    return len(str(v))
+
+def item_size(item):
+    """Bytes de un item (tipos Python): nombre + valor de cada atributo."""
+    return sum(len(k.encode()) + _value_size(v) for k, v in (item or {}).items())
+
+def rcu(size, consistent=False, transact=False):
+    """Unidades de lectura: 4 KB; eventual = la mitad, transaccional = el doble."""
+    n = max(1, -(-size // 4096))
+    return n * 2 if transact else (n if consistent else n / 2)
+
+def wcu(size, transact=False):
+    """Unidades de escritura: 1 KB; transaccional = el doble."""
+    n = max(1, -(-size // 1024))
+    return n * 2 if transact else n
+
+
+# ---------------------------------------------------------------------------
+# FakeAWS: estado compartido, contadores y modelo de latencia
+# ---------------------------------------------------------------------------
+
+class FakeAWS:
+    """Estado en memoria de las tres APIs + métricas.
+
+    `schemas`: tabla -> (hashKey, rangeKey|None). `latency`: 'dynamodb.GetItem' -> segundos
+    (o 'dynamodb.*' como default por servicio) que se duermen en cada llamada.
+    `capacity`: tabla -> {'RCU', 'WCU'} estimadas por tamaño de item (sólo el client low-level).
+    """
+    DEFAULT_SCHEMAS = {
+        'OrdenesCompra': ('orderId', None),
+        'StockGlobal':   ('sku', None),
+        'Envios':        ('envioId', None),
+        'StockSucursal': ('sku', None),
+        'AsignacionesEnvio': ('envioId', 'parte'),
+        'MovimientosStock': ('sku', 'mov'),
+        'SnapshotsStock':   ('sku', 'hasta'),
+        'StockDisponible':  ('sku', None),
+        'NotificacionesPendientes': ('destino', 'entrada'),
+        'HistorialOrdenes': ('orderId', 'evento'),
+        'VigilanciaSLA': ('ventana', None),
+        'Exportaciones': ('clave', None),
+        'Idempotencia':  ('idemKey', None),
+    }
+
+    DEFAULT_INDEXES = {
+        'OrdenesCompra': {'status-updatedAt-index': ('status', 'updatedAt')},
+        'StockDisponible': {'vista-sku-index': ('vista', 'sku'), 'bajo-sku-index': ('bajo', 'sku')},
+    }
+
+    def __init__(self, schemas=None, latency=None, indexes=None):
+        self.schemas = dict(self.DEFAULT_SCHEMAS, **(schemas or {}))
+        self.indexes = {t: dict(ix) for t, ix in self.DEFAULT_INDEXES.items()}
+        for t, ix in (indexes or {}).items():
+            self.indexes.setdefault(t, {}).update(ix)
+        self.tables = {name: {} for name in self.schemas}
+        self.latency = dict(latency or {})
+        self.calls = Counter()
+        self.capacity = defaultdict(Counter)
+        self.lock = threading.RLock()
+        self.event_listeners = []
+        self.sns_messages = Counter()   # topicArn -> cantidad
+        self.queues = defaultdict(list)  # QueueUrl -> [mensaje]; una cola se crea al primer envío
+        self.dead_letters = defaultdict(list)
+
+    # -- métricas ---------------------------------------------------------
+    def record(self, api, n=1):
+        with self.lock:
+            self.calls[api] += n
+        delay = self.latency.get(api, self.latency.get(api.split('.')[0] + '.*', 0))
+        if delay:
+            time.sleep(delay)
+
+    def consume(self, table, rcu=0, wcu=0):
+        with self.lock:
+            if rcu:
+                self.capacity[table]['RCU'] += rcu
+            if wcu:
+                self.capacity[table]['WCU'] += wcu
+
+    # -- tablas -----------------------------------------------------------
+    def table(self, name, op):
+        if name not in self.tables:
+            raise _error(op, 'ResourceNotFoundException', f'Requested resource not found: {name}')
+        return self.tables[name]
+
+    def key_of(self, name, key_or_item, op):
+        h, r = self.schemas[name]
+        try:
+            return (key_or_item[h], key_or_item[r]) if r else (key_or_item[h],)
+        except KeyError:
+            raise _error(op, 'ValidationException', 'The provided key element does not match the schema')
+
+
+# ---------------------------------------------------------------------------
+# DynamoDB: núcleo en tipos Python, usado por el client y por el resource
+# ---------------------------------------------------------------------------
+
+class _DynamoCore:
+    def __init__(self, aws):
+        self.aws = aws
+
+    def _cond_fail(self, op, cur, rv):
+        extra = {'Item': {k: serialize(v) for k, v in cur.items()}} if (rv == 'ALL_OLD' and cur) else {}
+        return _error(op, 'ConditionalCheckFailedException', 'The conditional request failed', **extra)
+
+    def get(self, table, key, op='GetItem'):
+        t = self.aws.table(table, op)
+        cur = t.get(self.aws.key_of(table, key, op))
+        return copy.deepcopy(cur) if cur is not None else None
+
+    def put(self, table, item, cond=None, names=None, values=None, rv_fail=None, op='PutItem'):
+        t = self.aws.table(table, op)
+        k = self.aws.key_of(table, item, op)
+        cur = t.get(k)
+        if not compile_condition(cond, names, values)(cur or {}):
+            raise self._cond_fail(op, cur, rv_fail)
+        t[k] = copy.deepcopy(item)
+        return cur
+
+    def update(self, table, key, expr, cond=None, names=None, values=None, rv_fail=None, op='UpdateItem'):
+        t = self.aws.table(table, op)
+        k = self.aws.key_of(table, key, op)
+        cur = t.get(k)
+        if not compile_condition(cond, names, values)(cur or {}):
+            raise self._cond_fail(op, cur, rv_fail)
+        new = copy.deepcopy(cur) if cur is not None else dict(key)
+        apply_update(new, expr, names, values)
+        t[k] = new
+        return cur, copy.deepcopy(new)
+
+    def delete(self, table, key, cond=None, names=None, values=None, rv_fail=None, op='DeleteItem'):
+        t = self.aws.table(table, op)
+        k = self.aws.key_of(table, key, op)
+        cur = t.get(k)
+        if not compile_condition(cond, names, values)(cur or {}):
+            raise self._cond_fail(op, cur, rv_fail)
+        t.pop(k, None)
+        return cur
+
+    def check(self, table, key, cond, names=None, values=None, rv_fail=None, op='ConditionCheck'):
+        cur = self.aws.table(table, op).get(self.aws.key_of(table, key, op))
+        if not compile_condition(cond, names, values)(cur or {}):
+            raise self._cond_fail(op, cur, rv_fail)
+
+    def query(self, table, index, key_cond, names=None, values=None, limit=None, start=None,
+              forward=True, filter_expr=None, op='Query'):
+        t = self.aws.table(table, op)
+        if index:
+            if index not in self.aws.indexes.get(table, {}):
+                raise _error(op, 'ValidationException', f'The table does not have the specified index: {index}')
+            hk, rk = self.aws.indexes[table][index]
+        else:
+            hk, rk = self.aws.schemas[table]
+        base_h, base_r = self.aws.schemas[table]
+        match = compile_condition(key_cond, names, values)
+
+        def orden(it):
+            return (it.get(rk) if rk else '', self.aws.key_of(table, it, op))
+
+        # índice "sparse": sólo items que tienen las claves del índice
+        rows = sorted((it for it in t.values() if hk in it and (not rk or rk in it) and match(it)),
+                      key=orden, reverse=not forward)
+        if start:
+            pos = orden(start)
+            rows = [it for it in rows if (orden(it) > pos if forward else orden(it) < pos)]
+        page = rows[:limit] if limit else rows
+        lek = None
+        if limit and len(rows) > limit:
+            last = page[-1]
+            lek = {k: last[k] for k in {hk, rk, base_h, base_r} if k}
+        filt = compile_condition(filter_expr, names, values)
+        return [copy.deepcopy(it) for it in page if filt(it)], len(page), lek, sum(map(item_size, page))
+
+    def scan(self, table, limit=None, start=None, segment=None, total_segments=None, filter_expr=None,
+             names=None, values=None, op='Scan'):
+        t = self.aws.table(table, op)
+        keys = sorted(t)
+        if total_segments:
+            keys = [k for k in keys if zlib.crc32(repr(k).encode()) % total_segments == segment]
+        if start:
+            pos = self.aws.key_of(table, start, op)
+            keys = [k for k in keys if k > pos]
+        page = keys[:limit] if limit else keys
+        lek = None
+        if limit and len(keys) > limit:
+            h, r = self.aws.schemas[table]
+            lek = {k: t[page[-1]][k] for k in (h, r) if k}
+        filt = compile_condition(filter_expr, names, values)
+        rows = [t[k] for k in page]
+        return [copy.deepcopy(it) for it in rows if filt(it)], len(rows), lek, sum(map(item_size, rows))
+
+    def transact(self, actions, op='TransactWriteItems'):
+        """actions: lista de (kind, table, payload) en tipos Python; todo o nada."""
+        if len(actions) > 100:
+            raise _error(op, 'ValidationException', 'Member must have length less than or equal to 100')
+        claves = [(tbl, self.aws.key_of(tbl, p.get('Key') or p.get('Item'), op)) for _, tbl, p in actions]
+        if len(set(claves)) != len(claves):
+            raise _error(op, 'ValidationException', 'Transaction request cannot include multiple operations on one item')
+        previos = [(tbl, k, self.aws.table(tbl, op).get(k)) for tbl, k in claves]
+        reasons, fallo = [], False
+        for kind, tbl, p in actions:
+            try:
+                rv = p.get('ReturnValuesOnConditionCheckFailure')
+                args = (p.get('ConditionExpression'), p.get('ExpressionAttributeNames'), p.get('ExpressionAttributeValues'), rv)
+                if kind == 'Put':
+                    self.put(tbl, p['Item'], *args, op=op)
+                elif kind == 'Update':
+                    self.update(tbl, p['Key'], p['UpdateExpression'], *args, op=op)
+                elif kind == 'Delete':
+                    self.delete(tbl, p['Key'], *args, op=op)
+                elif kind == 'ConditionCheck':
+                    self.check(tbl, p['Key'], *args, op=op)
+                reasons.append({'Code': 'None'})
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                r = {'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'}
+                if 'Item' in e.response:
+                    r['Item'] = e.response['Item']
+                reasons.append(r)
+                fallo = True
+        if fallo:
+            for tbl, k, prev in previos:
+                if prev is None:
+                    self.aws.tables[tbl].pop(k, None)
+                else:
+                    self.aws.tables[tbl][k] = prev
+            raise _error(op, 'TransactionCanceledException',
+                         'Transaction cancelled, please refer cancellation reasons for specific reasons',
+                         CancellationReasons=reasons)
+
+
+def _values_py(values):
+    return {k: deserialize(v) for k, v in (values or {}).items()}
+
+def _item_py(item):
+    return {k: deserialize(v) for k, v in (item or {}).items()}
+
+def _item_ll(item):
+    return {k: serialize(v) for k, v in (item or {}).items()}
+
+
+def _project(item, projection, names):
+    if not projection:
+        return item
+    campos = [names.get(f.strip(), f.strip()) if f.strip().startswith('#') else f.strip()
+              for f in projection.split(',')]
+    return {k: item[k] for k in campos if k in item}
+
+
+def _consumed(out, kw, table, unidades):
+    """ReturnConsumedCapacity='TOTAL'|'INDEXES': agrega ConsumedCapacity como DynamoDB."""
+    if kw.get('ReturnConsumedCapacity') in ('TOTAL', 'INDEXES'):
+        out['ConsumedCapacity'] = {'TableName': table, 'CapacityUnits': unidades}
+    return out
+
+
+class FakeDynamoClient:
+    """boto3.client('dynamodb') (tipos low-level)."""
+    ITEM_MAX_BYTES = 400 * 1024
+    TX_MAX_ITEMS = 100
+    TX_MAX_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, aws):
+        self.aws = aws
+        self.core = _DynamoCore(aws)
+
+    def _returns(self, rv, old, new):
+        if rv in ('ALL_NEW', 'UPDATED_NEW'):
+            return {'Attributes': _item_ll(new)}
+        if rv in ('ALL_OLD', 'UPDATED_OLD') and old:
+            return {'Attributes': _item_ll(old)}
+        return {}
+
+    def get_item(self, TableName, Key, ConsistentRead=False, **kw):
+        self.aws.record('dynamodb.GetItem')
+        with self.aws.lock:
+            item = self.core.get(TableName, _item_py(Key))
+        self.aws.consume(TableName, rcu=rcu(item_size(item), ConsistentRead))
+        return {'Item': _item_ll(item)} if item is not None else {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, ReturnValuesOnConditionCheckFailure=None, **kw):
+        self.aws.record('dynamodb.PutItem')
+        item = _item_py(Item)
+        self.aws.consume(TableName, wcu=wcu(item_size(item)))
+        with self.aws.lock:
+            self.core.put(TableName, item, ConditionExpression, ExpressionAttributeNames,
+                          _values_py(ExpressionAttributeValues), ReturnValuesOnConditionCheckFailure)
+        return {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression=None,
+                    ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ReturnValues='NONE', ReturnValuesOnConditionCheckFailure=None, **kw):
+        self.aws.record('dynamodb.UpdateItem')
+        size = 0   # si la condición falla se cobra 1 WCU
+        try:
+            with self.aws.lock:
+                old, new = self.core.update(TableName, _item_py(Key), UpdateExpression, ConditionExpression,
+                                            ExpressionAttributeNames, _values_py(ExpressionAttributeValues),
+                                            ReturnValuesOnConditionCheckFailure)
+            size = max(item_size(old), item_size(new))
+        finally:
+            self.aws.consume(TableName, wcu=wcu(size))
+        return self._returns(ReturnValues, old, new)
+
+    def delete_item(self, TableName, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValuesOnConditionCheckFailure=None, **kw):
+        self.aws.record('dynamodb.DeleteItem')
+        size = 0
+        try:
+            with self.aws.lock:
+                size = item_size(self.core.delete(TableName, _item_py(Key), ConditionExpression, ExpressionAttributeNames,
+                                                  _values_py(ExpressionAttributeValues), ReturnValuesOnConditionCheckFailure))
+        finally:
+            self.aws.consume(TableName, wcu=wcu(size))
+        return {}
+
+    def query(self, TableName, KeyConditionExpression, IndexName=None, ExpressionAttributeNames=None,
+              ExpressionAttributeValues=None, Limit=None, ExclusiveStartKey=None, ScanIndexForward=True,
+              ProjectionExpression=None, FilterExpression=None, ConsistentRead=False, **kw):
+        self.aws.record('dynamodb.Query')
+        names = ExpressionAttributeNames or {}
+        with self.aws.lock:
+            rows, scanned, lek, leidos = self.core.query(TableName, IndexName, KeyConditionExpression, names,
+                                                 _values_py(ExpressionAttributeValues), Limit,
+                                                 _item_py(ExclusiveStartKey) if ExclusiveStartKey else None,
+                                                 ScanIndexForward, FilterExpression)
+        unidades = rcu(leidos, ConsistentRead)
+        self.aws.consume(TableName, rcu=unidades)
+        out = {'Items': [_item_ll(_project(r, ProjectionExpression, names)) for r in rows],
+               'Count': len(rows), 'ScannedCount': scanned}
+        if lek:
+            out['LastEvaluatedKey'] = _item_ll(lek)
+        return _consumed(out, kw, TableName, unidades)
+
+    def scan(self, TableName, Limit=None, ExclusiveStartKey=None, Segment=None, TotalSegments=None,
+             FilterExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+             ProjectionExpression=None, ConsistentRead=False, **kw):
+        self.aws.record('dynamodb.Scan')
+        names = ExpressionAttributeNames or {}
+        with self.aws.lock:
+            rows, scanned, lek, leidos = self.core.scan(TableName, Limit,
+                                                _item_py(ExclusiveStartKey) if ExclusiveStartKey else None,
+                                                Segment, TotalSegments, FilterExpression, names,
+                                                _values_py(ExpressionAttributeValues))
+        unidades = rcu(leidos, ConsistentRead)
+        self.aws.consume(TableName, rcu=unidades)
+        out = {'Items': [_item_ll(_project(r, ProjectionExpression, names)) for r in rows],
+               'Count': len(rows), 'ScannedCount': scanned}
+        if lek:
+            out['LastEvaluatedKey'] = _item_ll(lek)
+        return _consumed(out, kw, TableName, unidades)
+
+    def batch_get_item(self, RequestItems, **kw):
+        self.aws.record('dynamodb.BatchGetItem')
+        if sum(len(r['Keys']) for r in RequestItems.values()) > 100:
+            raise _error('BatchGetItem', 'ValidationException', 'Too many items requested for the BatchGetItem call')
+        out, consumida = {}, []
+        with self.aws.lock:
+            for table, req in RequestItems.items():
+                names = req.get('ExpressionAttributeNames') or {}
+                rows, unidades = [], 0
+                for key in req['Keys']:
+                    item = self.core.get(table, _item_py(key), op='BatchGetItem')
+                    unidades += rcu(item_size(item), req.get('ConsistentRead', False))
+                    if item is not None:
+                        rows.append(_item_ll(_project(item, req.get('ProjectionExpression'), names)))
+                self.aws.consume(table, rcu=unidades)
+                out[table] = rows
+                consumida.append({'TableName': table, 'CapacityUnits': unidades})
+        resp = {'Responses': out, 'UnprocessedKeys': {}}
+        if kw.get('ReturnConsumedCapacity') in ('TOTAL', 'INDEXES'):
+            resp['ConsumedCapacity'] = consumida
+        return resp
+
+    def batch_write_item(self, RequestItems, **kw):
+        self.aws.record('dynamodb.BatchWriteItem')
+        if sum(len(r) for r in RequestItems.values()) > 25:
+            raise _error('BatchWriteItem', 'ValidationException', 'Too many items requested for the BatchWriteItem call')
+        with self.aws.lock:
+            for table, reqs in RequestItems.items():
+                for r in reqs:
+                    if 'PutRequest' in r:
+                        item = _item_py(r['PutRequest']['Item'])
+                        self.core.put(table, item, op='BatchWriteItem')
+                    else:
+                        item = self.core.delete(table, _item_py(r['DeleteRequest']['Key']), op='BatchWriteItem')
+                    self.aws.consume(table, wcu=wcu(item_size(item)))
+        return {'UnprocessedItems': {}}
+
+    def transact_write_items(self, TransactItems, **kw):
+        self.aws.record('dynamodb.TransactWriteItems')
+        actions = []
+        for ti in TransactItems:
+            (kind, p), = ti.items()
+            p = dict(p)
+            for f in ('Key', 'Item'):
+                if f in p:
+                    p[f] = _item_py(p[f])
+            p['ExpressionAttributeValues'] = _values_py(p.get('ExpressionAttributeValues'))
+            actions.append((kind, p['TableName'], p))
+        sizes = [item_size(p.get('Item')) for _, _, p in actions]
+        if len(actions) > self.TX_MAX_ITEMS:
+            raise _error('TransactWriteItems', 'ValidationException',
+                         f'Member must have length less than or equal to {self.TX_MAX_ITEMS}')
+        if max(sizes, default=0) > self.ITEM_MAX_BYTES:
+            raise _error('TransactWriteItems', 'ValidationException', 'Item size has exceeded the maximum allowed size')
+        if sum(sizes) > self.TX_MAX_BYTES:
+            raise _error('TransactWriteItems', 'ValidationException',
+                         'Transaction request cannot be larger than 4 MB')
+        try:
+            with self.aws.lock:
+                self.core.transact(actions)
+        finally:
+            # 2 unidades por item (prepare + commit), también si se cancela
+            with self.aws.lock:
+                for kind, tbl, p in actions:
+                    if tbl not in self.aws.schemas:
+                        continue
+                    actual = self.aws.tables.get(tbl, {}).get(self.aws.key_of(tbl, p.get('Key') or p.get('Item'), 'TransactWriteItems'))
+                    size = max(item_size(actual), item_size(p.get('Item')))
+                    if kind == 'ConditionCheck':
+                        self.aws.consume(tbl, rcu=rcu(size, transact=True))
+                    else:
+                        self.aws.consume(tbl, wcu=wcu(size, transact=True))
+        return {}
+
+
+class FakeTable:
+    """boto3.resource('dynamodb').Table(name) (tipos Python)."""
+
+    def __init__(self, aws, name):
+        self.aws = aws
+        self.name = name
+        self.table_name = name
+        self.core = _DynamoCore(aws)
+
+    def get_item(self, Key, **kw):
+        self.aws.record('dynamodb.GetItem')
+        with self.aws.lock:
+            item = self.core.get(self.name, _py(Key))
+        return {'Item': item} if item is not None else {}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, ReturnValuesOnConditionCheckFailure=None, **kw):
+        self.aws.record('dynamodb.PutItem')
+        with self.aws.lock:
+            self.core.put(self.name, _py(Item), ConditionExpression, ExpressionAttributeNames,
+                          _py(ExpressionAttributeValues or {}), ReturnValuesOnConditionCheckFailure)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, ReturnValues='NONE',
+                    ReturnValuesOnConditionCheckFailure=None, **kw):
+        self.aws.record('dynamodb.UpdateItem')
+        with self.aws.lock:
+            old, new = self.core.update(self.name, _py(Key), UpdateExpression, ConditionExpression,
+                                        ExpressionAttributeNames, _py(ExpressionAttributeValues or {}),
+                                        ReturnValuesOnConditionCheckFailure)
+        if ReturnValues in ('ALL_NEW', 'UPDATED_NEW'):
+            return {'Attributes': new}
+        if ReturnValues in ('ALL_OLD', 'UPDATED_OLD') and old:
+            return {'Attributes': copy.deepcopy(old)}
+        return {}
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeNames=None,
+                    ExpressionAttributeValues=None, **kw):
+        self.aws.record('dynamodb.DeleteItem')
+        with self.aws.lock:
+            self.core.delete(self.name, _py(Key), ConditionExpression, ExpressionAttributeNames,
+                             _py(ExpressionAttributeValues or {}))
+        return {}
+
+
+class FakeDynamoResource:
+    def __init__(self, aws):
+        self.aws = aws
+        self.meta = types.SimpleNamespace(client=FakeDynamoClient(aws))
+
+    def Table(self, name):
+        return FakeTable(self.aws, name)
+
+
+# ---------------------------------------------------------------------------
+# EventBridge / SNS
+# ---------------------------------------------------------------------------
+
+class FakeEventsClient:
+    MAX_BYTES = 256 * 1024
+
+    def __init__(self, aws):
+        self.aws = aws
+
+    def put_events(self, Entries, **kw):
+        self.aws.record('events.PutEvents')
+        if len(Entries) > 10:
+            raise _error('PutEvents', 'ValidationException', 'Entries must have length less than or equal to 10')
+        if sum(len(str(e.get(k, '')).encode()) for e in Entries for k in ('Source', 'DetailType', 'Detail')) > self.MAX_BYTES:
+            raise _error('PutEvents', 'ValidationException', 'Total size of the entries in the request is over the limit')
+        out = []
+        for e in Entries:
+            out.append({'EventId': str(uuid.uuid4())})
+            for listener in list(self.aws.event_listeners):
+                listener(e)
+        return {'FailedEntryCount': 0, 'Entries': out}
+
+
+class FakeSNSClient:
+    def __init__(self, aws):
+        self.aws = aws
+
+    def publish(self, TopicArn, Message, Subject=None, **kw):
+        self.aws.record('sns.Publish')
+        with self.aws.lock:
+            self.aws.sns_messages[TopicArn] += 1
+        return {'MessageId': str(uuid.uuid4())}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries, **kw):
+        self.aws.record('sns.PublishBatch')
+        if len(PublishBatchRequestEntries) > 10:
+            raise _error('PublishBatch', 'TooManyEntriesInBatchRequest', 'max 10')
+        with self.aws.lock:
+            self.aws.sns_messages[TopicArn] += len(PublishBatchRequestEntries)
+        return {'Successful': [{'Id': e['Id'], 'MessageId': str(uuid.uuid4())} for e in PublishBatchRequestEntries],
+                'Failed': []}
+
+
+# ---------------------------------------------------------------------------
+# SQS (cola estándar en memoria: visibilidad, ReceiveCount y DLQ por maxReceiveCount)
+# ---------------------------------------------------------------------------
+
+class FakeSQSClient:
+    MAX_BATCH = 10
+    MAX_BYTES = 256 * 1024
+
+    def __init__(self, aws, visibility_timeout=30.0, max_receive_count=5):
+        self.aws = aws
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max_receive_count   # después va a aws.dead_letters (redrive policy)
+
+    def _nuevo(self, body, attrs=None):
+        return {'MessageId': str(uuid.uuid4()), 'Body': body, 'MessageAttributes': attrs or {},
+                'ReceiveCount': 0, 'VisibleAt': 0.0, 'ReceiptHandle': None, 'SentAt': time.time()}
+
+    def send_message(self, QueueUrl, MessageBody, MessageAttributes=None, **kw):
+        self.aws.record('sqs.SendMessage')
+        if len(MessageBody.encode()) > self.MAX_BYTES:
+            raise _error('SendMessage', 'InvalidParameterValue', 'Message must be shorter than 262144 bytes')
+        msg = self._nuevo(MessageBody, MessageAttributes)
+        with self.aws.lock:
+            self.aws.queues[QueueUrl].append(msg)
+        return {'MessageId': msg['MessageId']}
+
+    def send_message_batch(self, QueueUrl, Entries, **kw):
+        self.aws.record('sqs.SendMessageBatch')
+        if len(Entries) > self.MAX_BATCH:
+            raise _error('SendMessageBatch', 'AWS.SimpleQueueService.TooManyEntriesInBatchRequest', 'max 10')
+        if sum(len(e['MessageBody'].encode()) for e in Entries) > self.MAX_BYTES:
+            raise _error('SendMessageBatch', 'AWS.SimpleQueueService.BatchRequestTooLong', 'max 262144 bytes')
+        ok = []
+        with self.aws.lock:
+            for e in Entries:
+                msg = self._nuevo(e['MessageBody'], e.get('MessageAttributes'))
+                self.aws.queues[QueueUrl].append(msg)
+                ok.append({'Id': e['Id'], 'MessageId': msg['MessageId']})
+        return {'Successful': ok, 'Failed': []}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, VisibilityTimeout=None, **kw):
+        self.aws.record('sqs.ReceiveMessage')
+        ahora, out = time.time(), []
+        vt = self.visibility_timeout if VisibilityTimeout is None else VisibilityTimeout
+        with self.aws.lock:
+            cola = self.aws.queues[QueueUrl]
+            for msg in list(cola):
+                if len(out) >= min(MaxNumberOfMessages, self.MAX_BATCH):
+                    break
+                if msg['VisibleAt'] > ahora:
+                    continue
+                if msg['ReceiveCount'] >= self.max_receive_count:
+                    cola.remove(msg)
+                    self.aws.dead_letters[QueueUrl].append(msg)
+                    continue
+                msg['ReceiveCount'] += 1
+                msg['VisibleAt'] = ahora + vt
+                msg['ReceiptHandle'] = str(uuid.uuid4())
+                out.append({'MessageId': msg['MessageId'], 'ReceiptHandle': msg['ReceiptHandle'],
+                            'Body': msg['Body'], 'MessageAttributes': msg['MessageAttributes'],
+                            'Attributes': {'ApproximateReceiveCount': str(msg['ReceiveCount']),
+                                           'SentTimestamp': str(int(msg['SentAt'] * 1000))}})
+        return {'Messages': out} if out else {}
+
+    def delete_message_batch(self, QueueUrl, Entries, **kw):
+        self.aws.record('sqs.DeleteMessageBatch')
+        handles = {e['ReceiptHandle']: e['Id'] for e in Entries}
+        ok = []
+        with self.aws.lock:
+            cola = self.aws.queues[QueueUrl]
+            for msg in [m for m in cola if m['ReceiptHandle'] in handles]:
+                cola.remove(msg)
+                ok.append({'Id': handles[msg['ReceiptHandle']]})
+        return {'Successful': ok, 'Failed': []}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries, **kw):
+        self.aws.record('sqs.ChangeMessageVisibilityBatch')
+        vt = {e['ReceiptHandle']: e['VisibilityTimeout'] for e in Entries}
+        with self.aws.lock:
+            for msg in self.aws.queues[QueueUrl]:
+                if msg['ReceiptHandle'] in vt:
+                    msg['VisibleAt'] = time.time() + vt[msg['ReceiptHandle']]
+        return {'Successful': [{'Id': e['Id']} for e in Entries], 'Failed': []}
+
+    def get_queue_attributes(self, QueueUrl, AttributeNames=None, **kw):
+        self.aws.record('sqs.GetQueueAttributes')
+        ahora = time.time()
+        with self.aws.lock:
+            cola = self.aws.queues[QueueUrl]
+            visibles = sum(1 for m in cola if m['VisibleAt'] <= ahora)
+        return {'Attributes': {'ApproximateNumberOfMessages': str(visibles),
+                               'ApproximateNumberOfMessagesNotVisible': str(len(cola) - visibles)}}
+
+
+def sqs_event(messages, queue_arn='arn:aws:sqs:local:000000000000:altas-ordenes'):
+    """Evento de Lambda para un lote de `receive_message` (event source mapping de SQS)."""
+    return {'Records': [{
+        'messageId': m['MessageId'], 'receiptHandle': m['ReceiptHandle'], 'body': m['Body'],
+        'attributes': m.get('Attributes', {}), 'messageAttributes': m.get('MessageAttributes', {}),
+        'eventSource': 'aws:sqs', 'eventSourceARN': queue_arn,
+    } for m in messages]}
+
+
+def poll_queue(sqs, queue_url, handler, batch_size=10, max_concurrency=4, idle_rounds=1):
+    """Stand-in del event source mapping: `max_concurrency` pollers reciben lotes de
+    `batch_size`, invocan `handler(event)` y borran los mensajes que no vienen en
+    `batchItemFailures` (ReportBatchItemFailures); los fallidos vuelven a la cola al vencer
+    la visibilidad. Termina cuando la cola queda vacía. Devuelve métricas del drenado."""
+    stats = Counter()
+    lock = threading.Lock()
+
+    def poller():
+        vacias = 0
+        while vacias < idle_rounds:
+            msgs = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=batch_size).get('Messages', [])
+            if not msgs:
+                attrs = sqs.get_queue_attributes(QueueUrl=queue_url)['Attributes']
+                if int(attrs['ApproximateNumberOfMessagesNotVisible']):
+                    time.sleep(0.01)   # en vuelo en otro poller o esperando visibilidad
+                    continue
+                vacias += 1
+                continue
+            vacias = 0
+            try:
+                res = handler(sqs_event(msgs)) or {}
+                fallidos = {f['itemIdentifier'] for f in res.get('batchItemFailures', [])}
+            except Exception:
+                fallidos = {m['MessageId'] for m in msgs}   # error del handler: todo el lote vuelve
+            ok = [m for m in msgs if m['MessageId'] not in fallidos]
+            if ok:
+                sqs.delete_message_batch(QueueUrl=queue_url, Entries=[
+                    {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(ok)])
+            with lock:
+                stats['batches'] += 1
+                stats['deleted'] += len(ok)
+                stats['failed'] += len(msgs) - len(ok)
+
+    hilos = [threading.Thread(target=poller) for _ in range(max_concurrency)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return dict(stats)
+
+
+# ---------------------------------------------------------------------------
+# Módulos boto3/botocore falsos
+# ---------------------------------------------------------------------------
+
+class FakeConfig:
+    """botocore.config.Config: sólo guarda las opciones."""
+
+    def __init__(self, **kw):
+        self.options = kw
+
+
+def install(aws=None):
+    """Registra `boto3`/`botocore` falsos ligados a `aws` y lo devuelve."""
+    aws = aws or FakeAWS()
+    clients = {
+        'dynamodb': FakeDynamoClient(aws),
+        'events': FakeEventsClient(aws),
+        'sns': FakeSNSClient(aws),
+        'sqs': FakeSQSClient(aws),
+    }
+
+    boto3 = types.ModuleType('boto3')
+    boto3.client = lambda name, *a, **kw: clients[name]
+    boto3.resource = lambda name, *a, **kw: FakeDynamoResource(aws)
+    boto3.FAKE_AWS = aws
+
+    botocore = types.ModuleType('botocore')
+    exceptions = types.ModuleType('botocore.exceptions')
+    exceptions.ClientError = ClientError
+    botocore.exceptions = exceptions
+    config = types.ModuleType('botocore.config')
+    config.Config = FakeConfig
+    botocore.config = config
+
+    sys.modules.update({'boto3': boto3, 'botocore': botocore, 'botocore.exceptions': exceptions,
+                        'botocore.config': config})
+    if 'comun.aws' in sys.modules:
+        sys.modules['comun.aws'].reset()   # clientes de un install anterior
+    return aws
@@ -0,0 +1,288 @@
+"""Harness offline end-to-end del flujo de OC (load test local).
+
+Carga los 11 handlers numerados como módulos (un "contenedor warm" por Lambda),
+enruta cada entrada de `put_events` según la tabla de reglas de EventBridge del
+README y simula los clicks de aprobador / depósito / logística.
+
+Con `--intake async` el POST sólo encola (202) y la misma Lambda drena la cola en
+lotes (stand-in del event source mapping de SQS, `fakes.poll_queue`) antes de seguir.
+
+Uso:
+    python -m local.harness --orders 500 --concurrency 16 --lines 20 [--intake async] [--json]
+"""
+import os, re, sys, json, time, glob, uuid, random, argparse, threading, contextlib, io, importlib.util
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Nombres de target del README que no coinciden con el nombre del archivo
+TARGET_ALIASES = {
+    'Notificacion-Deposito':  'Notificaciones-Deposito-A-R',
+    'Notificacion-Logistica': 'Notificaciones-Logistica-Recepcion',
+}
+
+# Endpoints HTTP que en la realidad dispara una persona desde el mail
+CREATE   = 'Compras-CrearOrden-CasaCentral'
+APPROVE  = 'CasaCentral-AprobarOrden'
+REJECT   = 'CasaCentral-RechazarOrden'
+RECEIVE  = 'Deposito-AceptarRecepcion'
+DISPATCH = 'Logistica-ConfirmarDespacho'
+
+FAKE_ENV = {
+    'ROLE_TOPIC_MAP': json.dumps({'COMPRAS_APROBADORES': 'arn:aws:sns:local:000000000000:COMPRAS_APROBADORES'}),
+    'PROVEEDORES': 'arn:aws:sns:local:000000000000:PROVEEDORES',
+    'DEPOSITO': 'arn:aws:sns:local:000000000000:DEPOSITO',
+    'LOGISTICA': 'arn:aws:sns:local:000000000000:LOGISTICA',
+    'SUCURSALES_TOPIC_ARN': 'arn:aws:sns:local:000000000000:SUCURSALES',
+    'API_BASE_URL': 'http://localhost',
+    'APPROVAL_BASE_URL': 'http://localhost',
+    'INTAKE_QUEUE_URL': 'https://sqs.local/000000000000/altas-ordenes',
+}
+CONSUME = CREATE + ' (cola)'   # etapa del consumidor en modo async
+
+
+def load_rules(readme=os.path.join(ROOT, 'README.md')):
+    """Lee la tabla '| **Regla** | `source` / `detail-type` | `Target` |' del README."""
+    fila = re.compile(r"^\|\s*\*\*(.+?)\*\*\s*\|\s*`([^`]+)`\s*/\s*`([^`]+)`\s*\|\s*`([^`]+)`\s*\|")
+    rules = []
+    with open(readme, encoding='utf-8') as f:
+        for line in f:
+            m = fila.match(line.strip())
+            if m:
+                name, source, detail_type, target = m.groups()
+                rules.append({'name': name, 'source': source, 'detailType': detail_type,
+                              'target': TARGET_ALIASES.get(target, target)})
+    return rules
+
+
+def load_handlers(root=ROOT):
+    """{nombre-lambda: módulo} para cada '<n> <Nombre>.py' del repo."""
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    handlers = {}
+    for path in sorted(glob.glob(os.path.join(root, '[0-9]* *.py'))):
+        name = os.path.basename(path)[:-3].split(' ', 1)[1]
+        spec = importlib.util.spec_from_file_location(f"lambda_{name.replace('-', '_')}", path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        handlers[name] = mod
+    return handlers
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+class Pipeline:
+    """Bus de eventos en proceso + handlers cargados + métricas por etapa."""
+
+    def __init__(self, aws, rules=None, handlers=None, hop_latency=0.0):
+        self.aws = aws
+        self.hop_latency = hop_latency   # demora simulada de EventBridge + invocación por hop
+        self.rules = rules if rules is not None else load_rules()
+        self.handlers = handlers if handlers is not None else load_handlers()
+        faltan = {r['target'] for r in self.rules} - set(self.handlers)
+        if faltan:
+            raise RuntimeError(f"Targets sin handler: {sorted(faltan)}")
+        self.latencies = defaultdict(list)   # etapa -> [segundos]
+        self.errors = defaultdict(int)       # etapa -> cantidad
+        self.events = defaultdict(int)       # detail-type -> cantidad
+        self._lock = threading.Lock()
+        self._pending = threading.local()
+        aws.event_listeners.append(self._on_put_event)
+
+    # Los eventos se encolan por hilo y se entregan después de que el productor
+    # termina: así la latencia de cada etapa no incluye la de sus consumidores.
+    def _on_put_event(self, entry):
+        q = getattr(self._pending, 'q', None)
+        if q is None:
+            q = self._pending.q = []
+        q.append(entry)
+
+    def _route(self, entry):
+        # Igual que el patrón de regla recomendado para el modo fusionado:
+        # la copia de auditoría no se entrega a los targets que ya la procesaron.
+        fused = json.loads(entry.get('Detail') or '{}').get('fusedTargets') or []
+        return [r['target'] for r in self.rules
+                if r['source'] == entry.get('Source') and r['detailType'] == entry.get('DetailType')
+                and r['target'] not in fused]
+
+    def invoke(self, name, event, etapa=None):
+        t0 = time.perf_counter()
+        try:
+            res = self.handlers[name].lambda_handler(event, None)
+        except Exception as e:
+            res = {'statusCode': 599, 'body': repr(e)}
+        dt = time.perf_counter() - t0
+        failed = isinstance(res, dict) and (res.get('statusCode', 200) >= 400 or res.get('ok') is False
+                                            or bool(res.get('batchItemFailures')))
+        with self._lock:
+            self.latencies[etapa or name].append(dt)
+            if failed:
+                self.errors[etapa or name] += 1
+        return res
+
+    def drain(self):
+        """Entrega (BFS) todos los eventos pendientes de este hilo."""
+        q = getattr(self._pending, 'q', None) or []
+        while q:
+            entry = q.pop(0)
+            with self._lock:
+                self.events[entry.get('DetailType')] += 1
+            evt = {
+                'version': '0', 'id': str(uuid.uuid4()),
+                'source': entry.get('Source'), 'detail-type': entry.get('DetailType'),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'detail': json.loads(entry.get('Detail') or '{}'),
+            }
+            targets = self._route(entry)
+            if targets and self.hop_latency:
+                time.sleep(self.hop_latency)
+            for target in targets:
+                self.invoke(target, evt)
+
+    def call(self, name, event, etapa=None):
+        res = self.invoke(name, event, etapa)
+        self.drain()
+        return res
+
+
+def _http(order_id, **query):
+    return {'pathParameters': {'orderId': order_id}, 'queryStringParameters': query or None,
+            'requestContext': {'http': {'method': 'GET'}}}
+
+
+def run(orders=100, concurrency=8, lines=5, sku_pool=200, reject_ratio=0.0, seed=1, latency=None, quiet=True,
+        fused=None, hop_latency=0.0, log=None, intake='sync', batch_size=10):
+    """Corre `orders` OCs completas y devuelve el reporte (dict).
+    `log`: archivo donde guardar la salida de los handlers (spans EMF para local.timeline).
+    `intake='async'`: POST → cola → consumidor en lotes de `batch_size` (`concurrency` pollers)."""
+    from local import fakes
+    for k, v in FAKE_ENV.items():
+        os.environ.setdefault(k, v)
+    if fused is not None:
+        os.environ['FUSED_DISPATCH'] = json.dumps(fused)
+    os.environ['INTAKE_MODE'] = intake
+    aws = fakes.install(fakes.FakeAWS(latency=latency))
+    pipe = Pipeline(aws, hop_latency=hop_latency)
+    rnd = random.Random(seed)
+    planes = []
+    for i in range(orders):
+        items = [{'sku': f"SKU-{rnd.randrange(sku_pool):04d}", 'qty': rnd.randrange(1, 50)} for _ in range(lines)]
+        planes.append((f"OC-LT-{i:06d}", items, rnd.random() < reject_ratio))
+
+    e2e = []
+    e2e_lock = threading.Lock()
+    inicio, cola = {}, None
+
+    def alta(plan):
+        inicio[plan[0]] = time.perf_counter()
+        pipe.call(CREATE, {'body': json.dumps({'orderId': plan[0], 'items': plan[1], 'origen': 'LoadTest'})})
+
+    def flujo(plan):
+        order_id, items, rechazar = plan
+        if intake != 'async':
+            alta(plan)
+        t0 = inicio[order_id]
+        if rechazar:
+            pipe.call(REJECT, _http(order_id, reason='loadtest'))
+        else:
+            pipe.call(APPROVE, _http(order_id))
+            pipe.call(RECEIVE, _http(order_id))
+            pipe.call(DISPATCH, _http(order_id))
+        with e2e_lock:
+            e2e.append(time.perf_counter() - t0)
+
+    sink = io.StringIO() if quiet or log else None
+    t0 = time.perf_counter()
+    with (contextlib.redirect_stdout(sink) if sink else contextlib.nullcontext()):
+        if intake == 'async':
+            # 1) ráfaga de POST (sólo encolan)  2) drenar la cola  3) resto del flujo
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(alta, planes))
+            sqs = sys.modules['boto3'].client('sqs')
+            sqs.visibility_timeout = 0.05   # los reintentos vuelven enseguida
+            t_cola = time.perf_counter()
+            cola = fakes.poll_queue(sqs, FAKE_ENV['INTAKE_QUEUE_URL'], lambda ev: pipe.call(CREATE, ev, CONSUME),
+                                    batch_size=batch_size, max_concurrency=concurrency)
+            cola['drain_s'] = round(time.perf_counter() - t_cola, 3)
+            cola['dead_letters'] = sum(len(v) for v in aws.dead_letters.values())
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(flujo, planes))
+    wall = time.perf_counter() - t0
+    if log:
+        with open(log, 'w', encoding='utf-8') as f:
+            f.write(sink.getvalue())
+
+    def resumen(vals):
+        return {'count': len(vals),
+                'p50_ms': round(percentile(vals, 50) * 1000, 3),
+                'p95_ms': round(percentile(vals, 95) * 1000, 3),
+                'p99_ms': round(percentile(vals, 99) * 1000, 3)}
+
+    return {
+        'orders': orders, 'concurrency': concurrency, 'lines': lines, 'intake': intake,
+        'queue': cola,
+        'wall_s': round(wall, 3),
+        'throughput_orders_s': round(orders / wall, 2) if wall else None,
+        'e2e': resumen(e2e),
+        'stages': {name: dict(resumen(v), errors=pipe.errors.get(name, 0))
+                   for name, v in sorted(pipe.latencies.items())},
+        'events': dict(pipe.events),
+        'aws_calls': dict(sorted(aws.calls.items())),
+        'aws_calls_per_order': {k: round(v / orders, 2) for k, v in sorted(aws.calls.items())},
+    }
+
+
+def _print(report):
+    print(f"{report['orders']} OCs · concurrencia {report['concurrency']} · {report['lines']} líneas/OC")
+    print(f"wall {report['wall_s']}s · {report['throughput_orders_s']} OCs/s · "
+          f"e2e p50/p95/p99 {report['e2e']['p50_ms']}/{report['e2e']['p95_ms']}/{report['e2e']['p99_ms']} ms\n")
+    if report.get('queue'):
+        q = report['queue']
+        print(f"cola: {q.get('batches', 0)} lotes · {q.get('deleted', 0)} altas · {q.get('failed', 0)} reintentos · "
+              f"{q.get('dead_letters', 0)} a DLQ · drenada en {q['drain_s']}s\n")
+    print(f"{'etapa':<38} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'err':>5}")
+    for name, s in report['stages'].items():
+        print(f"{name:<38} {s['count']:>6} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {s['errors']:>5}")
+    print(f"\n{'API':<32} {'llamadas':>9} {'por OC':>7}")
+    for api, n in report['aws_calls'].items():
+        print(f"{api:<32} {n:>9} {report['aws_calls_per_order'][api]:>7}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--orders', type=int, default=100)
+    ap.add_argument('--concurrency', type=int, default=8)
+    ap.add_argument('--lines', type=int, default=5, help='líneas (SKUs) por OC')
+    ap.add_argument('--sku-pool', type=int, default=200)
+    ap.add_argument('--reject-ratio', type=float, default=0.0)
+    ap.add_argument('--seed', type=int, default=1)
+    ap.add_argument('--latency-ms', type=float, default=0.0, help='latencia simulada por llamada AWS')
+    ap.add_argument('--hop-ms', type=float, default=0.0, help='latencia simulada por hop de EventBridge')
+    ap.add_argument('--fused', type=json.loads, default=None,
+                    help='config FUSED_DISPATCH en JSON, ej. \'{"OrdenCreada": ["CasaCentral-ProcesarOrden-Deposito"]}\'')
+    ap.add_argument('--intake', choices=('sync', 'async'), default='sync',
+                    help='async: POST encola (202) y el consumidor drena la cola en lotes')
+    ap.add_argument('--batch-size', type=int, default=10, help='mensajes por lote del consumidor (async)')
+    ap.add_argument('--verbose', action='store_true', help='no silenciar los print de los handlers')
+    ap.add_argument('--log', default=None, help='guardar la salida de los handlers (spans EMF) en este archivo')
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+    latency = {s + '.*': args.latency_ms / 1000.0 for s in ('dynamodb', 'events', 'sns')} if args.latency_ms else None
+    report = run(args.orders, args.concurrency, args.lines, args.sku_pool, args.reject_ratio,
+                 args.seed, latency, quiet=not args.verbose, fused=args.fused,
+                 hop_latency=args.hop_ms / 1000.0, log=args.log, intake=args.intake, batch_size=args.batch_size)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print(report)
+
+
+if __name__ == '__main__':
+    main()
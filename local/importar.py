@@ -0,0 +1,315 @@
+"""Importación de OCs desde archivos grandes de reposición (CSV / NDJSON), en streaming.
+
+Lee el archivo fila por fila, arma una OC con las filas consecutivas que tienen el mismo
+`--key`, valida sku / qty y da de alta por el mismo camino que el bulk de POST /ordenes-compra
+(Compras-CrearOrden-CasaCentral: Put condicional + historial en TransactWriteItems de a
+BULK_TX_CHUNK órdenes y OrdenCreada en PutEvents de a 10), en lotes de `--batch` OCs con a lo
+sumo `--window` lotes en vuelo. La memoria no depende del tamaño del archivo: como mucho
+window × batch OCs de hasta `--max-lines` líneas.
+
+El avance se guarda en `--checkpoint` (offset del archivo después del último lote confirmado,
+en orden): si la importación se corta, la misma línea de comando sigue desde ahí. Las OCs
+que estaban en vuelo al cortarse vuelven como `duplicate` (el Put es condicional), no se
+duplican. Las OCs rechazadas (fila inválida, repetida, falla de DynamoDB) van a `--errores`.
+
+Formatos (por extensión o `--format`):
+  CSV     encabezado con `orderId` (o `--key`), `sku`, `qty` y opcionales `origen`, `prioridad`
+  NDJSON  una fila por línea con esos campos, o una OC completa {"orderId": ..., "items": [...]}
+
+Uso:
+    python -m local.importar reposicion.csv [--key orderId] [--batch 100] [--window 4]
+    python -m local.importar reposicion.ndjson --checkpoint rep.ckpt --errores rep.errores.ndjson
+    python -m local.importar reposicion.csv --offline [--latency-ms 5]     # contra local/fakes.py
+"""
+import os, sys, csv, glob, json, time, argparse, contextlib, importlib.util
+from decimal import Decimal, InvalidOperation
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALTA = 'Compras-CrearOrden-CasaCentral'
+
+
+def cargar_alta(root=ROOT):
+    """Módulo del handler de alta (siempre en modo sincrónico: la importación no pasa por la cola)."""
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    os.environ['INTAKE_MODE'] = 'sync'
+    path, = glob.glob(os.path.join(root, f"[0-9]* {ALTA}.py"))
+    spec = importlib.util.spec_from_file_location(f"lambda_{ALTA.replace('-', '_')}", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+# ----------------------------------------------------------------------------
+# Lectura en streaming (con offset para el checkpoint)
+# ----------------------------------------------------------------------------
+
+def _lineas(f, pos):
+    """Líneas decodificadas de `f` (binario); pos[0] = offset después de la última leída."""
+    while True:
+        linea = f.readline()
+        if not linea:
+            return
+        pos[0] += len(linea)
+        yield linea.decode('utf-8-sig' if pos[0] == len(linea) else 'utf-8')
+
+def filas_csv(f, offset, primera=1, delimiter=','):
+    """(n, fila, fin): n = número de registro (`primera` = el del offset), fin = offset al terminarla."""
+    f.seek(0)
+    pos = [0]
+    encabezado = next(csv.reader(_lineas(f, pos), delimiter=delimiter), None)
+    if not encabezado:
+        return
+    campos = [c.strip() for c in encabezado]
+    if offset > pos[0]:
+        f.seek(offset)
+        pos[0] = offset
+    for n, valores in enumerate(csv.reader(_lineas(f, pos), delimiter=delimiter), primera):
+        if valores:
+            yield n, dict(zip(campos, valores)), pos[0]
+
+def filas_ndjson(f, offset, primera=1):
+    f.seek(offset)
+    pos = [offset]
+    for n, linea in enumerate(_lineas(f, pos), primera):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except ValueError:
+            fila = None
+        yield n, fila if isinstance(fila, dict) else {'_error': 'línea JSON inválida'}, pos[0]
+
+
+# ----------------------------------------------------------------------------
+# Filas → OCs
+# ----------------------------------------------------------------------------
+
+def _item(fila):
+    """(item, None) o (None, motivo)."""
+    sku = str(fila.get('sku') or '').strip()
+    if not sku:
+        return None, 'sku vacío'
+    try:
+        qty = Decimal(str(fila.get('qty')).strip())
+    except (InvalidOperation, ValueError):
+        return None, f"qty inválida: {fila.get('qty')!r}"
+    if not qty.is_finite() or qty <= 0 or qty != qty.to_integral_value():
+        return None, f"qty inválida: {fila.get('qty')!r}"
+    return {'sku': sku, 'qty': int(qty)}, None
+
+MAX_ERRORES = 20   # motivos guardados por OC (una OC inválida de 10k filas no crece sin límite)
+
+def _nueva(order_id, n, fila, origen):
+    return {'orderId': order_id, 'items': [], 'errores': [], 'excedida': False, 'desde': n, 'hasta': n,
+            'origen': str(fila.get('origen') or origen), 'prioridad': fila.get('prioridad') or None}
+
+def _rechazar(oc, motivo):
+    if len(oc['errores']) < MAX_ERRORES:
+        oc['errores'].append(motivo)
+
+def _agregar(oc, n, fila, max_lines):
+    item, motivo = _item(fila)
+    if motivo:
+        _rechazar(oc, f"fila {n}: {motivo}")
+    elif oc['excedida']:
+        pass
+    elif len(oc['items']) >= max_lines:
+        # se rechaza la OC y no se guardan más líneas en memoria
+        oc['excedida'], oc['items'] = True, []
+        _rechazar(oc, f"más de {max_lines} líneas")
+    else:
+        oc['items'].append(item)
+
+def ordenes(filas, key, origen, max_lines):
+    """Agrupa filas consecutivas con el mismo `key`. Cada OC lleva `fin` (offset para retomar
+    después de ella) y `errores` (si tiene alguno no se da de alta)."""
+    actual = None
+    for n, fila, fin in filas:
+        completa = isinstance(fila.get('items'), list)
+        order_id = str(fila.get(key) or '').strip()
+        if actual and (completa or order_id != actual['orderId']):
+            yield actual
+            actual = None
+        oc = actual or _nueva(order_id, n, fila, origen)
+        oc['hasta'], oc['fin'] = n, fin
+        if fila.get('_error'):
+            _rechazar(oc, f"fila {n}: {fila['_error']}")
+        elif not order_id:
+            _rechazar(oc, f"fila {n}: falta {key}")
+        elif completa:
+            for it in fila['items']:
+                _agregar(oc, n, it if isinstance(it, dict) else {}, max_lines)
+            if not oc['items'] and not oc['errores']:
+                _rechazar(oc, f"fila {n}: items vacío")
+        else:
+            _agregar(oc, n, fila, max_lines)
+        if completa:
+            yield oc
+        else:
+            actual = oc
+    if actual:
+        yield actual
+
+
+# ----------------------------------------------------------------------------
+# Alta por lotes con ventana acotada
+# ----------------------------------------------------------------------------
+
+class Checkpoint:
+    """Avance de la importación en un JSON (escritura atómica)."""
+
+    def __init__(self, path, archivo):
+        self.path, self.archivo = path, os.path.abspath(archivo)
+        self.estado = {'archivo': self.archivo, 'offset': 0, 'ordenes': {}, 'filas': 0}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                previo = json.load(f)
+            if previo.get('archivo') != self.archivo:
+                raise SystemExit(f"{path} es de otro archivo ({previo.get('archivo')}); usar --restart o otro --checkpoint")
+            self.estado = previo
+
+    def guardar(self, offset, filas, conteo):
+        """`filas`: número de la última fila confirmada (al retomar se numera desde la siguiente)."""
+        self.estado.update(offset=offset, filas=filas,
+                           ordenes=dict(Counter(self.estado['ordenes']) + conteo),
+                           actualizado=time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.estado, f)
+        os.replace(tmp, self.path)
+
+def _alta(handler, lote):
+    """Da de alta las OCs válidas del lote con el bulk del handler. Devuelve [(oc, resultado)]."""
+    validas = [oc for oc in lote if not oc['errores']]
+    out = [(oc, {'status': 'invalid', 'message': '; '.join(oc['errores'][:20])}) for oc in lote if oc['errores']]
+    if not validas:
+        return out
+    body = [{'orderId': oc['orderId'], 'items': oc['items'], 'origen': oc['origen'], 'prioridad': oc['prioridad']}
+            for oc in validas]
+    try:
+        res = handler.lambda_handler({'orders': body}, None)
+        resultados = res['results']
+    except Exception as e:
+        resultados = [{'status': 'failed', 'message': f"{type(e).__name__}: {e}"}] * len(validas)
+    return out + list(zip(validas, resultados))
+
+def importar(path, handler, fmt=None, key='orderId', origen='Importacion', batch=100, window=4,
+             max_lines=10000, checkpoint=None, errores=None, delimiter=',', progreso=10.0, log=sys.stderr):
+    """Importa `path` y devuelve el resumen (dict)."""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    ckpt = Checkpoint(checkpoint, path)
+    desde = ckpt.estado['offset']
+    total = os.path.getsize(path)
+    conteo, filas0 = Counter(), ckpt.estado['filas']
+    t0 = ultimo = time.perf_counter()
+
+    with open(path, 'rb') as f, open(errores, 'a', encoding='utf-8') if errores else contextlib.nullcontext() as ferr, \
+            ThreadPoolExecutor(max_workers=window) as pool:
+        primera = ckpt.estado['filas'] + 1
+        filas = filas_csv(f, desde, primera, delimiter) if fmt == 'csv' else filas_ndjson(f, desde, primera)
+        en_vuelo = deque()   # (future, offset al terminar el lote, última fila) en orden de envío
+
+        def confirmar():
+            # el más viejo primero: el checkpoint sólo avanza sobre lotes confirmados en orden
+            fut, fin, fila = en_vuelo.popleft()
+            lote = Counter()
+            for oc, r in fut.result():
+                lote[r['status']] += 1
+                if r['status'] != 'created' and ferr:
+                    ferr.write(json.dumps({'orderId': oc['orderId'], 'filas': [oc['desde'], oc['hasta']],
+                                           'status': r['status'], 'message': r.get('message')},
+                                          ensure_ascii=False) + '\n')
+                elif r.get('eventError') and ferr:
+                    ferr.write(json.dumps({'orderId': oc['orderId'], 'status': 'created',
+                                           'eventError': r['eventError']}, ensure_ascii=False) + '\n')
+            if ferr:
+                ferr.flush()
+            conteo.update(lote)
+            ckpt.guardar(fin, fila, lote)
+
+        def enviar(lote):
+            en_vuelo.append((pool.submit(_alta, handler, lote), lote[-1]['fin'], lote[-1]['hasta']))
+            while len(en_vuelo) >= window or (en_vuelo and en_vuelo[0][0].done()):
+                confirmar()
+
+        lote = []
+        try:
+            for oc in ordenes(filas, key, origen, max_lines):
+                lote.append(oc)
+                if len(lote) >= batch:
+                    enviar(lote)
+                    lote = []
+                ahora = time.perf_counter()
+                if log and progreso and ahora - ultimo >= progreso:
+                    ultimo = ahora
+                    n = sum(conteo.values())
+                    print(f"[IMPORTAR] {n} OCs · {n / (ahora - t0):.1f} OCs/s · {ckpt.estado['filas'] - filas0} filas · "
+                          f"{100 * ckpt.estado['offset'] / max(total, 1):.1f}%", file=log)
+            if lote:
+                enviar(lote)
+        finally:
+            while en_vuelo:   # también si se interrumpe: lo enviado se confirma antes de salir
+                confirmar()
+
+    segundos = time.perf_counter() - t0
+    n, filas = sum(conteo.values()), ckpt.estado['filas'] - filas0
+    return {
+        'archivo': ckpt.archivo, 'formato': fmt, 'retomadoDesde': desde, 'offset': ckpt.estado['offset'],
+        'completo': ckpt.estado['offset'] >= total,
+        'ordenes': n, **{s: conteo.get(s, 0) for s in ('created', 'duplicate', 'invalid', 'failed')},
+        'filas': filas, 'segundos': round(segundos, 3),
+        'ordenes_s': round(n / segundos, 1) if segundos else None,
+        'filas_s': round(filas / segundos, 1) if segundos else None,
+        'acumulado': ckpt.estado['ordenes'],
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('archivo')
+    ap.add_argument('--format', choices=('csv', 'ndjson'), default=None, help='default: por extensión')
+    ap.add_argument('--key', default='orderId', help='columna que agrupa las filas en una OC')
+    ap.add_argument('--origen', default='Importacion', help='origen de las OCs (si la fila no trae uno)')
+    ap.add_argument('--delimiter', default=',')
+    ap.add_argument('--batch', type=int, default=100, help='OCs por invocación del bulk')
+    ap.add_argument('--window', type=int, default=4, help='lotes en vuelo')
+    ap.add_argument('--max-lines', type=int, default=10000, help='líneas por OC (más se rechaza)')
+    ap.add_argument('--checkpoint', default=None, help='default: <archivo>.checkpoint.json')
+    ap.add_argument('--errores', default=None, help='default: <archivo>.errores.ndjson')
+    ap.add_argument('--restart', action='store_true', help='ignorar el checkpoint y empezar de cero')
+    ap.add_argument('--progress-s', type=float, default=10.0, help='cada cuánto informar el avance (stderr)')
+    ap.add_argument('--offline', action='store_true', help='contra los fakes de local/fakes.py')
+    ap.add_argument('--latency-ms', type=float, default=0.0, help='latencia simulada por llamada AWS (--offline)')
+    ap.add_argument('--verbose', action='store_true', help='no silenciar los print del handler')
+    args = ap.parse_args(argv)
+
+    checkpoint = args.checkpoint or args.archivo + '.checkpoint.json'
+    if args.restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    if args.offline:
+        from local import fakes, harness
+        for k, v in harness.FAKE_ENV.items():
+            os.environ.setdefault(k, v)
+        latency = {s + '.*': args.latency_ms / 1000.0 for s in ('dynamodb', 'events')} if args.latency_ms else None
+        fakes.install(fakes.FakeAWS(latency=latency))
+    handler = cargar_alta()
+    try:
+        with (contextlib.nullcontext() if args.verbose else open(os.devnull, 'w')) as sink, \
+                (contextlib.redirect_stdout(sink) if sink else contextlib.nullcontext()):
+            resumen = importar(args.archivo, handler, args.format, args.key, args.origen, args.batch, args.window,
+                               args.max_lines, checkpoint, args.errores or args.archivo + '.errores.ndjson',
+                               args.delimiter, args.progress_s)
+    except KeyboardInterrupt:
+        # los lotes en vuelo ya se confirmaron (importar): se retoma con la misma línea de comando
+        print(f"[IMPORTAR] interrumpido; avance guardado en {checkpoint}", file=sys.stderr)
+        sys.exit(130)
+    print(json.dumps(resumen, indent=2))
+
+
+if __name__ == '__main__':
+    main()
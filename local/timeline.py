@@ -0,0 +1,141 @@
+"""Línea de tiempo por orden a partir de los spans EMF de comun/trazas.py.
+
+Lee logs de CloudWatch exportados (o `python -m local.harness --log spans.log`),
+agrupa los spans por orden y reporta p50/p95/p99 end-to-end, por etapa (Lambda),
+la espera entre etapas (EventBridge / click del usuario) y por llamada AWS.
+
+Uso:
+    python -m local.timeline spans.log [otro.log ...] [--json]
+    python -m local.timeline spans.log --order OC-LT-000003
+    aws logs tail /aws/lambda/... | python -m local.timeline -
+"""
+import sys, json, argparse
+from collections import defaultdict
+from local.harness import percentile
+
+
+def parse_spans(lines):
+    """Spans EMF de cada línea; ignora el resto. Tolera prefijos de CloudWatch (timestamp, requestId)."""
+    for line in lines:
+        i = line.find('{')
+        if i < 0 or '"_aws"' not in line:
+            continue
+        try:
+            rec = json.loads(line[i:])
+        except ValueError:
+            continue
+        if 'Operation' in rec and 'DurationMs' in rec:
+            rec.setdefault('startMs', rec['_aws'].get('Timestamp', 0))
+            yield rec
+
+
+def por_orden(spans):
+    """{orderId: [spans ordenados]}. Los spans sin orderId se asignan por traceId si es de una sola orden."""
+    ordenes = defaultdict(list)
+    trace_orden = defaultdict(set)
+    sueltos = []
+    for s in spans:
+        if s.get('orderId'):
+            ordenes[s['orderId']].append(s)
+            if s.get('traceId'):
+                trace_orden[s['traceId']].add(s['orderId'])
+        else:
+            sueltos.append(s)
+    for s in sueltos:
+        destino = trace_orden.get(s.get('traceId')) or ()
+        if len(destino) == 1:
+            ordenes[next(iter(destino))].append(s)
+    for lista in ordenes.values():
+        lista.sort(key=lambda s: s['startMs'])
+    return ordenes
+
+
+def _fin(s):
+    return s['startMs'] + s['DurationMs']
+
+
+def analizar(ordenes):
+    e2e = []
+    etapas = defaultdict(list)     # stage -> [ms]
+    esperas = defaultdict(list)    # stage -> [ms desde el fin de la etapa anterior]
+    ops = defaultdict(list)        # (stage, operation) -> [ms]
+    for spans in ordenes.values():
+        handlers = [s for s in spans if s['Operation'] == 'handler']
+        if handlers:
+            e2e.append(max(_fin(s) for s in spans) - min(s['startMs'] for s in spans))
+        for i, h in enumerate(handlers):
+            etapas[h['Stage']].append(h['DurationMs'])
+            previos = [_fin(p) for p in handlers[:i] if _fin(p) <= h['startMs']]
+            if previos:
+                esperas[h['Stage']].append(h['startMs'] - max(previos))
+        for s in spans:
+            if s['Operation'] != 'handler':
+                ops[(s['Stage'], s['Operation'])].append(s['DurationMs'])
+
+    def resumen(vals):
+        return {'count': len(vals), 'p50_ms': round(percentile(vals, 50), 3),
+                'p95_ms': round(percentile(vals, 95), 3), 'p99_ms': round(percentile(vals, 99), 3)}
+
+    return {
+        'orders': len(ordenes),
+        'e2e': resumen(e2e) if e2e else None,
+        'stages': {st: dict(resumen(v), wait=resumen(esperas[st]) if esperas.get(st) else None)
+                   for st, v in sorted(etapas.items(), key=lambda kv: percentile(kv[1], 50), reverse=True)},
+        'operations': {f"{st} {op}": resumen(v) for (st, op), v in sorted(ops.items())},
+    }
+
+
+def _print(report):
+    e = report['e2e'] or {}
+    print(f"{report['orders']} órdenes · e2e p50/p95/p99 {e.get('p50_ms')}/{e.get('p95_ms')}/{e.get('p99_ms')} ms\n")
+    print(f"{'etapa':<38} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'espera p50':>11}")
+    for st, s in report['stages'].items():
+        w = (s['wait'] or {}).get('p50_ms', '-')
+        print(f"{st:<38} {s['count']:>6} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8} {w:>11}")
+    print(f"\n{'etapa / llamada':<60} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, s in report['operations'].items():
+        print(f"{name:<60} {s['count']:>6} {s['p50_ms']:>8} {s['p95_ms']:>8} {s['p99_ms']:>8}")
+
+
+def _print_orden(order_id, spans):
+    if not spans:
+        print(f"sin spans para {order_id}")
+        return
+    t0 = spans[0]['startMs']
+    print(f"{order_id} · traceId {next((s['traceId'] for s in spans if s.get('traceId')), '-')}")
+    print(f"{'+ms':>10} {'dur ms':>8}  etapa / llamada")
+    for s in spans:
+        sangria = '' if s['Operation'] == 'handler' else '    '
+        nombre = s['Stage'] if s['Operation'] == 'handler' else s['Operation']
+        extra = f"  [{s['error']}]" if s.get('error') else ''
+        print(f"{s['startMs'] - t0:>10.3f} {s['DurationMs']:>8.3f}  {sangria}{nombre}{extra}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('logs', nargs='+', help="archivos de log ('-' = stdin)")
+    ap.add_argument('--order', default=None, help='imprimir la línea de tiempo de una orden')
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    spans = []
+    for path in args.logs:
+        if path == '-':
+            spans.extend(parse_spans(sys.stdin))
+        else:
+            with open(path, encoding='utf-8') as f:
+                spans.extend(parse_spans(f))
+    ordenes = por_orden(spans)
+
+    if args.order:
+        _print_orden(args.order, ordenes.get(args.order, []))
+        return
+    report = analizar(ordenes)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TRACE_SPANS', '0')
+
+from local import fakes   # noqa: E402
+
+fakes.install()   # boto3/botocore falsos antes de que los tests importen comun.*
+
+
+@pytest.fixture
+def aws():
+    """AWS en memoria (local/fakes.py), nuevo en cada test."""
+    return fakes.install()
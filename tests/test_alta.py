@@ -0,0 +1,130 @@
+import os
+import json
+import importlib.util
+
+import pytest
+
+from comun import eventos
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def alta(aws):
+    spec = importlib.util.spec_from_file_location('alta', os.path.join(RAIZ, '0 Compras-CrearOrden-CasaCentral.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _orden(i, lineas):
+    return {'orderId': f'OC-{i}', 'items': [{'sku': f'SKU-{i}-{n:05d}', 'qty': 1} for n in range(lineas)]}
+
+
+def test_bulk_corta_transacciones_y_eventos_por_tamano(alta, aws):
+    # 25 órdenes de ~200KB: entran en TX_CHUNK pero no en una transacción de 4MB
+    publicados = []
+    aws.event_listeners.append(publicados.append)
+    res = alta.lambda_handler([_orden(i, 6000) for i in range(25)], None)
+    assert res['created'] == 25 and res['failed'] == 0
+    assert len(aws.tables['OrdenesCompra']) == 25
+    assert aws.calls['dynamodb.TransactWriteItems'] == 2
+    # y de a una por PutEvents (256KB), con los items
+    assert aws.calls['events.PutEvents'] == 25
+    assert all('items' in json.loads(e['Detail']) for e in publicados)
+
+
+def test_evento_de_orden_enorme_viaja_sin_items(alta):
+    entry = alta._event_entry(_orden(1, 12000))
+    assert alta._tam_evento(entry) <= alta.EVENTS_MAX_BYTES
+    assert 'items' not in json.loads(entry['Detail'])
+
+
+def test_orden_mas_grande_que_un_item_falla_sola(alta, aws):
+    res = alta.lambda_handler([_orden(1, 20000), _orden(2, 3)], None)
+    assert [r['status'] for r in res['results']] == ['failed', 'created']
+    assert list(aws.tables['OrdenesCompra']) == [('OC-2',)]
+
+
+def test_order_id_que_no_es_texto_falla_sin_tumbar_el_lote(alta, aws):
+    ordenes = [dict(_orden(1, 2), orderId={'x': 1}), dict(_orden(2, 2), orderId=''), _orden(3, 2),
+               dict(_orden(4, 2), orderId=['OC-4'])]
+    res = alta.lambda_handler(ordenes, None)
+    assert [r['status'] for r in res['results']] == ['failed', 'failed', 'created', 'failed']
+    assert list(aws.tables['OrdenesCompra']) == [('OC-3',)]
+
+
+def test_bulk_pasa_por_eventos_y_reintenta_sin_repetir_el_fusionado(alta, aws, monkeypatch):
+    import boto3
+    monkeypatch.setitem(eventos.FUSED_DISPATCH, 'OrdenCreada', ['CasaCentral-ProcesarOrden-Deposito'])
+    publicados = []
+    aws.event_listeners.append(publicados.append)
+    cliente = boto3.client('events')
+    real, llamadas = cliente.put_events, []
+
+    def put_events(Entries, **kw):
+        # primer PutEvents de OrdenCreada: la segunda entrada falla (throttling) y se reintenta sola
+        if Entries[0]['DetailType'] != 'OrdenCreada':
+            return real(Entries=Entries, **kw)   # lo que publica el handler fusionado
+        llamadas.append(len(Entries))
+        if len(llamadas) == 1:
+            resp = real(Entries=[Entries[0]] + Entries[2:])
+            ok = resp['Entries']
+            return {'FailedEntryCount': 1, 'Entries': ok[:1] + [{'ErrorCode': 'ThrottlingException'}] + ok[1:]}
+        return real(Entries=Entries, **kw)
+
+    monkeypatch.setattr(cliente, 'put_events', put_events)
+    monkeypatch.setattr(alta, 'BASE_BACKOFF', 0)
+    res = alta.lambda_handler([_orden(i, 2) for i in range(3)], None)
+    assert res['created'] == 3 and not any('eventError' in r for r in res['results'])
+    assert llamadas == [3, 1]
+    creadas = [json.loads(e['Detail']) for e in publicados if e['DetailType'] == 'OrdenCreada']
+    assert sorted(d['orderId'] for d in creadas) == ['OC-0', 'OC-1', 'OC-2']
+    assert all(d['fusedTargets'] == ['CasaCentral-ProcesarOrden-Deposito'] for d in creadas)
+    # el reintento de OC-1 corre de nuevo el handler fusionado con el mismo id: un solo aviso por orden
+    pendientes = [json.loads(e['Detail'])['orderId'] for e in publicados
+                  if e['DetailType'] == 'OrdenPendienteAprobacion']
+    assert sorted(pendientes) == ['OC-0', 'OC-1', 'OC-2']
+    assert {v['status'] for v in aws.tables['OrdenesCompra'].values()} == {'PENDING_APPROVAL'}
+
+
+@pytest.fixture
+def cola(alta, aws, monkeypatch):
+    """SendMessageBatch que falla con los códigos de `fallas` ({orderId: (code, senderFault)})."""
+    import boto3
+    monkeypatch.setattr(alta, 'INTAKE_QUEUE_URL', 'https://sqs.local/alta')
+    monkeypatch.setattr(alta, 'BASE_BACKOFF', 0)
+    cliente, fallas, llamadas = boto3.client('sqs'), {}, []
+    real = cliente.send_message_batch
+
+    def send_message_batch(QueueUrl, Entries, **kw):
+        llamadas.append(len(Entries))
+        malas = {e['Id']: fallas[json.loads(e['MessageBody'])['orderId']] for e in Entries
+                 if json.loads(e['MessageBody'])['orderId'] in fallas}
+        resp = real(QueueUrl=QueueUrl, Entries=[e for e in Entries if e['Id'] not in malas])
+        resp['Failed'] = [{'Id': i, 'Code': c, 'SenderFault': sf, 'Message': 'x'} for i, (c, sf) in malas.items()]
+        return resp
+
+    monkeypatch.setattr(cliente, 'send_message_batch', send_message_batch)
+    return fallas, llamadas
+
+
+def test_encolar_sender_fault_no_se_reintenta(alta, cola):
+    fallas, llamadas = cola
+    fallas['OC-1'] = ('InvalidMessageContents', True)
+    res = alta._aceptar([_orden(0, 1), _orden(1, 1)], True)
+    body = json.loads(res['body'])
+    assert res['statusCode'] == 202 and llamadas == [2]
+    assert body['results'][1]['status'] == 'failed' and body['results'][1]['retryable'] is False
+    # sola: 422 (SQS rechazó el mensaje, reintentar no sirve)
+    assert alta._aceptar([_orden(1, 1)], False)['statusCode'] == 422
+
+
+def test_encolar_falla_del_servicio_se_reintenta_y_da_503(alta, cola):
+    fallas, llamadas = cola
+    fallas['OC-1'] = ('InternalError', False)
+    res = alta._aceptar([_orden(1, 1)], False)
+    assert res['statusCode'] == 503
+    assert llamadas == [1] * (alta.MAX_RETRIES + 1)
+    # la orden inválida sigue siendo 400
+    assert alta._aceptar([{'orderId': 'OC-2', 'items': []}], False)['statusCode'] == 400
@@ -0,0 +1,50 @@
+import random
+from decimal import Decimal
+
+from comun import asignacion, sucursales
+
+
+def _caso(skus, sucs, seed):
+    rnd = random.Random(seed)
+    cantidades = [rnd.randrange(0, 4 * sucs) for _ in range(skus)]
+    stock = [[float(rnd.randrange(0, 20)) for _ in range(sucs)] for _ in range(skus)]
+    demanda = [[rnd.random() * 3 if rnd.random() < 0.6 else 0.0 for _ in range(sucs)] for _ in range(skus)]
+    return cantidades, stock, demanda
+
+
+def test_asignar_es_deterministico_y_conserva_lo_despachado():
+    cantidades, stock, demanda = _caso(200, 40, seed=3)
+    matriz = asignacion.asignar(cantidades, stock, demanda)
+    assert matriz == asignacion.asignar(cantidades, stock, demanda)
+    assert [sum(fila) for fila in matriz] == cantidades
+    assert all(q >= 0 and isinstance(q, int) for fila in matriz for q in fila)
+
+
+def test_asignar_cubre_faltantes_y_reparte_excedente_por_demanda():
+    # faltantes (demanda × 7 − stock): S1 = 14, S2 = 0, S3 = 7
+    [fila] = asignacion.asignar([21], [[0.0, 50.0, 0.0]], [[2.0, 1.0, 1.0]], cobertura=7)
+    assert fila == [14, 0, 7]
+    # con 25 sobran 4: van por demanda 2:1:1 sobre los faltantes
+    [fila] = asignacion.asignar([25], [[0.0, 50.0, 0.0]], [[2.0, 1.0, 1.0]], cobertura=7)
+    assert fila == [16, 1, 8]
+    # sin demanda ni faltantes: parejo, el resto por orden de sucursal
+    [fila] = asignacion.asignar([5], [[0.0, 0.0, 0.0]], [[0.0, 0.0, 0.0]])
+    assert fila == [2, 2, 1]
+
+
+def test_asignar_fraccion_va_a_la_sucursal_con_mas_asignado():
+    [fila] = asignacion.asignar([Decimal('10.5')], [[0.0, 0.0]], [[1.0, 3.0]], cobertura=0)
+    assert sum(fila) == Decimal('10.5')
+    assert fila[1] - int(fila[1]) == Decimal('0.5')
+
+
+def test_sumar_en_stock_sucursal_es_idempotente_por_orden(aws):
+    aws.tables['StockSucursal'][('A',)] = {'sku': 'A', 'demanda': {'S1': Decimal(4)}}
+    reparto = {'S1': {'A': 3, 'B': 1}, 'S2': {'A': 2}}
+    assert sucursales.sumar('OC-1', reparto, '2026-01-01T10:00:00') == []
+    assert sucursales.sumar('OC-1', reparto, '2026-01-01T10:00:00') == []   # reentrega
+    assert sucursales.sumar('OC-2', {'S2': {'A': 1}}, '2026-01-01T11:00:00') == []
+    a, b = aws.tables['StockSucursal'][('A',)], aws.tables['StockSucursal'][('B',)]
+    assert a['qty'] == {'S1': 3, 'S2': 3} and a['demanda'] == {'S1': 4} and a['version'] == 2
+    assert b['qty'] == {'S1': 1}
+    assert sucursales.stock_y_demanda(['A', 'C']) == {'A': {'S1': (3.0, 4.0), 'S2': (3.0, 0.0)}, 'C': {}}
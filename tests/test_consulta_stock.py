@@ -0,0 +1,55 @@
+import os
+import json
+import importlib.util
+from decimal import Decimal
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def consulta(aws):
+    spec = importlib.util.spec_from_file_location('consulta', os.path.join(RAIZ, '14 Stock-ConsultarStock.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    for i in range(120):
+        sku = f'SKU-{i:04d}'
+        aws.tables['StockGlobal'][(sku,)] = {'sku': sku, 'qty': Decimal(i % 25)}
+    aws.tables['StockGlobal'][('OTRO-1',)] = {'sku': 'OTRO-1', 'qty': Decimal(3)}
+    assert mod.lambda_handler({'reconstruir': True}, None)['refreshed'] == 121
+    return mod
+
+
+def _paginar(consulta, qp):
+    vistos, cursor, paginas = [], None, 0
+    while True:
+        res = json.loads(consulta.lambda_handler({'queryStringParameters': dict(qp, **({'cursor': cursor} if cursor else {}))},
+                                                 None)['body'])
+        vistos += [it['sku'] for it in res['items']]
+        paginas += 1
+        cursor = res['nextCursor']
+        if not cursor:
+            return vistos, paginas
+
+
+def test_vista_repartida_en_particiones(consulta, aws):
+    particiones = {it['vista'] for it in aws.tables['StockDisponible'].values()}
+    assert particiones == {f'STOCK#{n}' for n in range(consulta.VISTA_SHARDS)}
+
+
+def test_prefijo_pagina_todas_las_particiones_en_orden(consulta):
+    vistos, paginas = _paginar(consulta, {'prefix': 'SKU-', 'limit': '7'})
+    assert vistos == [f'SKU-{i:04d}' for i in range(120)]
+    assert paginas == 18
+
+
+def test_stock_bajo_pagina_sin_repetir(consulta):
+    vistos, _ = _paginar(consulta, {'lowStock': '1', 'limit': '5'})
+    esperados = sorted([f'SKU-{i:04d}' for i in range(120) if i % 25 <= 10] + ['OTRO-1'])
+    assert vistos == esperados
+
+
+def test_cursor_invalido(consulta):
+    res = consulta.lambda_handler({'queryStringParameters': {'prefix': 'SKU-', 'cursor': 'xx'}}, None)
+    assert res['statusCode'] == 400
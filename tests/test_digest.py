@@ -0,0 +1,23 @@
+import sys
+
+from comun import digest, plantillas
+
+TOPIC = 'arn:aws:sns:us-east-2:000000000000:aprobadores'
+
+
+def test_aviso_que_solo_no_entra_sale_recortado_con_link(aws, monkeypatch):
+    enviados = []
+    sns = sys.modules['boto3'].client('sns')
+    publicar = sns.publish
+    monkeypatch.setattr(sns, 'publish', lambda **kw: enviados.append(kw['Message']) or publicar(**kw))
+    enorme = 'x' * (plantillas.SNS_MAX_BYTES + 1000)
+    digest.encolar([digest.entrada('ROL', TOPIC, 'OC-1', enorme, 'Pendientes'),
+                    digest.entrada('ROL', TOPIC, 'OC-2', 'OC OC-2 chica', 'Pendientes')])
+
+    res = digest.flush('ROL')
+
+    assert res['avisos'] == 2 and len(enviados) == 2
+    assert len(enviados[0].encode()) <= plantillas.SNS_MAX_BYTES
+    assert 'x' * 1000 in enviados[0] and 'orderId=OC-1' in enviados[0]
+    assert 'OC OC-2 chica' in enviados[1]
+    assert digest.destinos_pendientes() == []
@@ -0,0 +1,66 @@
+import os
+import csv
+import gzip
+import glob
+import importlib.util
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from comun import exportacion
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AHORA = datetime(2026, 1, 2, 12, 0, 0)
+
+
+@pytest.fixture
+def exportar(aws, tmp_path, monkeypatch):
+    spec = importlib.util.spec_from_file_location('exportar', os.path.join(RAIZ, '17 Reportes-ExportarTablas.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    monkeypatch.setattr(mod, 'EXPORT_DIR', str(tmp_path))
+    monkeypatch.setattr(mod, 'EXPORT_SEGMENTS', 2)
+    monkeypatch.setattr(mod, 'EXPORT_PAGE_SIZE', 10)
+    monkeypatch.setattr(mod, 'EXPORT_ROWS_PER_FILE', 20)
+    monkeypatch.setattr(exportacion, 'EXPORT_FORMAT', 'csv')
+    monkeypatch.setattr(exportacion, 'EXTENSION', '.csv.gz')
+    for i in range(150):
+        sku = f'SKU-{i:04d}'
+        aws.tables['StockGlobal'][(sku,)] = {'sku': sku, 'qty': Decimal(i), 'updatedAt': '2026-01-01T10:00:00'}
+    return mod
+
+
+def _exportados(directorio):
+    skus = []
+    for path in glob.glob(os.path.join(directorio, 'StockGlobal', '**', '*.csv.gz'), recursive=True):
+        with gzip.open(path, 'rt', newline='') as f:
+            skus += [fila['sku'] for fila in csv.DictReader(f)]
+    return skus
+
+
+def _corte_por_paginas(n):
+    """queda_tiempo que se agota después de `n` páginas (entre todas las tareas)."""
+    paginas = [0]
+
+    def queda_tiempo():
+        paginas[0] += 1
+        return paginas[0] <= n
+    return queda_tiempo
+
+
+def test_exportacion_sigue_desde_el_cursor_despues_de_un_corte(exportar, tmp_path):
+    # 1) Primera invocación: se queda sin tiempo a mitad de las tareas
+    res = exportar._exportar('StockGlobal', 'full', AHORA, exportacion.Presupuesto(0), _corte_por_paginas(5))
+    assert res['pendiente']
+    parciales = _exportados(str(tmp_path))
+    assert 0 < len(parciales) < 150
+    # 2) La siguiente sigue la misma corrida desde los cursores guardados y la cierra
+    res = exportar._exportar('StockGlobal', 'full', AHORA, exportacion.Presupuesto(0), lambda: True)
+    assert not res['pendiente']
+    exportados = _exportados(str(tmp_path))
+    # al menos una vez: nada se pierde ni se pisa un archivo de la invocación anterior
+    assert set(exportados) == {f'SKU-{i:04d}' for i in range(150)}
+    assert set(parciales) <= set(exportados)
+    assert exportar._estado('StockGlobal')['marca']
+    assert not exportar._estado('StockGlobal')['enCurso']
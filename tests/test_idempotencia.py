@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from comun import idempotencia
+
+EVENTO = {'id': 'ev-1', 'detail-type': 'OrdenCreada', 'detail': {'orderId': 'OC-1'}}
+CLAVE = 'Prueba#ev-1'
+
+
+@pytest.fixture
+def handler(aws, monkeypatch):
+    monkeypatch.setattr(idempotencia, '_local', idempotencia.OrderedDict())
+    respuestas = []
+
+    @idempotencia.idempotente(idempotencia.por_evento('Prueba.py'))
+    def lambda_handler(event, context):
+        res = respuestas.pop(0)
+        if isinstance(res, Exception):
+            raise res
+        return res
+
+    lambda_handler.respuestas = respuestas
+    return lambda_handler
+
+
+def _ledger(aws):
+    return aws.tables['Idempotencia'].get((CLAVE,))
+
+
+def test_error_libera_la_clave_y_el_reintento_procesa(handler, aws):
+    ok = {'statusCode': 200, 'body': json.dumps({'ok': 1})}
+    handler.respuestas.extend([RuntimeError('caída'), {'statusCode': 409, 'body': '{}'}, {'ok': False}, ok])
+
+    with pytest.raises(RuntimeError):
+        handler(EVENTO, None)
+    assert _ledger(aws) is None
+    assert handler(EVENTO, None)['statusCode'] == 409     # >= 400: no se guarda
+    assert _ledger(aws) is None
+    assert handler(EVENTO, None) == {'ok': False}          # ok: False tampoco
+    assert _ledger(aws) is None
+    assert handler(EVENTO, None) == ok
+    assert _ledger(aws)['status'] == 'COMPLETED'
+
+
+def test_exito_guarda_la_respuesta_y_el_duplicado_no_reprocesa(handler, aws, monkeypatch):
+    ok = {'statusCode': 200, 'body': json.dumps({'ok': 1})}
+    handler.respuestas.append(ok)
+    assert handler(EVENTO, None) == ok
+    assert handler(EVENTO, None) == ok                     # cache local del contenedor
+
+    # otro contenedor (sin cache local): la respuesta sale del ledger
+    monkeypatch.setattr(idempotencia, '_local', idempotencia.OrderedDict())
+    assert handler(EVENTO, None) == ok
+    assert handler.respuestas == []
@@ -0,0 +1,60 @@
+import sys
+from decimal import Decimal
+
+from comun import ledger, stock
+
+T1, T2, T3 = '2026-01-01T10:00:00', '2026-01-01T11:00:00', '2026-01-01T12:00:00'
+
+
+def test_saldo_cruza_el_borde_de_la_compactacion(aws):
+    stock.ingresar('A', 10, T1, 'o1')
+    stock.retirar('A', 3, T2, 'o2')
+    assert ledger.compactar('A', T2) == 1          # [inicio, T2): el movimiento de T2 queda afuera
+    stock.ingresar('A', 5, T3, 'o3')
+
+    assert ledger.saldo('A', T1) == (Decimal(10), {'snapshot': None, 'movimientos': 1})
+    # el snapshot con hasta=T2 no incluye el retiro de T2; la cola [T2, T2#~] lo suma una vez
+    assert ledger.saldo('A', T2) == (Decimal(7), {'snapshot': T2, 'movimientos': 1})
+    assert ledger.saldo('A', T3)[0] == Decimal(12)
+    assert ledger.compactar('A', T3) == 1           # parte del snapshot previo
+    assert ledger.saldo('A', T3) == (Decimal(12), {'snapshot': T3, 'movimientos': 1})
+    assert aws.tables['StockGlobal'][('A',)]['qty'] == Decimal(12)
+
+
+def test_compactar_es_idempotente_y_sin_movimientos_no_escribe(aws):
+    stock.ingresar('A', 4, T1, 'o1')
+    assert ledger.compactar('A', T2) == 1
+    assert ledger.compactar('A', T2) == 0           # condición sobre la clave
+    assert ledger.compactar('A', T3) == 0           # nada nuevo en [T2, T3)
+    assert [k for k in aws.tables['SnapshotsStock']] == [('A', T2)]
+
+
+def test_fin_ordena_despues_de_cualquier_movimiento_del_mismo_instante(aws):
+    stock.ingresar('A', 1, T1, 'zzz')
+    stock.ingresar('A', 1, T1 + '.5', 'o2')        # otro instante con el mismo prefijo
+    assert ledger.saldo('A', T1)[0] == Decimal(1)
+    assert ledger.saldo('A', T1 + '.5')[0] == Decimal(2)
+
+
+def test_apertura_con_movimiento_concurrente_relee(aws, monkeypatch):
+    aws.tables['StockGlobal'][('A',)] = {'sku': 'A', 'qty': Decimal(50)}   # stock previo al ledger
+    cliente = sys.modules['boto3'].client('dynamodb')
+    real_get = cliente.get_item
+    llamadas = []
+
+    def get_item(**kw):
+        res = real_get(**kw)
+        if not llamadas:   # entra un ingreso entre la lectura de la cola y la del item
+            stock.ingresar('A', 5, T1, 'o1')
+        llamadas.append(1)
+        return res
+    monkeypatch.setattr(cliente, 'get_item', get_item)
+
+    assert ledger.apertura('A') is True
+    assert len(llamadas) == 2
+    assert ledger.saldo('A', T2)[0] == Decimal(55)
+    assert ledger.apertura('A') is False
+
+
+def test_corte_cubre_el_timeout_de_lambda():
+    assert ledger.COMPACT_LAG_S > ledger.LAMBDA_MAX_TIMEOUT_S
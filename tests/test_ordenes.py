@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from comun import ordenes
+
+
+def test_cache_concurrente_no_pierde_entradas(aws, monkeypatch):
+    # cache chico + invalidaciones: con varios hilos move_to_end / popitem se cruzan
+    monkeypatch.setattr(ordenes, 'ORDER_CACHE_SIZE', 8)
+    monkeypatch.setattr(ordenes, '_cache', ordenes.OrderedDict())
+    for i in range(50):
+        aws.tables['OrdenesCompra'][(f'OC-{i}',)] = {'orderId': f'OC-{i}', 'updatedAt': '2026-01-01'}
+    ordenes.reset_stats()
+
+    def trabajar(h):
+        for k in range(500):
+            order_id = f'OC-{(h * 7 + k) % 50}'
+            assert ordenes.get_order(order_id)['orderId'] == order_id
+            if k % 5 == 0:
+                ordenes.invalidate(order_id)
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(trabajar, range(16)))
+
+    st = ordenes.stats()
+    assert st['hits'] + st['misses'] == 16 * 500
+    assert st['size'] <= 8
@@ -0,0 +1,59 @@
+import os
+import json
+import importlib.util
+from decimal import Decimal
+
+import pytest
+from botocore.exceptions import ClientError
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NOW = '2026-01-01T10:00:00'
+
+
+@pytest.fixture
+def recepcion(aws):
+    spec = importlib.util.spec_from_file_location('recepcion', os.path.join(RAIZ, '7 Deposito-AceptarRecepcion.py'))
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+@pytest.fixture
+def orden(aws):
+    # 120 SKUs: con el ledger (2 acciones por SKU) no entran en una transacción
+    items = [{'sku': f'SKU-{i:04d}', 'qty': i + 1} for i in range(120)]
+    aws.tables['OrdenesCompra'][('OC-1',)] = {'orderId': 'OC-1', 'status': 'APPROVED', 'items': json.dumps(items)}
+    return {it['sku']: Decimal(it['qty']) for it in items}
+
+
+def _stock(aws):
+    return {k[0]: v['qty'] for k, v in aws.tables['StockGlobal'].items()}
+
+
+def test_recepcion_en_chunks_se_reanuda_sin_duplicar_stock(recepcion, orden, aws, monkeypatch):
+    import boto3
+    cliente = boto3.client('dynamodb')
+    real, llamadas = cliente.transact_write_items, []
+
+    def transact(TransactItems, **kw):
+        # el segundo chunk falla con un error no reintentable: el primero ya quedó aplicado
+        llamadas.append(len(TransactItems))
+        if len(llamadas) == 2:
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'corte'}}, 'TransactWriteItems')
+        return real(TransactItems=TransactItems, **kw)
+
+    monkeypatch.setattr(cliente, 'transact_write_items', transact)
+    with pytest.raises(ClientError):
+        recepcion._aplicar_recepcion('OC-1', orden, NOW)
+    parcial = _stock(aws)
+    assert 0 < len(parcial) < len(orden)
+    assert aws.tables['OrdenesCompra'][('OC-1',)]['status'] == 'APPROVED'
+
+    # reintento: saltea el chunk marcado en recepcionChunks y aplica el resto una sola vez
+    monkeypatch.setattr(cliente, 'transact_write_items', real)
+    assert recepcion._aplicar_recepcion('OC-1', orden, NOW) == ('APPLIED', None)
+    assert _stock(aws) == orden
+    assert aws.tables['OrdenesCompra'][('OC-1',)]['status'] == 'RECEIVED'
+    # y una recepción repetida ya no toca el stock
+    assert recepcion._aplicar_recepcion('OC-1', orden, NOW)[0] == 'ALREADY_RECEIVED'
+    assert _stock(aws) == orden
@@ -0,0 +1,82 @@
+from decimal import Decimal
+
+import pytest
+
+from comun import ledger, stock
+
+NOW = '2026-01-01T10:00:00'
+
+
+@pytest.fixture
+def caliente(aws, monkeypatch):
+    """SKU 'H' con 3 shards: H=2, H#1=5, H#2=1."""
+    monkeypatch.setitem(stock.STOCK_HOT_SKUS, 'H', 3)
+    for key, qty in (('H', 2), ('H#1', 5), ('H#2', 1)):
+        aws.tables['StockGlobal'][(key,)] = {'sku': key, 'qty': Decimal(qty)}
+    return aws
+
+
+def _qty(aws):
+    return {k[0]: v['qty'] for k, v in aws.tables['StockGlobal'].items()}
+
+
+def test_plan_retiro():
+    por_shard = {'H': Decimal(2), 'H#1': Decimal(5), 'H#2': Decimal(1)}
+    assert stock.plan_retiro(por_shard, 5) == [('H#1', Decimal(5))]
+    assert stock.plan_retiro(por_shard, 7) == [('H#1', Decimal(5)), ('H', Decimal(2))]
+    assert stock.plan_retiro(por_shard, 9) is None
+    # un solo shard alcanza: se elige entre los que alcanzan según la semilla
+    elegidos = {stock.plan_retiro(por_shard, 1, str(i))[0][0] for i in range(20)}
+    assert elegidos == {'H', 'H#1', 'H#2'}
+
+
+def test_retirar_faltante_en_sku_con_shards_no_toca_nada(caliente):
+    antes = _qty(caliente)
+    assert stock.retirar('H', 9, NOW, 'o1') == Decimal(8)
+    assert _qty(caliente) == antes
+    assert not caliente.tables['MovimientosStock']
+
+
+def test_retirar_replanifica_si_otro_retiro_cambio_los_shards(caliente, monkeypatch):
+    leer = stock.leer_shards
+    lecturas = []
+
+    def leer_viejo(skus, consistente=True):
+        lecturas.append(skus)
+        if len(lecturas) == 1:   # lectura vieja: H#1 ya lo vació otro despacho
+            caliente.tables['StockGlobal'][('H#1',)]['qty'] = Decimal(0)
+            return {'H': {'H': Decimal(2), 'H#1': Decimal(5), 'H#2': Decimal(1)}}
+        return leer(skus, consistente)
+    monkeypatch.setattr(stock, 'leer_shards', leer_viejo)
+
+    assert stock.retirar('H', 3, NOW, 'o1') is None
+    assert len(lecturas) == 2
+    assert _qty(caliente) == {'H': Decimal(0), 'H#1': Decimal(0), 'H#2': Decimal(0)}
+    movs = caliente.tables['MovimientosStock']
+    assert sum(m['delta'] for m in movs.values()) == Decimal(-3)
+    assert stock.historico('H', NOW) == Decimal(-3)   # sin apertura: sólo los movimientos
+
+
+def test_retirar_faltante_despues_de_replanificar(caliente, monkeypatch):
+    leer = stock.leer_shards
+    lecturas = []
+
+    def leer_viejo(skus, consistente=True):
+        lecturas.append(skus)
+        if len(lecturas) == 1:
+            caliente.tables['StockGlobal'][('H#1',)]['qty'] = Decimal(0)
+            return {'H': {'H': Decimal(2), 'H#1': Decimal(5), 'H#2': Decimal(1)}}
+        return leer(skus, consistente)
+    monkeypatch.setattr(stock, 'leer_shards', leer_viejo)
+
+    assert stock.retirar('H', 5, NOW, 'o1') == Decimal(3)
+    assert _qty(caliente) == {'H': Decimal(2), 'H#1': Decimal(0), 'H#2': Decimal(1)}
+    assert not caliente.tables['MovimientosStock']
+
+
+def test_ingresos_con_shards_suman_en_el_ledger(caliente):
+    for i in range(6):
+        stock.ingresar('H', 1, NOW, f'o{i}')
+    assert sum(stock.disponible(['H'], ttl=0).values()) == Decimal(14)
+    assert {k[0].split('#')[0] for k in caliente.tables['MovimientosStock']} == {'H'}
+    assert ledger.LEDGER_ENABLED